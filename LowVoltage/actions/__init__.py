@@ -15,3 +15,4 @@ from .query import Query, QueryResponse
 from .scan import Scan, ScanResponse
 from .update_item import UpdateItem, UpdateItemResponse
 from .update_table import UpdateTable, UpdateTableResponse
+from .conversion import register_encoder, register_decoder
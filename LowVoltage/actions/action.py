@@ -3,6 +3,11 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 
+# Names of the actions reading and writing items, shared by rate limiting, hedging, coalescing and fault injection.
+_read_actions = frozenset(["GetItem", "BatchGetItem", "Query", "Scan"])
+_write_actions = frozenset(["PutItem", "UpdateItem", "DeleteItem", "BatchWriteItem"])
+
+
 class Action(object):
     def __init__(self, name, response_class):
         self.name = name
@@ -20,10 +20,15 @@ Note that responses are in an undefined order.
 See also the :func:`.iterate_batch_get_item` compound. And :ref:`actions-vs-compounds` in the user guide.
 """
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from .action import Action
-from .conversion import _convert_dict_to_db, _convert_db_to_dict
+from .conversion import _convert_dict_to_db, _convert_db_to_dict, _convert_db_to_lazy_dict
 from .next_gen_mixins import proxy, variadic
 from .next_gen_mixins import (
     ConsistentRead,
@@ -50,6 +55,8 @@ class BatchGetItemResponse(object):
     ):
         self.__consumed_capacity = ConsumedCapacity
         self.__responses = Responses
+        self.__converted_responses = None
+        self.__lazy_responses = None
         self.__unprocessed_keys = UnprocessedKeys
 
     @property
@@ -66,11 +73,39 @@ class BatchGetItemResponse(object):
     def responses(self):
         """
         The items you just got.
+        Items are converted from DynamoDB notation the first time this property is read,
+        and the same dict is returned after that.
+
+        :type: ``None`` or dict of string (table name) to list of dict
+        """
+        if self.__converted_responses is None and _is_dict(self.__responses):
+            self.__converted_responses = {t: [_convert_db_to_dict(v) for v in vs] for t, vs in self.__responses.iteritems()}
+        return self.__converted_responses
+
+    @property
+    def lazy_responses(self):
+        """
+        The same items as :attr:`responses`, as :class:`collections.MutableMapping` instances
+        converting each attribute from DynamoDB notation when it is first accessed.
+        Useful when you only look at a few attributes of large items.
+        They are accepted by all actions and compounds:
+        use ``dict(item)`` where a real ``dict`` is needed, for example with ``json.dumps``.
+
+        :type: ``None`` or dict of string (table name) to list of :class:`collections.MutableMapping`
+        """
+        if self.__lazy_responses is None and _is_dict(self.__responses):
+            self.__lazy_responses = {t: [_convert_db_to_lazy_dict(v) for v in vs] for t, vs in self.__responses.iteritems()}
+        return self.__lazy_responses
+
+    @property
+    def raw_responses(self):
+        """
+        The items you just got, exactly as returned by DynamoDB, without any conversion.
 
         :type: ``None`` or dict of string (table name) to list of dict
         """
         if _is_dict(self.__responses):
-            return {t: [_convert_db_to_dict(v) for v in vs] for t, vs in self.__responses.iteritems()}
+            return self.__responses
 
     @property
     def unprocessed_keys(self):
@@ -91,7 +126,7 @@ class BatchGetItem(Action):
     The `BatchGetItem request <http://docs.aws.amazon.com/amazondynamodb/latest/APIReference/API_BatchGetItem.html#API_BatchGetItem_RequestParameters>`__
     """
 
-    @variadic(dict)
+    @variadic(Mapping)
     def __init__(self, table=None, *keys):
         """
         Passing ``table`` (and ``keys``) to the constructor is like calling :meth:`table` on the new instance.
@@ -132,7 +167,7 @@ class BatchGetItem(Action):
             data.update(self.projection_expression.payload)
             return data
 
-    @variadic(dict)
+    @variadic(Mapping)
     def table(self, name, *keys):
         """
         Set the active table. Calls to methods like :meth:`keys` or :meth:`consistent_read_true` will apply to this table.
@@ -158,7 +193,7 @@ class BatchGetItem(Action):
         self.keys(*keys)
         return self
 
-    @variadic(dict)
+    @variadic(Mapping)
     def keys(self, *keys):
         """
         Add keys to get from the active table.
@@ -422,6 +457,22 @@ class BatchGetItemUnitTests(_tst.UnitTests):
             }
         )
 
+    def test_keys_from_queried_items(self):
+        items = _lv.QueryResponse(Items=[{"hash": {"S": "h1"}}, {"hash": {"S": "h2"}}]).lazy_items
+        self.assertEqual(
+            BatchGetItem("Table", items[0]).keys(items[1:]).payload,
+            {
+                "RequestItems": {
+                    "Table": {
+                        "Keys": [
+                            {"hash": {"S": "h1"}},
+                            {"hash": {"S": "h2"}},
+                        ]
+                    },
+                }
+            }
+        )
+
     def test_consistent_read(self):
         self.assertEqual(
             BatchGetItem().table("Table1").consistent_read_true().table("Table2").consistent_read_false().payload,
@@ -500,3 +551,18 @@ class BatchGetItemResponseUnitTests(_tst.UnitTests):
         self.assertIsInstance(r.consumed_capacity[0], ConsumedCapacity)
         self.assertEqual(r.responses, {"A": [{"h": u"a"}]})
         self.assertIs(r.unprocessed_keys, unprocessed_keys)
+
+    def test_raw_responses(self):
+        responses = {"A": [{"h": {"S": "a"}}]}
+        r = BatchGetItemResponse(Responses=responses)
+        self.assertIs(r.raw_responses, responses)
+
+    def test_responses_are_converted_once(self):
+        r = BatchGetItemResponse(Responses={"A": [{"h": {"S": "a"}}]})
+        self.assertIs(r.responses, r.responses)
+        self.assertIs(type(r.responses["A"][0]), dict)
+
+    def test_lazy_responses(self):
+        r = BatchGetItemResponse(Responses={"A": [{"h": {"S": "a"}}]})
+        self.assertIs(r.lazy_responses, r.lazy_responses)
+        self.assertEqual(r.lazy_responses, {"A": [{"h": "a"}]})
@@ -13,6 +13,11 @@ When given a :class:`BatchWriteItem`, the connection will return a :class:`Batch
 See also the :func:`.batch_put_item` and :func:`.batch_delete_item` compounds. And :ref:`actions-vs-compounds` in the user guide.
 """
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from .action import Action
@@ -151,7 +156,7 @@ class BatchWriteItem(Action):
         self.delete(*delete)
         return self
 
-    @variadic(dict)
+    @variadic(Mapping)
     def put(self, *items):
         """
         Add items to put in the active table.
@@ -168,7 +173,7 @@ class BatchWriteItem(Action):
         self.__active_table.put.extend(items)
         return self
 
-    @variadic(dict)
+    @variadic(Mapping)
     def delete(self, *keys):
         """
         Add keys to delete from the active table.
@@ -447,6 +452,21 @@ class BatchWriteItemUnitTests(_tst.UnitTests):
             }
         )
 
+    def test_put_scanned_items(self):
+        items = _lv.ScanResponse(Items=[{"hash": {"S": u"h1"}, "a": {"N": "1"}}, {"hash": {"S": u"h2"}}]).lazy_items
+        items[1]["a"] = 2
+        self.assertEqual(
+            BatchWriteItem().table("Table").put(items[0], items[1:]).payload,
+            {
+                "RequestItems": {
+                    "Table": [
+                        {"PutRequest": {"Item": {"hash": {"S": "h1"}, "a": {"N": "1"}}}},
+                        {"PutRequest": {"Item": {"hash": {"S": "h2"}, "a": {"N": "2"}}}},
+                    ],
+                },
+            }
+        )
+
     def test_alternate_between_tables_and_put_delete(self):
         self.assertEqual(
             BatchWriteItem()
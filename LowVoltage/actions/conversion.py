@@ -86,50 +86,199 @@ Note that lists are stored as ``"L"`` even if they are homogeneous, so you have
 Traceback (most recent call last):
   ...
 TypeError: ...
+
+Subclasses of these types (and other :class:`numbers.Integral` and :class:`collections.Mapping`) are stored the same way.
+
+Other types can be stored by registering an encoder with :func:`register_encoder`.
+It applies to the registered type and its subclasses, including in sets:
+
+>>> import uuid
+>>> register_encoder(uuid.UUID, lambda u: {"S": unicode(u)})
+>>> connection(PutItem(table, {"h": 0, "uuid": uuid.UUID("6ba7b810-9dad-11d1-80b4-00c04fd430c8")}))
+<LowVoltage.actions.put_item.PutItemResponse ...>
+>>> connection(GetItem(table, {"h": 0})).item
+{u'h': 0, u'uuid': u'6ba7b810-9dad-11d1-80b4-00c04fd430c8'}
+
+DynamoDB doesn't store the Python type, so values are always read back as the types listed above,
+unless you register a decoder for a DynamoDB type with :func:`register_decoder`.
+For example, to store numbers with decimals and read all numbers as :class:`decimal.Decimal`::
+
+    register_encoder(decimal.Decimal, lambda d: {"N": str(d)})
+    register_decoder("N", decimal.Decimal)
+
+Decoders of ``"N"``, ``"S"`` and ``"B"`` are also used for the elements of ``"NS"``, ``"SS"`` and ``"BS"``.
+Encoders and decoders are global: register them once, when your application starts.
 """
 
 import base64
+import decimal
 import numbers
 import sys
+try:
+    from collections.abc import Mapping, MutableMapping
+except ImportError:
+    from collections import Mapping, MutableMapping
 
 import LowVoltage.testing as _tst
 
 
 def _convert_dict_to_db(attributes):
+    if isinstance(attributes, _LazyDict):
+        return attributes._to_db()
     return {
         key: _convert_value_to_db(val)
         for key, val in attributes.iteritems()
     }
 
 
+def register_encoder(type_, encoder):
+    """
+    Store values of type ``type_`` (and of its subclasses) using ``encoder``.
+
+    :param type_: a class.
+    :param encoder: a function taking a value and returning it in DynamoDB notation, like ``{"S": u"foo"}`` or ``{"N": "42"}``.
+    """
+    _encoders[type_] = encoder
+    _dispatch.clear()
+
+
+def register_decoder(db_type, decoder):
+    """
+    Read values of DynamoDB type ``db_type`` using ``decoder``.
+
+    :param db_type: a DynamoDB type, like ``"S"`` or ``"N"``.
+    :param decoder: a function taking a value in DynamoDB notation, without its type (like ``u"foo"`` or ``"42"``) and returning it.
+    """
+    global _plain_strings
+    _decoders[db_type] = decoder
+    _plain_strings = _decoders["S"] is _decode_string
+
+
 def _convert_value_to_db(value):
-    if isinstance(value, unicode):
-        return {"S": value}
-    elif isinstance(value, bytes):
-        return {"B": base64.b64encode(value).decode("utf8")}
-    elif isinstance(value, bool):
-        return {"BOOL": value}
-    elif isinstance(value, numbers.Integral):
-        return {"N": str(value)}
-    elif value is None:
-        return {"NULL": True}
-    elif isinstance(value, (set, frozenset)):
-        if len(value) == 0:
-            raise TypeError
-        elif all(isinstance(v, numbers.Integral) for v in value):
-            return {"NS": [str(n) for n in value]}
-        elif all(isinstance(v, unicode) for v in value):
-            return {"SS": [s for s in value]}
-        elif all(isinstance(v, bytes) for v in value):
-            return {"BS": [base64.b64encode(b).decode("utf8") for b in value]}
-        else:
-            raise TypeError
-    elif isinstance(value, list):
-        return {"L": [_convert_value_to_db(v) for v in value]}
-    elif isinstance(value, dict):
-        return {"M": {n: _convert_value_to_db(v) for n, v in value.iteritems()}}
+    try:
+        encoder = _dispatch[type(value)]
+    except KeyError:
+        encoder = _dispatch[type(value)] = _find_encoder(type(value))
+    return encoder(value)
+
+
+def _find_encoder(type_):
+    for klass in type_.__mro__:
+        encoder = _encoders.get(klass)
+        if encoder is not None:
+            return encoder
+    if issubclass(type_, numbers.Integral):
+        return _encode_number
+    elif issubclass(type_, Mapping):
+        return _encode_map
+    else:
+        return _encode_unsupported
+
+
+def _encode_string(value):
+    return {"S": value}
+
+
+def _encode_binary(value):
+    return {"B": base64.b64encode(value).decode("utf8")}
+
+
+def _encode_bool(value):
+    return {"BOOL": value}
+
+
+def _encode_number(value):
+    return {"N": str(value)}
+
+
+def _encode_null(value):
+    return {"NULL": True}
+
+
+def _encode_set(value):
+    # In the common case, all elements have the exact type of the first one, and a single pass both checks and converts them
+    for first in value:
+        break
     else:
         raise TypeError
+    element_type = type(first)
+    fast = _set_element_encoders.get(element_type)
+    if fast is not None:
+        db_type, encode = fast
+        if encode is None:
+            elements = [v for v in value if type(v) is element_type]
+        else:
+            elements = [encode(v) for v in value if type(v) is element_type]
+        if len(elements) == len(value):
+            return {db_type: elements}
+    return _encode_mixed_set(value)
+
+
+def _encode_mixed_set(value):
+    # Elements of different types (int and long, subclasses, registered types) must still be stored with the same DynamoDB type
+    db_type = None
+    elements = []
+    for v in value:
+        fast = _set_element_encoders.get(type(v))
+        if fast is None:
+            element_type, element = _encode_set_element(v)
+        else:
+            element_type, element = fast[0], fast[1](v)
+        if element_type != db_type:
+            if db_type is not None:
+                raise TypeError
+            db_type = element_type
+        elements.append(element)
+    return {db_type: elements}
+
+
+def _encode_set_element(value):
+    # Subclasses and registered types are encoded as standalone values, which must be scalar
+    attribute = _convert_value_to_db(value)
+    if len(attribute) == 1:
+        for db_type in ("S", "N", "B"):
+            if db_type in attribute:
+                return db_type + "S", attribute[db_type]
+    raise TypeError
+
+
+def _encode_list(value):
+    return {"L": [_convert_value_to_db(v) for v in value]}
+
+
+def _encode_map(value):
+    return {"M": {n: _convert_value_to_db(v) for n, v in value.iteritems()}}
+
+
+def _encode_unsupported(value):
+    raise TypeError
+
+
+def _b64encode(value):
+    return base64.b64encode(value).decode("utf8")
+
+
+# Encoders by exact type. _dispatch caches the encoder of each type seen, including subclasses and unsupported types.
+_encoders = {
+    unicode: _encode_string,
+    bytes: _encode_binary,
+    bool: _encode_bool,
+    int: _encode_number,
+    long: _encode_number,
+    type(None): _encode_null,
+    set: _encode_set,
+    frozenset: _encode_set,
+    list: _encode_list,
+    dict: _encode_map,
+}
+_dispatch = {}
+
+_set_element_encoders = {
+    unicode: ("SS", None),
+    bytes: ("BS", _b64encode),
+    int: ("NS", str),
+    long: ("NS", str),
+}
 
 
 def _convert_db_to_dict(attributes):
@@ -139,29 +288,138 @@ def _convert_db_to_dict(attributes):
     }
 
 
+class _LazyDict(MutableMapping):
+    # A dict-like view of attributes in DynamoDB notation, converting each value on first access.
+    # The first modification converts all values, after that it behaves like a plain dict.
+    def __init__(self, attributes):
+        self.__attributes = attributes
+        self.__values = {}
+
+    def __getitem__(self, key):
+        try:
+            return self.__values[key]
+        except KeyError:
+            if self.__attributes is None:
+                raise
+            value = _convert_db_to_value(self.__attributes[key])
+            self.__values[key] = value
+            return value
+
+    def __iter__(self):
+        return iter(self.__values if self.__attributes is None else self.__attributes)
+
+    def __len__(self):
+        return len(self.__values if self.__attributes is None else self.__attributes)
+
+    def __contains__(self, key):
+        return key in (self.__values if self.__attributes is None else self.__attributes)
+
+    def __setitem__(self, key, value):
+        self.__convert_all()
+        self.__values[key] = value
+
+    def __delitem__(self, key):
+        self.__convert_all()
+        del self.__values[key]
+
+    def __convert_all(self):
+        if self.__attributes is not None:
+            for key in self.__attributes:
+                self[key]
+            self.__attributes = None
+
+    def __repr__(self):
+        return repr(dict(self))
+
+    def _to_db(self):
+        # Attributes never accessed are still in DynamoDB notation. Accessed ones may have been modified in place.
+        if self.__attributes is None:
+            return {key: _convert_value_to_db(value) for key, value in self.__values.iteritems()}
+        else:
+            return {
+                key: _convert_value_to_db(self.__values[key]) if key in self.__values else value
+                for key, value in self.__attributes.iteritems()
+            }
+
+
+def _convert_db_to_lazy_dict(attributes):
+    return _LazyDict(attributes)
+
+
+def _encode_lazy_dict(value):
+    return {"M": value._to_db()}
+
+
+_encoders[_LazyDict] = _encode_lazy_dict
+
+
 def _convert_db_to_value(value):
-    if "S" in value:
+    # Strings are the most common values: return them without a call, unless a decoder is registered for them
+    if _plain_strings and "S" in value:
         return value["S"]
-    elif "B" in value:
-        return bytes(base64.b64decode(value["B"].encode("utf8")))
-    elif "BOOL" in value:
-        return value["BOOL"]
-    elif "N" in value:
-        return int(value["N"])
-    elif "NULL" in value:
-        return None
-    elif "NS" in value:
-        return set(int(v) for v in value["NS"])
-    elif "SS" in value:
-        return set(value["SS"])
-    elif "BS" in value:
-        return set(bytes(base64.b64decode(v.encode("utf8"))) for v in value["BS"])
-    elif "L" in value:
-        return [_convert_db_to_value(v) for v in value["L"]]
-    elif "M" in value:
-        return {n: _convert_db_to_value(v) for n, v in value["M"].iteritems()}
-    else:
-        raise TypeError
+    # A value in DynamoDB notation has a single key: its type
+    for db_type in value:
+        try:
+            decoder = _decoders[db_type]
+        except KeyError:
+            raise TypeError
+        return decoder(value[db_type])
+    raise TypeError
+
+
+def _decode_string(value):
+    return value
+
+
+def _decode_binary(value):
+    return bytes(base64.b64decode(value.encode("utf8")))
+
+
+def _decode_bool(value):
+    return value
+
+
+def _decode_null(value):
+    return None
+
+
+def _decode_number_set(values):
+    decode = _decoders["N"]
+    return set(decode(v) for v in values)
+
+
+def _decode_string_set(values):
+    decode = _decoders["S"]
+    return set(values) if decode is _decode_string else set(decode(v) for v in values)
+
+
+def _decode_binary_set(values):
+    decode = _decoders["B"]
+    return set(decode(v) for v in values)
+
+
+def _decode_list(values):
+    return [_convert_db_to_value(v) for v in values]
+
+
+def _decode_map(values):
+    return {n: _convert_db_to_value(v) for n, v in values.iteritems()}
+
+
+# Decoders by DynamoDB type
+_decoders = {
+    "S": _decode_string,
+    "B": _decode_binary,
+    "BOOL": _decode_bool,
+    "N": int,
+    "NULL": _decode_null,
+    "NS": _decode_number_set,
+    "SS": _decode_string_set,
+    "BS": _decode_binary_set,
+    "L": _decode_list,
+    "M": _decode_map,
+}
+_plain_strings = True
 
 
 class ConversionUnitTests(_tst.UnitTests):
@@ -269,3 +527,145 @@ class ConversionUnitTests(_tst.UnitTests):
 
     def test_convert_db_to_dict(self):
         self.assertEqual(_convert_db_to_dict({"a": {"N": "42"}}), {"a": 42})
+
+    def test_convert_db_to_lazy_dict(self):
+        d = _convert_db_to_lazy_dict({"a": {"N": "42"}, "b": {"S": u"foo"}})
+        self.assertEqual(d, {"a": 42, "b": u"foo"})
+        self.assertEqual(repr(d), repr({"a": 42, "b": u"foo"}))
+        self.assertEqual(sorted(d.keys()), ["a", "b"])
+        self.assertEqual(len(d), 2)
+        self.assertIn("a", d)
+        self.assertNotIn("c", d)
+        with self.assertRaises(KeyError):
+            d["c"]
+
+    def test_lazy_dict_converts_each_attribute_once(self):
+        attributes = {"a": {"N": "42"}, "b": {"NS": ["1"]}}
+        d = _convert_db_to_lazy_dict(attributes)
+        self.assertEqual(d["a"], 42)
+        attributes["a"] = {"N": "57"}
+        attributes["b"] = {"N": "43"}
+        self.assertEqual(d["a"], 42)
+        self.assertEqual(d["b"], 43)
+
+    def test_lazy_dict_values_are_stable(self):
+        d = _convert_db_to_lazy_dict({"a": {"NS": ["42"]}})
+        d["a"].add(43)
+        self.assertEqual(d["a"], set([42, 43]))
+
+    def test_convert_lazy_dict_to_db(self):
+        d = _convert_db_to_lazy_dict({"a": {"N": "42"}})
+        self.assertEqual(_convert_dict_to_db(d), {"a": {"N": "42"}})
+        self.assertEqual(_convert_value_to_db(d), {"M": {"a": {"N": "42"}}})
+
+    def test_lazy_dict_to_db_reuses_unaccessed_attributes(self):
+        attributes = {"a": {"N": "42"}, "b": {"NS": ["1"]}}
+        d = _convert_db_to_lazy_dict(attributes)
+        d["b"].add(2)
+        converted = _convert_dict_to_db(d)
+        self.assertIs(converted["a"], attributes["a"])
+        self.assertEqual(sorted(converted["b"]["NS"]), ["1", "2"])
+        self.assertEqual(_convert_value_to_db([d]), {"L": [{"M": converted}]})
+
+    def test_modify_lazy_dict(self):
+        attributes = {"a": {"N": "42"}, "b": {"N": "43"}}
+        d = _convert_db_to_lazy_dict(attributes)
+        d["c"] = 44
+        del d["a"]
+        self.assertEqual(d, {"b": 43, "c": 44})
+        self.assertEqual(attributes, {"a": {"N": "42"}, "b": {"N": "43"}})
+        with self.assertRaises(KeyError):
+            d["a"]
+
+
+class ConversionRegistryUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(ConversionRegistryUnitTests, self).setUp()
+        self.encoders = dict(_encoders)
+        self.decoders = dict(_decoders)
+
+    def tearDown(self):
+        _encoders.clear()
+        _encoders.update(self.encoders)
+        _dispatch.clear()
+        for db_type in list(_decoders):
+            if db_type not in self.decoders:
+                del _decoders[db_type]
+        for db_type, decoder in self.decoders.iteritems():
+            register_decoder(db_type, decoder)
+        super(ConversionRegistryUnitTests, self).tearDown()
+
+    def test_convert_subclasses_to_db(self):
+        class MyUnicode(unicode):
+            pass
+
+        class MyDict(dict):
+            pass
+
+        self.assertEqual(_convert_value_to_db(MyUnicode(u"foo")), {"S": u"foo"})
+        self.assertEqual(_convert_value_to_db(MyDict(a=42)), {"M": {"a": {"N": "42"}}})
+        self.assertEqual(_convert_value_to_db(set([MyUnicode(u"foo")])), {"SS": [u"foo"]})
+
+    def test_convert_set_of_int_and_long_to_db(self):
+        self.assertEqual(sorted(_convert_value_to_db(set([1, 2 ** 70]))["NS"]), ["1", str(2 ** 70)])
+
+    def test_convert_set_of_bool_to_db(self):
+        with self.assertRaises(TypeError):
+            _convert_value_to_db(set([True]))
+
+    def test_convert_unsupported_type_to_db(self):
+        with self.assertRaises(TypeError):
+            _convert_value_to_db(decimal.Decimal("1.5"))
+        # Also when cached
+        with self.assertRaises(TypeError):
+            _convert_value_to_db(decimal.Decimal("1.5"))
+
+    def test_convert_db_to_unknown_type(self):
+        with self.assertRaises(TypeError):
+            _convert_db_to_value({"X": "42"})
+
+    def test_register_encoder(self):
+        with self.assertRaises(TypeError):
+            _convert_value_to_db(decimal.Decimal("1.5"))
+        register_encoder(decimal.Decimal, lambda d: {"N": str(d)})
+        self.assertEqual(_convert_value_to_db(decimal.Decimal("1.5")), {"N": "1.5"})
+        self.assertEqual(_convert_value_to_db([decimal.Decimal("1.5")]), {"L": [{"N": "1.5"}]})
+        self.assertEqual(_convert_value_to_db(set([decimal.Decimal("1.5")])), {"NS": ["1.5"]})
+        self.assertIn(_convert_value_to_db(set([decimal.Decimal("1.5"), 2])), [{"NS": ["1.5", "2"]}, {"NS": ["2", "1.5"]}])
+        with self.assertRaises(TypeError):
+            _convert_value_to_db(set([decimal.Decimal("1.5"), u"2"]))
+
+    def test_register_encoder_for_subclasses(self):
+        class Base(object):
+            pass
+
+        class Derived(Base):
+            pass
+
+        register_encoder(Base, lambda v: {"S": u"base"})
+        self.assertEqual(_convert_value_to_db(Derived()), {"S": u"base"})
+        register_encoder(Derived, lambda v: {"S": u"derived"})
+        self.assertEqual(_convert_value_to_db(Derived()), {"S": u"derived"})
+        self.assertEqual(_convert_value_to_db(Base()), {"S": u"base"})
+
+    def test_register_encoder_overrides_builtin(self):
+        register_encoder(list, lambda l: {"NS": [str(n) for n in l]})
+        self.assertEqual(_convert_value_to_db([1, 2]), {"NS": ["1", "2"]})
+
+    def test_register_decoder(self):
+        register_decoder("N", decimal.Decimal)
+        self.assertEqual(_convert_db_to_value({"N": "1.5"}), decimal.Decimal("1.5"))
+        self.assertEqual(_convert_db_to_value({"NS": ["1.5"]}), set([decimal.Decimal("1.5")]))
+        self.assertEqual(_convert_db_to_value({"M": {"a": {"N": "1.5"}}}), {"a": decimal.Decimal("1.5")})
+
+    def test_register_string_decoder(self):
+        register_decoder("S", lambda s: s.upper())
+        self.assertEqual(_convert_db_to_value({"S": u"foo"}), u"FOO")
+        self.assertEqual(_convert_db_to_value({"SS": [u"foo"]}), set([u"FOO"]))
+        self.assertEqual(_convert_db_to_lazy_dict({"a": {"S": u"foo"}})["a"], u"FOO")
+        register_decoder("S", _decode_string)
+        self.assertEqual(_convert_db_to_value({"S": u"foo"}), u"foo")
+
+    def test_register_decoder_for_new_type(self):
+        register_decoder("X", int)
+        self.assertEqual(_convert_db_to_value({"X": "42"}), 42)
@@ -71,6 +71,16 @@ class GetItemResponse(object):
         if _is_dict(self.__item):
             return _convert_db_to_dict(self.__item)
 
+    @property
+    def raw_item(self):
+        """
+        The item you just got, exactly as returned by DynamoDB, without any conversion.
+
+        :type: ``None`` or dict
+        """
+        if _is_dict(self.__item):
+            return self.__item
+
 
 class GetItem(Action):
     """
@@ -303,3 +313,8 @@ class GetItemResponseUnitTests(_tst.UnitTests):
         r = GetItemResponse(ConsumedCapacity={}, Item={"h": {"S": "a"}})
         self.assertIsInstance(r.consumed_capacity, ConsumedCapacity)
         self.assertEqual(r.item, {"h": u"a"})
+
+    def test_raw_item(self):
+        item = {"h": {"S": "a"}}
+        self.assertIs(GetItemResponse(Item=item).raw_item, item)
+        self.assertIsNone(GetItemResponse().raw_item)
@@ -4,6 +4,10 @@
 
 import numbers
 import inspect
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
 
 import LowVoltage.exceptions as _exn
 import LowVoltage.testing as _tst
@@ -76,7 +80,7 @@ def plain_parameter_mixin(typ):
 
 class ItemParameterMixin(object):
     def _convert(self, item):
-        if isinstance(item, dict):
+        if isinstance(item, Mapping):
             return _convert_dict_to_db(item)
         else:
             raise TypeError("Parameter {} must be a dict.".format(self._name))
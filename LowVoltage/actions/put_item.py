@@ -265,6 +265,16 @@ class PutItemUnitTests(_tst.UnitTests):
             }
         )
 
+    def test_item_from_a_response(self):
+        item = _lv.ScanResponse(Items=[{"hash": {"S": u"value"}}]).lazy_items[0]
+        self.assertEqual(
+            PutItem("Table", item).payload,
+            {
+                "TableName": "Table",
+                "Item": {"hash": {"S": "value"}},
+            }
+        )
+
     def test_return_values_none(self):
         self.assertEqual(
             PutItem("Table", {"hash": u"h"}).return_values_none().payload,
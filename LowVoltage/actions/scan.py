@@ -21,7 +21,7 @@ See also the :func:`.iterate_scan` compound. And :ref:`actions-vs-compounds` in
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from .action import Action
-from .conversion import _convert_db_to_dict
+from .conversion import _convert_db_to_dict, _convert_db_to_lazy_dict
 from .next_gen_mixins import proxy
 from .next_gen_mixins import OptionalIntParameter
 from .next_gen_mixins import (
@@ -58,6 +58,8 @@ class ScanResponse(object):
         self.__consumed_capacity = ConsumedCapacity
         self.__count = Count
         self.__items = Items
+        self.__converted_items = None
+        self.__lazy_items = None
         self.__last_evaluated_key = LastEvaluatedKey
         self.__scanned_count = ScannedCount
 
@@ -85,11 +87,39 @@ class ScanResponse(object):
     def items(self):
         """
         The items matching the scan. Unless you used :meth:`.Scan.select_count`.
+        Items are converted from DynamoDB notation the first time this property is read,
+        and the same list is returned after that.
+
+        :type: ``None`` or list of dict
+        """
+        if self.__converted_items is None and _is_list_of_dict(self.__items):
+            self.__converted_items = [_convert_db_to_dict(i) for i in self.__items]
+        return self.__converted_items
+
+    @property
+    def lazy_items(self):
+        """
+        The same items as :attr:`items`, as :class:`collections.MutableMapping` instances
+        converting each attribute from DynamoDB notation when it is first accessed.
+        Useful when you only look at a few attributes of large items.
+        They are accepted by all actions and compounds:
+        use ``dict(item)`` where a real ``dict`` is needed, for example with ``json.dumps``.
+
+        :type: ``None`` or list of :class:`collections.MutableMapping`
+        """
+        if self.__lazy_items is None and _is_list_of_dict(self.__items):
+            self.__lazy_items = [_convert_db_to_lazy_dict(i) for i in self.__items]
+        return self.__lazy_items
+
+    @property
+    def raw_items(self):
+        """
+        The items matching the scan, exactly as returned by DynamoDB, without any conversion.
 
         :type: ``None`` or list of dict
         """
         if _is_list_of_dict(self.__items):
-            return [_convert_db_to_dict(i) for i in self.__items]
+            return self.__items
 
     @property
     def last_evaluated_key(self):
@@ -372,3 +402,20 @@ class ScanResponseUnitTests(_tst.UnitTests):
         self.assertEqual(r.items, [{"h": "a"}])
         self.assertEqual(r.last_evaluated_key, {"h": "b"})
         self.assertEqual(r.scanned_count, 2)
+
+    def test_raw_items(self):
+        items = [{"h": {"S": "a"}}]
+        r = ScanResponse(Items=items)
+        self.assertIs(r.raw_items, items)
+
+    def test_items_are_converted_once(self):
+        r = ScanResponse(Items=[{"h": {"S": "a"}}])
+        self.assertIs(r.items, r.items)
+        self.assertEqual(r.items, [{"h": "a"}])
+        self.assertIs(type(r.items[0]), dict)
+
+    def test_lazy_items(self):
+        r = ScanResponse(Items=[{"h": {"S": "a"}}])
+        self.assertIs(r.lazy_items, r.lazy_items)
+        self.assertEqual(r.lazy_items, [{"h": "a"}])
+        self.assertIsNot(r.lazy_items[0], r.items[0])
@@ -2,7 +2,7 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
-from ..conversion import ConversionUnitTests
+from ..conversion import ConversionUnitTests, ConversionRegistryUnitTests
 from ..expressions import ConditionExpressionUnitTests
 from ..return_types import (
     TableDescriptionUnitTests,
@@ -0,0 +1,41 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+End-to-end benchmarks of compounds, through a real :class:`.Connection` to an :class:`.InMemoryDynamoDb`.
+They include the time spent by the in-memory engine, so they are best compared with each other and with a baseline,
+not with timings against DynamoDB.
+
+Run them with ``python -m LowVoltage.benchmarks.suite --filter compounds``.
+"""
+
+import LowVoltage as _lv
+from LowVoltage.testing import InMemoryDynamoDb
+from .hot_path import make_item
+
+
+def get_benchmarks(items_count=100):
+    """
+    Return the list of (name, function) of the benchmarks of this module.
+    Each benchmark reads or writes ``items_count`` items.
+    """
+    connection = InMemoryDynamoDb().connection()
+    connection(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).range_key("r", _lv.NUMBER).provisioned_throughput(1, 1))
+    items = [dict(make_item(), h=u"customer-{:08}".format(i // 10), r=i) for i in range(items_count)]
+    keys = [{"h": item["h"], "r": item["r"]} for item in items]
+    _lv.batch_put_item(connection, "Aaa", items)
+
+    def buffered_batch_writer():
+        with _lv.BufferedBatchWriter(connection, key_names={"Aaa": ["h", "r"]}) as writer:
+            for item in items:
+                writer.put("Aaa", item)
+
+    return [
+        ("compounds/GetItem", lambda: connection(_lv.GetItem("Aaa", keys[0])).item),
+        ("compounds/batch_put_item", lambda: _lv.batch_put_item(connection, "Aaa", items)),
+        ("compounds/BufferedBatchWriter", buffered_batch_writer),
+        ("compounds/iterate_batch_get_item", lambda: list(_lv.iterate_batch_get_item(connection, "Aaa", keys))),
+        ("compounds/iterate_query", lambda: list(_lv.iterate_query(connection, _lv.Query("Aaa").key_eq("h", items[0]["h"]).limit(3)))),
+        ("compounds/iterate_scan", lambda: list(_lv.iterate_scan(connection, _lv.Scan("Aaa").limit(25)))),
+    ]
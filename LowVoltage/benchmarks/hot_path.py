@@ -0,0 +1,148 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Benchmarks of the client-side stages of each request, in isolation:
+building the payloads of actions, converting attributes to and from DynamoDB notation,
+encoding and decoding JSON, signing, parsing responses and wrapping them in return types.
+
+Run them with ``python -m LowVoltage.benchmarks.suite --filter hot_path``.
+"""
+
+import datetime
+import hashlib
+
+import LowVoltage as _lv
+from LowVoltage.actions.conversion import _convert_value_to_db, _convert_db_to_value
+from LowVoltage.actions.return_types import TableDescription
+from LowVoltage.connection.connection import Signer, Responder
+from LowVoltage.connection.json_codecs import DEFAULT
+from .json_codecs import make_query_page
+
+
+def make_item():
+    """
+    Return a typical item, with a few attributes of each type.
+    """
+    return {
+        "h": u"customer-00000042",
+        "r": 1420070400,
+        "status": u"délivré",
+        "amount": 12345,
+        "tags": set([u"tag-1", u"tag-2", u"tag-3"]),
+        "address": {"street": u"12 rue de la Paix", "city": u"Paris", "zip": 75002},
+        "history": [1, 2, 3],
+        "active": True,
+    }
+
+
+def make_values():
+    """
+    Return values of realistic shapes, by name: the typical item and larger ones.
+    """
+    return [
+        ("item", make_item()),
+        ("wide_map", dict((u"attribute-{}".format(i), i if i % 2 else u"value-{}".format(i)) for i in range(200))),
+        ("large_number_set", set(range(1000))),
+        ("large_string_set", set(u"element-{}".format(i) for i in range(1000))),
+        ("nested_lists", [[[i, u"x" * i] for i in range(10)] for j in range(10)]),
+        ("big_binary", b"\x00\x01\x02\x03" * 100000),
+    ]
+
+
+class _Response(object):
+    def __init__(self, content):
+        self.status_code = 200
+        self.content = content
+        self.text = content.decode("utf-8")
+
+
+def get_benchmarks():
+    """
+    Return the list of (name, function) of the benchmarks of this module.
+    """
+    benchmarks = []
+
+    item = make_item()
+    key = {"h": item["h"], "r": item["r"]}
+    keys = [{"h": u"customer-{:08}".format(i), "r": i} for i in range(100)]
+    items = [dict(item, h=u"customer-{:08}".format(i)) for i in range(25)]
+    benchmarks += [
+        ("hot_path/payload/PutItem", lambda: _lv.PutItem("Aaa", item).condition_expression("attribute_not_exists(h)").payload),
+        ("hot_path/payload/GetItem", lambda: _lv.GetItem("Aaa", key).project("status", "amount").consistent_read_true().payload),
+        ("hot_path/payload/UpdateItem", lambda: (
+            _lv.UpdateItem("Aaa", key)
+                .set("status", "s").add("amount", "one").remove("tags")
+                .expression_attribute_value("s", u"pending").expression_attribute_value("one", 1)
+                .return_values_all_new()
+        ).payload),
+        ("hot_path/payload/DeleteItem", lambda: _lv.DeleteItem("Aaa", key).return_values_all_old().payload),
+        ("hot_path/payload/Query", lambda: (
+            _lv.Query("Aaa").key_eq("h", item["h"]).key_between("r", 0, 1500000000)
+                .filter_expression("#s = :s").expression_attribute_name("s", "status").expression_attribute_value("s", u"pending")
+                .limit(100)
+        ).payload),
+        ("hot_path/payload/Scan", lambda: _lv.Scan("Aaa").segment(3, 8).project("h", "r", "status").limit(100).payload),
+        ("hot_path/payload/BatchGetItem", lambda: _lv.BatchGetItem().table("Aaa").keys(keys).project("status").payload),
+        ("hot_path/payload/BatchWriteItem", lambda: _lv.BatchWriteItem().table("Aaa").put(items).payload),
+    ]
+
+    for name, value in make_values():
+        db_value = _convert_value_to_db(value)
+        benchmarks += [
+            ("hot_path/convert_to_db/" + name, lambda value=value: _convert_value_to_db(value)),
+            ("hot_path/convert_from_db/" + name, lambda db_value=db_value: _convert_db_to_value(db_value)),
+        ]
+
+    payload = _lv.BatchWriteItem().table("Aaa").put(items).payload
+    page = make_query_page(64 * 1024)
+    body = DEFAULT.encode(page).encode("utf-8")
+    benchmarks += [
+        ("hot_path/json/encode_BatchWriteItem", lambda: DEFAULT.encode(payload)),
+        ("hot_path/json/decode_Query_page_64kB", lambda: DEFAULT.decode(body)),
+    ]
+
+    signer = Signer("us-west-2", "dynamodb.us-west-2.amazonaws.com")
+    now = datetime.datetime(2015, 1, 1, 12, 0, 0)
+    body_hash = hashlib.sha256(DEFAULT.encode(payload).encode("utf-8")).hexdigest()
+    benchmarks.append(("hot_path/sign", lambda: signer("DummyKey", "DummySecret", now, "BatchWriteItem", body_hash)))
+
+    responder = Responder(DEFAULT)
+    response = _Response(body)
+    benchmarks.append(("hot_path/respond/Query_page_64kB", lambda: responder(_lv.QueryResponse, response)))
+
+    description = {
+        "AttributeDefinitions": [{"AttributeName": "h", "AttributeType": "S"}, {"AttributeName": "r", "AttributeType": "N"}],
+        "CreationDateTime": 1420070400.,
+        "ItemCount": 1000,
+        "KeySchema": [{"AttributeName": "h", "KeyType": "HASH"}, {"AttributeName": "r", "KeyType": "RANGE"}],
+        "ProvisionedThroughput": {"NumberOfDecreasesToday": 0, "ReadCapacityUnits": 10, "WriteCapacityUnits": 5},
+        "TableName": "Aaa",
+        "TableSizeBytes": 100000,
+        "TableStatus": "ACTIVE",
+        "GlobalSecondaryIndexes": [{
+            "IndexName": "gsi",
+            "IndexStatus": "ACTIVE",
+            "KeySchema": [{"AttributeName": "r", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "ALL"},
+            "ProvisionedThroughput": {"ReadCapacityUnits": 10, "WriteCapacityUnits": 5},
+        }],
+    }
+    benchmarks += [
+        ("hot_path/return_types/Query_page_64kB_items", lambda: [dict(i) for i in _lv.QueryResponse(**page).items]),
+        ("hot_path/return_types/TableDescription", lambda: _read_table_description(TableDescription(**description))),
+        ("hot_path/return_types/ConsumedCapacity", lambda: _lv.PutItemResponse(ConsumedCapacity={"TableName": "Aaa", "CapacityUnits": 1.}).consumed_capacity.capacity_units),
+    ]
+
+    return benchmarks
+
+
+def _read_table_description(description):
+    return (
+        [(d.attribute_name, d.attribute_type) for d in description.attribute_definitions],
+        [(k.attribute_name, k.key_type) for k in description.key_schema],
+        description.provisioned_throughput.read_capacity_units,
+        [(i.index_name, i.index_status, i.projection.projection_type) for i in description.global_secondary_indexes],
+        description.table_status,
+    )
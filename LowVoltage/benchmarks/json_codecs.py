@@ -0,0 +1,81 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Compare JSON codecs on a realistic 1MB :class:`.Query` response page.
+
+Run with ``python -m LowVoltage.benchmarks.json_codecs``.
+Codecs based on `simplejson <https://pypi.python.org/pypi/simplejson>`__ and `ujson <https://pypi.python.org/pypi/ujson>`__
+are included if those packages are installed.
+"""
+
+import timeit
+
+from LowVoltage.connection.json_codecs import DEFAULT, JsonCodec
+
+
+def make_query_page(size=1024 * 1024):
+    """
+    Return the body of a Query response, in DynamoDB notation, of about ``size`` bytes once encoded.
+    """
+    items = []
+    page = {"Count": 0, "ScannedCount": 0, "Items": items, "LastEvaluatedKey": None}
+    encoded_size = 0
+    while encoded_size < size:
+        i = len(items)
+        item = {
+            "h": {"S": u"customer-{:08}".format(i // 100)},
+            "r": {"N": str(1420070400 + i)},
+            "status": {"S": u"délivré" if i % 3 else u"pending"},
+            "amount": {"N": str(i * 137 % 100000)},
+            "tags": {"SS": [u"tag-{}".format(t) for t in range(i % 7 + 1)]},
+            "scores": {"NS": [str(s * 31 % 997) for s in range(i % 5 + 1)]},
+            "thumbnail": {"B": u"iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAADUlEQVR42mNkYPhfDwAChwGA60e6kgAAAABJRU5ErkJggg=="},
+            "address": {"M": {
+                "street": {"S": u"{} rue de la Paix".format(i % 200)},
+                "city": {"S": u"Paris"},
+                "zip": {"N": "75002"},
+            }},
+            "history": {"L": [{"N": str(h)} for h in range(i % 4)]},
+            "active": {"BOOL": i % 2 == 0},
+            "comment": {"S": u"x" * (i % 120)},
+        }
+        items.append(item)
+        encoded_size += len(DEFAULT.encode(item)) + 2
+    page["Count"] = page["ScannedCount"] = len(items)
+    page["LastEvaluatedKey"] = {"h": items[-1]["h"], "r": items[-1]["r"]}
+    return page
+
+
+def get_codecs():
+    codecs = [("json (DEFAULT)", DEFAULT)]
+    try:
+        import simplejson
+    except ImportError:
+        pass
+    else:
+        codecs.append(("simplejson", JsonCodec(dumps=simplejson.dumps, loads=simplejson.loads)))
+    try:
+        import ujson
+    except ImportError:
+        pass
+    else:
+        codecs.append(("ujson", JsonCodec(dumps=ujson.dumps, loads=ujson.loads)))
+    return codecs
+
+
+def main(repeat=5, number=10):
+    page = make_query_page()
+    body = DEFAULT.encode(page).encode("utf-8")
+    print("Query page: {} items, {} bytes".format(len(page["Items"]), len(body)))
+    print("{:<16} {:>12} {:>12}".format("codec", "encode (ms)", "decode (ms)"))
+    for name, codec in get_codecs():
+        assert codec.decode(codec.encode(page).encode("utf-8")) == codec.decode(body)
+        encode = min(timeit.repeat(lambda: codec.encode(page), repeat=repeat, number=number)) / number
+        decode = min(timeit.repeat(lambda: codec.decode(body), repeat=repeat, number=number)) / number
+        print("{:<16} {:>12.2f} {:>12.2f}".format(name, encode * 1000, decode * 1000))
+
+
+if __name__ == "__main__":
+    main()
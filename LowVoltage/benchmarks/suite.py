@@ -0,0 +1,157 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Run all benchmarks of :mod:`LowVoltage.benchmarks.hot_path` and :mod:`LowVoltage.benchmarks.compounds`,
+store their results as a baseline, and compare later runs with it.
+
+Run with ``python -m LowVoltage.benchmarks.suite``. Options:
+
+- ``--save FILE`` stores the results in ``FILE``, as JSON;
+- ``--baseline FILE`` prints a comparison of the results with the baseline stored in ``FILE``;
+- ``--filter TEXT`` runs only the benchmarks whose name contains ``TEXT``.
+
+Typically, save a baseline before an upgrade (or a change), and compare with it afterwards, on the same machine::
+
+    python -m LowVoltage.benchmarks.suite --save before.json
+    # upgrade
+    python -m LowVoltage.benchmarks.suite --baseline before.json
+"""
+
+import argparse
+import collections
+import json
+import platform
+import timeit
+
+import LowVoltage.testing as _tst
+from . import hot_path, compounds
+
+
+def measure(function, repeat=5, min_time=0.05):
+    """
+    Return the time (in seconds) of a call to ``function``: the best of ``repeat`` measures,
+    each calling it enough times to last at least ``min_time`` seconds.
+    """
+    number = 1
+    while True:
+        elapsed = timeit.timeit(function, number=number)
+        if elapsed >= min_time or number >= 1000000:
+            break
+        number *= 10
+    times = [elapsed] + timeit.repeat(function, repeat=repeat - 1, number=number)
+    return min(times) / number
+
+
+def run(benchmarks, repeat=5, min_time=0.05, progress=None):
+    """
+    Measure each benchmark and return an ordered dict of name to time per call.
+
+    :param benchmarks: a list of (name, function).
+    :param progress: ``None`` or a function called with each name and time, as soon as it's measured.
+    """
+    results = collections.OrderedDict()
+    for name, function in benchmarks:
+        results[name] = measure(function, repeat, min_time)
+        if progress is not None:
+            progress(name, results[name])
+    return results
+
+
+def save(results, filename):
+    """
+    Store results in a JSON file.
+    """
+    with open(filename, "w") as f:
+        json.dump({"python": platform.python_version(), "results": results}, f, indent=2, sort_keys=True)
+
+
+def load(filename):
+    """
+    Return the results stored in a JSON file by :func:`save`.
+    """
+    with open(filename) as f:
+        return json.load(f)["results"]
+
+
+def compare(baseline, results, threshold=0.1):
+    """
+    Return the lines of a report comparing results with a baseline.
+    Benchmarks more than ``threshold`` (relatively) slower or faster than their baseline are marked as such.
+    """
+    lines = ["{:<48} {:>12} {:>12} {:>8}".format("benchmark", "before (us)", "after (us)", "change")]
+    for name, after in results.iteritems():
+        before = baseline.get(name)
+        if before is None:
+            lines.append("{:<48} {:>12} {:>12.1f} {:>8}".format(name, "-", after * 1e6, "new"))
+        else:
+            change = after / before - 1
+            if change > threshold:
+                verdict = "slower"
+            elif change < -threshold:
+                verdict = "faster"
+            else:
+                verdict = ""
+            lines.append("{:<48} {:>12.1f} {:>12.1f} {:>+7.1f}% {}".format(name, before * 1e6, after * 1e6, change * 100, verdict).rstrip())
+    return lines
+
+
+def get_benchmarks():
+    """
+    Return the list of (name, function) of all benchmarks.
+    """
+    return hot_path.get_benchmarks() + compounds.get_benchmarks()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LowVoltage's client-side overhead")
+    parser.add_argument("--save", metavar="FILE", help="store results in FILE")
+    parser.add_argument("--baseline", metavar="FILE", help="compare results with the baseline stored in FILE")
+    parser.add_argument("--filter", metavar="TEXT", default="", help="run only benchmarks whose name contains TEXT")
+    parser.add_argument("--repeat", type=int, default=5, help="number of measures of each benchmark")
+    args = parser.parse_args(argv)
+
+    def progress(name, seconds):
+        print("{:<48} {:>12.1f} us".format(name, seconds * 1e6))
+
+    benchmarks = [(name, function) for (name, function) in get_benchmarks() if args.filter in name]
+    results = run(benchmarks, repeat=args.repeat, progress=progress)
+    if args.baseline:
+        print("")
+        for line in compare(load(args.baseline), results):
+            print(line)
+    if args.save:
+        save(results, args.save)
+
+
+class SuiteUnitTests(_tst.UnitTests):
+    def test_compare(self):
+        self.assertEqual(
+            compare(
+                {"a": 1e-6, "b": 2e-6, "c": 1e-6, "d": 1e-6},
+                collections.OrderedDict([("a", 1.08e-6), ("b", 3e-6), ("c", 0.5e-6), ("e", 4e-6)]),
+            ),
+            [
+                "benchmark                                         before (us)   after (us)   change",
+                "a                                                         1.0          1.1    +8.0%",
+                "b                                                         2.0          3.0   +50.0% slower",
+                "c                                                         1.0          0.5   -50.0% faster",
+                "e                                                           -          4.0      new",
+            ]
+        )
+
+    def test_run_all_benchmarks_once(self):
+        # Benchmarks are not tested otherwise, so make sure they keep working
+        for name, function in get_benchmarks():
+            function()
+
+    def test_run(self):
+        calls = []
+        results = run([("a", lambda: calls.append(None))], repeat=3, min_time=0.)
+        self.assertEqual(list(results.keys()), ["a"])
+        self.assertEqual(len(calls), 3)
+
+
+if __name__ == "__main__":
+    main()
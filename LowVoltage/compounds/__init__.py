@@ -3,10 +3,15 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 from .batch_delete_item import batch_delete_item
+from .batch_get_item_loader import BatchGetItemLoader
+from .checkpoints import FileCheckpointStore, checkpointed_iterate_scan, checkpointed_iterate_query, resume_iterate
 from .iterate_batch_get_item import iterate_batch_get_item
 from .batch_put_item import batch_put_item
+from .buffered_batch_writer import BufferedBatchWriter, BufferedWrite
 from .iterate_list_tables import iterate_list_tables
 from .iterate_query import iterate_query
-from .iterate_scan import iterate_scan, parallelize_scan
+from .iterate_scan import iterate_scan, parallelize_scan, parallel_iterate_scan
+from .pipelined_batch_write_item import pipelined_batch_put_item, pipelined_batch_delete_item
+from .table import Table, AccessPlan
 from .wait_for_table_activation import wait_for_table_activation
 from .wait_for_table_deletion import wait_for_table_deletion
@@ -2,12 +2,19 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
+import collections
+import itertools
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from LowVoltage.variadic import variadic
 
 
-@variadic(dict)
+@variadic(Mapping)
 def batch_delete_item(connection, table, *keys):
     """
     Make as many :class:`.BatchWriteItem` actions as needed to delete all specified keys.
@@ -21,18 +28,19 @@ def batch_delete_item(connection, table, *keys):
     ...   {"h": 2}
     ... )
     """
-    keys = list(keys)
-    unprocessed_items = []
+    keys = iter(keys)
+    unprocessed_items = collections.deque()
 
-    while len(keys) != 0:
-        r = connection(_lv.BatchWriteItem().table(table).delete(keys[:25]))
-        keys = keys[25:]
+    chunk = list(itertools.islice(keys, 25))
+    while len(chunk) != 0:
+        r = connection(_lv.BatchWriteItem().table(table).delete(chunk))
         if isinstance(r.unprocessed_items, dict) and table in r.unprocessed_items:
             unprocessed_items.extend(r.unprocessed_items[table])
+        chunk = list(itertools.islice(keys, 25))
 
     while len(unprocessed_items) != 0:
-        r = connection(_lv.BatchWriteItem().previous_unprocessed_items({table: unprocessed_items[:25]}))
-        unprocessed_items = unprocessed_items[25:]
+        chunk = [unprocessed_items.popleft() for i in range(min(25, len(unprocessed_items)))]
+        r = connection(_lv.BatchWriteItem().previous_unprocessed_items({table: chunk}))
         if isinstance(r.unprocessed_items, dict) and table in r.unprocessed_items:
             unprocessed_items.extend(r.unprocessed_items[table])
 
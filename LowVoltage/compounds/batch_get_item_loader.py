@@ -0,0 +1,456 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import base64
+import decimal
+import json
+import re
+import threading
+import time
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from LowVoltage.actions.conversion import _convert_db_to_dict
+
+
+class BatchGetItemLoader(object):
+    """
+    Group :class:`.GetItem` actions made by several threads into :class:`.BatchGetItem` actions.
+
+    The first call to :meth:`get` starts a batch. Calls made in the next ``window`` seconds join it,
+    until it contains ``max_keys`` keys. The batch is then sent as one or a few :class:`.BatchGetItem` actions
+    (including processing :attr:`.BatchGetItemResponse.unprocessed_keys`, after a delay growing from 50ms to 1s),
+    and each caller gets its own item.
+
+    .. Warning, this is NOT doctest. Because the item depends on the order of doctests.
+
+    ::
+
+        >>> loader = BatchGetItemLoader(connection)
+        >>> loader.get(GetItem(table, {"h": 0}))
+        {u'h': 0, u'gr': 10, u'gh': 0}
+
+    :class:`.GetItem` actions on the same table with the same consistent read and projection options are sent together.
+    Key attributes are added to projections to match items with callers, and removed before returning items.
+    Identical keys in the same batch are fetched only once.
+    If DynamoDB rejects a :class:`.BatchGetItem` with a non-retryable error, like a :exc:`.ValidationException` caused by an invalid key,
+    its keys are sent again one by one, so that only the callers of invalid keys get the exception.
+    :meth:`~.GetItem.return_consumed_capacity_total` and similar are ignored.
+
+    :param connection: the connection. It must be usable from several threads.
+    :param window: the maximum time a call to :meth:`get` waits for other calls before sending the batch, in seconds.
+    :param max_keys: the maximum number of keys in a batch. :class:`.BatchGetItem` accepts at most 100.
+    """
+
+    def __init__(self, connection, window=0.005, max_keys=100):
+        self.__connection = connection
+        self.__window = window
+        self.__max_keys = max_keys
+        self.__lock = threading.Lock()
+        self.__batch = None
+
+        # Dependency injection through monkey-patching
+        self.__sleep = time.sleep
+
+    def get(self, action):
+        """
+        Add a :class:`.GetItem` action to the current batch, wait for the batch to be sent and return the item.
+
+        :param action: a :class:`.GetItem`.
+        :type: ``None`` or dict
+        :raise: the exception raised by the connection for the :class:`.BatchGetItem` containing the key.
+        """
+        payload = action.payload
+        group = (
+            payload["TableName"],
+            payload.get("ConsistentRead", False),
+            payload.get("ProjectionExpression"),
+            json.dumps(payload.get("ExpressionAttributeNames"), sort_keys=True),
+        )
+        key = payload["Key"]
+        request = _Request(key)
+        with self.__lock:
+            batch = self.__batch
+            leader = batch is None
+            if leader:
+                batch = self.__batch = _Batch()
+            batch.add(group, request)
+            if batch.keys >= self.__max_keys:
+                self.__batch = None
+                batch.full.set()
+        if leader:
+            batch.full.wait(self.__window)
+            with self.__lock:
+                if self.__batch is batch:
+                    self.__batch = None
+            self.__send(batch)
+        request.done.wait()
+        if request.exception is not None:
+            raise request.exception
+        return request.item
+
+    def __send(self, batch):
+        try:
+            # A table can appear only once in a BatchGetItem: groups of the same table are sent in successive actions
+            groups = [_Group(group, requests) for group, requests in batch.groups.iteritems()]
+            while groups:
+                tables = {}
+                remaining = []
+                for group in groups:
+                    if group.table in tables:
+                        remaining.append(group)
+                    else:
+                        tables[group.table] = group
+                self.__send_groups(tables)
+                groups = remaining
+        except Exception as e:
+            batch.fail(e)
+        finally:
+            batch.finish()
+
+    def __send_groups(self, tables):
+        try:
+            self.__send_request_items(tables, {table: group.request_items() for table, group in tables.iteritems()})
+        except _exn.Error as e:
+            if e.retryable or sum(len(group.pending_keys()) for group in tables.itervalues()) <= 1:
+                for group in tables.itervalues():
+                    group.fail(e)
+            else:
+                # A single invalid key fails the whole BatchGetItem: send keys one by one so that only its callers get the exception
+                for table, group in tables.iteritems():
+                    for key in group.pending_keys():
+                        try:
+                            self.__send_request_items({table: group}, {table: group.request_items([key])})
+                        except Exception as e:
+                            group.fail(e, key)
+        except Exception as e:
+            for group in tables.itervalues():
+                group.fail(e)
+
+    def __send_request_items(self, tables, request_items):
+        resends = 0
+        while request_items:
+            if resends:
+                self.__sleep(_unprocessed_keys_delay(resends))
+            r = self.__connection(_lv.BatchGetItem().previous_unprocessed_keys(request_items))
+            for table, items in (r.raw_responses or {}).iteritems():
+                for item in items:
+                    tables[table].found(item)
+            request_items = r.unprocessed_keys
+            resends += 1
+
+
+def _unprocessed_keys_delay(resends):
+    # Unprocessed keys mean that the tables are throttled: wait 50ms before sending them again, twice longer each time, up to 1s
+    return min(1., 0.05 * 2 ** (resends - 1))
+
+
+class _Request(object):
+    def __init__(self, key):
+        self.key = key
+        self.done = threading.Event()
+        self.item = None
+        self.exception = None
+
+
+class _Batch(object):
+    def __init__(self):
+        self.full = threading.Event()
+        # group -> (normalized key -> list of _Request)
+        self.groups = {}
+        self.keys = 0
+
+    def add(self, group, request):
+        requests = self.groups.setdefault(group, {}).setdefault(_normalized_key(request.key), [])
+        if not requests:
+            self.keys += 1
+        requests.append(request)
+
+    def fail(self, exception):
+        # Requests already done got their item
+        for requests in self.groups.itervalues():
+            for same_key_requests in requests.itervalues():
+                for request in same_key_requests:
+                    if not request.done.is_set():
+                        request.exception = exception
+
+    def finish(self):
+        for requests in self.groups.itervalues():
+            for same_key_requests in requests.itervalues():
+                for request in same_key_requests:
+                    request.done.set()
+
+
+class _Group(object):
+    # Requests are done as soon as their item is found, or when they fail.
+    # Requests still pending after all their keys have been sent are done by _Batch.finish: their item is missing.
+    def __init__(self, group, requests):
+        self.table, consistent_read, projection, names = group
+        self.__requests = requests
+        key_names = sorted(next(requests.itervalues())[0].key.keys())
+        self.__key_names = key_names
+        self.__added_names = []
+        self.__request_items = {}
+        if consistent_read:
+            self.__request_items["ConsistentRead"] = True
+        names = dict(json.loads(names) or {})
+        if projection is not None:
+            projected = set(names.get(name, name) for name in _top_level_names(projection))
+            for key_name in key_names:
+                if key_name not in projected:
+                    placeholder = "#lvk{}".format(len(self.__added_names))
+                    names[placeholder] = key_name
+                    projection += ", " + placeholder
+                    self.__added_names.append(key_name)
+            self.__request_items["ProjectionExpression"] = projection
+        if names:
+            self.__request_items["ExpressionAttributeNames"] = names
+
+    def pending_keys(self):
+        return [key for key, same_key_requests in self.__requests.iteritems() if not same_key_requests[0].done.is_set()]
+
+    def request_items(self, keys=None):
+        if keys is None:
+            keys = self.pending_keys()
+        return dict(self.__request_items, Keys=[self.__requests[key][0].key for key in keys])
+
+    def found(self, item):
+        key = _normalized_key({name: item[name] for name in self.__key_names})
+        for request in self.__requests.get(key, []):
+            if not request.done.is_set():
+                request.item = _convert_db_to_dict({name: value for name, value in item.iteritems() if name not in self.__added_names})
+                request.done.set()
+
+    def fail(self, exception, key=None):
+        keys = self.pending_keys() if key is None else [key]
+        for key in keys:
+            for request in self.__requests[key]:
+                if not request.done.is_set():
+                    request.exception = exception
+                    request.done.set()
+
+
+def _normalized_key(key):
+    # Keys of items returned by DynamoDB can be written differently from the requested ones: {"N": "1.50"} is returned as {"N": "1.5"}
+    return tuple(sorted((name, _normalized_key_value(value)) for name, value in key.iteritems()))
+
+
+def _normalized_key_value(value):
+    # Key attributes are strings, numbers or binaries
+    if "N" in value:
+        return ("N", decimal.Decimal(value["N"]))
+    elif "B" in value:
+        return ("B", base64.b64decode(value["B"]))
+    else:
+        return next(value.iteritems())
+
+
+def _top_level_names(projection):
+    for path in projection.split(","):
+        yield re.split(r"[.\[]", path.strip(), 1)[0]
+
+
+class BatchGetItemLoaderUnitTests(_tst.UnitTests):
+    class Connection(object):
+        def __init__(self, responses=None, exception=None):
+            self.lock = threading.Lock()
+            self.payloads = []
+            self.responses = responses or []
+            self.exception = exception
+
+        def __call__(self, action):
+            with self.lock:
+                self.payloads.append(action.payload)
+                if self.exception is not None:
+                    raise self.exception
+                if self.responses:
+                    return _lv.BatchGetItemResponse(**self.responses.pop(0))
+                else:
+                    # Return all requested items, with an attribute "a" equal to the hash key, and the hash key if it's a number
+                    responses = {}
+                    for table, request in action.payload["RequestItems"].iteritems():
+                        responses[table] = [dict(key, a={"S": u"a" + key["h"]["N"]}) for key in request["Keys"] if key["h"]["N"] != "404"]
+                    return _lv.BatchGetItemResponse(Responses=responses)
+
+    def get_all(self, loader, actions):
+        results = [None] * len(actions)
+        exceptions = []
+
+        def get(i, action):
+            try:
+                results[i] = loader.get(action)
+            except Exception as e:
+                exceptions.append(e)
+
+        threads = [threading.Thread(target=get, args=(i, action)) for i, action in enumerate(actions)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, exceptions
+
+    def test_single_get(self):
+        connection = self.Connection()
+        loader = BatchGetItemLoader(connection, window=0)
+        self.assertEqual(loader.get(_lv.GetItem("t", {"h": 42})), {"h": 42, "a": "a42"})
+        self.assertEqual(connection.payloads, [{"RequestItems": {"t": {"Keys": [{"h": {"N": "42"}}]}}}])
+
+    def test_missing_item(self):
+        loader = BatchGetItemLoader(self.Connection(), window=0)
+        self.assertIsNone(loader.get(_lv.GetItem("t", {"h": 404})))
+
+    def test_full_batch_is_sent_before_window(self):
+        connection = self.Connection()
+        loader = BatchGetItemLoader(connection, window=60, max_keys=4)
+        before = time.time()
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": i}) for i in range(4)])
+        self.assertLess(time.time() - before, 30)
+        self.assertEqual(results, [{"h": i, "a": "a{}".format(i)} for i in range(4)])
+        self.assertEqual(len(connection.payloads), 1)
+        self.assertEqual(sorted(k["h"]["N"] for k in connection.payloads[0]["RequestItems"]["t"]["Keys"]), ["0", "1", "2", "3"])
+
+    def test_batches_are_split_at_max_keys(self):
+        connection = self.Connection()
+        loader = BatchGetItemLoader(connection, window=60, max_keys=2)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": i}) for i in range(6)])
+        self.assertEqual(results, [{"h": i, "a": "a{}".format(i)} for i in range(6)])
+        self.assertEqual([len(p["RequestItems"]["t"]["Keys"]) for p in connection.payloads], [2, 2, 2])
+
+    def test_identical_keys_are_fetched_once(self):
+        connection = self.Connection()
+        # Threads can call get in any order, so the batch is sent at the end of the window rather than when it's full
+        loader = BatchGetItemLoader(connection, window=0.5)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 1})])
+        self.assertEqual(results, [{"h": 0, "a": "a0"}, {"h": 0, "a": "a0"}, {"h": 1, "a": "a1"}])
+        self.assertEqual(len(connection.payloads), 1)
+        self.assertEqual(len(connection.payloads[0]["RequestItems"]["t"]["Keys"]), 2)
+        self.assertIsNot(results[0], results[1])
+
+    def test_groups(self):
+        connection = self.Connection()
+        loader = BatchGetItemLoader(connection, window=60, max_keys=4)
+        results, exceptions = self.get_all(loader, [
+            _lv.GetItem("t", {"h": 0}),
+            _lv.GetItem("t", {"h": 1}).consistent_read_true(),
+            _lv.GetItem("u", {"h": 2}),
+            _lv.GetItem("u", {"h": 3}),
+        ])
+        self.assertEqual(results, [{"h": i, "a": "a{}".format(i)} for i in range(4)])
+        self.assertEqual(len(connection.payloads), 2)
+        self.assertEqual(sorted(len(p["RequestItems"]) for p in connection.payloads), [1, 2])
+        self.assertEqual(sorted(p["RequestItems"]["t"].get("ConsistentRead", False) for p in connection.payloads), [False, True])
+
+    def test_projection(self):
+        connection = self.Connection(responses=[{"Responses": {"t": [{"h": {"N": "0"}, "b": {"S": "x"}, "c": {"M": {"d": {"N": "1"}}}}]}}])
+        loader = BatchGetItemLoader(connection, window=0)
+        self.assertEqual(loader.get(_lv.GetItem("t", {"h": 0}).project("b", "c.d")), {"b": "x", "c": {"d": 1}})
+        self.assertEqual(
+            connection.payloads,
+            [{"RequestItems": {"t": {"Keys": [{"h": {"N": "0"}}], "ProjectionExpression": "b, c.d, #lvk0", "ExpressionAttributeNames": {"#lvk0": "h"}}}}]
+        )
+
+    def test_projection_including_key(self):
+        connection = self.Connection()
+        loader = BatchGetItemLoader(connection, window=0)
+        self.assertEqual(loader.get(_lv.GetItem("t", {"h": 0}).expression_attribute_name("k", "h").project("#k", "a")), {"h": 0, "a": "a0"})
+        self.assertEqual(
+            connection.payloads,
+            [{"RequestItems": {"t": {"Keys": [{"h": {"N": "0"}}], "ProjectionExpression": "#k, a", "ExpressionAttributeNames": {"#k": "h"}}}}]
+        )
+
+    def test_unprocessed_keys(self):
+        connection = self.Connection(responses=[
+            {"Responses": {"t": [{"h": {"N": "0"}}]}, "UnprocessedKeys": {"t": {"Keys": [{"h": {"N": "1"}}], "ConsistentRead": True}}},
+            {"Responses": {"t": [{"h": {"N": "1"}}]}},
+        ])
+        loader = BatchGetItemLoader(connection, window=60, max_keys=2)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}).consistent_read_true(), _lv.GetItem("t", {"h": 1}).consistent_read_true()])
+        self.assertEqual(results, [{"h": 0}, {"h": 1}])
+        self.assertEqual(connection.payloads[1], {"RequestItems": {"t": {"Keys": [{"h": {"N": "1"}}], "ConsistentRead": True}}})
+
+    def test_unprocessed_keys_are_sent_after_a_delay(self):
+        connection = self.Connection(responses=[
+            {"UnprocessedKeys": {"t": {"Keys": [{"h": {"N": "0"}}]}}},
+            {"UnprocessedKeys": {"t": {"Keys": [{"h": {"N": "0"}}]}}},
+            {"Responses": {"t": [{"h": {"N": "0"}}]}},
+        ])
+        loader = BatchGetItemLoader(connection, window=0)
+        sleeps = []
+        loader._BatchGetItemLoader__sleep = sleeps.append
+        self.assertEqual(loader.get(_lv.GetItem("t", {"h": 0})), {"h": 0})
+        self.assertEqual(sleeps, [0.05, 0.1])
+        self.assertEqual(len(connection.payloads), 3)
+
+    def test_unprocessed_keys_delay(self):
+        self.assertEqual([_unprocessed_keys_delay(i) for i in range(1, 8)], [0.05, 0.1, 0.2, 0.4, 0.8, 1., 1.])
+
+    def test_numbers_are_matched_by_value(self):
+        class Action(object):
+            # Like GetItem("t", {"h": decimal.Decimal("1.50")}).project("a") with a registered encoder
+            payload = {"TableName": "t", "Key": {"h": {"N": "1.50"}}, "ProjectionExpression": "a"}
+
+        connection = self.Connection(responses=[{"Responses": {"t": [{"h": {"N": "1.5"}, "a": {"S": "x"}}]}}])
+        loader = BatchGetItemLoader(connection, window=0)
+        self.assertEqual(loader.get(Action()), {"a": "x"})
+
+    def test_normalized_key(self):
+        self.assertEqual(_normalized_key({"h": {"N": "1.50"}}), _normalized_key({"h": {"N": "1.5"}}))
+        self.assertEqual(_normalized_key({"h": {"N": "1E+2"}}), _normalized_key({"h": {"N": "100"}}))
+        self.assertNotEqual(_normalized_key({"h": {"N": "1"}}), _normalized_key({"h": {"S": "1"}}))
+        self.assertEqual(_normalized_key({"h": {"S": u"a"}, "r": {"B": u"/wCr"}}), _normalized_key({"r": {"B": u"/wCr"}, "h": {"S": u"a"}}))
+
+    def test_exception(self):
+        exception = _exn.ProvisionedThroughputExceededException()
+        connection = self.Connection(exception=exception)
+        loader = BatchGetItemLoader(connection, window=60, max_keys=2)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 1})])
+        self.assertEqual(results, [None, None])
+        self.assertEqual(exceptions, [exception, exception])
+        self.assertEqual(len(connection.payloads), 1)
+
+    def test_invalid_key_doesnt_fail_other_keys(self):
+        class Connection(self.Connection):
+            def __call__(self, action):
+                if any(key["h"]["N"] == "666" for key in action.payload["RequestItems"]["t"]["Keys"]):
+                    with self.lock:
+                        self.payloads.append(action.payload)
+                    raise exception
+                return super(Connection, self).__call__(action)
+
+        exception = _exn.ValidationException()
+        connection = Connection()
+        loader = BatchGetItemLoader(connection, window=60, max_keys=3)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 666}), _lv.GetItem("t", {"h": 1})])
+        self.assertEqual(results, [{"h": 0, "a": "a0"}, None, {"h": 1, "a": "a1"}])
+        self.assertEqual(exceptions, [exception])
+        self.assertEqual([len(p["RequestItems"]["t"]["Keys"]) for p in connection.payloads], [3, 1, 1, 1])
+
+    def test_exception_doesnt_fail_delivered_items(self):
+        class Connection(self.Connection):
+            def __call__(self, action):
+                if action.payload["RequestItems"]["t"].get("ConsistentRead"):
+                    raise exception
+                return super(Connection, self).__call__(action)
+
+        exception = _exn.ProvisionedThroughputExceededException()
+        loader = BatchGetItemLoader(Connection(), window=60, max_keys=2)
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 1}).consistent_read_true()])
+        self.assertEqual(results, [{"h": 0, "a": "a0"}, None])
+        self.assertEqual(exceptions, [exception])
+
+    def test_exception_after_partial_response(self):
+        class Connection(self.Connection):
+            def __call__(self, action):
+                if len(self.payloads) == 1:
+                    raise exception
+                return super(Connection, self).__call__(action)
+
+        exception = _exn.ProvisionedThroughputExceededException()
+        connection = Connection(responses=[{"Responses": {"t": [{"h": {"N": "0"}}]}, "UnprocessedKeys": {"t": {"Keys": [{"h": {"N": "1"}}]}}}])
+        loader = BatchGetItemLoader(connection, window=60, max_keys=2)
+        loader._BatchGetItemLoader__sleep = lambda delay: None
+        results, exceptions = self.get_all(loader, [_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 1})])
+        self.assertEqual(results, [{"h": 0}, None])
+        self.assertEqual(exceptions, [exception])
@@ -2,12 +2,19 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
+import collections
+import itertools
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from LowVoltage.variadic import variadic
 
 
-@variadic(dict)
+@variadic(Mapping)
 def batch_put_item(connection, table, *items):
     """
     Make as many :class:`.BatchWriteItem` actions as needed to put all specified items.
@@ -21,18 +28,19 @@ def batch_put_item(connection, table, *items):
     ...   {"h": 2, "a": 33, "b": 22},
     ... )
     """
-    items = list(items)
-    unprocessed_items = []
+    items = iter(items)
+    unprocessed_items = collections.deque()
 
-    while len(items) != 0:
-        r = connection(_lv.BatchWriteItem().table(table).put(items[:25]))
-        items = items[25:]
+    chunk = list(itertools.islice(items, 25))
+    while len(chunk) != 0:
+        r = connection(_lv.BatchWriteItem().table(table).put(chunk))
         if isinstance(r.unprocessed_items, dict) and table in r.unprocessed_items:
             unprocessed_items.extend(r.unprocessed_items[table])
+        chunk = list(itertools.islice(items, 25))
 
     while len(unprocessed_items) != 0:
-        r = connection(_lv.BatchWriteItem().previous_unprocessed_items({table: unprocessed_items[:25]}))
-        unprocessed_items = unprocessed_items[25:]
+        chunk = [unprocessed_items.popleft() for i in range(min(25, len(unprocessed_items)))]
+        r = connection(_lv.BatchWriteItem().previous_unprocessed_items({table: chunk}))
         if isinstance(r.unprocessed_items, dict) and table in r.unprocessed_items:
             unprocessed_items.extend(r.unprocessed_items[table])
 
@@ -45,6 +53,15 @@ class BatchPutItemUnitTests(_tst.UnitTestsWithMocks):
     def test_no_keys(self):
         batch_put_item(self.connection.object, "Aaa", [])
 
+    def test_lazy_scanned_items(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"S": "a"}, "v": {"N": "1"}}}}, {"PutRequest": {"Item": {"h": {"S": "b"}}}}]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse()
+        )
+
+        batch_put_item(self.connection.object, "Aaa", _lv.ScanResponse(Items=[{"h": {"S": "a"}, "v": {"N": "1"}}, {"h": {"S": "b"}}]).lazy_items)
+
     def test_one_page(self):
         self.connection.expect._call_.withArguments(
             self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"S": "a"}}}}, {"PutRequest": {"Item": {"h": {"S": "b"}}}}]}})
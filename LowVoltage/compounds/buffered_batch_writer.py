@@ -0,0 +1,502 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import collections
+import json
+import logging
+import threading
+import time
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from LowVoltage.actions.conversion import _convert_dict_to_db
+
+
+_logger = logging.getLogger(__name__)
+
+
+class BufferedBatchWriter(object):
+    """
+    Buffer individual puts and deletes, on any number of tables, and send them as :class:`.BatchWriteItem` actions
+    from a background thread. Useful when items arrive one by one, unlike :func:`.batch_put_item` and :func:`.batch_delete_item`.
+
+    A :class:`.BatchWriteItem` is sent when 25 writes are buffered, when they reach ``max_bytes``,
+    when the oldest one has been buffered for ``max_delay`` seconds, or when :meth:`flush` or :meth:`close` is called.
+    :attr:`.BatchWriteItemResponse.unprocessed_items` are buffered again, and the next :class:`.BatchWriteItem` is sent after a delay
+    growing from 50ms to 1s while DynamoDB keeps returning unprocessed items.
+    :class:`.BatchWriteItem` rejects several writes on the same key, so when a key is written again before being sent,
+    only the last write is kept.
+
+    >>> with BufferedBatchWriter(connection) as writer:
+    ...   for h in range(3):
+    ...     w = writer.put(table, {"h": h, "a": 42})
+
+    Each call to :meth:`put` or :meth:`delete` returns a :class:`BufferedWrite`, to wait for the write and see its exception if any.
+
+    The background thread is a daemon thread: writes still buffered when the interpreter exits are lost.
+    Call :meth:`close` (or use the writer as a context manager like above) before exiting.
+
+    :param connection: the connection. It's used from the background thread and from threads calling :meth:`put` and :meth:`delete`.
+    :param max_delay: the maximum time a write is buffered before being sent, in seconds.
+    :param max_bytes:
+        the maximum size of the writes sent in a single :class:`.BatchWriteItem`, as encoded in JSON.
+        If left ``None``, only the number of writes is limited, and the size of writes is not computed.
+    :param key_names:
+        a dict of table name to list of key attribute names.
+        If a table is not in this dict, a :class:`.DescribeTable` is sent the first time it's written to.
+    """
+
+    def __init__(self, connection, max_delay=1., max_bytes=None, key_names=None):
+        self.__connection = connection
+        self.__max_delay = max_delay
+        self.__max_bytes = max_bytes
+        self.__key_names = dict(key_names or {})
+        self.__condition = threading.Condition()
+        # (table, canonical key) -> _Entry, in the order keys were first buffered
+        self.__entries = collections.OrderedDict()
+        self.__bytes = 0
+        self.__flushing = 0
+        self.__sending = False
+        self.__closed = False
+        # Number of successive BatchWriteItem with unprocessed items, only used by the background thread
+        self.__throttled = 0
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+        self.__sleep = time.sleep
+
+        self.__thread = threading.Thread(target=self.__work)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    def put(self, table, item):
+        """
+        Buffer a put request.
+
+        :type: :class:`BufferedWrite`
+        """
+        item = _convert_dict_to_db(item)
+        key_names = self.__get_key_names(table)
+        return self.__add(table, {name: item[name] for name in key_names}, {"PutRequest": {"Item": item}})
+
+    def delete(self, table, key):
+        """
+        Buffer a delete request.
+
+        :type: :class:`BufferedWrite`
+        """
+        key = _convert_dict_to_db(key)
+        return self.__add(table, key, {"DeleteRequest": {"Key": key}})
+
+    def flush(self):
+        """
+        Send all buffered writes and wait until they are done, including the unprocessed ones.
+        Exceptions are not raised: they are reported by each :class:`BufferedWrite`.
+        """
+        with self.__condition:
+            self.__flushing += 1
+            self.__condition.notify_all()
+            try:
+                while self.__entries or self.__sending:
+                    self.__condition.wait()
+            finally:
+                self.__flushing -= 1
+
+    def close(self):
+        """
+        Flush and stop the background thread. Calling :meth:`put` or :meth:`delete` after that raises :exc:`ValueError`.
+        """
+        with self.__condition:
+            self.__closed = True
+            self.__condition.notify_all()
+        self.__thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __get_key_names(self, table):
+        key_names = self.__key_names.get(table)
+        if key_names is None:
+            key_names = [k.attribute_name for k in self.__connection(_lv.DescribeTable(table)).table.key_schema]
+            self.__key_names[table] = key_names
+        return key_names
+
+    def __add(self, table, key, request):
+        write = BufferedWrite()
+        size = len(json.dumps(request)) if self.__max_bytes is not None else 0
+        with self.__condition:
+            if self.__closed:
+                raise ValueError("BufferedBatchWriter is closed")
+            entry_key = (table, _canonical_key(key))
+            entry = self.__entries.get(entry_key)
+            if entry is None:
+                self.__entries[entry_key] = _Entry(table, request, size, write, self.__clock())
+            else:
+                self.__bytes -= entry.size
+                entry.replace(request, size, write)
+            self.__bytes += size
+            self.__condition.notify_all()
+        return write
+
+    def __work(self):
+        while True:
+            chunk = self.__next_chunk()
+            if chunk is None:
+                return
+            self.__send(chunk)
+
+    def __next_chunk(self):
+        with self.__condition:
+            while True:
+                if self.__entries and (self.__flushing or self.__closed or len(self.__entries) >= 25 or self.__max_bytes is not None and self.__bytes >= self.__max_bytes):
+                    break
+                if self.__closed and not self.__entries:
+                    return None
+                if self.__entries:
+                    timeout = next(self.__entries.itervalues()).time + self.__max_delay - self.__clock()
+                    if timeout <= 0:
+                        break
+                    self.__condition.wait(timeout)
+                else:
+                    self.__condition.wait()
+            chunk = []
+            size = 0
+            for entry_key, entry in self.__entries.iteritems():
+                if len(chunk) == 25 or chunk and self.__max_bytes is not None and size + entry.size > self.__max_bytes:
+                    break
+                chunk.append((entry_key, entry))
+                size += entry.size
+            for entry_key, entry in chunk:
+                del self.__entries[entry_key]
+            self.__bytes -= size
+            self.__sending = True
+            return chunk
+
+    def __send(self, chunk):
+        # Writes are done before __sending is reset, so that flush returns only once they are done
+        try:
+            # Any exception fails the writes of the chunk: the background thread must keep running for flush to return
+            try:
+                request_items = {}
+                for entry_key, entry in chunk:
+                    request_items.setdefault(entry.table, []).append(entry.request)
+                r = self.__connection(_lv.BatchWriteItem().previous_unprocessed_items(request_items))
+                unprocessed = set()
+                for table, requests in (r.unprocessed_items or {}).iteritems():
+                    for request in requests:
+                        unprocessed.add((table, _canonical_key(self.__request_key(table, request))))
+            except Exception as e:
+                for entry_key, entry in chunk:
+                    entry.fail(e)
+                return
+
+            done = []
+            with self.__condition:
+                for entry_key, entry in chunk:
+                    if entry_key in unprocessed:
+                        newer = self.__entries.get(entry_key)
+                        if newer is None:
+                            entry.time = self.__clock()
+                            self.__entries[entry_key] = entry
+                            self.__bytes += entry.size
+                        else:
+                            newer.supersede(entry)
+                    else:
+                        done.append(entry)
+            for entry in done:
+                entry.succeed()
+            if unprocessed:
+                # Sending the unprocessed items again right away, especially when flushing or closing, would hammer a throttled table
+                self.__throttled += 1
+                self.__sleep(min(1., 0.05 * 2 ** (self.__throttled - 1)))
+            else:
+                self.__throttled = 0
+        finally:
+            with self.__condition:
+                self.__sending = False
+                self.__condition.notify_all()
+
+    def __request_key(self, table, request):
+        if "DeleteRequest" in request:
+            return request["DeleteRequest"]["Key"]
+        else:
+            item = request["PutRequest"]["Item"]
+            return {name: item[name] for name in self.__get_key_names(table)}
+
+
+class BufferedWrite(object):
+    """
+    The outcome of a write buffered by :class:`BufferedBatchWriter`, similar to a ``concurrent.futures.Future``.
+    A write that was replaced by a later write on the same key is done when the later write is done.
+    """
+
+    def __init__(self):
+        self.__done = threading.Event()
+        self.__exception = None
+        self.__callbacks = []
+        self.__lock = threading.Lock()
+
+    def done(self):
+        """
+        Return ``True`` if the write was sent, successfully or not.
+        """
+        return self.__done.is_set()
+
+    def result(self, timeout=None):
+        """
+        Wait for the write to be sent and raise its exception, if any.
+
+        :raise: :exc:`.Error` if the :class:`.BatchWriteItem` failed, :exc:`RuntimeError` on timeout.
+        """
+        exception = self.exception(timeout)
+        if exception is not None:
+            raise exception
+
+    def exception(self, timeout=None):
+        """
+        Wait for the write to be sent and return its exception, or ``None``.
+
+        :raise: :exc:`RuntimeError` on timeout.
+        """
+        if not self.__done.wait(timeout) and not self.__done.is_set():
+            raise RuntimeError("Timeout waiting for buffered write")
+        return self.__exception
+
+    def add_done_callback(self, callback):
+        """
+        Call ``callback(write)`` when the write is done, from the background thread of the :class:`BufferedBatchWriter`.
+        If the write is already done, ``callback`` is called immediately.
+        Exceptions raised by ``callback`` are logged and ignored, like in ``concurrent.futures``.
+        """
+        with self.__lock:
+            if not self.__done.is_set():
+                self.__callbacks.append(callback)
+                return
+        self.__call(callback)
+
+    def _set(self, exception):
+        with self.__lock:
+            self.__exception = exception
+            self.__done.set()
+            callbacks, self.__callbacks = self.__callbacks, []
+        for callback in callbacks:
+            self.__call(callback)
+
+    def __call(self, callback):
+        # An exception would otherwise stop the background thread, and flush would never return
+        try:
+            callback(self)
+        except Exception:
+            _logger.exception("Exception calling callback for %r", self)
+
+
+class _Entry(object):
+    def __init__(self, table, request, size, write, time):
+        self.table = table
+        self.request = request
+        self.size = size
+        self.writes = [write]
+        self.time = time
+
+    def replace(self, request, size, write):
+        self.request = request
+        self.size = size
+        self.writes.append(write)
+
+    def supersede(self, older):
+        self.writes[:0] = older.writes
+
+    def succeed(self):
+        for write in self.writes:
+            write._set(None)
+
+    def fail(self, exception):
+        for write in self.writes:
+            write._set(exception)
+
+
+def _canonical_key(key):
+    return json.dumps(key, sort_keys=True)
+
+
+class BufferedBatchWriterUnitTests(_tst.UnitTests):
+    class Connection(object):
+        def __init__(self, unprocessed=None, exception=None, describe_exception=None):
+            self.lock = threading.Lock()
+            self.payloads = []
+            self.unprocessed = list(unprocessed or [])
+            self.exception = exception
+            self.describe_exception = describe_exception
+
+        def __call__(self, action):
+            with self.lock:
+                if action.name == "DescribeTable":
+                    self.payloads.append(action.payload)
+                    if self.describe_exception is not None:
+                        raise self.describe_exception
+                    return _lv.DescribeTableResponse(Table={"KeySchema": [{"AttributeName": "h", "KeyType": "HASH"}]})
+                self.payloads.append(action.payload["RequestItems"])
+                if self.exception is not None:
+                    raise self.exception
+                return _lv.BatchWriteItemResponse(UnprocessedItems=self.unprocessed.pop(0) if self.unprocessed else {})
+
+    def test_flush(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        w1 = writer.put("t", {"h": 0, "a": 1})
+        w2 = writer.delete("u", {"h": 1})
+        self.assertFalse(w1.done())
+        writer.flush()
+        self.assertTrue(w1.done())
+        self.assertIsNone(w2.exception())
+        self.assertEqual(connection.payloads, [{
+            "t": [{"PutRequest": {"Item": {"h": {"N": "0"}, "a": {"N": "1"}}}}],
+            "u": [{"DeleteRequest": {"Key": {"h": {"N": "1"}}}}],
+        }])
+        writer.close()
+
+    def test_close(self):
+        connection = self.Connection()
+        with BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]}) as writer:
+            writer.put("t", {"h": 0})
+        self.assertEqual(len(connection.payloads), 1)
+        with self.assertRaises(ValueError):
+            writer.put("t", {"h": 1})
+
+    def test_full_batch_is_sent(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        writes = [writer.put("t", {"h": i}) for i in range(30)]
+        writes[24].result(timeout=10)
+        self.assertEqual([len(p["t"]) for p in connection.payloads], [25])
+        self.assertFalse(writes[25].done())
+        writer.close()
+        self.assertEqual([len(p["t"]) for p in connection.payloads], [25, 5])
+
+    def test_max_bytes(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60, max_bytes=100, key_names={"t": ["h"]})
+        writes = [writer.put("t", {"h": i, "a": u"x" * 30}) for i in range(4)]
+        writes[0].result(timeout=10)
+        writer.close()
+        self.assertEqual([len(p["t"]) for p in connection.payloads], [1, 1, 1, 1])
+
+    def test_max_delay(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=0.01, key_names={"t": ["h"]})
+        writer.put("t", {"h": 0}).result(timeout=10)
+        self.assertEqual(len(connection.payloads), 1)
+        writer.close()
+
+    def test_last_write_per_key_is_kept(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        w1 = writer.put("t", {"h": 0, "a": 1})
+        w2 = writer.put("t", {"h": 1})
+        w3 = writer.delete("t", {"h": 0})
+        writer.close()
+        self.assertEqual(connection.payloads, [{"t": [{"DeleteRequest": {"Key": {"h": {"N": "0"}}}}, {"PutRequest": {"Item": {"h": {"N": "1"}}}}]}])
+        self.assertTrue(w1.done())
+        self.assertTrue(w3.done())
+
+    def test_key_names_from_describe_table(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60)
+        writer.put("t", {"h": 0, "a": 1})
+        writer.put("t", {"h": 0, "a": 2})
+        writer.close()
+        self.assertEqual(connection.payloads, [{"TableName": "t"}, {"t": [{"PutRequest": {"Item": {"h": {"N": "0"}, "a": {"N": "2"}}}}]}])
+
+    def test_unprocessed_items(self):
+        connection = self.Connection(unprocessed=[{"t": [{"PutRequest": {"Item": {"h": {"N": "1"}}}}]}])
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        sleeps = []
+        writer._BufferedBatchWriter__sleep = sleeps.append
+        w0 = writer.put("t", {"h": 0})
+        w1 = writer.put("t", {"h": 1})
+        writer.flush()
+        self.assertTrue(w0.done())
+        self.assertTrue(w1.done())
+        self.assertEqual([len(p["t"]) for p in connection.payloads], [2, 1])
+        self.assertEqual(sleeps, [0.05])
+        writer.close()
+
+    def test_unprocessed_items_delay(self):
+        unprocessed = {"t": [{"PutRequest": {"Item": {"h": {"N": "0"}}}}]}
+        connection = self.Connection(unprocessed=[unprocessed] * 7 + [{}, unprocessed])
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        sleeps = []
+        writer._BufferedBatchWriter__sleep = sleeps.append
+        writer.put("t", {"h": 0})
+        writer.flush()
+        writer.put("t", {"h": 0})
+        writer.close()
+        self.assertEqual(sleeps, [0.05, 0.1, 0.2, 0.4, 0.8, 1., 1., 0.05])
+        self.assertEqual(len(connection.payloads), 10)
+
+    def test_callback_exception(self):
+        connection = self.Connection()
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        called = []
+
+        def callback(write):
+            called.append(write)
+            raise Exception("Callback failed")
+
+        class Handler(logging.Handler):
+            def emit(self, record):
+                logged.append(record.exc_info[1].args)
+
+        logged = []
+        handler = Handler()
+        _logger.addHandler(handler)
+        try:
+            w1 = writer.put("t", {"h": 0})
+            w1.add_done_callback(callback)
+            w1.add_done_callback(called.append)
+            writer.flush()
+            self.assertEqual(called, [w1, w1])
+            w2 = writer.put("t", {"h": 1})
+            writer.flush()
+            self.assertIsNone(w2.exception())
+            w2.add_done_callback(callback)
+            self.assertEqual(called, [w1, w1, w2])
+            writer.close()
+        finally:
+            _logger.removeHandler(handler)
+        self.assertEqual(len(connection.payloads), 2)
+        self.assertEqual(logged, [("Callback failed",)] * 2)
+
+    def test_exception(self):
+        exception = _exn.ValidationException()
+        writer = BufferedBatchWriter(self.Connection(exception=exception), max_delay=60, key_names={"t": ["h"]})
+        write = writer.put("t", {"h": 0})
+        called = []
+        write.add_done_callback(called.append)
+        writer.flush()
+        self.assertIs(write.exception(), exception)
+        with self.assertRaises(_exn.ValidationException):
+            write.result()
+        self.assertEqual(called, [write])
+        write.add_done_callback(called.append)
+        self.assertEqual(called, [write, write])
+        writer.close()
+
+    def test_exception_in_unprocessed_items_key_lookup(self):
+        exception = _exn.ResourceNotFoundException()
+        # Key names of table "u" are not known yet, and the DescribeTable sent from the background thread fails
+        connection = self.Connection(unprocessed=[{"u": [{"PutRequest": {"Item": {"h": {"N": "1"}}}}]}], describe_exception=exception)
+        writer = BufferedBatchWriter(connection, max_delay=60, key_names={"t": ["h"]})
+        w0 = writer.put("t", {"h": 0})
+        writer.flush()
+        self.assertIs(w0.exception(), exception)
+        # The background thread is still running
+        w1 = writer.put("t", {"h": 1})
+        writer.flush()
+        self.assertIsNone(w1.exception())
+        writer.close()
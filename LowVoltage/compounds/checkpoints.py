@@ -0,0 +1,334 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Long scans and queries can be checkpointed: after the items of each page have been consumed,
+the position of each segment (its ``ExclusiveStartKey``) is saved to a checkpoint store.
+If the process stops, :func:`resume_iterate` rebuilds the :class:`.Scan` or :class:`.Query` from the store and continues from there.
+
+>>> store = FileCheckpointStore("scan.checkpoint")
+>>> for item in checkpointed_iterate_scan(connection, Scan(table), store, total_segments=2):
+...   pass
+
+Later, maybe in another process:
+
+>>> for item in resume_iterate(connection, store):
+...   pass
+
+Items of the page being consumed when the process stopped will be returned again, so processing should be idempotent.
+
+.. testcleanup::
+
+    import os
+    os.remove("scan.checkpoint")
+
+.. py:class:: CheckpointStore
+
+    The interface to be implemented by all checkpoint stores. Note that you must not inherit from this class, just implement the same interface.
+
+    .. py:method:: save(checkpoint)
+
+        Save the checkpoint, replacing the previous one.
+
+        :param checkpoint: a dict that can be serialized to JSON.
+
+    .. py:method:: load()
+
+        Return the last saved checkpoint.
+
+        :type: dict
+"""
+
+import copy
+import json
+import os
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+from LowVoltage.actions.action import Action
+from .iterate_scan import _parallel_iterate_segments
+
+
+class FileCheckpointStore(object):
+    """
+    Checkpoint store saving the checkpoint as JSON in a local file.
+    The file is replaced atomically (on POSIX systems) so a crash while saving leaves the previous checkpoint intact.
+
+    :param path: the path of the file.
+    """
+
+    def __init__(self, path):
+        self.__path = path
+
+    def save(self, checkpoint):
+        temporary_path = self.__path + ".tmp"
+        with open(temporary_path, "w") as f:
+            json.dump(checkpoint, f)
+        try:
+            os.rename(temporary_path, self.__path)
+        except OSError:  # pragma no cover (Windows can't rename over an existing file)
+            os.remove(self.__path)
+            os.rename(temporary_path, self.__path)
+
+    def load(self):
+        with open(self.__path) as f:
+            return json.load(f)
+
+
+def checkpointed_iterate_scan(connection, scan, store, total_segments=1, workers=None):
+    """
+    Like :func:`.iterate_scan` (or :func:`.parallel_iterate_scan` if ``total_segments`` is greater than 1),
+    saving a checkpoint to ``store`` after each page.
+    Any previous checkpoint in ``store`` is replaced.
+
+    The :class:`.Scan` instance passed in is not modified.
+    """
+    payload = scan.payload
+    checkpoint = {
+        "action": "Scan",
+        "payload": payload,
+        "total_segments": total_segments,
+        "segments": {str(segment): {"exclusive_start_key": payload.get("ExclusiveStartKey"), "done": False} for segment in range(total_segments)},
+    }
+    store.save(checkpoint)
+    return _iterate(connection, store, checkpoint, workers)
+
+
+def checkpointed_iterate_query(connection, query, store):
+    """
+    Like :func:`.iterate_query`, saving a checkpoint to ``store`` after each page.
+    Any previous checkpoint in ``store`` is replaced.
+
+    The :class:`.Query` instance passed in is not modified.
+    """
+    payload = query.payload
+    checkpoint = {
+        "action": "Query",
+        "payload": payload,
+        "total_segments": 1,
+        "segments": {"0": {"exclusive_start_key": payload.get("ExclusiveStartKey"), "done": False}},
+    }
+    store.save(checkpoint)
+    return _iterate(connection, store, checkpoint, None)
+
+
+def resume_iterate(connection, store, workers=None):
+    """
+    Continue the iteration saved in ``store`` by :func:`checkpointed_iterate_scan` or :func:`checkpointed_iterate_query`.
+    Checkpoints are still saved to ``store``. Segments that were complete are not scanned again.
+    """
+    return _iterate(connection, store, store.load(), workers)
+
+
+class _RawLastEvaluatedKey(object):
+    # The LastEvaluatedKey is kept exactly as returned by DynamoDB, to be saved in checkpoints
+    # and sent back as ExclusiveStartKey without a round trip through the conversion functions.
+    def __init__(self, LastEvaluatedKey=None, **kwds):
+        super(_RawLastEvaluatedKey, self).__init__(LastEvaluatedKey=LastEvaluatedKey, **kwds)
+        self.__last_evaluated_key = LastEvaluatedKey
+
+    @property
+    def last_evaluated_key(self):
+        return self.__last_evaluated_key
+
+
+class _ResumableScanResponse(_RawLastEvaluatedKey, _lv.ScanResponse):
+    pass
+
+
+class _ResumableQueryResponse(_RawLastEvaluatedKey, _lv.QueryResponse):
+    pass
+
+
+class _ResumableAction(Action):
+    # An action rebuilt from a saved payload, with just the methods needed by the iteration compounds.
+    def __init__(self, name, payload):
+        super(_ResumableAction, self).__init__(name, {"Scan": _ResumableScanResponse, "Query": _ResumableQueryResponse}[name])
+        self.payload = copy.deepcopy(payload)
+
+    def segment(self, segment, total_segments):
+        if total_segments > 1:
+            self.payload["Segment"] = segment
+            self.payload["TotalSegments"] = total_segments
+        return self
+
+    def exclusive_start_key(self, key):
+        self.payload["ExclusiveStartKey"] = key
+        return self
+
+
+def _iterate(connection, store, checkpoint, workers):
+    segments = []
+    for segment in range(checkpoint["total_segments"]):
+        state = checkpoint["segments"][str(segment)]
+        if not state["done"]:
+            action = _ResumableAction(checkpoint["action"], checkpoint["payload"]).segment(segment, checkpoint["total_segments"])
+            action.payload.pop("ExclusiveStartKey", None)
+            if state["exclusive_start_key"] is not None:
+                action.payload["ExclusiveStartKey"] = state["exclusive_start_key"]
+            segments.append((segment, action))
+
+    def progress(segment, r):
+        last_evaluated_key = r.last_evaluated_key
+        checkpoint["segments"][str(segment)] = {
+            "exclusive_start_key": last_evaluated_key,
+            "done": last_evaluated_key is None,
+        }
+        store.save(checkpoint)
+
+    if len(segments) == 1:
+        segment, action = segments[0]
+        return _iterate_segment(connection, segment, action, progress)
+    else:
+        return _parallel_iterate_segments(connection, segments, workers, None, progress)
+
+
+def _iterate_segment(connection, segment, action, progress):
+    r = connection(action)
+    for item in r.items:
+        yield item
+    progress(segment, r)
+    while r.last_evaluated_key is not None:
+        action.exclusive_start_key(r.last_evaluated_key)
+        r = connection(action)
+        for item in r.items:
+            yield item
+        progress(segment, r)
+
+
+class CheckpointsUnitTests(_tst.UnitTestsWithMocks):
+    class Store(object):
+        def __init__(self):
+            self.checkpoints = []
+
+        def save(self, checkpoint):
+            self.checkpoints.append(json.loads(json.dumps(checkpoint)))
+
+        def load(self):
+            return self.checkpoints[-1]
+
+    def setUp(self):
+        super(CheckpointsUnitTests, self).setUp()
+        self.connection = self.mocks.create("connection")
+        self.store = self.Store()
+
+    def test_query(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Query", {"TableName": "Aaa", "KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "0"}]}}})
+        ).andReturn(
+            _ResumableQueryResponse(Items=[{"h": {"N": "0"}, "r": {"S": u"a"}}], LastEvaluatedKey={"h": {"N": "0"}, "r": {"S": u"a"}})
+        )
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Query", {"TableName": "Aaa", "KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "0"}]}}, "ExclusiveStartKey": {"h": {"N": "0"}, "r": {"S": u"a"}}})
+        ).andReturn(
+            _ResumableQueryResponse(Items=[{"h": {"N": "0"}, "r": {"S": u"b"}}])
+        )
+
+        self.assertEqual(
+            list(checkpointed_iterate_query(self.connection.object, _lv.Query("Aaa").key_eq("h", 0), self.store)),
+            [{"h": 0, "r": "a"}, {"h": 0, "r": "b"}]
+        )
+        self.assertEqual(
+            [c["segments"] for c in self.store.checkpoints],
+            [
+                {"0": {"exclusive_start_key": None, "done": False}},
+                {"0": {"exclusive_start_key": {"h": {"N": "0"}, "r": {"S": u"a"}}, "done": False}},
+                {"0": {"exclusive_start_key": None, "done": True}},
+            ]
+        )
+
+    def test_checkpoint_is_saved_after_items_are_consumed(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa"})
+        ).andReturn(
+            _ResumableScanResponse(Items=[{"h": {"N": "0"}}, {"h": {"N": "1"}}], LastEvaluatedKey={"h": {"N": "1"}})
+        )
+
+        items = checkpointed_iterate_scan(self.connection.object, _lv.Scan("Aaa"), self.store)
+        self.assertEqual(next(items), {"h": 0})
+        self.assertEqual(next(items), {"h": 1})
+        self.assertEqual(len(self.store.checkpoints), 1)
+
+    def test_resume_scan(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa"})
+        ).andReturn(
+            _ResumableScanResponse(Items=[{"h": {"N": "0"}}], LastEvaluatedKey={"h": {"N": "0"}})
+        )
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa", "ExclusiveStartKey": {"h": {"N": "0"}}})
+        ).andRaise(_lv.NetworkError())
+
+        items = checkpointed_iterate_scan(self.connection.object, _lv.Scan("Aaa"), self.store)
+        self.assertEqual(next(items), {"h": 0})
+        with self.assertRaises(_lv.NetworkError):
+            next(items)
+
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa", "ExclusiveStartKey": {"h": {"N": "0"}}})
+        ).andReturn(
+            _ResumableScanResponse(Items=[{"h": {"N": "1"}}])
+        )
+
+        self.assertEqual(list(resume_iterate(self.connection.object, self.store)), [{"h": 1}])
+        self.assertEqual(self.store.load()["segments"], {"0": {"exclusive_start_key": None, "done": True}})
+
+    def test_resume_segmented_scan(self):
+        self.store.save({
+            "action": "Scan",
+            "payload": {"TableName": "Aaa"},
+            "total_segments": 3,
+            "segments": {
+                "0": {"exclusive_start_key": None, "done": True},
+                "1": {"exclusive_start_key": {"h": {"N": "1"}}, "done": False},
+                "2": {"exclusive_start_key": None, "done": False},
+            },
+        })
+
+        with self.mocks.unordered:
+            self.connection.expect._call_.withArguments(
+                self.ActionChecker("Scan", {"TableName": "Aaa", "Segment": 1, "TotalSegments": 3, "ExclusiveStartKey": {"h": {"N": "1"}}})
+            ).andReturn(
+                _ResumableScanResponse(Items=[{"h": {"N": "4"}}])
+            )
+            self.connection.expect._call_.withArguments(
+                self.ActionChecker("Scan", {"TableName": "Aaa", "Segment": 2, "TotalSegments": 3})
+            ).andReturn(
+                _ResumableScanResponse(Items=[{"h": {"N": "2"}}])
+            )
+
+        self.assertEqual(sorted(item["h"] for item in resume_iterate(self.connection.object, self.store, workers=1)), [2, 4])
+        self.assertEqual(
+            self.store.load()["segments"],
+            {
+                "0": {"exclusive_start_key": None, "done": True},
+                "1": {"exclusive_start_key": None, "done": True},
+                "2": {"exclusive_start_key": None, "done": True},
+            }
+        )
+
+    def test_last_evaluated_key_is_saved_and_sent_back_unchanged(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa"})
+        ).andReturn(
+            _ResumableScanResponse(Items=[{"h": {"N": "0"}}], LastEvaluatedKey={"h": {"N": "1.50"}})
+        )
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "Aaa", "ExclusiveStartKey": {"h": {"N": "1.50"}}})
+        ).andReturn(
+            _ResumableScanResponse(Items=[{"h": {"N": "1"}}])
+        )
+
+        self.assertEqual(list(checkpointed_iterate_scan(self.connection.object, _lv.Scan("Aaa"), self.store)), [{"h": 0}, {"h": 1}])
+        self.assertEqual(self.store.checkpoints[1]["segments"], {"0": {"exclusive_start_key": {"h": {"N": "1.50"}}, "done": False}})
+
+    def test_file_store(self):
+        path = "LowVoltage.Tests.Unit.checkpoint"
+        store = FileCheckpointStore(path)
+        try:
+            store.save({"a": [1, 2]})
+            store.save({"b": [3, 4]})
+            self.assertEqual(FileCheckpointStore(path).load(), {"b": [3, 4]})
+        finally:
+            os.remove(path)
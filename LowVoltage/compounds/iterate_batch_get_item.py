@@ -2,12 +2,17 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 from LowVoltage.variadic import variadic
 
 
-@variadic(dict)
+@variadic(Mapping)
 def iterate_batch_get_item(connection, table, *keys):
     """
     Make as many :class:`.BatchGetItem` actions as needed to iterate over all specified items.
@@ -56,6 +61,19 @@ class IterateBatchGetItemUnitTests(_tst.UnitTestsWithMocks):
             []
         )
 
+    def test_lazy_queried_keys(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchGetItem", {"RequestItems": {"Aaa": {"Keys": [{"h": {"S": "a"}, "r": {"N": "0"}}, {"h": {"S": "a"}, "r": {"N": "1"}}]}}})
+        ).andReturn(
+            _lv.BatchGetItemResponse(Responses={"Aaa": [{"h": {"S": "a"}, "r": {"N": "0"}, "v": {"N": "0"}}, {"h": {"S": "a"}, "r": {"N": "1"}, "v": {"N": "10"}}]})
+        )
+
+        keys = _lv.QueryResponse(Items=[{"h": {"S": "a"}, "r": {"N": "0"}}, {"h": {"S": "a"}, "r": {"N": "1"}}]).lazy_items
+        self.assertEqual(
+            list(_lv.iterate_batch_get_item(self.connection.object, "Aaa", keys)),
+            [{"h": "a", "r": 0, "v": 0}, {"h": "a", "r": 1, "v": 10}]
+        )
+
     def test_one_page(self):
         self.connection.expect._call_.withArguments(
             self.ActionChecker("BatchGetItem", {"RequestItems": {"Aaa": {"Keys": [{"h": {"S": "a"}}, {"h": {"S": "b"}}]}}})
@@ -3,6 +3,8 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 import copy
+import Queue
+import threading
 
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
@@ -70,6 +72,87 @@ def parallelize_scan(scan, total_segments):
     ]
 
 
+def parallel_iterate_scan(connection, scan, total_segments, workers=None, queue_size=None, progress=None):
+    """
+    Split ``scan`` in ``total_segments`` segments (see :func:`parallelize_scan`) and iterate over all of them at the same time,
+    each segment in a worker thread. Items are returned in an unspecified order.
+
+    >>> sorted(item["h"] for item in parallel_iterate_scan(connection, Scan(table), 3))
+    [0, 1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+    :param workers: the number of threads. Defaults to ``total_segments``. If smaller, segments are processed as threads become available.
+    :param queue_size: the number of pages that can wait to be consumed. Defaults to ``2 * workers``.
+        When this limit is reached, the threads wait before making more :class:`.Scan` actions.
+    :param progress: a callable called as ``progress(segment, response)`` with the index of the segment and the :class:`.ScanResponse`
+        once all items of the response have been consumed. ``response.last_evaluated_key`` is ``None`` when the segment is complete.
+        It is called in the thread consuming the items.
+
+    The connection must be usable from several threads.
+    If a :class:`.Scan` action raises an exception, it is re-raised by the iteration.
+    If the iteration is stopped early, the threads stop after their current action.
+
+    The :class:`.Scan` instance passed in is not modified.
+    """
+    return _parallel_iterate_segments(connection, enumerate(parallelize_scan(scan, total_segments)), workers, queue_size, progress)
+
+
+def _parallel_iterate_segments(connection, indexed_segments, workers, queue_size, progress):
+    segments = Queue.Queue()
+    for segment, segment_scan in indexed_segments:
+        segments.put((segment, segment_scan))
+    if workers is None:
+        workers = segments.qsize()
+    if queue_size is None:
+        queue_size = 2 * workers
+    pages = Queue.Queue(queue_size)
+    stop = threading.Event()
+
+    def work():
+        try:
+            while not stop.is_set():
+                try:
+                    segment, segment_scan = segments.get_nowait()
+                except Queue.Empty:
+                    break
+                r = connection(segment_scan)
+                pages.put((segment, r, None))
+                while r.last_evaluated_key is not None and not stop.is_set():
+                    segment_scan.exclusive_start_key(r.last_evaluated_key)
+                    r = connection(segment_scan)
+                    pages.put((segment, r, None))
+        except Exception as e:
+            pages.put((None, None, e))
+        else:
+            pages.put((None, None, None))
+
+    threads = [threading.Thread(target=work) for i in range(min(workers, segments.qsize()))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    try:
+        finished = 0
+        while finished < len(threads):
+            segment, r, exception = pages.get()
+            if exception is not None:
+                raise exception
+            elif segment is None:
+                finished += 1
+            else:
+                for item in r.items:
+                    yield item
+                if progress is not None:
+                    progress(segment, r)
+    finally:
+        stop.set()
+        # Unblock threads waiting to put pages in the queue
+        while any(thread.is_alive() for thread in threads):
+            try:
+                pages.get(timeout=0.01)
+            except Queue.Empty:
+                pass
+
+
 class IterateScanUnitTests(_tst.UnitTestsWithMocks):
     def setUp(self):
         super(IterateScanUnitTests, self).setUp()
@@ -108,6 +191,62 @@ class IterateScanUnitTests(_tst.UnitTestsWithMocks):
             [{'h': 0, 'r': 'foo'}, {'h': 0, 'r': 'bar'}, {'h': 0, 'r': 'baz'}]
         )
 
+    def test_parallel_iterate_scan(self):
+        class Connection(object):
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.calls = []
+
+            def __call__(self, scan):
+                payload = scan.payload
+                segment = payload["Segment"]
+                page = 0 if "ExclusiveStartKey" not in payload else int(payload["ExclusiveStartKey"]["h"]["N"]) % 10 + 1
+                with self.lock:
+                    self.calls.append((segment, page))
+                return _lv.ScanResponse(
+                    Items=[{"h": {"N": str(100 * segment + 10 * page + i)}} for i in range(3)],
+                    LastEvaluatedKey={"h": {"N": str(100 * segment + page)}} if page < segment else None,
+                )
+
+        connection = Connection()
+        progress = []
+        items = list(parallel_iterate_scan(connection, _lv.Scan("Table"), 3, workers=2, queue_size=1, progress=lambda segment, r: progress.append((segment, r.last_evaluated_key))))
+
+        self.assertEqual(
+            sorted(item["h"] for item in items),
+            [0, 1, 2, 100, 101, 102, 110, 111, 112, 200, 201, 202, 210, 211, 212, 220, 221, 222]
+        )
+        self.assertEqual(sorted(connection.calls), [(0, 0), (1, 0), (1, 1), (2, 0), (2, 1), (2, 2)])
+        # Segments progress concurrently, but each one in order
+        progress_by_segment = {}
+        for segment, key in progress:
+            progress_by_segment.setdefault(segment, []).append(key)
+        self.assertEqual(
+            progress_by_segment,
+            {0: [None], 1: [{"h": 100}, None], 2: [{"h": 200}, {"h": 201}, None]}
+        )
+
+    def test_parallel_iterate_scan_exception(self):
+        exception = _lv.ValidationException()
+
+        def connection(scan):
+            if scan.payload["Segment"] == 1:
+                raise exception
+            else:
+                return _lv.ScanResponse(Items=[])
+
+        with self.assertRaises(_lv.ValidationException) as catcher:
+            list(parallel_iterate_scan(connection, _lv.Scan("Table"), 2))
+        self.assertIs(catcher.exception, exception)
+
+    def test_parallel_iterate_scan_stopped_early(self):
+        def connection(scan):
+            return _lv.ScanResponse(Items=[{"h": {"N": "0"}}], LastEvaluatedKey={"h": {"N": "0"}})
+
+        items = parallel_iterate_scan(connection, _lv.Scan("Table"), 4, queue_size=1)
+        self.assertEqual(next(items), {"h": 0})
+        items.close()
+
     def test_parallelize_scan(self):
         s1, s2 = parallelize_scan(_lv.Scan("Table"), 2)
         self.assertEqual(s1.payload, {"TableName": "Table", "Segment": 0, "TotalSegments": 2})
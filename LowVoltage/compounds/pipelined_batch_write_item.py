@@ -0,0 +1,204 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import collections
+import itertools
+import threading
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+from LowVoltage.actions.conversion import _convert_dict_to_db
+
+
+def pipelined_batch_put_item(connection, table, items, in_flight=4):
+    """
+    Like :func:`.batch_put_item`, but keep up to ``in_flight`` :class:`.BatchWriteItem` actions running at the same time, each in its own thread.
+    :attr:`.BatchWriteItemResponse.unprocessed_items` are sent again as soon as they are returned, mixed with the next items.
+
+    ``items`` can be any iterable (a generator for example). It is consumed lazily, 25 items at a time.
+
+    >>> pipelined_batch_put_item(
+    ...   connection,
+    ...   table,
+    ...   ({"h": h, "a": 42} for h in range(3)),
+    ...   in_flight=2,
+    ... )
+
+    The connection must be usable from several threads. If an action raises an exception, no more actions are started
+    and the exception is re-raised once the running actions are done.
+    """
+    _Pipeline(connection, table, ({"PutRequest": {"Item": _convert_dict_to_db(item)}} for item in items), in_flight).run()
+
+
+def pipelined_batch_delete_item(connection, table, keys, in_flight=4):
+    """
+    Like :func:`.batch_delete_item`, but keep up to ``in_flight`` :class:`.BatchWriteItem` actions running at the same time.
+    See :func:`pipelined_batch_put_item` for details.
+
+    >>> pipelined_batch_delete_item(
+    ...   connection,
+    ...   table,
+    ...   ({"h": h} for h in range(3)),
+    ...   in_flight=2,
+    ... )
+    """
+    _Pipeline(connection, table, ({"DeleteRequest": {"Key": _convert_dict_to_db(key)}} for key in keys), in_flight).run()
+
+
+class _Pipeline(object):
+    # Requests are kept in DynamoDB notation, so that fresh requests and unprocessed ones can share the same action.
+    def __init__(self, connection, table, requests, in_flight):
+        self.__connection = connection
+        self.__table = table
+        self.__requests = iter(requests)
+        self.__in_flight = in_flight
+        self.__unprocessed_requests = collections.deque()
+        self.__running = 0
+        self.__exhausted = False
+        self.__exception = None
+        self.__condition = threading.Condition()
+
+    def run(self):
+        workers = [threading.Thread(target=self.__work) for i in range(self.__in_flight)]
+        for worker in workers:
+            worker.daemon = True
+            worker.start()
+        for worker in workers:
+            worker.join()
+        if self.__exception is not None:
+            raise self.__exception
+
+    def __work(self):
+        while True:
+            chunk = self.__next_chunk()
+            if chunk is None:
+                return
+            try:
+                r = self.__connection(_lv.BatchWriteItem().previous_unprocessed_items({self.__table: chunk}))
+            except Exception as e:
+                with self.__condition:
+                    if self.__exception is None:
+                        self.__exception = e
+                    self.__running -= 1
+                    self.__condition.notify_all()
+                return
+            with self.__condition:
+                if isinstance(r.unprocessed_items, dict) and self.__table in r.unprocessed_items:
+                    self.__unprocessed_requests.extend(r.unprocessed_items[self.__table])
+                self.__running -= 1
+                self.__condition.notify_all()
+
+    def __next_chunk(self):
+        # Return the next chunk of at most 25 requests, or None when there is nothing left to do.
+        with self.__condition:
+            while True:
+                if self.__exception is not None:
+                    return None
+                chunk = [self.__unprocessed_requests.popleft() for i in range(min(25, len(self.__unprocessed_requests)))]
+                if len(chunk) < 25 and not self.__exhausted:
+                    try:
+                        chunk.extend(itertools.islice(self.__requests, 25 - len(chunk)))
+                    except Exception as e:
+                        self.__exception = e
+                        self.__condition.notify_all()
+                        return None
+                    if len(chunk) < 25:
+                        self.__exhausted = True
+                if len(chunk) != 0:
+                    self.__running += 1
+                    return chunk
+                elif self.__running == 0:
+                    return None
+                else:
+                    # Running actions may return unprocessed items
+                    self.__condition.wait()
+
+
+class PipelinedBatchWriteItemUnitTests(_tst.UnitTestsWithMocks):
+    def setUp(self):
+        super(PipelinedBatchWriteItemUnitTests, self).setUp()
+        self.connection = self.mocks.create("connection")
+
+    def test_no_items(self):
+        pipelined_batch_put_item(self.connection.object, "Aaa", [])
+
+    def test_put_one_page(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"S": "a"}}}}, {"PutRequest": {"Item": {"h": {"S": "b"}}}}]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse()
+        )
+
+        pipelined_batch_put_item(self.connection.object, "Aaa", [{"h": u"a"}, {"h": u"b"}])
+
+    def test_delete_one_page(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"DeleteRequest": {"Key": {"h": {"S": "a"}}}}, {"DeleteRequest": {"Key": {"h": {"S": "b"}}}}]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse()
+        )
+
+        pipelined_batch_delete_item(self.connection.object, "Aaa", [{"h": u"a"}, {"h": u"b"}])
+
+    def test_unprocessed_items_are_mixed_with_next_items(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"N": str(i)}}}} for i in range(0, 25)]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse(UnprocessedItems={"Aaa": [{"PutRequest": {"Item": {"h": {"N": str(i)}}}} for i in range(20, 25)]})
+        )
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"N": str(i)}}}} for i in range(20, 45)]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse()
+        )
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"N": str(i)}}}} for i in range(45, 50)]}})
+        ).andReturn(
+            _lv.BatchWriteItemResponse()
+        )
+
+        pipelined_batch_put_item(self.connection.object, "Aaa", ({"h": i} for i in range(50)), in_flight=1)
+
+    def test_exception_is_reraised(self):
+        exception = _lv.ValidationException()
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"Aaa": [{"PutRequest": {"Item": {"h": {"S": "a"}}}}]}})
+        ).andRaise(exception)
+
+        with self.assertRaises(_lv.ValidationException) as catcher:
+            pipelined_batch_put_item(self.connection.object, "Aaa", [{"h": u"a"}])
+        self.assertIs(catcher.exception, exception)
+
+    def test_concurrent_actions(self):
+        # The first three actions block until they are all running. Each action returns its first items as unprocessed, until 10 items were returned.
+        class Connection(object):
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.running = 0
+                self.max_running = 0
+                self.put = set()
+                self.unprocessed = 10
+                self.barrier = threading.Semaphore(0)
+
+            def __call__(self, action):
+                requests = action.payload["RequestItems"]["Aaa"]
+                with self.lock:
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                    if self.running == 3:
+                        for i in range(3):
+                            self.barrier.release()
+                self.barrier.acquire()
+                with self.lock:
+                    self.running -= 1
+                    unprocessed = requests[:min(self.unprocessed, 2)]
+                    self.unprocessed -= len(unprocessed)
+                    self.put.update(int(r["PutRequest"]["Item"]["h"]["N"]) for r in requests[len(unprocessed):])
+                    self.barrier.release()
+                return _lv.BatchWriteItemResponse(UnprocessedItems={"Aaa": unprocessed})
+
+        connection = Connection()
+        pipelined_batch_put_item(connection, "Aaa", ({"h": i} for i in range(1000)), in_flight=3)
+        self.assertEqual(connection.put, set(range(1000)))
+        self.assertEqual(connection.max_running, 3)
@@ -0,0 +1,474 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+:class:`Table` learns the keys and indexes of a table with :class:`.DescribeTable`,
+and uses them to choose the cheapest way to read items matching some conditions:
+
+>>> Table(connection, table).plan({"h": 0}).action.name
+'GetItem'
+>>> Table(connection, table).plan({"gh": 0, "gr": 0}).index_name
+'gsi'
+>>> Table(connection, table2).plan({"h": 42}, ("r2", "ge", 7)).index_name
+'lsi'
+>>> list(Table(connection, table).find({"h": 0}))
+[{u'h': 0, u'gr': 10, u'gh': 0}]
+
+A :class:`.Scan` is never chosen unless explicitly allowed:
+
+>>> Table(connection, table).plan({"gr": 10})
+Traceback (most recent call last):
+  ...
+ValueError: No key or index of table LowVoltage.Tests.Doc.1 matches the conditions
+>>> Table(connection, table).plan({"gr": 10}, allow_scan=True).action.name
+'Scan'
+"""
+
+import math
+import threading
+import time
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+
+
+class Table(object):
+    """
+    A table whose description is cached, able to choose between :class:`.GetItem`, :class:`.Query`
+    (on the table or on one of its indexes) and :class:`.Scan`.
+
+    :param connection: the connection used to describe the table and to send the chosen actions.
+    :param name: the name of the table.
+    :param ttl: the time the description of the table is cached, in seconds.
+    """
+
+    def __init__(self, connection, name, ttl=300.):
+        self.__connection = connection
+        self.__name = name
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+        self.__description = None
+        self.__described_at = None
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+
+    @property
+    def name(self):
+        """
+        The name of the table.
+        """
+        return self.__name
+
+    @property
+    def description(self):
+        """
+        The description of the table, from a :class:`.DescribeTable` sent at most ``ttl`` seconds ago.
+
+        :type: :class:`.TableDescription`
+        """
+        with self.__lock:
+            if self.__description is None or self.__clock() >= self.__described_at + self.__ttl:
+                self.__describe()
+            return self.__description
+
+    def refresh(self):
+        """
+        Send a :class:`.DescribeTable` now, for example after an index was created.
+        """
+        with self.__lock:
+            self.__describe()
+
+    def __describe(self):
+        self.__description = self.__connection(_lv.DescribeTable(self.__name)).table
+        self.__described_at = self.__clock()
+
+    def plan(self, key, range_condition=None, attributes=None, consistent_read=False, allow_scan=False, expected_items=1):
+        """
+        Choose the cheapest way to read the items matching some conditions.
+
+        A :class:`.GetItem` if ``key`` contains exactly the primary key of the table.
+        Else a :class:`.Query` on the table or on the index whose key is best constrained by the conditions,
+        cheaper indexes (smaller items, no fetches from the table) being preferred.
+        Else a :class:`.Scan` if ``allow_scan`` is true. Conditions not used as key conditions are sent as a filter expression.
+
+        :param key: a dict of attribute names and values the items must be equal to.
+        :param range_condition: ``None`` or a tuple like ``(name, operator, value)``,
+            with operator one of ``"lt"``, ``"le"``, ``"gt"``, ``"ge"`` and ``"begins_with"``,
+            or like ``(name, "between", lo, hi)``.
+        :param attributes: ``None`` to read all attributes, or a list of attribute names.
+        :param consistent_read: if true, strongly consistent reads are used, so global secondary indexes are not considered.
+        :param allow_scan: if false, a :exc:`ValueError` is raised when no key or index matches the conditions.
+            :class:`.Scan` is never chosen for strongly consistent reads.
+        :param expected_items: the number of items a :class:`.Query` is expected to return, used to estimate its capacity.
+
+        :rtype: :class:`AccessPlan`
+        """
+        if range_condition is not None and range_condition[1] not in _operators:
+            raise ValueError("Unknown operator {}".format(range_condition[1]))
+        description = self.description
+        paths = [_AccessPath(None, description.key_schema, None, description.item_count, description.table_size_bytes)]
+        for index in description.local_secondary_indexes or []:
+            paths.append(_AccessPath(index.index_name, index.key_schema, index.projection, index.item_count, index.index_size_bytes, fetches=paths[0]))
+        if not consistent_read:
+            for index in description.global_secondary_indexes or []:
+                paths.append(_AccessPath(index.index_name, index.key_schema, index.projection, index.item_count, index.index_size_bytes))
+
+        needed = None
+        if attributes is not None:
+            needed = set(attributes) | set(key)
+            if range_condition is not None:
+                needed.add(range_condition[0])
+
+        candidates = []
+        for path in paths:
+            plan = path.plan(self.__name, paths[0], key, range_condition, needed, consistent_read, expected_items)
+            if plan is not None:
+                candidates.append(plan)
+        if candidates:
+            rank, capacity, is_index, plan = min(candidates, key=lambda c: c[:3])
+        elif allow_scan and not consistent_read:
+            plan = AccessPlan(_lv.Scan(self.__name), None, _capacity(description.table_size_bytes or 0, False))
+            _add_filter(plan.action, key, range_condition)
+        else:
+            raise ValueError("No key or index of table {} matches the conditions".format(self.__name))
+        if attributes is not None:
+            plan.action.project(*attributes)
+        return plan
+
+    def find(self, key, range_condition=None, attributes=None, consistent_read=False, allow_scan=False):
+        """
+        Iterate over the items matching some conditions, using the action chosen by :meth:`plan`.
+        """
+        plan = self.plan(key, range_condition, attributes, consistent_read, allow_scan)
+        if plan.action.name == "GetItem":
+            item = self.__connection(plan.action).item
+            if item is not None:
+                yield item
+        elif plan.action.name == "Query":
+            for item in _lv.iterate_query(self.__connection, plan.action):
+                yield item
+        else:
+            for item in _lv.iterate_scan(self.__connection, plan.action):
+                yield item
+
+
+class AccessPlan(object):
+    """
+    The way :meth:`Table.plan` chose to read some items.
+    """
+
+    def __init__(self, action, index_name, estimated_capacity_units):
+        self.action = action
+        """The :class:`.GetItem`, :class:`.Query` or :class:`.Scan` to send. It can be customized before sending it."""
+        self.index_name = index_name
+        """The name of the index used by the :class:`.Query`, or ``None`` if it uses the table."""
+        self.estimated_capacity_units = estimated_capacity_units
+        """The read capacity units the action is expected to consume, estimated from the size of the table or index."""
+
+
+_operators = ("lt", "le", "gt", "ge", "begins_with", "between")
+
+
+class _AccessPath(object):
+    def __init__(self, index_name, key_schema, projection, item_count, size_bytes, fetches=None):
+        self.index_name = index_name
+        self.hash_key = None
+        self.range_key = None
+        for element in key_schema or []:
+            if element.key_type == "HASH":
+                self.hash_key = element.attribute_name
+            else:
+                self.range_key = element.attribute_name
+        if projection is None:
+            self.projection_type = "ALL"
+            self.projected = set()
+        else:
+            self.projection_type = projection.projection_type
+            self.projected = set(projection.non_key_attributes or [])
+        self.item_size = float(size_bytes or 0) / item_count if item_count else 0
+        # Local secondary indexes fetch attributes they don't project from the table
+        self.fetches = fetches
+
+    def covers(self, table, needed):
+        if self.projection_type == "ALL":
+            return True
+        if needed is None:
+            return False
+        projected = self.projected | set([self.hash_key, self.range_key, table.hash_key, table.range_key])
+        return needed <= projected
+
+    def plan(self, table_name, table, key, range_condition, needed, consistent_read, expected_items):
+        # Return (rank, estimated capacity, is an index, plan) or None if this path can't be used
+        if self.hash_key not in key:
+            return None
+        covered = self.covers(table, needed)
+        if not covered and self.fetches is None:
+            return None
+        is_index = self.index_name is not None
+
+        if not is_index and set(key) == set([self.hash_key, self.range_key]) - set([None]) and range_condition is None:
+            action = _lv.GetItem(table_name, key)
+            if consistent_read:
+                action.consistent_read_true()
+            capacity = _capacity(self.item_size, consistent_read)
+            return (0, capacity, False, AccessPlan(action, None, capacity))
+
+        action = _lv.Query(table_name).key_eq(self.hash_key, key[self.hash_key])
+        filtered_key = dict((name, value) for name, value in key.iteritems() if name != self.hash_key)
+        filtered_range_condition = range_condition
+        if self.range_key is not None and self.range_key in key:
+            rank = 1
+            action.key_eq(self.range_key, filtered_key.pop(self.range_key))
+        elif self.range_key is not None and range_condition is not None and range_condition[0] == self.range_key:
+            rank = 2
+            name, operator = range_condition[:2]
+            getattr(action, "key_" + operator)(name, *range_condition[2:])
+            filtered_range_condition = None
+        else:
+            rank = 3
+        if is_index:
+            action.index_name(self.index_name)
+        if consistent_read:
+            action.consistent_read_true()
+        _add_filter(action, filtered_key, filtered_range_condition)
+
+        capacity = _capacity(expected_items * self.item_size, consistent_read)
+        if not covered:
+            if needed is None:
+                action.select_all_attributes()
+            capacity += expected_items * _capacity(self.fetches.item_size, consistent_read)
+        return (rank, capacity, is_index, AccessPlan(action, self.index_name, capacity))
+
+
+def _capacity(size, consistent_read):
+    # One unit per 4KB, at least one, halved for eventually consistent reads
+    units = max(1, int(math.ceil(size / 4096.)))
+    if consistent_read:
+        return float(units)
+    else:
+        return units / 2.
+
+
+def _add_filter(action, key, range_condition):
+    conditions = []
+    for i, (name, value) in enumerate(sorted(key.iteritems())):
+        action.expression_attribute_name("lvt{}".format(i), name)
+        action.expression_attribute_value("lvt{}".format(i), value)
+        conditions.append("#lvt{0}=:lvt{0}".format(i))
+    if range_condition is not None:
+        i = len(key)
+        name, operator, values = range_condition[0], range_condition[1], range_condition[2:]
+        action.expression_attribute_name("lvt{}".format(i), name)
+        for j, value in enumerate(values):
+            action.expression_attribute_value("lvt{}_{}".format(i, j), value)
+        if operator == "begins_with":
+            conditions.append("begins_with(#lvt{0}, :lvt{0}_0)".format(i))
+        elif operator == "between":
+            conditions.append("#lvt{0} BETWEEN :lvt{0}_0 AND :lvt{0}_1".format(i))
+        else:
+            conditions.append("#lvt{0}{1}:lvt{0}_0".format(i, _comparators[operator]))
+    if conditions:
+        action.filter_expression(" AND ".join(conditions))
+
+
+_comparators = {"lt": "<", "le": "<=", "gt": ">", "ge": ">="}
+
+
+class TableUnitTests(_tst.UnitTestsWithMocks):
+    def setUp(self):
+        super(TableUnitTests, self).setUp()
+        self.connection = self.mocks.create("connection")
+        self.table = Table(self.connection.object, "t")
+        self.now = 1000.
+        self.table._Table__clock = lambda: self.now
+
+    def expect_describe(self):
+        def key_schema(hash_key, range_key=None):
+            schema = [{"AttributeName": hash_key, "KeyType": "HASH"}]
+            if range_key is not None:
+                schema.append({"AttributeName": range_key, "KeyType": "RANGE"})
+            return schema
+
+        self.connection.expect._call_.withArguments(self.ActionChecker("DescribeTable", {"TableName": "t"})).andReturn(
+            _lv.DescribeTableResponse(Table={
+                "TableName": "t",
+                "KeySchema": key_schema("h", "r"),
+                "ItemCount": 10,
+                "TableSizeBytes": 100000,
+                "LocalSecondaryIndexes": [
+                    {"IndexName": "lsi", "KeySchema": key_schema("h", "l"), "Projection": {"ProjectionType": "KEYS_ONLY"}, "ItemCount": 10, "IndexSizeBytes": 1000},
+                ],
+                "GlobalSecondaryIndexes": [
+                    {"IndexName": "gsi", "KeySchema": key_schema("g"), "Projection": {"ProjectionType": "INCLUDE", "NonKeyAttributes": ["a"]}, "ItemCount": 10, "IndexSizeBytes": 2000},
+                    {"IndexName": "gsi_all", "KeySchema": key_schema("g", "r"), "Projection": {"ProjectionType": "ALL"}, "ItemCount": 10, "IndexSizeBytes": 100000},
+                ],
+            })
+        )
+
+    def assertPlan(self, plan, name, payload, index_name, estimated_capacity_units):
+        self.assertEqual(plan.action.name, name)
+        self.assertEqual(plan.action.payload, payload)
+        self.assertEqual(plan.index_name, index_name)
+        self.assertEqual(plan.estimated_capacity_units, estimated_capacity_units)
+
+    def test_get_item(self):
+        self.expect_describe()
+        self.assertPlan(self.table.plan({"h": u"x", "r": 1}), "GetItem", {"TableName": "t", "Key": {"h": {"S": "x"}, "r": {"N": "1"}}}, None, 1.5)
+        self.assertPlan(
+            self.table.plan({"h": u"x", "r": 1}, consistent_read=True),
+            "GetItem", {"TableName": "t", "Key": {"h": {"S": "x"}, "r": {"N": "1"}}, "ConsistentRead": True}, None, 3.
+        )
+
+    def test_query_with_key_condition_on_table(self):
+        self.expect_describe()
+        self.assertPlan(
+            self.table.plan({"h": u"x"}, ("r", "between", 1, 3), expected_items=2),
+            "Query",
+            {
+                "TableName": "t",
+                "KeyConditions": {
+                    "h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"S": "x"}]},
+                    "r": {"ComparisonOperator": "BETWEEN", "AttributeValueList": [{"N": "1"}, {"N": "3"}]},
+                },
+            },
+            None,
+            2.5,
+        )
+
+    def test_query_on_covering_local_index(self):
+        self.expect_describe()
+        self.assertPlan(
+            self.table.plan({"h": u"x"}, ("l", "ge", 1), attributes=["h", "l"]),
+            "Query",
+            {
+                "TableName": "t",
+                "IndexName": "lsi",
+                "KeyConditions": {
+                    "h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"S": "x"}]},
+                    "l": {"ComparisonOperator": "GE", "AttributeValueList": [{"N": "1"}]},
+                },
+                "ProjectionExpression": "h, l",
+            },
+            "lsi",
+            0.5,
+        )
+
+    def test_query_on_local_index_with_fetch(self):
+        self.expect_describe()
+        self.assertPlan(
+            self.table.plan({"h": u"x", "a": 2}, ("l", "lt", 1)),
+            "Query",
+            {
+                "TableName": "t",
+                "IndexName": "lsi",
+                "KeyConditions": {
+                    "h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"S": "x"}]},
+                    "l": {"ComparisonOperator": "LT", "AttributeValueList": [{"N": "1"}]},
+                },
+                "Select": "ALL_ATTRIBUTES",
+                "FilterExpression": "#lvt0=:lvt0",
+                "ExpressionAttributeNames": {"#lvt0": "a"},
+                "ExpressionAttributeValues": {":lvt0": {"N": "2"}},
+            },
+            "lsi",
+            2.,
+        )
+
+    def test_query_on_global_indexes(self):
+        self.expect_describe()
+        # Only gsi_all projects all attributes
+        self.assertPlan(
+            self.table.plan({"g": 1}),
+            "Query",
+            {"TableName": "t", "IndexName": "gsi_all", "KeyConditions": {"g": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "1"}]}}},
+            "gsi_all",
+            1.5,
+        )
+        # Both project a, gsi has smaller items
+        self.assertPlan(
+            self.table.plan({"g": 1}, attributes=["a"]),
+            "Query",
+            {"TableName": "t", "IndexName": "gsi", "KeyConditions": {"g": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "1"}]}}, "ProjectionExpression": "a"},
+            "gsi",
+            0.5,
+        )
+        # gsi_all's key is better constrained
+        self.assertPlan(
+            self.table.plan({"g": 1, "r": 2}, attributes=["a"]),
+            "Query",
+            {
+                "TableName": "t",
+                "IndexName": "gsi_all",
+                "KeyConditions": {
+                    "g": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "1"}]},
+                    "r": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "2"}]},
+                },
+                "ProjectionExpression": "a",
+            },
+            "gsi_all",
+            1.5,
+        )
+
+    def test_consistent_read_excludes_global_indexes(self):
+        self.expect_describe()
+        with self.assertRaises(ValueError) as catcher:
+            self.table.plan({"g": 1}, consistent_read=True, allow_scan=True)
+        self.assertEqual(catcher.exception.args, ("No key or index of table t matches the conditions",))
+
+    def test_scan(self):
+        self.expect_describe()
+        with self.assertRaises(ValueError):
+            self.table.plan({"a": 1})
+        self.assertPlan(
+            self.table.plan({"a": 1}, ("b", "begins_with", u"x"), allow_scan=True),
+            "Scan",
+            {
+                "TableName": "t",
+                "FilterExpression": "#lvt0=:lvt0 AND begins_with(#lvt1, :lvt1_0)",
+                "ExpressionAttributeNames": {"#lvt0": "a", "#lvt1": "b"},
+                "ExpressionAttributeValues": {":lvt0": {"N": "1"}, ":lvt1_0": {"S": "x"}},
+            },
+            None,
+            12.5,
+        )
+
+    def test_unknown_operator(self):
+        with self.assertRaises(ValueError) as catcher:
+            self.table.plan({"h": u"x"}, ("r", "ne", 1))
+        self.assertEqual(catcher.exception.args, ("Unknown operator ne",))
+
+    def test_description_is_cached(self):
+        self.expect_describe()
+        self.table.plan({"h": u"x", "r": 1})
+        self.now += 299
+        self.table.plan({"h": u"x", "r": 1})
+        self.now += 1
+        self.expect_describe()
+        self.table.plan({"h": u"x", "r": 1})
+        self.expect_describe()
+        self.table.refresh()
+        self.assertEqual(self.table.description.table_name, "t")
+
+    def test_find_with_get_item(self):
+        self.expect_describe()
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"S": "x"}, "r": {"N": "1"}}})
+        ).andReturn(_lv.GetItemResponse(Item={"h": {"S": "x"}, "r": {"N": "1"}}))
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"S": "x"}, "r": {"N": "2"}}})
+        ).andReturn(_lv.GetItemResponse())
+        self.assertEqual(list(self.table.find({"h": u"x", "r": 1})), [{"h": "x", "r": 1}])
+        self.assertEqual(list(self.table.find({"h": u"x", "r": 2})), [])
+
+    def test_find_with_query_and_scan(self):
+        self.expect_describe()
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Query", {"TableName": "t", "KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"S": "x"}]}}})
+        ).andReturn(_lv.QueryResponse(Items=[{"h": {"S": "x"}, "r": {"N": "1"}}, {"h": {"S": "x"}, "r": {"N": "2"}}]))
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("Scan", {"TableName": "t", "FilterExpression": "#lvt0=:lvt0", "ExpressionAttributeNames": {"#lvt0": "a"}, "ExpressionAttributeValues": {":lvt0": {"N": "1"}}})
+        ).andReturn(_lv.ScanResponse(Items=[{"h": {"S": "y"}, "r": {"N": "1"}, "a": {"N": "1"}}]))
+        self.assertEqual(list(self.table.find({"h": u"x"})), [{"h": "x", "r": 1}, {"h": "x", "r": 2}])
+        self.assertEqual(list(self.table.find({"a": 1}, allow_scan=True)), [{"h": "y", "r": 1, "a": 1}])
@@ -3,10 +3,15 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 from .test_batch_delete_item import BatchDeleteItemLocalIntegTests
+from .test_batch_get_item_loader import BatchGetItemLoaderLocalIntegTests
+from .test_checkpoints import CheckpointsLocalIntegTests
 from .test_iterate_batch_get_item import IterateBatchGetItemLocalIntegTests
 from .test_batch_put_item import BatchPutItemLocalIntegTests
+from .test_buffered_batch_writer import BufferedBatchWriterLocalIntegTests
 from .test_iterate_list_tables import IterateListTablesLocalIntegTests
 from .test_iterate_query import QueryIteratorLocalIntegTests
 from .test_iterate_scan import ScanIteratorLocalIntegTests
+from .test_pipelined_batch_write_item import PipelinedBatchWriteItemLocalIntegTests
+from .test_table import TableLocalIntegTests
 from .test_wait_for_table_activation import WaitForTableActivationLocalIntegTests
 from .test_wait_for_table_deletion import WaitForTableDeletionLocalIntegTests
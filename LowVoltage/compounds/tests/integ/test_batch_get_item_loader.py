@@ -0,0 +1,34 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import threading
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+
+
+class BatchGetItemLoaderLocalIntegTests(_tst.LocalIntegTestsWithTableH):
+    def setUp(self):
+        super(BatchGetItemLoaderLocalIntegTests, self).setUp()
+        _lv.batch_put_item(self.connection, "Aaa", [{"h": u"{}".format(i), "a": i, "b": i * 2} for i in range(20)])
+
+    def test(self):
+        loader = _lv.BatchGetItemLoader(self.connection, window=0.05)
+        actions = [_lv.GetItem("Aaa", {"h": u"{}".format(i)}) for i in range(25)]
+        actions[3].project("b")
+        actions[4].consistent_read_true()
+        results = [None] * len(actions)
+
+        def get(i):
+            results[i] = loader.get(actions[i])
+
+        threads = [threading.Thread(target=get, args=(i,)) for i in range(len(actions))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        expected = [{"h": u"{}".format(i), "a": i, "b": i * 2} for i in range(20)] + [None] * 5
+        expected[3] = {"b": 6}
+        self.assertEqual(results, expected)
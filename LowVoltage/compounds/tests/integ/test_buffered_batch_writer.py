@@ -0,0 +1,21 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+
+
+class BufferedBatchWriterLocalIntegTests(_tst.LocalIntegTestsWithTableH):
+    def test(self):
+        with _lv.BufferedBatchWriter(self.connection, max_delay=0.01) as writer:
+            writes = [writer.put("Aaa", {"h": u"{}".format(i), "a": i}) for i in range(60)]
+            writes.append(writer.put("Aaa", {"h": u"0", "a": 42}))
+            writes.append(writer.delete("Aaa", {"h": u"1"}))
+        for write in writes:
+            write.result()
+
+        items = sorted(_lv.iterate_scan(self.connection, _lv.Scan("Aaa")), key=lambda item: int(item["h"]))
+        self.assertEqual(len(items), 59)
+        self.assertEqual(items[0], {"h": u"0", "a": 42})
+        self.assertEqual(items[1], {"h": u"2", "a": 2})
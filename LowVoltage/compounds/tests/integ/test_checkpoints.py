@@ -0,0 +1,40 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+
+
+class CheckpointsLocalIntegTests(_tst.LocalIntegTestsWithTableH):
+    keys = [u"{:03}".format(k) for k in range(15)]
+
+    class Store(object):
+        def __init__(self):
+            self.checkpoint = None
+
+        def save(self, checkpoint):
+            self.checkpoint = checkpoint
+
+        def load(self):
+            return self.checkpoint
+
+    def setUp(self):
+        super(CheckpointsLocalIntegTests, self).setUp()
+        self.connection(
+            _lv.BatchWriteItem().table("Aaa").put(
+                {"h": h, "xs": "x" * 300000}  # 300kB items ensure a single Scan will return at most 4 items
+                for h in self.keys
+            )
+        )
+
+    def test_interrupted_scan(self):
+        store = self.Store()
+        keys = []
+        for item in _lv.checkpointed_iterate_scan(self.connection, _lv.Scan("Aaa"), store, total_segments=2):
+            keys.append(item["h"])
+            if len(keys) == 6:
+                break
+        keys.extend(item["h"] for item in _lv.resume_iterate(self.connection, store))
+        self.assertEqual(sorted(set(keys)), self.keys)
+        self.assertTrue(all(segment["done"] for segment in store.checkpoint["segments"].values()))
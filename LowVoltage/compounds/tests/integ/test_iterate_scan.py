@@ -29,3 +29,15 @@ class ScanIteratorLocalIntegTests(_tst.LocalIntegTestsWithTableH):
         for segment in _lv.parallelize_scan(_lv.Scan("Aaa"), 3):
             keys.extend(item["h"] for item in _lv.iterate_scan(self.connection, segment))
         self.assertEqual(sorted(keys), self.keys)
+
+    def test_parallel_iterate_scan(self):
+        last_evaluated_keys = {}
+
+        def progress(segment, r):
+            last_evaluated_keys[segment] = r.last_evaluated_key
+
+        self.assertEqual(
+            sorted(item["h"] for item in _lv.parallel_iterate_scan(self.connection, _lv.Scan("Aaa"), 3, progress=progress)),
+            self.keys
+        )
+        self.assertEqual(last_evaluated_keys, {0: None, 1: None, 2: None})
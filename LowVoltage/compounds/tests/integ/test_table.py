@@ -0,0 +1,33 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+
+
+class TableLocalIntegTests(_tst.LocalIntegTestsWithTableHR):
+    def setUp(self):
+        super(TableLocalIntegTests, self).setUp()
+        _lv.batch_put_item(self.connection, "Aaa", [{"h": u"{}".format(h), "r": r, "a": h * 10 + r} for h in range(3) for r in range(5)])
+        self.table = _lv.Table(self.connection, "Aaa")
+
+    def test_get_item(self):
+        self.assertEqual(list(self.table.find({"h": u"1", "r": 2})), [{"h": u"1", "r": 2, "a": 12}])
+
+    def test_query(self):
+        self.assertEqual(
+            list(self.table.find({"h": u"1"}, ("r", "ge", 3))),
+            [{"h": u"1", "r": 3, "a": 13}, {"h": u"1", "r": 4, "a": 14}]
+        )
+
+    def test_query_with_filter(self):
+        self.assertEqual(list(self.table.find({"h": u"2", "a": 21})), [{"h": u"2", "r": 1, "a": 21}])
+
+    def test_scan(self):
+        self.assertEqual(sorted(self.table.find({}, ("a", "between", 13, 21), allow_scan=True), key=lambda item: item["a"]), [
+            {"h": u"1", "r": 3, "a": 13},
+            {"h": u"1", "r": 4, "a": 14},
+            {"h": u"2", "r": 0, "a": 20},
+            {"h": u"2", "r": 1, "a": 21},
+        ])
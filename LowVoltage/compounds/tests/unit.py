@@ -3,10 +3,15 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 from ..batch_delete_item import BatchDeleteItemUnitTests
+from ..batch_get_item_loader import BatchGetItemLoaderUnitTests
 from ..batch_put_item import BatchPutItemUnitTests
+from ..buffered_batch_writer import BufferedBatchWriterUnitTests
+from ..checkpoints import CheckpointsUnitTests
 from ..iterate_batch_get_item import IterateBatchGetItemUnitTests
 from ..iterate_list_tables import IterateListTablesUnitTests
 from ..iterate_query import IterateQueryUnitTests
 from ..iterate_scan import IterateScanUnitTests
+from ..pipelined_batch_write_item import PipelinedBatchWriteItemUnitTests
+from ..table import TableUnitTests
 from ..wait_for_table_activation import WaitForTableActivationUnitTests
 from ..wait_for_table_deletion import WaitForTableDeletionUnitTests
@@ -3,5 +3,12 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 from .connection import Connection
-from .retry_policies import ExponentialBackoffRetryPolicy
+from .async_connection import AsyncConnection
+from .retry_policies import ExponentialBackoffRetryPolicy, FullJitterRetryPolicy, DecorrelatedJitterRetryPolicy, ExceptionDependentRetryPolicy, BudgetedRetryPolicy
+from .json_codecs import JsonCodec
+from .metrics import MetricsRegistry
+from .rate_limiters import TokenBucketRateLimiter
+from .hedging import PercentileHedgingPolicy
+from .caching import CachingConnection
 from .credentials import StaticCredentials, EnvironmentCredentials, Ec2RoleCredentials
+from .recording import TrafficRecorder, load_traffic, replay
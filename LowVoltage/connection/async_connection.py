@@ -0,0 +1,597 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+import datetime
+import functools
+import hashlib
+import json
+import unittest
+import urlparse
+
+try:
+    import asyncio
+except ImportError:  # pragma no cover (Python 2)
+    try:
+        import trollius as asyncio
+    except ImportError:
+        asyncio = None
+
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from . import retry_policies
+from . import json_codecs
+from .connection import Signer, Responder, _EncodedAction
+
+
+class AsyncConnection(object):
+    """
+    An asynchronous counterpart of :class:`.Connection`, based on `asyncio <https://docs.python.org/3/library/asyncio.html>`__
+    (or `Trollius <http://trollius.readthedocs.org/>`__ on Python 2).
+
+    It sends the same actions and returns the same responses, but calling it returns a future instead of blocking,
+    so a single event loop can have many requests in flight at once.
+    Retries are scheduled on the event loop, they don't block it.
+
+    :param region: see :class:`.Connection`.
+    :param credentials: see :class:`.Connection`. Note that the credentials provider is called synchronously.
+    :param endpoint: see :class:`.Connection`.
+    :param retry_policy: see :class:`.Connection`.
+    :param loop: the event loop to run requests on. If left ``None``, ``asyncio.get_event_loop()`` will be used.
+    :param http_session: an :class:`AsyncHttpSession`. Typically not used. Leave it to ``None`` and one will be created for you.
+    :param codec: see :class:`.Connection`.
+    """
+
+    def __init__(self, region, credentials, endpoint=None, retry_policy=None, loop=None, http_session=None, codec=None):
+        if asyncio is None:  # pragma no cover (Python 2 without Trollius)
+            raise ImportError("AsyncConnection requires asyncio (or Trollius on Python 2).")
+        if endpoint is None:
+            endpoint = "https://dynamodb.{}.amazonaws.com/".format(region)
+        if retry_policy is None:
+            retry_policy = retry_policies.DEFAULT
+        if loop is None:
+            loop = asyncio.get_event_loop()
+        if http_session is None:
+            http_session = AsyncHttpSession(loop)
+        if codec is None:
+            codec = json_codecs.DEFAULT
+
+        self.__region = region
+        self.__credentials = credentials
+        self.__endpoint = endpoint
+        self.__host = urlparse.urlparse(self.__endpoint).hostname
+        self.__retry_policy = retry_policy
+        self.__loop = loop
+        self.__session = http_session
+        self.__codec = codec
+
+        # Dependency injection through monkey-patching
+        self.__signer = Signer(self.__region, self.__host)
+        self.__responder = Responder(self.__codec)
+        self.__now = datetime.datetime.utcnow
+
+    def __call__(self, action):
+        """
+        Send requests and return a future of the response.
+
+        With Python 3.5+, ``response = await connection(action)``.
+        With Python 3.4, ``response = yield from connection(action)``.
+        With Trollius, ``response = yield From(connection(action))``.
+        """
+        future = asyncio.Future(loop=self.__loop)
+        try:
+            encoded = _EncodedAction(action, self.__codec)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            self.__request(action, encoded, [], future)
+        return future
+
+    def close(self):
+        """
+        Close the idle HTTP connections.
+        """
+        self.__session.close()
+
+    def __request(self, action, encoded, errors, future):
+        if future.done():
+            return
+        try:
+            key, secret, token = self.__credentials.get()
+            headers = self.__signer(key, secret, self.__now(), encoded.name, encoded.body_hash)
+            if token is not None:
+                headers["X-Amz-Security-Token"] = token
+            post = self.__session.post(self.__endpoint, data=encoded.body, headers=headers)
+        except _exn.Error as e:
+            self.__handle_error(action, encoded, errors, future, e)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            post.add_done_callback(functools.partial(self.__on_post_done, action, encoded, errors, future))
+
+    def __on_post_done(self, action, encoded, errors, future, post):
+        if future.done():
+            return
+        try:
+            try:
+                r = post.result()
+            except EnvironmentError as e:
+                raise _exn.NetworkError(e)
+            except Exception as e:
+                raise _exn.UnknownError(e)
+            response = self.__responder(action.response_class, r)
+        except _exn.Error as e:
+            self.__handle_error(action, encoded, errors, future, e)
+        except Exception as e:
+            future.set_exception(e)
+        else:
+            future.set_result(response)
+
+    def __handle_error(self, action, encoded, errors, future, e):
+        if e.retryable:
+            errors.append(e)
+            delay = self.__retry_policy.retry(action, errors)
+            if delay is not None:
+                self.__loop.call_later(delay, self.__request, action, encoded, errors, future)
+                return
+        future.set_exception(e)
+
+
+class AsyncHttpResponse(object):
+    """
+    The minimal part of a ``requests.Response`` needed by the responder.
+    """
+
+    def __init__(self, status_code, headers, content):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+
+    @property
+    def text(self):
+        return self.content.decode("utf-8")
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class AsyncHttpSession(object):
+    """
+    A tiny HTTP/1.1 client running on an event loop, with keep-alive connections.
+    It only implements what DynamoDB needs: POST requests with a body, and responses with a
+    ``Content-Length``, a chunked body or a body terminated by the end of the connection.
+
+    :param loop: the event loop.
+    :param max_idle_connections: the maximum number of idle connections kept alive for each host.
+    """
+
+    def __init__(self, loop, max_idle_connections=10):
+        self.__loop = loop
+        self.__max_idle_connections = max_idle_connections
+        self.__idle = {}
+
+    def post(self, url, data, headers):
+        """
+        Send a POST request and return a future of an :class:`AsyncHttpResponse`.
+        The future raises an ``EnvironmentError`` (``OSError``) for network problems.
+        """
+        url = urlparse.urlparse(url)
+        use_ssl = url.scheme == "https"
+        host = url.hostname
+        port = url.port or (443 if use_ssl else 80)
+        pool_key = (host, port, use_ssl)
+
+        if isinstance(data, unicode):
+            data = data.encode("utf-8")
+        headers = dict(headers)
+        headers.setdefault("Host", host)
+        headers["Content-Length"] = len(data)
+        lines = ["POST {} HTTP/1.1".format(url.path or "/")]
+        lines.extend("{}: {}".format(k, v) for k, v in sorted(headers.iteritems()))
+        request = ("\r\n".join(lines) + "\r\n\r\n").encode("latin-1") + data
+
+        future = asyncio.Future(loop=self.__loop)
+        protocol = self.__pop_idle(pool_key)
+        if protocol is None:
+            connecting = self.__loop.create_task(self.__loop.create_connection(
+                functools.partial(_HttpClientProtocol, self.__loop),
+                host, port,
+                ssl=use_ssl or None,
+                server_hostname=host if use_ssl else None,
+            ))
+            connecting.add_done_callback(functools.partial(self.__on_connected, pool_key, request, future))
+        else:
+            self.__send(pool_key, protocol, request, future)
+        return future
+
+    def close(self):
+        """
+        Close all idle connections.
+        """
+        for protocols in self.__idle.itervalues():
+            for protocol in protocols:
+                protocol.close()
+        self.__idle = {}
+
+    def __pop_idle(self, pool_key):
+        protocols = self.__idle.get(pool_key, [])
+        while protocols:
+            protocol = protocols.pop()
+            if protocol.is_reusable():
+                return protocol
+        return None
+
+    def __push_idle(self, pool_key, protocol):
+        protocols = self.__idle.setdefault(pool_key, [])
+        if protocol.is_reusable() and len(protocols) < self.__max_idle_connections:
+            protocols.append(protocol)
+        else:
+            protocol.close()
+
+    def __on_connected(self, pool_key, request, future, connecting):
+        try:
+            transport, protocol = connecting.result()
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.__send(pool_key, protocol, request, future)
+
+    def __send(self, pool_key, protocol, request, future):
+        exchange = protocol.send(request)
+        exchange.add_done_callback(functools.partial(self.__on_exchange_done, pool_key, protocol, future))
+
+    def __on_exchange_done(self, pool_key, protocol, future, exchange):
+        try:
+            response = exchange.result()
+        except Exception as e:
+            protocol.close()
+            if not future.done():
+                future.set_exception(e)
+        else:
+            self.__push_idle(pool_key, protocol)
+            if not future.done():
+                future.set_result(response)
+
+
+class _HttpClientProtocol(asyncio.Protocol if asyncio is not None else object):
+    def __init__(self, loop):
+        self.__loop = loop
+        self.__transport = None
+        self.__future = None
+        self.__buffer = bytearray()
+        self.__reusable = False
+
+    def connection_made(self, transport):
+        self.__transport = transport
+        self.__reusable = True
+
+    def send(self, request):
+        assert self.__future is None
+        self.__future = asyncio.Future(loop=self.__loop)
+        self.__buffer = bytearray()
+        self.__transport.write(request)
+        return self.__future
+
+    def is_reusable(self):
+        return self.__reusable and self.__future is None
+
+    def close(self):
+        self.__reusable = False
+        if self.__transport is not None:
+            self.__transport.close()
+
+    def data_received(self, data):
+        self.__buffer.extend(data)
+        self.__parse(eof=False)
+
+    def eof_received(self):
+        self.__parse(eof=True)
+
+    def connection_lost(self, exc):
+        self.__reusable = False
+        if self.__future is not None:
+            self.__parse(eof=True)
+        if self.__future is not None:
+            self.__fail(exc or IOError("Connection closed before the end of the response"))
+
+    def __parse(self, eof):
+        if self.__future is None:
+            return
+        end_of_headers = self.__buffer.find(b"\r\n\r\n")
+        if end_of_headers == -1:
+            if eof:
+                self.__fail(IOError("Connection closed before the end of the response headers"))
+            return
+        head = bytes(self.__buffer[:end_of_headers]).decode("latin-1").split("\r\n")
+        try:
+            status_code = int(head[0].split(" ")[1])
+        except (IndexError, ValueError):
+            self.__fail(IOError("Malformed HTTP status line: {!r}".format(head[0])))
+            return
+        headers = {}
+        for line in head[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        body = self.__buffer[end_of_headers + 4:]
+
+        if "content-length" in headers:
+            length = int(headers["content-length"])
+            if len(body) < length:
+                if eof:
+                    self.__fail(IOError("Connection closed before the end of the response body"))
+                return
+            content = bytes(body[:length])
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            content = _decode_chunked(body)
+            if content is None:
+                if eof:
+                    self.__fail(IOError("Connection closed before the end of the chunked response body"))
+                return
+        elif eof:
+            content = bytes(body)
+            self.__reusable = False
+        else:
+            return
+
+        if headers.get("connection", "").lower() == "close":
+            self.__reusable = False
+        future, self.__future = self.__future, None
+        self.__buffer = bytearray()
+        if not future.done():
+            future.set_result(AsyncHttpResponse(status_code, headers, content))
+
+    def __fail(self, exc):
+        self.__reusable = False
+        future, self.__future = self.__future, None
+        if self.__transport is not None:
+            self.__transport.close()
+        if not future.done():
+            future.set_exception(exc)
+
+
+def _decode_chunked(body):
+    # Return None while the body is incomplete
+    content = bytearray()
+    position = 0
+    while True:
+        end_of_size = body.find(b"\r\n", position)
+        if end_of_size == -1:
+            return None
+        size = int(bytes(body[position:end_of_size]).split(b";")[0], 16)
+        start = end_of_size + 2
+        if size == 0:
+            return bytes(content)
+        if len(body) < start + size + 2:
+            return None
+        content.extend(body[start:start + size])
+        position = start + size + 2
+
+
+if asyncio is not None:
+    class AsyncConnectionUnitTests(_tst.UnitTestsWithMocks):
+        def setUp(self):
+            super(AsyncConnectionUnitTests, self).setUp()
+            self.loop = asyncio.new_event_loop()
+            self.credentials = self.mocks.create("credentials")
+            self.retry_policy = self.mocks.create("retry_policy")
+            self.session = self.mocks.create("session")
+            self.connection = AsyncConnection(
+                region="us-west-2",
+                credentials=self.credentials.object,
+                endpoint="http://endpoint.com:8000/",
+                retry_policy=self.retry_policy.object,
+                loop=self.loop,
+                http_session=self.session.object,
+            )
+            self.now = self.mocks.replace("self.connection._AsyncConnection__now")
+            self.signer = self.mocks.replace("self.connection._AsyncConnection__signer")
+            self.responder = self.mocks.replace("self.connection._AsyncConnection__responder")
+            self.action = self.mocks.create("action")
+
+        def tearDown(self):
+            self.loop.close()
+            super(AsyncConnectionUnitTests, self).tearDown()
+
+        def __done(self, result=None, exception=None):
+            future = asyncio.Future(loop=self.loop)
+            if exception is None:
+                future.set_result(result)
+            else:
+                future.set_exception(exception)
+            return future
+
+        def __expect_encode(self):
+            # Once per call, not once per attempt
+            self.action.expect.name.andReturn("c")
+            self.action.expect.payload.andReturn({"d": "e"})
+
+        def __expect_post(self, token=None):
+            self.credentials.expect.get().andReturn(("a", "b", token))
+            self.now.expect().andReturn("f")
+            self.signer.expect("a", "b", "f", "c", hashlib.sha256(b'{"d": "e"}').hexdigest()).andReturn({"g": "h"})
+            headers = {"g": "h"}
+            if token is not None:
+                headers["X-Amz-Security-Token"] = token
+            return self.session.expect.post("http://endpoint.com:8000/", data=b'{"d": "e"}', headers=headers)
+
+        def test_identification_with_token(self):
+            self.__expect_encode()
+            self.__expect_post("t").andReturn(self.__done("i"))
+            self.action.expect.response_class.andReturn("j")
+            self.responder.expect("j", "i").andReturn("k")
+
+            self.assertEqual(self.loop.run_until_complete(self.connection(self.action.object)), "k")
+
+        def test_success_on_first_try(self):
+            self.__expect_encode()
+            self.__expect_post().andReturn(self.__done("i"))
+            self.action.expect.response_class.andReturn("j")
+            self.responder.expect("j", "i").andReturn("k")
+
+            self.assertEqual(self.loop.run_until_complete(self.connection(self.action.object)), "k")
+
+        def test_success_on_second_try(self):
+            self.__expect_encode()
+            self.__expect_post().andReturn(self.__done("i"))
+            self.action.expect.response_class.andReturn("j")
+            exception1 = _exn.ProvisionedThroughputExceededException()
+            self.responder.expect("j", "i").andRaise(exception1)
+            self.retry_policy.expect.retry(self.action.object, [exception1]).andReturn(0)
+
+            self.__expect_post().andReturn(self.__done("k"))
+            self.action.expect.response_class.andReturn("l")
+            self.responder.expect("l", "k").andReturn("m")
+
+            self.assertEqual(self.loop.run_until_complete(self.connection(self.action.object)), "m")
+
+        def test_give_up_after_second_try(self):
+            self.__expect_encode()
+            self.__expect_post().andReturn(self.__done("i"))
+            self.action.expect.response_class.andReturn("j")
+            exception1 = _exn.ProvisionedThroughputExceededException()
+            self.responder.expect("j", "i").andRaise(exception1)
+            self.retry_policy.expect.retry(self.action.object, [exception1]).andReturn(0)
+
+            self.__expect_post().andReturn(self.__done("k"))
+            self.action.expect.response_class.andReturn("l")
+            exception2 = _exn.ProvisionedThroughputExceededException()
+            self.responder.expect("l", "k").andRaise(exception2)
+            self.retry_policy.expect.retry(self.action.object, [exception1, exception2]).andReturn(None)
+
+            with self.assertRaises(_exn.ProvisionedThroughputExceededException) as catcher:
+                self.loop.run_until_complete(self.connection(self.action.object))
+            self.assertIs(catcher.exception, exception2)
+
+        def test_failure_on_non_retryable_error(self):
+            self.__expect_encode()
+            self.__expect_post().andReturn(self.__done("i"))
+            self.action.expect.response_class.andReturn("j")
+            exception = _exn.UnknownClientError()
+            self.responder.expect("j", "i").andRaise(exception)
+
+            with self.assertRaises(_exn.UnknownClientError) as catcher:
+                self.loop.run_until_complete(self.connection(self.action.object))
+            self.assertIs(catcher.exception, exception)
+
+        def test_success_after_network_error(self):
+            self.__expect_encode()
+            self.__expect_post().andReturn(self.__done(exception=IOError()))
+            self.retry_policy.expect.retry.withArguments(lambda args, kwds: args[0] is self.action.object and isinstance(args[1][0], _exn.NetworkError)).andReturn(0)
+
+            self.__expect_post().andReturn(self.__done("k"))
+            self.action.expect.response_class.andReturn("l")
+            self.responder.expect("l", "k").andReturn("m")
+
+            self.assertEqual(self.loop.run_until_complete(self.connection(self.action.object)), "m")
+
+        def test_failure_on_unknown_exception_raised_by_session(self):
+            self.__expect_encode()
+            exception = Exception()
+            self.__expect_post().andReturn(self.__done(exception=exception))
+
+            with self.assertRaises(_exn.UnknownError) as catcher:
+                self.loop.run_until_complete(self.connection(self.action.object))
+            self.assertEqual(catcher.exception.args, (exception,))
+
+        def test_success_after_network_error_during_credentials(self):
+            self.__expect_encode()
+            exception = _exn.NetworkError()
+            self.credentials.expect.get().andRaise(exception)
+            self.retry_policy.expect.retry(self.action.object, [exception]).andReturn(0)
+
+            self.__expect_post().andReturn(self.__done("k"))
+            self.action.expect.response_class.andReturn("l")
+            self.responder.expect("l", "k").andReturn("m")
+
+            self.assertEqual(self.loop.run_until_complete(self.connection(self.action.object)), "m")
+
+    class AsyncHttpSessionUnitTests(_tst.UnitTests):
+        class ServerProtocol(asyncio.Protocol):
+            def __init__(self, responses, connections):
+                self.responses = responses
+                connections.append(self)
+
+            def connection_made(self, transport):
+                self.transport = transport
+                self.received = b""
+
+            def data_received(self, data):
+                self.received += data
+                if b"\r\n\r\n" in self.received and self.received.endswith(b"}"):
+                    self.received = b""
+                    response = self.responses.pop(0)
+                    self.transport.write(response)
+                    if b"Connection: close" in response:
+                        self.transport.close()
+
+        def setUp(self):
+            super(AsyncHttpSessionUnitTests, self).setUp()
+            self.loop = asyncio.new_event_loop()
+            self.responses = []
+            self.connections = []
+            self.server = self.loop.run_until_complete(self.loop.create_server(
+                lambda: self.ServerProtocol(self.responses, self.connections),
+                "127.0.0.1", 0
+            ))
+            self.url = "http://127.0.0.1:{}/".format(self.server.sockets[0].getsockname()[1])
+            self.session = AsyncHttpSession(self.loop)
+
+        def tearDown(self):
+            self.session.close()
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+            super(AsyncHttpSessionUnitTests, self).tearDown()
+
+        def post(self):
+            return self.loop.run_until_complete(self.session.post(self.url, data='{"a": 0}', headers={"X-Foo": "bar"}))
+
+        def test_content_length(self):
+            self.responses.append(b'HTTP/1.1 200 OK\r\nContent-Length: 8\r\n\r\n{"b": 1}')
+            r = self.post()
+            self.assertEqual(r.status_code, 200)
+            self.assertEqual(r.json(), {"b": 1})
+
+        def test_chunked(self):
+            self.responses.append(b'HTTP/1.1 400 Bad Request\r\nTransfer-Encoding: chunked\r\n\r\n3\r\n{"b\r\n5\r\n": 1}\r\n0\r\n\r\n')
+            r = self.post()
+            self.assertEqual(r.status_code, 400)
+            self.assertEqual(r.text, u'{"b": 1}')
+
+        def test_keep_alive(self):
+            self.responses.append(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}')
+            self.responses.append(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n[]')
+            self.assertEqual(self.post().json(), {})
+            self.assertEqual(self.post().json(), [])
+            self.assertEqual(len(self.connections), 1)
+
+        def test_connection_close(self):
+            self.responses.append(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\nConnection: close\r\n\r\n{}')
+            self.responses.append(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n[]')
+            self.assertEqual(self.post().json(), {})
+            self.assertEqual(self.post().json(), [])
+            self.assertEqual(len(self.connections), 2)
+
+        def test_concurrent_requests(self):
+            self.responses.extend([b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\n{}'] * 3)
+            futures = [self.session.post(self.url, data='{"a": 0}', headers={}) for i in range(3)]
+            responses = self.loop.run_until_complete(asyncio.gather(*futures))
+            self.assertEqual([r.json() for r in responses], [{}, {}, {}])
+            self.assertEqual(len(self.connections), 3)
+
+        def test_connection_refused(self):
+            self.server.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            with self.assertRaises(EnvironmentError):
+                self.post()
+else:  # pragma no cover (Python 2 without Trollius)
+    @unittest.skip("requires asyncio or Trollius")
+    class AsyncConnectionUnitTests(_tst.UnitTests):
+        def test_async_connection(self):
+            pass
+
+    @unittest.skip("requires asyncio or Trollius")
+    class AsyncHttpSessionUnitTests(_tst.UnitTests):
+        def test_async_http_session(self):
+            pass
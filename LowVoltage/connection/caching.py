@@ -0,0 +1,742 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+:class:`CachingConnection` wraps a connection and keeps the items it gets in an in-process cache,
+to answer eventually consistent reads of the same items without sending requests to DynamoDB:
+
+>>> cached_connection = CachingConnection(connection, max_bytes=16 * 1024 * 1024, ttl=60)
+>>> cached_connection(GetItem(table, {"h": 0})).item
+{u'h': 0, u'gr': 10, u'gh': 0}
+>>> cached_connection(GetItem(table, {"h": 0})).item
+{u'h': 0, u'gr': 10, u'gh': 0}
+>>> cached_connection.stats().hits
+1
+
+Writes sent through the caching connection remove the items they modify from the cache,
+but writes sent by other connections (or other processes) are only seen when cached items expire.
+So a caching connection returns data that can be up to ``ttl`` seconds older than what eventually consistent reads return.
+
+Pages of :class:`.Query` and :class:`.Scan` are cached only if ``page_ttl`` is set.
+Then :meth:`~CachingConnection.invalidate` removes the pages (and items) of a table, or of a single hash key, from the cache:
+
+>>> cached_connection = CachingConnection(connection, page_ttl=60)
+>>> cached_connection(Query(table).key_eq("h", 0)).items
+[{u'h': 0, u'gr': 10, u'gh': 0}]
+>>> cached_connection(Query(table).key_eq("h", 0)).items
+[{u'h': 0, u'gr': 10, u'gh': 0}]
+>>> cached_connection.invalidate(table, {"h": 0})
+>>> cached_connection.stats().invalidations
+1
+"""
+
+import collections
+import decimal
+import json
+import re
+import threading
+import time
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from LowVoltage.actions.action import Action
+from LowVoltage.actions.conversion import _convert_dict_to_db
+
+
+class CachingConnection(object):
+    """
+    A connection answering :class:`.GetItem` and :class:`.BatchGetItem` from a least-recently-used cache of items,
+    optionally answering :class:`.Query` and :class:`.Scan` from a cache of result pages,
+    and forwarding other actions (and the reads it can't answer) to the wrapped connection.
+
+    Eventually consistent reads are answered from the cache. Strongly consistent reads are always sent, and fill the cache.
+    Items are cached separately for each projection. Missing items are cached too ("negative caching").
+    Pages are cached for each distinct request, so the pages of a :func:`.iterate_query` or :func:`.iterate_scan`
+    are all answered from the cache when the same iteration is repeated.
+
+    :class:`.PutItem`, :class:`.UpdateItem`, :class:`.DeleteItem` and :class:`.BatchWriteItem` remove the items
+    they write from the cache, as well as the pages that may contain them, even if they fail.
+    Responses to reads that were sent before such a write and returned after it are not cached.
+    Writes sent by other connections can be taken into account with :meth:`invalidate`.
+
+    Responses built from the cache have no :class:`.ConsumedCapacity`.
+    When a :class:`.BatchGetItem` is partially answered from the cache, its :class:`.ConsumedCapacity` only
+    contains the table names and capacity units of the request sent for the other keys.
+
+    :param connection: the wrapped connection.
+    :param max_bytes: the approximate maximum size of the cache, items and pages included.
+        They are counted with the size of their JSON encoding.
+    :param ttl: the time items are kept in the cache, in seconds.
+    :param negative_ttl: the time missing items are kept in the cache, in seconds. If left ``None``, ``ttl`` will be used.
+    :param page_ttl: the time pages of :class:`.Query` and :class:`.Scan` are kept in the cache, in seconds.
+        If left ``None``, these actions are not cached.
+
+    It can be used by several threads if the wrapped connection can.
+    """
+
+    def __init__(self, connection, max_bytes=64 * 1024 * 1024, ttl=60., negative_ttl=None, page_ttl=None):
+        if negative_ttl is None:
+            negative_ttl = ttl
+        self.__connection = connection
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__page_ttl = page_ttl
+        self.__lock = threading.Lock()
+        # ("item", table, canonical key, projection) or ("page", table, canonical request) -> _Entry, least recently used first
+        self.__entries = collections.OrderedDict()
+        # ("item", table, canonical key) or ("page", table) -> set of keys in __entries
+        self.__groups = {}
+        self.__bytes = 0
+        self.__key_names = {}
+        self.__stats = CacheStats()
+        # See __start_read and __invalidate
+        self.__generation = 0
+        self.__invalidated = {}
+        self.__reads = {}
+        self.__handlers = {
+            "GetItem": self.__get_item,
+            "BatchGetItem": self.__batch_get_item,
+            "Query": self.__query_or_scan,
+            "Scan": self.__query_or_scan,
+            "PutItem": self.__put_item,
+            "UpdateItem": self.__update_or_delete_item,
+            "DeleteItem": self.__update_or_delete_item,
+            "BatchWriteItem": self.__batch_write_item,
+        }
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+
+    def __call__(self, action):
+        """
+        Send an action, or answer it from the cache.
+        """
+        handler = self.__handlers.get(action.name)
+        if handler is None:
+            return self.__connection(action)
+        else:
+            return handler(action)
+
+    def stats(self):
+        """
+        Return statistics about the cache.
+
+        :type: :class:`CacheStats`
+        """
+        with self.__lock:
+            stats = CacheStats()
+            stats.__dict__.update(self.__stats.__dict__)
+            stats.entries = len(self.__entries)
+            stats.bytes = self.__bytes
+            return stats
+
+    def invalidate(self, table, key=None):
+        """
+        Remove the items of a table, and the pages that may contain them, from the cache.
+
+        :param table: the name of the table.
+        :param key: a dict of some attributes of the key, typically the hash key.
+            Items and pages of :class:`.Query` that don't match these attributes are kept.
+            If left ``None``, all items and pages of the table are removed.
+        """
+        key = _attributes(_convert_dict_to_db(key or {}))
+        with self.__lock:
+            self.__generation += 1
+            if self.__reads:
+                self.__invalidated[("table", table)] = self.__generation
+            for cache_key, entry in list(self.__entries.items()):
+                if cache_key[1] == table and _may_contain(entry.attributes, key):
+                    self.__remove(cache_key)
+                    self.__stats.invalidations += 1
+
+    def clear(self):
+        """
+        Remove all items and pages from the cache.
+        """
+        with self.__lock:
+            for cache_key in list(self.__entries.keys()):
+                self.__remove(cache_key)
+
+    def __get_item(self, action):
+        payload = action.payload
+        table = payload["TableName"]
+        self.__learn_key_names(table, payload["Key"])
+        group = ("item", table, _canonical(payload["Key"]))
+        cache_key = group + (_projection(payload),)
+        if not payload.get("ConsistentRead"):
+            found, item = self.__lookup(cache_key)
+            if found:
+                return _lv.GetItemResponse(Item=item)
+        generation = self.__start_read()
+        try:
+            r = self.__connection(action)
+            with self.__lock:
+                self.__fill_item(cache_key, payload["Key"], r.raw_item, generation)
+            return r
+        finally:
+            self.__end_read(generation)
+
+    def __batch_get_item(self, action):
+        payload = action.payload
+        found_items = {}
+        request_items = {}
+        for table, request in payload["RequestItems"].iteritems():
+            projection = _projection(request)
+            if request["Keys"]:
+                self.__learn_key_names(table, request["Keys"][0])
+            if request.get("ConsistentRead"):
+                request_items[table] = request
+            else:
+                keys = []
+                for key in request["Keys"]:
+                    found, item = self.__lookup(("item", table, _canonical(key), projection))
+                    if not found:
+                        keys.append(key)
+                    elif item is not None:
+                        found_items.setdefault(table, []).append(item)
+                if keys:
+                    request_items[table] = dict(request, Keys=keys)
+        if not request_items:
+            return _lv.BatchGetItemResponse(Responses=found_items)
+
+        generation = self.__start_read()
+        try:
+            if found_items:
+                sent_action = _lv.BatchGetItem().previous_unprocessed_keys(request_items)
+                if payload.get("ReturnConsumedCapacity") == "TOTAL":
+                    sent_action.return_consumed_capacity_total()
+            else:
+                sent_action = action
+            r = self.__connection(sent_action)
+            self.__fill_batch(request_items, r, generation)
+        finally:
+            self.__end_read(generation)
+
+        if found_items:
+            responses = dict(found_items)
+            for table, items in (r.raw_responses or {}).iteritems():
+                responses[table] = responses.get(table, []) + items
+            consumed_capacity = None
+            if r.consumed_capacity is not None:
+                consumed_capacity = [{"TableName": c.table_name, "CapacityUnits": c.capacity_units} for c in r.consumed_capacity]
+            return _lv.BatchGetItemResponse(Responses=responses, UnprocessedKeys=r.unprocessed_keys, ConsumedCapacity=consumed_capacity)
+        else:
+            return r
+
+    def __fill_batch(self, request_items, r, generation):
+        with self.__lock:
+            for table, request in request_items.iteritems():
+                key_names = self.__key_names.get(table)
+                projection = _projection(request)
+                if key_names is None or not _projects(request, key_names):
+                    # Returned items can't be matched with requested keys
+                    continue
+                missing = dict((_canonical(key), key) for key in request["Keys"])
+                for key in ((r.unprocessed_keys or {}).get(table) or {}).get("Keys", []):
+                    missing.pop(_canonical(key), None)
+                for item in (r.raw_responses or {}).get(table, []):
+                    key = dict((name, item[name]) for name in key_names)
+                    missing.pop(_canonical(key), None)
+                    self.__fill_item(("item", table, _canonical(key), projection), key, item, generation)
+                for canonical_key, key in missing.iteritems():
+                    self.__fill_item(("item", table, canonical_key, projection), key, None, generation)
+
+    def __query_or_scan(self, action):
+        if self.__page_ttl is None:
+            return self.__connection(action)
+        payload = action.payload
+        table = payload["TableName"]
+        request = dict(payload)
+        request.pop("ConsistentRead", None)
+        request.pop("ReturnConsumedCapacity", None)
+        cache_key = ("page", table, _canonical(request))
+        if not payload.get("ConsistentRead"):
+            found, page = self.__lookup(cache_key)
+            if found:
+                return _response_classes[action.name](**page)
+        generation = self.__start_read()
+        try:
+            r = self.__connection(action)
+            page = dict(Items=r.raw_items, Count=r.count, ScannedCount=r.scanned_count, LastEvaluatedKey=None)
+            if r.last_evaluated_key is not None:
+                page["LastEvaluatedKey"] = _convert_dict_to_db(r.last_evaluated_key)
+            conditions = dict(
+                (name, condition["AttributeValueList"][0])
+                for name, condition in payload.get("KeyConditions", {}).iteritems()
+                if condition["ComparisonOperator"] == "EQ"
+            )
+            with self.__lock:
+                if self.__invalidated.get(("page", table), -1) <= generation:
+                    size = len(cache_key[2]) + len(json.dumps(page["Items"]))
+                    self.__fill(cache_key, ("page", table), page, size, self.__page_ttl, _attributes(conditions), generation)
+            return r
+        finally:
+            self.__end_read(generation)
+
+    def __put_item(self, action):
+        payload = action.payload
+        table = payload["TableName"]
+        try:
+            return self.__connection(action)
+        finally:
+            key_names = self.__key_names.get(table)
+            if key_names is None:
+                self.__invalidate([(table, None)])
+            else:
+                self.__invalidate([(table, dict((name, payload["Item"][name]) for name in key_names))])
+
+    def __update_or_delete_item(self, action):
+        payload = action.payload
+        try:
+            return self.__connection(action)
+        finally:
+            self.__invalidate([(payload["TableName"], payload["Key"])])
+
+    def __batch_write_item(self, action):
+        payload = action.payload
+        try:
+            return self.__connection(action)
+        finally:
+            keys = []
+            for table, requests in payload.get("RequestItems", {}).iteritems():
+                key_names = self.__key_names.get(table)
+                for request in requests:
+                    if "DeleteRequest" in request:
+                        keys.append((table, request["DeleteRequest"]["Key"]))
+                    elif key_names is None:
+                        keys.append((table, None))
+                    else:
+                        item = request["PutRequest"]["Item"]
+                        keys.append((table, dict((name, item[name]) for name in key_names)))
+            self.__invalidate(keys)
+
+    def __learn_key_names(self, table, key):
+        # Items are only cached for tables whose key names are known, so puts on other tables don't need to invalidate any item
+        if table not in self.__key_names:
+            self.__key_names[table] = sorted(key.keys())
+
+    def __lookup(self, cache_key):
+        with self.__lock:
+            entry = self.__entries.get(cache_key)
+            if entry is not None and entry.expiration <= self.__clock():
+                self.__remove(cache_key)
+                entry = None
+            if entry is None:
+                self.__stats.misses += 1
+                return False, None
+            else:
+                # Move to the most recently used end
+                del self.__entries[cache_key]
+                self.__entries[cache_key] = entry
+                self.__stats.hits += 1
+                return True, entry.value
+
+    # A read that was sent before a write and returns after it may return the item as it was before the write.
+    # So each read notes the generation when it starts, each invalidation increments the generation,
+    # and a response is not cached if one of its keys (or its table's pages) was invalidated since the read started.
+    # Invalidations older than all reads in flight are forgotten.
+    def __start_read(self):
+        with self.__lock:
+            generation = self.__generation
+            self.__reads[generation] = self.__reads.get(generation, 0) + 1
+            return generation
+
+    def __end_read(self, generation):
+        with self.__lock:
+            self.__reads[generation] -= 1
+            if self.__reads[generation] == 0:
+                del self.__reads[generation]
+            if not self.__reads:
+                self.__invalidated.clear()
+            elif len(self.__invalidated) > 1000:
+                oldest = min(self.__reads)
+                for key, invalidated in self.__invalidated.items():
+                    if invalidated <= oldest:
+                        del self.__invalidated[key]
+
+    def __invalidate(self, keys):
+        # A None key means any item of the table: it invalidates all its pages but no item, as items are only cached for tables with known key names
+        with self.__lock:
+            self.__generation += 1
+            for table, key in keys:
+                pages = ("page", table)
+                if self.__reads:
+                    self.__invalidated[pages] = self.__generation
+                if key is None:
+                    attributes = {}
+                else:
+                    attributes = _attributes(key)
+                    group = ("item", table, _canonical(key))
+                    if self.__reads:
+                        self.__invalidated[group] = self.__generation
+                    for cache_key in list(self.__groups.get(group, [])):
+                        self.__remove(cache_key)
+                        self.__stats.invalidations += 1
+                for cache_key in list(self.__groups.get(pages, [])):
+                    if _may_contain(self.__entries[cache_key].attributes, attributes):
+                        self.__remove(cache_key)
+                        self.__stats.invalidations += 1
+
+    def __fill_item(self, cache_key, key, item, generation):
+        # Must be called with the lock held
+        group = cache_key[:3]
+        if self.__invalidated.get(group, -1) > generation:
+            return
+        if item is None:
+            size = len(cache_key[2]) + 1
+            ttl = self.__negative_ttl
+        else:
+            size = len(cache_key[2]) + len(json.dumps(item))
+            ttl = self.__ttl
+        self.__fill(cache_key, group, item, size, ttl, _attributes(key), generation)
+
+    def __fill(self, cache_key, group, value, size, ttl, attributes, generation):
+        # Must be called with the lock held
+        if self.__invalidated.get(("table", cache_key[1]), -1) > generation:
+            return
+        if cache_key in self.__entries:
+            self.__remove(cache_key)
+        self.__entries[cache_key] = _Entry(value, size, self.__clock() + ttl, group, attributes)
+        self.__groups.setdefault(group, set()).add(cache_key)
+        self.__bytes += size
+        while self.__bytes > self.__max_bytes and self.__entries:
+            self.__remove(next(iter(self.__entries)))
+            self.__stats.evictions += 1
+
+    def __remove(self, cache_key):
+        # Must be called with the lock held
+        entry = self.__entries.pop(cache_key)
+        self.__bytes -= entry.size
+        group = self.__groups[entry.group]
+        group.discard(cache_key)
+        if not group:
+            del self.__groups[entry.group]
+
+
+class CacheStats(object):
+    """
+    Statistics about a :class:`CachingConnection`, as returned by :meth:`CachingConnection.stats`.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        """The number of keys and pages found in the cache. Including missing items."""
+        self.misses = 0
+        """The number of keys and pages not found in the cache (or expired)."""
+        self.evictions = 0
+        """The number of items and pages removed from the cache to stay under ``max_bytes``."""
+        self.invalidations = 0
+        """The number of items and pages removed from the cache because they were written or explicitly invalidated."""
+        self.entries = 0
+        """The number of items and pages in the cache."""
+        self.bytes = 0
+        """The approximate size of the items and pages in the cache."""
+
+
+class _Entry(object):
+    def __init__(self, value, size, expiration, group, attributes):
+        self.value = value
+        self.size = size
+        self.expiration = expiration
+        self.group = group
+        # Canonical values of the key attributes of an item, or of the attributes a Query's KeyConditions require to be equal
+        self.attributes = attributes
+
+
+_response_classes = {
+    "Query": _lv.QueryResponse,
+    "Scan": _lv.ScanResponse,
+}
+
+
+def _canonical(key):
+    return json.dumps(_normalized(key), sort_keys=True)
+
+
+def _normalized(value):
+    # Numbers are compared by value: DynamoDB returns {"N": "1.5"} for the key {"N": "1.50"}
+    if isinstance(value, dict):
+        if len(value) == 1:
+            db_type, db_value = next(value.iteritems())
+            if db_type == "N" and isinstance(db_value, basestring):
+                return {"N": _normalized_number(db_value)}
+            elif db_type == "NS" and isinstance(db_value, list):
+                return {"NS": sorted(_normalized_number(n) for n in db_value)}
+        return dict((name, _normalized(v)) for name, v in value.iteritems())
+    elif isinstance(value, list):
+        return [_normalized(v) for v in value]
+    else:
+        return value
+
+
+def _normalized_number(number):
+    try:
+        number = decimal.Decimal(number)
+    except decimal.InvalidOperation:
+        return number
+    return "0" if number == 0 else str(number.normalize())
+
+
+def _attributes(attributes):
+    return dict((name, _canonical(value)) for name, value in attributes.iteritems())
+
+
+def _may_contain(attributes, key):
+    return all(attributes.get(name, value) == value for name, value in key.iteritems())
+
+
+def _projection(request):
+    if "ProjectionExpression" in request:
+        return (request["ProjectionExpression"], _canonical(request.get("ExpressionAttributeNames")))
+
+
+def _projects(request, key_names):
+    # True if items returned for this request contain their key attributes
+    if "ProjectionExpression" not in request:
+        return True
+    names = request.get("ExpressionAttributeNames") or {}
+    projected = set(names.get(name, name) for name in (re.split(r"[.\[]", path.strip(), 1)[0] for path in request["ProjectionExpression"].split(",")))
+    return all(name in projected for name in key_names)
+
+
+class CachingConnectionUnitTests(_tst.UnitTestsWithMocks):
+    def setUp(self):
+        super(CachingConnectionUnitTests, self).setUp()
+        self.connection = self.mocks.create("connection")
+        self.cached = CachingConnection(self.connection.object, max_bytes=1000, ttl=10, negative_ttl=5)
+        self.now = 1000.
+        self.cached._CachingConnection__clock = lambda: self.now
+
+    def expect_get_item(self, key, item):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": key})
+        ).andReturn(_lv.GetItemResponse(Item=item))
+
+    def test_get_item_hit(self):
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}, "a": {"S": "x"}})
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": "x"})
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": "x"})
+        stats = self.cached.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (1, 1, 1))
+
+    def test_negative_caching(self):
+        self.expect_get_item({"h": {"N": "0"}}, None)
+        self.assertIsNone(self.cached(_lv.GetItem("t", {"h": 0})).item)
+        self.now += 4
+        self.assertIsNone(self.cached(_lv.GetItem("t", {"h": 0})).item)
+        self.now += 1
+        self.expect_get_item({"h": {"N": "0"}}, None)
+        self.assertIsNone(self.cached(_lv.GetItem("t", {"h": 0})).item)
+
+    def test_ttl(self):
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}})
+        self.cached(_lv.GetItem("t", {"h": 0}))
+        self.now += 9
+        self.cached(_lv.GetItem("t", {"h": 0}))
+        self.now += 1
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}})
+        self.cached(_lv.GetItem("t", {"h": 0}))
+
+    def test_consistent_reads_are_sent(self):
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"N": "0"}}, "ConsistentRead": True})
+        ).andReturn(_lv.GetItemResponse(Item={"h": {"N": "0"}, "a": {"N": "1"}}))
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"N": "0"}}, "ConsistentRead": True})
+        ).andReturn(_lv.GetItemResponse(Item={"h": {"N": "0"}, "a": {"N": "2"}}))
+        self.cached(_lv.GetItem("t", {"h": 0}).consistent_read_true())
+        self.cached(_lv.GetItem("t", {"h": 0}).consistent_read_true())
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": 2})
+
+    def test_projections_are_cached_separately(self):
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}, "a": {"N": "1"}})
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"N": "0"}}, "ProjectionExpression": "a"})
+        ).andReturn(_lv.GetItemResponse(Item={"a": {"N": "1"}}))
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": 1})
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0}).project("a")).item, {"a": 1})
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0}).project("a")).item, {"a": 1})
+        self.assertEqual(self.cached.stats().entries, 2)
+
+    def test_eviction(self):
+        for i in range(10):
+            self.expect_get_item({"h": {"N": str(i)}}, {"h": {"N": str(i)}, "a": {"S": u"x" * 200}})
+            self.cached(_lv.GetItem("t", {"h": i}))
+        stats = self.cached.stats()
+        self.assertEqual((stats.entries, stats.evictions), (4, 6))
+        self.assertLessEqual(stats.bytes, 1000)
+        # Least recently used items are evicted first
+        self.cached(_lv.GetItem("t", {"h": 6}))
+        self.expect_get_item({"h": {"N": "10"}}, {"h": {"N": "10"}, "a": {"S": u"x" * 200}})
+        self.cached(_lv.GetItem("t", {"h": 10}))
+        self.cached(_lv.GetItem("t", {"h": 6}))
+        self.expect_get_item({"h": {"N": "7"}}, None)
+        self.cached(_lv.GetItem("t", {"h": 7}))
+
+    def test_writes_invalidate(self):
+        for i in range(4):
+            self.expect_get_item({"h": {"N": str(i)}}, {"h": {"N": str(i)}})
+            self.cached(_lv.GetItem("t", {"h": i}))
+        self.connection.expect._call_.withArguments(self.ActionChecker("PutItem", {"TableName": "t", "Item": {"h": {"N": "0"}, "a": {"N": "1"}}})).andReturn(_lv.PutItemResponse())
+        self.cached(_lv.PutItem("t", {"h": 0, "a": 1}))
+        self.connection.expect._call_.withArguments(self.ActionChecker("DeleteItem", {"TableName": "t", "Key": {"h": {"N": "1"}}})).andRaise(_exn.NetworkError())
+        with self.assertRaises(_exn.NetworkError):
+            self.cached(_lv.DeleteItem("t", {"h": 1}))
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchWriteItem", {"RequestItems": {"t": [{"DeleteRequest": {"Key": {"h": {"N": "9"}}}}, {"PutRequest": {"Item": {"h": {"N": "2"}}}}]}})
+        ).andReturn(_lv.BatchWriteItemResponse())
+        self.cached(_lv.BatchWriteItem().table("t").put({"h": 2}).delete({"h": 9}))
+        stats = self.cached.stats()
+        self.assertEqual((stats.entries, stats.invalidations), (1, 3))
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}, "a": {"N": "1"}})
+        self.assertEqual(self.cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": 1})
+
+    def test_read_concurrent_with_write_is_not_cached(self):
+        cached = self.cached
+
+        class Connection(object):
+            def __call__(self, action):
+                if action.name == "GetItem":
+                    # The item is written while the read is in flight
+                    cached(_lv.PutItem("t", {"h": 0, "a": 2}))
+                    return _lv.GetItemResponse(Item={"h": {"N": "0"}, "a": {"N": "1"}})
+                else:
+                    return _lv.PutItemResponse()
+
+        cached._CachingConnection__connection = Connection()
+        cached._CachingConnection__key_names["t"] = ["h"]
+        self.assertEqual(cached(_lv.GetItem("t", {"h": 0})).item, {"h": 0, "a": 1})
+        self.assertEqual(cached.stats().entries, 0)
+        self.assertEqual(cached._CachingConnection__invalidated, {})
+
+    def test_batch_get_item(self):
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}})
+        self.cached(_lv.GetItem("t", {"h": 0}))
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchGetItem", {"RequestItems": {"t": {"Keys": [{"h": {"N": "1"}}, {"h": {"N": "2"}}, {"h": {"N": "3"}}]}}, "ReturnConsumedCapacity": "TOTAL"})
+        ).andReturn(_lv.BatchGetItemResponse(
+            Responses={"t": [{"h": {"N": "1"}}]},
+            UnprocessedKeys={"t": {"Keys": [{"h": {"N": "3"}}]}},
+            ConsumedCapacity=[{"TableName": "t", "CapacityUnits": 1.}],
+        ))
+        r = self.cached(_lv.BatchGetItem().table("t").keys({"h": 0}, {"h": 1}, {"h": 2}, {"h": 3}).return_consumed_capacity_total())
+        self.assertEqual(r.responses, {"t": [{"h": 0}, {"h": 1}]})
+        self.assertEqual(r.unprocessed_keys, {"t": {"Keys": [{"h": {"N": "3"}}]}})
+        self.assertEqual(r.consumed_capacity[0].capacity_units, 1.)
+
+        # 0 and 1 are cached, 2 is cached as missing, 3 was not processed
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("BatchGetItem", {"RequestItems": {"t": {"Keys": [{"h": {"N": "3"}}]}}})
+        ).andReturn(_lv.BatchGetItemResponse(Responses={"t": [{"h": {"N": "3"}}]}))
+        r = self.cached(_lv.BatchGetItem().table("t").keys({"h": 0}, {"h": 1}, {"h": 2}, {"h": 3}))
+        self.assertEqual(r.responses, {"t": [{"h": 0}, {"h": 1}, {"h": 3}]})
+
+        r = self.cached(_lv.BatchGetItem().table("t").keys({"h": 0}, {"h": 2}))
+        self.assertEqual(r.responses, {"t": [{"h": 0}]})
+        self.assertIsNone(r.unprocessed_keys)
+
+    def test_numbers_are_compared_by_value(self):
+        def get_item(number):
+            action = Action("GetItem", _lv.GetItemResponse)
+            action.payload = {"TableName": "t", "Key": {"h": {"N": number}}}
+            return action
+
+        self.connection.expect._call_.withArguments(
+            self.ActionChecker("GetItem", {"TableName": "t", "Key": {"h": {"N": "1.50"}}})
+        ).andReturn(_lv.GetItemResponse(Item={"h": {"N": "1.5"}, "a": {"S": "x"}}))
+        self.cached(get_item("1.50"))
+        self.cached(get_item("1.5"))
+        self.cached(get_item("15E-1"))
+        self.assertEqual(self.cached.stats().hits, 2)
+
+    def test_normalized_numbers(self):
+        self.assertEqual(_canonical({"h": {"N": "100"}}), _canonical({"h": {"N": "1E2"}}))
+        self.assertEqual(_canonical({"h": {"N": "-0.0"}}), _canonical({"h": {"N": "0"}}))
+        self.assertEqual(_canonical({"a": {"NS": ["2.0", "1"]}}), _canonical({"a": {"NS": ["1.0", "2"]}}))
+        self.assertEqual(_canonical({"a": {"M": {"b": {"L": [{"N": "1.0"}]}}}}), _canonical({"a": {"M": {"b": {"L": [{"N": "1"}]}}}}))
+        self.assertNotEqual(_canonical({"h": {"N": "1"}}), _canonical({"h": {"S": "1"}}))
+
+    def test_batch_get_item_projection_without_keys_is_not_cached(self):
+        for i in range(2):
+            self.connection.expect._call_.withArguments(
+                self.ActionChecker("BatchGetItem", {"RequestItems": {"t": {"Keys": [{"h": {"N": "0"}}], "ProjectionExpression": "a"}}})
+            ).andReturn(_lv.BatchGetItemResponse(Responses={"t": [{"a": {"N": "1"}}]}))
+            self.cached(_lv.BatchGetItem().table("t").keys({"h": 0}).project("a"))
+
+    def test_other_actions_are_forwarded(self):
+        self.connection.expect._call_.withArguments(self.ActionChecker("DescribeTable", {"TableName": "t"})).andReturn("r")
+        self.assertEqual(self.cached(_lv.DescribeTable("t")), "r")
+
+    def test_clear(self):
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}})
+        self.cached(_lv.GetItem("t", {"h": 0}))
+        self.cached.clear()
+        self.assertEqual((self.cached.stats().entries, self.cached.stats().bytes), (0, 0))
+        self.expect_get_item({"h": {"N": "0"}}, {"h": {"N": "0"}})
+        self.cached(_lv.GetItem("t", {"h": 0}))
+
+    def expect_query(self, h, items, last_evaluated_key=None, exclusive_start_key=None):
+        payload = {"TableName": "t", "KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": str(h)}]}}}
+        if exclusive_start_key is not None:
+            payload["ExclusiveStartKey"] = exclusive_start_key
+        self.connection.expect._call_.withArguments(self.ActionChecker("Query", payload)).andReturn(
+            _lv.QueryResponse(Items=items, Count=len(items), ScannedCount=len(items), LastEvaluatedKey=last_evaluated_key)
+        )
+
+    def test_pages_are_not_cached_by_default(self):
+        self.expect_query(0, [])
+        self.expect_query(0, [])
+        self.cached(_lv.Query("t").key_eq("h", 0))
+        self.cached(_lv.Query("t").key_eq("h", 0))
+
+    def test_iterate_query_from_cached_pages(self):
+        cached = CachingConnection(self.connection.object, page_ttl=10)
+        cached._CachingConnection__clock = lambda: self.now
+        self.expect_query(0, [{"h": {"N": "0"}, "r": {"N": "1"}}], last_evaluated_key={"h": {"N": "0"}, "r": {"N": "1"}})
+        self.expect_query(0, [{"h": {"N": "0"}, "r": {"N": "2"}}], exclusive_start_key={"h": {"N": "0"}, "r": {"N": "1"}})
+        self.assertEqual(list(_lv.iterate_query(cached, _lv.Query("t").key_eq("h", 0))), [{"h": 0, "r": 1}, {"h": 0, "r": 2}])
+        self.assertEqual(list(_lv.iterate_query(cached, _lv.Query("t").key_eq("h", 0))), [{"h": 0, "r": 1}, {"h": 0, "r": 2}])
+        r = cached(_lv.Query("t").key_eq("h", 0).return_consumed_capacity_total())
+        self.assertEqual((r.count, r.scanned_count, r.last_evaluated_key, r.consumed_capacity), (1, 1, {"h": 0, "r": 1}, None))
+        stats = cached.stats()
+        self.assertEqual((stats.hits, stats.misses, stats.entries), (3, 2, 2))
+        self.now += 10
+        self.expect_query(0, [])
+        cached(_lv.Query("t").key_eq("h", 0))
+
+    def test_writes_invalidate_pages(self):
+        cached = CachingConnection(self.connection.object, page_ttl=10)
+        self.expect_query(0, [])
+        self.expect_query(1, [])
+        self.connection.expect._call_.withArguments(self.ActionChecker("Scan", {"TableName": "t"})).andReturn(_lv.ScanResponse(Items=[]))
+        cached(_lv.Query("t").key_eq("h", 0))
+        cached(_lv.Query("t").key_eq("h", 1))
+        cached(_lv.Scan("t"))
+        self.connection.expect._call_.withArguments(self.ActionChecker("DeleteItem", {"TableName": "t", "Key": {"h": {"N": "1"}}})).andReturn(_lv.DeleteItemResponse())
+        cached(_lv.DeleteItem("t", {"h": 1}))
+        self.assertEqual(cached.stats().invalidations, 2)
+        cached(_lv.Query("t").key_eq("h", 0))
+        # Key names are unknown, so a put may touch any page
+        self.connection.expect._call_.withArguments(self.ActionChecker("PutItem", {"TableName": "t", "Item": {"h": {"N": "0"}}})).andReturn(_lv.PutItemResponse())
+        cached(_lv.PutItem("t", {"h": 0}))
+        self.assertEqual(cached.stats().entries, 0)
+
+    def test_explicit_invalidation(self):
+        cached = CachingConnection(self.connection.object, page_ttl=10)
+        self.expect_query(0, [])
+        self.expect_query(1, [])
+        self.expect_get_item({"h": {"N": "0"}}, None)
+        self.expect_get_item({"h": {"N": "1"}}, None)
+        self.connection.expect._call_.withArguments(self.ActionChecker("Query", {"TableName": "u", "KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"N": "0"}]}}})).andReturn(_lv.QueryResponse(Items=[]))
+        cached(_lv.Query("t").key_eq("h", 0))
+        cached(_lv.Query("t").key_eq("h", 1))
+        cached(_lv.GetItem("t", {"h": 0}))
+        cached(_lv.GetItem("t", {"h": 1}))
+        cached(_lv.Query("u").key_eq("h", 0))
+        cached.invalidate("t", {"h": 0})
+        self.assertEqual((cached.stats().entries, cached.stats().invalidations), (3, 2))
+        cached.invalidate("t")
+        self.assertEqual((cached.stats().entries, cached.stats().invalidations), (1, 4))
@@ -2,25 +2,37 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
+import collections
+import copy
 import datetime
 import hashlib
 import hmac
 import json
+import Queue
+import threading
 import urlparse
 import time
+import timeit
 
 import requests
 
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 import LowVoltage.exceptions as _exn
+from LowVoltage.actions.action import Action, _read_actions
 from . import retry_policies
+from . import json_codecs
+from . import metrics as _metrics
 
 
 class Connection(object):
     """
     The main entry point of the package.
 
+    A connection can be used by several threads at the same time, as long as its credentials provider, retry policy, metrics collector,
+    rate limiter, hedging policy and ``requests`` session (if you give one) are thread-safe. All those provided by LowVoltage are.
+    Use ``max_connections`` to size the pool of keep-alive HTTP connections to the number of threads.
+
     :param region: the identifier of the AWS region you want to connect to. Like ``"us-west-2"`` or ``"eu-west-1"``.
     :param credentials: a credentials providers. See :mod:`.credentials`.
     :param endpoint:
@@ -30,15 +42,40 @@ class Connection(object):
         If left ``None``, it will be computed from the region.
     :param retry_policy: a retry policy. See :mod:`.retry_policies`. If left ``None``, the :obj:`~.retry_policies.DEFAULT` retry policy will be used.
     :param requests_session: a ``Session`` object from the `python-requests <http://python-requests.org>`__ library. Typically not used. Leave it to ``None`` and one will be created for you.
+    :param codec: a JSON codec. See :mod:`.json_codecs`. If left ``None``, the :obj:`~.json_codecs.DEFAULT` codec will be used.
+    :param metrics: a metrics collector. See :mod:`.metrics`. If left ``None``, nothing is measured.
+    :param rate_limiter: a rate limiter. See :mod:`.rate_limiters`. If left ``None``, requests are sent as soon as possible.
+    :param max_connections:
+        the maximum number of HTTP connections to DynamoDB open at the same time. They are kept alive for the following requests.
+        Threads wait for a free connection when they are all in use (see :meth:`pool_stats`).
+        If left ``None``, there is no limit, but ``requests`` keeps only 10 connections alive and reconnects for the others.
+        Must be left ``None`` if you give a ``requests_session``.
+    :param hedging_policy:
+        a hedging policy. See :mod:`.hedging`. If left ``None``, a single copy of each request is sent.
+        Hedged requests are sent from worker threads, so the connection must be usable from several threads.
+    :param coalesce_reads:
+        if ``True``, identical read actions (:class:`.GetItem`, :class:`.BatchGetItem`, :class:`.Query` and :class:`.Scan`)
+        called concurrently from several threads share a single request (including its retries), and all get its response.
+        Actions are identical if their serialized requests are the same.
+        Strongly consistent reads and writes are never coalesced.
+        Each caller gets its own shallow copy of the response object, or its own copy of the exception.
     """
 
-    def __init__(self, region, credentials, endpoint=None, retry_policy=None, requests_session=None):
+    def __init__(self, region, credentials, endpoint=None, retry_policy=None, requests_session=None, codec=None, metrics=None, rate_limiter=None, max_connections=None, hedging_policy=None, coalesce_reads=False):
         if endpoint is None:
             endpoint = "https://dynamodb.{}.amazonaws.com/".format(region)
         if retry_policy is None:
             retry_policy = retry_policies.DEFAULT
         if requests_session is None:
             requests_session = requests.Session()
+            if max_connections is not None:
+                adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_connections)
+                requests_session.mount("http://", adapter)
+                requests_session.mount("https://", adapter)
+        elif max_connections is not None:
+            raise ValueError("max_connections cannot be used with requests_session")
+        if codec is None:
+            codec = json_codecs.DEFAULT
 
         self.__region = region
         self.__credentials = credentials
@@ -46,20 +83,45 @@ class Connection(object):
         self.__host = urlparse.urlparse(self.__endpoint).hostname
         self.__retry_policy = retry_policy
         self.__session = requests_session
+        self.__codec = codec
+        self.__metrics = metrics
+        self.__rate_limiter = rate_limiter
+        self.__slots = None if max_connections is None else _Slots(max_connections)
+        self.__hedging_policy = hedging_policy
+        self.__workers = None if hedging_policy is None else _Workers()
+        self.__coalescer = _Coalescer() if coalesce_reads else None
 
         # Dependency injection through monkey-patching
         self.__signer = Signer(self.__region, self.__host)
-        self.__responder = Responder()
+        self.__responder = Responder(self.__codec)
         self.__now = datetime.datetime.utcnow
+        self.__timer = timeit.default_timer
 
     def __call__(self, action):
         """
         Send requests and return responses.
         """
+        encoded = self.__encode(action)
+        if self.__coalescer is not None and _is_coalescable(encoded):
+            # The body may depend on the insertion order of the payload's dicts, the key must not
+            key = (encoded.name, json.dumps(encoded.payload, sort_keys=True, separators=(",", ":")))
+            return self.__coalescer(key, lambda: self.__call_encoded(action, encoded))
+        else:
+            return self.__call_encoded(action, encoded)
+
+    def __call_encoded(self, action, encoded):
         errors = []
         while True:
             try:
-                return self.__request_once(action)
+                if self.__rate_limiter is None:
+                    return self.__request_once_with_hedging(action, encoded, len(errors))
+                else:
+                    delay = self.__rate_limiter.delay(action, encoded.table_names)
+                    if delay:
+                        time.sleep(delay)
+                    response = self.__request_once_with_hedging(action, encoded, len(errors))
+                    self.__rate_limiter.consumed(action, response, encoded.table_names)
+                    return response
             except _exn.Error as e:
                 if e.retryable:
                     errors.append(e)
@@ -71,20 +133,271 @@ class Connection(object):
                 else:
                     raise
 
-    def __request_once(self, action):
-        key, secret, token = self.__credentials.get()
-        payload = json.dumps(action.payload)
-        headers = self.__signer(key, secret, self.__now(), action.name, payload)
-        if token is not None:
-            headers["X-Amz-Security-Token"] = token
+    def __encode(self, action):
+        if self.__metrics is None:
+            return _EncodedAction(action, self.__codec)
+        else:
+            before = self.__timer()
+            encoded = _EncodedAction(action, self.__codec)
+            encoded.serialization = self.__timer() - before
+            return encoded
+
+    def __request_once_with_hedging(self, action, encoded, attempt):
+        if self.__hedging_policy is None:
+            return self.__request_once(action, encoded, attempt)
+        else:
+            delay = self.__hedging_policy.delay(action, encoded.table_names)
+            before = self.__timer()
+            if delay is None:
+                response = self.__request_once(action, encoded, attempt)
+            else:
+                response = self.__hedged_request_once(action, encoded, attempt, delay)
+            self.__hedging_policy.record(action, self.__timer() - before, encoded.table_names)
+            return response
+
+    def __hedged_request_once(self, action, encoded, attempt, delay):
+        # Copies are sent from reused worker threads, and put (succeeded, response or exception) in the queue.
+        # The calling thread waits for the first result at most for the delay, then without timeout.
+        results = Queue.Queue()
+
+        def send():
+            try:
+                results.put((True, self.__request_once(action, encoded, attempt)))
+            except Exception as e:
+                results.put((False, e))
+
+        self.__workers.submit(send)
+        pending = 1
+        timeout = delay
+        while True:
+            try:
+                succeeded, result = results.get(True, timeout)
+            except Queue.Empty:
+                timeout = None
+                if self.__hedging_policy.hedge(action):
+                    self.__workers.submit(send)
+                    pending += 1
+            else:
+                pending -= 1
+                if succeeded:
+                    return result
+                # If the first copy to finish failed, the other one may still succeed
+                elif pending == 0:
+                    raise result
+
+    def pool_stats(self):
+        """
+        Return statistics about the HTTP connections.
+
+        :type: :class:`ConnectionPoolStats`
+        """
+        stats = ConnectionPoolStats()
+        if self.__slots is not None:
+            stats.max_connections, stats.in_use, stats.waits = self.__slots.stats()
+        for adapter in set(self.__session.adapters.values()):
+            pools = getattr(getattr(adapter, "poolmanager", None), "pools", None)
+            if pools is not None:
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        stats.opened += pool.num_connections
+                        stats.idle += sum(1 for c in list(pool.pool.queue) if c is not None)
+        return stats
+
+    def __post(self, payload, headers):
+        if self.__slots is None:
+            return self.__session.post(self.__endpoint, data=payload, headers=headers)
+        else:
+            self.__slots.acquire()
+            try:
+                return self.__session.post(self.__endpoint, data=payload, headers=headers)
+            finally:
+                self.__slots.release()
+
+    def __request_once(self, action, encoded, attempt):
+        # Steps are timed only if there is a metrics collector
+        metrics = None
+        if self.__metrics is not None:
+            metrics = _metrics.RequestMetrics(encoded.name, encoded.table_names, attempt)
+            metrics.payload = encoded.payload
+            metrics.serialization = encoded.serialization if attempt == 0 else 0.
+            metrics.request_bytes = len(encoded.body)
+            before = self.__timer()
         try:
-            r = self.__session.post(self.__endpoint, data=payload, headers=headers)
-        except requests.exceptions.RequestException as e:
-            raise _exn.NetworkError(e)
+            key, secret, token = self.__credentials.get()
+            headers = self.__signer(key, secret, self.__now(), encoded.name, encoded.body_hash)
+            if token is not None:
+                headers["X-Amz-Security-Token"] = token
+            if metrics is not None:
+                after = self.__timer()
+                metrics.signing = after - before
+                before = after
+
+            try:
+                r = self.__post(encoded.body, headers)
+            except requests.exceptions.RequestException as e:
+                raise _exn.NetworkError(e)
+            except Exception as e:
+                raise _exn.UnknownError(e)
+            finally:
+                if metrics is not None:
+                    after = self.__timer()
+                    metrics.network = after - before
+                    before = after
+
+            if metrics is None:
+                return self.__responder(action.response_class, r)
+            metrics.response_bytes = len(r.content)
+            try:
+                response = self.__responder(action.response_class, r)
+            finally:
+                metrics.parsing = self.__timer() - before
+            metrics.consumed_capacity = _metrics._consumed_capacity(response)
+            return response
         except Exception as e:
-            raise _exn.UnknownError(e)
+            if metrics is not None:
+                metrics.exception = e
+            raise
+        finally:
+            if metrics is not None:
+                self.__metrics.record(metrics)
+
+
+class _EncodedAction(object):
+    # What doesn't change between attempts to send an action. Only the signature depends on the time of the attempt.
+    def __init__(self, action, codec):
+        self.name = action.name
+        self.payload = action.payload
+        self.table_names = _metrics._table_names(self.payload)
+        body = codec.encode(self.payload)
+        if not isinstance(body, bytes):
+            body = body.encode("utf-8")
+        self.body = body
+        self.body_hash = hashlib.sha256(body).hexdigest()
+        self.serialization = None
+
+
+class ConnectionPoolStats(object):
+    """
+    Statistics about the HTTP connections of a :class:`Connection`, as returned by :meth:`Connection.pool_stats`.
+    """
+
+    def __init__(self):
+        self.max_connections = None
+        """The ``max_connections`` parameter of the connection."""
+        self.in_use = None
+        """The number of requests currently being sent. ``None`` if ``max_connections`` is ``None``."""
+        self.waits = None
+        """The number of times a thread had to wait for a free HTTP connection. ``None`` if ``max_connections`` is ``None``."""
+        self.idle = 0
+        """The number of keep-alive HTTP connections currently unused."""
+        self.opened = 0
+        """The number of HTTP connections opened so far. If it grows with the number of requests, the pool is too small."""
+
+
+def _is_coalescable(encoded):
+    if encoded.name not in _read_actions:
+        return False
+    elif encoded.payload.get("ConsistentRead"):
+        return False
+    elif any(keys.get("ConsistentRead") for keys in encoded.payload.get("RequestItems", {}).itervalues()):
+        return False
+    else:
+        return True
+
+
+class _Coalescer(object):
+    # The first caller for a key (the leader) makes the call, concurrent callers with the same key wait for its outcome.
+    # The response object is never returned itself: each caller gets a shallow copy, so that conversions cached
+    # by the response (like QueryResponse.items) are not shared between threads.
+    # Likewise, waiting callers raise copies of the exception, so that each thread can annotate its own.
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__flights = {}
+
+    def __call__(self, key, call):
+        with self.__lock:
+            flight = self.__flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self.__flights[key] = _Flight()
+        if leader:
+            try:
+                flight.response = call()
+            except Exception as e:
+                flight.exception = e
+                raise
+            finally:
+                with self.__lock:
+                    del self.__flights[key]
+                flight.done.set()
+        else:
+            flight.done.wait()
+            if flight.exception is not None:
+                raise copy.copy(flight.exception)
+        return copy.copy(flight.response)
+
+
+class _Flight(object):
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.exception = None
+
+
+class _Workers(object):
+    # Daemon threads running tasks, started only when all existing ones are busy
+    def __init__(self):
+        self.__tasks = Queue.Queue()
+        self.__lock = threading.Lock()
+        self.__idle = 0
+        self.__threads = 0
+
+    def submit(self, task):
+        with self.__lock:
+            if self.__idle > 0:
+                self.__idle -= 1
+                start = False
+            else:
+                self.__threads += 1
+                start = True
+        self.__tasks.put(task)
+        if start:
+            thread = threading.Thread(target=self.__work)
+            thread.daemon = True
+            thread.start()
+
+    def __work(self):
+        while True:
+            self.__tasks.get()()
+            with self.__lock:
+                self.__idle += 1
+
+
+class _Slots(object):
+    def __init__(self, count):
+        self.__count = count
+        self.__semaphore = threading.Semaphore(count)
+        self.__lock = threading.Lock()
+        self.__in_use = 0
+        self.__waits = 0
 
-        return self.__responder(action.response_class, r)
+    def acquire(self):
+        if not self.__semaphore.acquire(False):
+            with self.__lock:
+                self.__waits += 1
+            self.__semaphore.acquire()
+        with self.__lock:
+            self.__in_use += 1
+
+    def release(self):
+        with self.__lock:
+            self.__in_use -= 1
+        self.__semaphore.release()
+
+    def stats(self):
+        with self.__lock:
+            return self.__count, self.__in_use, self.__waits
 
 
 class ConnectionUnitTests(_tst.UnitTestsWithMocks):
@@ -104,28 +417,32 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.signer = self.mocks.replace("self.connection._Connection__signer")
         self.responder = self.mocks.replace("self.connection._Connection__responder")
         self.action = self.mocks.create("action")
+        self.hash = hashlib.sha256(b'{"d": "e"}').hexdigest()
 
     def test_identification_with_token(self):
+        self.__expect_encode()
         self.credentials.expect.get().andReturn(("a", "b", "t"))
-        self.action.expect.payload.andReturn({"d": "e"})
         self.now.expect().andReturn("f")
-        self.action.expect.name.andReturn("c")
-        self.signer.expect("a", "b", "f", "c", '{"d": "e"}').andReturn({"g": "h"})
-        self.session.expect.post("http://endpoint.com:8000/", data='{"d": "e"}', headers={"g": "h", "X-Amz-Security-Token": "t"}).andReturn("i")
+        self.signer.expect("a", "b", "f", "c", self.hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"d": "e"}', headers={"g": "h", "X-Amz-Security-Token": "t"}).andReturn("i")
         self.action.expect.response_class.andReturn("j")
         self.responder.expect("j", "i").andReturn("k")
 
         self.assertEqual(self.connection(self.action.object), "k")
 
+    def __expect_encode(self):
+        # Once per call, not once per attempt
+        self.action.expect.name.andReturn("c")
+        self.action.expect.payload.andReturn({"d": "e"})
+
     def __expect_post(self):
         self.credentials.expect.get().andReturn(("a", "b", None))
-        self.action.expect.payload.andReturn({"d": "e"})
         self.now.expect().andReturn("f")
-        self.action.expect.name.andReturn("c")
-        self.signer.expect("a", "b", "f", "c", '{"d": "e"}').andReturn({"g": "h"})
-        return self.session.expect.post("http://endpoint.com:8000/", data='{"d": "e"}', headers={"g": "h"})
+        self.signer.expect("a", "b", "f", "c", self.hash).andReturn({"g": "h"})
+        return self.session.expect.post("http://endpoint.com:8000/", data=b'{"d": "e"}', headers={"g": "h"})
 
     def test_success_on_first_try(self):
+        self.__expect_encode()
         self.__expect_post().andReturn("i")
         self.action.expect.response_class.andReturn("j")
         self.responder.expect("j", "i").andReturn("k")
@@ -133,6 +450,7 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.assertEqual(self.connection(self.action.object), "k")
 
     def test_success_on_fourth_try(self):
+        self.__expect_encode()
         self.__expect_post().andReturn("i")
         self.action.expect.response_class.andReturn("j")
         exception1 = _exn.ProvisionedThroughputExceededException()
@@ -158,6 +476,7 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.assertEqual(self.connection(self.action.object), "q")
 
     def test_failure_on_second_try(self):
+        self.__expect_encode()
         self.__expect_post().andReturn("i")
         self.action.expect.response_class.andReturn("j")
         exception1 = _exn.ProvisionedThroughputExceededException()
@@ -174,6 +493,7 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.assertIs(catcher.exception, exception2)
 
     def test_give_up_after_third_try(self):
+        self.__expect_encode()
         self.__expect_post().andReturn("i")
         self.action.expect.response_class.andReturn("j")
         exception1 = _exn.ProvisionedThroughputExceededException()
@@ -197,6 +517,7 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.assertIs(catcher.exception, exception3)
 
     def test_success_after_network_error(self):
+        self.__expect_encode()
         exception = requests.exceptions.RequestException()
         self.__expect_post().andRaise(exception)
         self.retry_policy.expect.retry.withArguments(lambda args, kwds: args[0] is self.action.object and isinstance(args[1][0], _exn.NetworkError)).andReturn(0)
@@ -209,6 +530,7 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
         self.assertEqual(self.connection(self.action.object), "m")
 
     def test_failure_on_unkown_exception_raised_by_requests(self):
+        self.__expect_encode()
         exception = Exception()
         self.__expect_post().andRaise(exception)
 
@@ -216,7 +538,435 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
             self.connection(self.action.object)
         self.assertEqual(catcher.exception.args, (exception,))
 
+    def test_codec(self):
+        class Codec(object):
+            def encode(self, payload):
+                return "encoded {}".format(payload["d"])
+
+            def decode(self, body):
+                return {"decoded": body}
+
+        connection = Connection(
+            region="us-west-2",
+            credentials=self.credentials.object,
+            endpoint="http://endpoint.com:8000/",
+            retry_policy=self.retry_policy.object,
+            requests_session=self.session.object,
+            codec=Codec(),
+        )
+        now = self.mocks.replace("connection._Connection__now")
+        signer = self.mocks.replace("connection._Connection__signer")
+        response = self.mocks.create("response")
+
+        self.__expect_encode()
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", hashlib.sha256(b"encoded e").hexdigest()).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b"encoded e", headers={"g": "h"}).andReturn(response.object)
+        self.action.expect.response_class.andReturn(dict)
+        response.expect.status_code.andReturn(200)
+        response.expect.content.andReturn("body")
+
+        self.assertEqual(connection(self.action.object), {"decoded": "body"})
+
+    def test_metrics(self):
+        class Recorder(object):
+            def __init__(self):
+                self.records = []
+
+            def record(self, request_metrics):
+                self.records.append(request_metrics)
+
+        recorder = Recorder()
+        connection = Connection(
+            region="us-west-2",
+            credentials=self.credentials.object,
+            endpoint="http://endpoint.com:8000/",
+            retry_policy=self.retry_policy.object,
+            requests_session=self.session.object,
+            metrics=recorder,
+        )
+        now = self.mocks.replace("connection._Connection__now")
+        signer = self.mocks.replace("connection._Connection__signer")
+        responder = self.mocks.replace("connection._Connection__responder")
+        times = iter([0, 1, 1, 3, 6, 10, 20, 22, 25, 29])
+        connection._Connection__timer = lambda: next(times)
+        response = self.mocks.create("response")
+
+        payload_hash = hashlib.sha256(b'{"TableName": "t"}').hexdigest()
+        self.action.expect.name.andReturn("c")
+        self.action.expect.payload.andReturn({"TableName": "t"})
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", payload_hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"TableName": "t"}', headers={"g": "h"}).andReturn(response.object)
+        response.expect.content.andReturn("12345")
+        self.action.expect.response_class.andReturn("j")
+        exception = _exn.ProvisionedThroughputExceededException()
+        responder.expect("j", response.object).andRaise(exception)
+        self.retry_policy.expect.retry(self.action.object, [exception]).andReturn(0)
+
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", payload_hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"TableName": "t"}', headers={"g": "h"}).andReturn(response.object)
+        response.expect.content.andReturn("123")
+        self.action.expect.response_class.andReturn(_lv.GetItemResponse)
+        responder.expect(_lv.GetItemResponse, response.object).andReturn(_lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 0.5}))
+
+        self.assertIsInstance(connection(self.action.object), _lv.GetItemResponse)
+
+        first, second = recorder.records
+        self.assertEqual((first.action_name, first.table_names, first.attempt), ("c", ["t"], 0))
+        self.assertEqual(first.payload, {"TableName": "t"})
+        self.assertIs(first.exception, exception)
+        self.assertEqual((first.serialization, first.signing, first.network, first.parsing), (1, 2, 3, 4))
+        self.assertEqual((first.request_bytes, first.response_bytes), (18, 5))
+        self.assertIsNone(first.consumed_capacity)
+        self.assertEqual((second.action_name, second.table_names, second.attempt), ("c", ["t"], 1))
+        self.assertIsNone(second.exception)
+        self.assertEqual((second.serialization, second.signing, second.network, second.parsing), (0, 2, 3, 4))
+        self.assertEqual((second.request_bytes, second.response_bytes), (18, 3))
+        self.assertEqual(second.consumed_capacity[0].capacity_units, 0.5)
+
+    def test_metrics_with_unexpected_exception(self):
+        class Recorder(object):
+            def __init__(self):
+                self.records = []
+
+            def record(self, request_metrics):
+                self.records.append(request_metrics)
+
+        recorder = Recorder()
+        connection = Connection(
+            region="us-west-2",
+            credentials=self.credentials.object,
+            endpoint="http://endpoint.com:8000/",
+            retry_policy=self.retry_policy.object,
+            requests_session=self.session.object,
+            metrics=recorder,
+        )
+        now = self.mocks.replace("connection._Connection__now")
+        signer = self.mocks.replace("connection._Connection__signer")
+        responder = self.mocks.replace("connection._Connection__responder")
+        response = self.mocks.create("response")
+
+        payload_hash = hashlib.sha256(b'{"TableName": "t"}').hexdigest()
+        self.action.expect.name.andReturn("c")
+        self.action.expect.payload.andReturn({"TableName": "t"})
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", payload_hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"TableName": "t"}', headers={"g": "h"}).andReturn(response.object)
+        response.expect.content.andReturn("12345")
+        self.action.expect.response_class.andReturn("j")
+        exception = ValueError()
+        responder.expect("j", response.object).andRaise(exception)
+
+        with self.assertRaises(ValueError):
+            connection(self.action.object)
+
+        record, = recorder.records
+        self.assertIs(record.exception, exception)
+        self.assertIsNotNone(record.parsing)
+
+    def test_rate_limiter(self):
+        rate_limiter = self.mocks.create("rate_limiter")
+        connection = Connection(
+            region="us-west-2",
+            credentials=self.credentials.object,
+            endpoint="http://endpoint.com:8000/",
+            retry_policy=self.retry_policy.object,
+            requests_session=self.session.object,
+            rate_limiter=rate_limiter.object,
+        )
+        now = self.mocks.replace("connection._Connection__now")
+        signer = self.mocks.replace("connection._Connection__signer")
+        responder = self.mocks.replace("connection._Connection__responder")
+
+        self.__expect_encode()
+        rate_limiter.expect.delay(self.action.object, []).andReturn(0)
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", self.hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"d": "e"}', headers={"g": "h"}).andReturn("i")
+        self.action.expect.response_class.andReturn("j")
+        exception = _exn.ProvisionedThroughputExceededException()
+        responder.expect("j", "i").andRaise(exception)
+        self.retry_policy.expect.retry(self.action.object, [exception]).andReturn(0)
+
+        rate_limiter.expect.delay(self.action.object, []).andReturn(0.001)
+        self.credentials.expect.get().andReturn(("a", "b", None))
+        now.expect().andReturn("f")
+        signer.expect("a", "b", "f", "c", self.hash).andReturn({"g": "h"})
+        self.session.expect.post("http://endpoint.com:8000/", data=b'{"d": "e"}', headers={"g": "h"}).andReturn("k")
+        self.action.expect.response_class.andReturn("l")
+        responder.expect("l", "k").andReturn("m")
+        rate_limiter.expect.consumed(self.action.object, "m", [])
+
+        self.assertEqual(connection(self.action.object), "m")
+
+    def test_max_connections_with_requests_session(self):
+        with self.assertRaises(ValueError):
+            Connection("us-west-2", self.credentials.object, requests_session=self.session.object, max_connections=4)
+
+    def test_pool_stats_without_max_connections(self):
+        stats = Connection("us-west-2", self.credentials.object).pool_stats()
+        self.assertEqual((stats.max_connections, stats.in_use, stats.waits, stats.idle, stats.opened), (None, None, None, 0, 0))
+
+    def test_max_connections(self):
+        class Session(object):
+            def __init__(self):
+                self.lock = threading.Lock()
+                self.running = 0
+                self.max_running = 0
+                self.adapters = {}
+                self.barrier = threading.Semaphore(0)
+
+            def post(self, endpoint, data, headers):
+                with self.lock:
+                    self.running += 1
+                    self.max_running = max(self.max_running, self.running)
+                self.barrier.acquire()
+                with self.lock:
+                    self.running -= 1
+                return "response"
+
+        session = Session()
+        connection = Connection("us-west-2", _lv.StaticCredentials("a", "b"), max_connections=2)
+        connection._Connection__session = session
+        connection._Connection__responder = lambda response_class, r: r
+        threads = [threading.Thread(target=connection, args=(_lv.ListTables(),)) for i in range(5)]
+        for thread in threads:
+            thread.start()
+        while connection.pool_stats().waits < 3:
+            time.sleep(0.001)
+        stats = connection.pool_stats()
+        self.assertEqual((stats.max_connections, stats.in_use), (2, 2))
+        for i in range(5):
+            session.barrier.release()
+        for thread in threads:
+            thread.join()
+        stats = connection.pool_stats()
+        self.assertEqual((stats.max_connections, stats.in_use, stats.waits), (2, 0, 3))
+        self.assertEqual(session.max_running, 2)
+
+    class HedgingPolicy(object):
+        def __init__(self, delay, hedge):
+            self.__delay = delay
+            self.__hedge = hedge
+            self.hedges = 0
+            self.latencies = []
+
+        def delay(self, action, table_names):
+            return self.__delay
+
+        def hedge(self, action):
+            self.hedges += 1
+            return self.__hedge
+
+        def record(self, action, latency, table_names):
+            self.latencies.append(latency)
+
+    class HedgedSession(object):
+        # Each call to post waits for the corresponding event, then returns or raises the corresponding result
+        def __init__(self, *results):
+            self.adapters = {}
+            self.posts = 0
+            self.__results = [(threading.Event(), result) for result in results]
+
+        def post(self, endpoint, data, headers):
+            event, result = self.__results[self.posts]
+            self.posts += 1
+            event.wait()
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+        def release(self, index):
+            self.__results[index][0].set()
+
+    def __hedged_connection(self, session, hedging_policy):
+        connection = Connection("us-west-2", _lv.StaticCredentials("a", "b"), retry_policy=self.retry_policy.object, hedging_policy=hedging_policy)
+        connection._Connection__session = session
+        connection._Connection__responder = lambda response_class, r: r
+        return connection
+
+    def test_hedging_not_needed(self):
+        session = self.HedgedSession("first")
+        policy = self.HedgingPolicy(None, True)
+        session.release(0)
+        self.assertEqual(self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0})), "first")
+        self.assertEqual((session.posts, policy.hedges, len(policy.latencies)), (1, 0, 1))
+
+    def test_hedging_fast_response(self):
+        session = self.HedgedSession("first")
+        policy = self.HedgingPolicy(10, True)
+        session.release(0)
+        connection = self.__hedged_connection(session, policy)
+        self.assertEqual(connection(_lv.GetItem("t", {"h": 0})), "first")
+        self.assertEqual((session.posts, policy.hedges, len(policy.latencies)), (1, 0, 1))
+        # No thread is busy waiting for the delay
+        self.assertEqual(connection._Connection__workers._Workers__threads, 1)
+
+    def test_hedging_slow_response(self):
+        session = self.HedgedSession("first", "second")
+        policy = self.HedgingPolicy(0.001, True)
+        session.release(1)
+        self.assertEqual(self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0})), "second")
+        self.assertEqual((session.posts, policy.hedges, len(policy.latencies)), (2, 1, 1))
+        session.release(0)
+
+    def test_hedging_refused_by_budget(self):
+        session = self.HedgedSession("first")
+        policy = self.HedgingPolicy(0.001, False)
+        threading.Timer(0.1, session.release, (0,)).start()
+        self.assertEqual(self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0})), "first")
+        self.assertEqual((session.posts, policy.hedges), (1, 1))
+
+    def test_hedging_first_copy_fails(self):
+        session = self.HedgedSession(Exception(), "second")
+        policy = self.HedgingPolicy(0.001, True)
+        threading.Timer(0.1, session.release, (0,)).start()
+        threading.Timer(0.2, session.release, (1,)).start()
+        self.assertEqual(self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0})), "second")
+
+    def test_hedging_both_copies_fail(self):
+        session = self.HedgedSession(requests.exceptions.RequestException(), requests.exceptions.RequestException())
+        policy = self.HedgingPolicy(0.001, True)
+        self.retry_policy.expect.retry.withArguments(lambda args, kwds: isinstance(args[1][0], _exn.NetworkError)).andReturn(None)
+        threading.Timer(0.1, session.release, (0,)).start()
+        threading.Timer(0.2, session.release, (1,)).start()
+        with self.assertRaises(_exn.NetworkError):
+            self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0}))
+        self.assertEqual(policy.latencies, [])
+
+    def test_workers_are_reused(self):
+        workers = _Workers()
+        for i in range(5):
+            done = threading.Event()
+            workers.submit(done.set)
+            done.wait()
+            while workers._Workers__idle == 0:
+                time.sleep(0.001)
+        self.assertEqual(workers._Workers__threads, 1)
+        release = threading.Event()
+        done = threading.Event()
+        workers.submit(release.wait)
+        workers.submit(done.set)
+        done.wait()
+        release.set()
+        self.assertEqual(workers._Workers__threads, 2)
+
+    def test_hedging_policy_gets_table_names(self):
+        class Policy(self.HedgingPolicy):
+            def delay(self, action, table_names):
+                self.table_names = table_names
+
+        session = self.HedgedSession("first")
+        policy = Policy(None, True)
+        session.release(0)
+        self.__hedged_connection(session, policy)(_lv.GetItem("t", {"h": 0}))
+        self.assertEqual(policy.table_names, ["t"])
+
+    class CoalescedSession(object):
+        class Response(object):
+            status_code = 200
+
+            def __init__(self, content):
+                self.content = content
+
+        def __init__(self):
+            self.adapters = {}
+            self.lock = threading.Lock()
+            self.posts = []
+            self.barrier = threading.Event()
+            self.exception = None
+
+        def post(self, endpoint, data, headers):
+            with self.lock:
+                self.posts.append(headers["X-Amz-Target"])
+            self.barrier.wait()
+            if self.exception is not None:
+                raise self.exception
+            return self.Response(b'{"Item": {"h": {"N": "0"}, "a": {"S": "x"}}}')
+
+    def __coalesce(self, actions, session=None):
+        if session is None:
+            session = self.CoalescedSession()
+        connection = Connection("us-west-2", _lv.StaticCredentials("a", "b"), retry_policy=retry_policies.FAIL_FAST, coalesce_reads=True)
+        connection._Connection__session = session
+        results = []
+        exceptions = []
+
+        def call(action):
+            try:
+                results.append(connection(action))
+            except Exception as e:
+                exceptions.append(e)
+
+        threads = [threading.Thread(target=call, args=(action,)) for action in actions]
+        for thread in threads:
+            thread.start()
+        while len(session.posts) < 1:
+            time.sleep(0.001)
+        # Give the other threads some time to start their calls
+        time.sleep(0.02)
+        session.barrier.set()
+        for thread in threads:
+            thread.join()
+        return session, results, exceptions
+
+    def test_coalesce_identical_reads(self):
+        session, results, exceptions = self.__coalesce([_lv.GetItem("t", {"h": 0, "r": 1}), _lv.GetItem("t", {"h": 0, "r": 1}), _lv.GetItem("t", {"h": 0, "r": 1})])
+        self.assertEqual(session.posts, ["DynamoDB_20120810.GetItem"])
+        self.assertEqual([r.item for r in results], [{"h": 0, "a": "x"}] * 3)
+        self.assertEqual(len(set(id(r) for r in results)), 3)
+        self.assertEqual(exceptions, [])
+
+    def test_coalesce_reads_built_in_different_orders(self):
+        def get_item(*parts):
+            action = Action("GetItem", _lv.GetItemResponse)
+            action.payload = collections.OrderedDict(parts)
+            return action
+
+        table, key = ("TableName", "t"), ("Key", {"h": {"N": "0"}})
+        session, results, exceptions = self.__coalesce([get_item(table, key), get_item(key, table)])
+        self.assertEqual(session.posts, ["DynamoDB_20120810.GetItem"])
+        self.assertEqual(len(results), 2)
+
+    def test_dont_coalesce_different_reads(self):
+        session, results, exceptions = self.__coalesce([_lv.GetItem("t", {"h": 0}), _lv.GetItem("t", {"h": 1}), _lv.GetItem("u", {"h": 0})])
+        self.assertEqual(len(session.posts), 3)
+        self.assertEqual(len(results), 3)
+
+    def test_dont_coalesce_consistent_reads(self):
+        session, results, exceptions = self.__coalesce([
+            _lv.GetItem("t", {"h": 0}).consistent_read_true(),
+            _lv.GetItem("t", {"h": 0}).consistent_read_true(),
+            _lv.BatchGetItem().table("t").keys({"h": 0}).consistent_read_true(),
+            _lv.BatchGetItem().table("t").keys({"h": 0}).consistent_read_true(),
+        ])
+        self.assertEqual(len(session.posts), 4)
+
+    def test_dont_coalesce_writes(self):
+        session, results, exceptions = self.__coalesce([_lv.PutItem("t", {"h": 0}), _lv.PutItem("t", {"h": 0})])
+        self.assertEqual(session.posts, ["DynamoDB_20120810.PutItem"] * 2)
+
+    def test_coalesce_exception(self):
+        session = self.CoalescedSession()
+        session.exception = requests.exceptions.RequestException()
+        session, results, exceptions = self.__coalesce([_lv.GetItem("t", {"h": 0})] * 3, session)
+        self.assertEqual(len(session.posts), 1)
+        self.assertEqual(results, [])
+        self.assertEqual(len(exceptions), 3)
+        self.assertEqual(len(set(id(e) for e in exceptions)), 3)
+        for exception in exceptions:
+            self.assertIsInstance(exception, _exn.NetworkError)
+            self.assertIs(exception.args[0], session.exception)
+
     def test_success_after_network_error_during_credentials(self):
+        self.__expect_encode()
         exception = _exn.NetworkError()
         self.credentials.expect.get().andRaise(exception)
         self.retry_policy.expect.retry(self.action.object, [exception]).andReturn(0)
@@ -230,65 +980,84 @@ class ConnectionUnitTests(_tst.UnitTestsWithMocks):
 
 
 class Signer(object):
+    # http://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+
     def __init__(self, region, host):
         self.__host = host
         self.__region = region
+        self.__credentials_suffix = "/{}/dynamodb/aws4_request".format(region)
+        # Canonical headers, sorted by lower-case name: content-type, host, x-amz-date, x-amz-target
+        self.__header_names = "content-type;host;x-amz-date;x-amz-target"
+        self.__request_prefix = "POST\n/\n\ncontent-type:application/x-amz-json-1.0\nhost:{}\nx-amz-date:".format(host)
+        # The signing key only depends on the secret and the date: (secret, datestamp, key)
+        self.__signing_key = (None, None, None)
 
-    def __call__(self, key, secret, now, action, payload):
-        # http://docs.aws.amazon.com/general/latest/gr/sigv4-signed-request-examples.html
+        # Dependency injection through monkey-patching
+        self.__derive_signing_key = _derive_signing_key
 
+    def __call__(self, key, secret, now, action, payload_hash):
+        # payload_hash is the hex SHA-256 of the body, computed once for all attempts
         timestamp = now.strftime("%Y%m%dT%H%M%SZ")
-        datestamp = now.strftime("%Y%m%d")
+        datestamp = timestamp[:8]
+        target = "DynamoDB_20120810." + action
+
+        request = "{}{}\nx-amz-target:{}\n\n{}\n{}".format(
+            self.__request_prefix,
+            timestamp,
+            target,
+            self.__header_names,
+            payload_hash,
+        )
+        credentials = datestamp + self.__credentials_suffix
+        to_sign = "AWS4-HMAC-SHA256\n{}\n{}\n{}".format(timestamp, credentials, hashlib.sha256(request.encode("utf-8")).hexdigest())
 
-        headers = {
+        return {
             "Content-Type": "application/x-amz-json-1.0",
             "X-Amz-Date": timestamp,
-            "X-Amz-Target": "DynamoDB_20120810.{}".format(action),
+            "X-Amz-Target": target,
             "Host": self.__host,
+            "Authorization": "AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}".format(
+                key,
+                credentials,
+                self.__header_names,
+                hmac.new(self.__get_signing_key(secret, datestamp), to_sign.encode("utf-8"), hashlib.sha256).hexdigest(),
+            ),
         }
 
-        header_names = ";".join(k.lower() for k in sorted(headers.keys()))
-        request = "POST\n/\n\n{}\n{}\n{}".format(
-            "".join("{}:{}\n".format(k.lower(), v) for k, v in sorted(headers.iteritems())),
-            header_names,
-            hashlib.sha256(payload.encode("utf-8")).hexdigest(),
-        )
-        credentials = "{}/{}/dynamodb/aws4_request".format(datestamp, self.__region)
-        to_sign = "AWS4-HMAC-SHA256\n{}\n{}\n{}".format(timestamp, credentials, hashlib.sha256(request.encode("utf-8")).hexdigest())
+    def __get_signing_key(self, secret, datestamp):
+        # A single tuple is read and replaced, so concurrent calls are safe: at worst, the key is computed twice.
+        cached_secret, cached_datestamp, signing_key = self.__signing_key
+        if cached_secret != secret or cached_datestamp != datestamp:
+            signing_key = self.__derive_signing_key(secret, datestamp, self.__region)
+            self.__signing_key = (secret, datestamp, signing_key)
+        return signing_key
+
 
-        hmac_key = hmac.new(
+def _derive_signing_key(secret, datestamp, region):
+    return hmac.new(
+        hmac.new(
             hmac.new(
                 hmac.new(
-                    hmac.new(
-                        "AWS4{}".format(secret).encode("utf-8"),
-                        datestamp.encode("utf-8"),
-                        hashlib.sha256
-                    ).digest(),
-                    self.__region.encode("utf-8"),
+                    "AWS4{}".format(secret).encode("utf-8"),
+                    datestamp.encode("utf-8"),
                     hashlib.sha256
                 ).digest(),
-                "dynamodb".encode("utf-8"),
+                region.encode("utf-8"),
                 hashlib.sha256
             ).digest(),
-            "aws4_request".encode("utf-8"),
+            "dynamodb".encode("utf-8"),
             hashlib.sha256
-        ).digest()
-
-        headers["Authorization"] = "AWS4-HMAC-SHA256 Credential={}/{}, SignedHeaders={}, Signature={}".format(
-            key,
-            credentials,
-            header_names,
-            hmac.new(hmac_key, to_sign.encode("utf-8"), hashlib.sha256).hexdigest(),
-        )
-
-        return headers
+        ).digest(),
+        "aws4_request".encode("utf-8"),
+        hashlib.sha256
+    ).digest()
 
 
 class SignerUnitTests(_tst.UnitTests):
     def test(self):
         signer = Signer("us-west-2", "localhost")
         self.assertEqual(
-            signer("DummyKey", "DummySecret", datetime.datetime(2014, 10, 4, 6, 33, 2), "Operation", '{"Payload": "Value"}'),
+            signer("DummyKey", "DummySecret", datetime.datetime(2014, 10, 4, 6, 33, 2), "Operation", hashlib.sha256(b'{"Payload": "Value"}').hexdigest()),
             {
                 "Host": "localhost",
                 "Content-Type": "application/x-amz-json-1.0",
@@ -298,13 +1067,43 @@ class SignerUnitTests(_tst.UnitTests):
             }
         )
 
+    def test_cached_signing_key(self):
+        signer = Signer("us-west-2", "localhost")
+        derivations = []
+
+        def derive(secret, datestamp, region):
+            derivations.append((secret, datestamp))
+            return _derive_signing_key(secret, datestamp, region)
+
+        signer._Signer__derive_signing_key = derive
+        for secret, now in [
+            ("DummySecret", datetime.datetime(2014, 10, 4, 6, 33, 2)),
+            ("DummySecret", datetime.datetime(2014, 10, 4, 23, 59, 59)),
+            ("DummySecret", datetime.datetime(2014, 10, 5, 0, 0, 0)),
+            ("DummySecret", datetime.datetime(2014, 10, 5, 0, 0, 1)),
+            ("RotatedSecret", datetime.datetime(2014, 10, 5, 0, 0, 2)),
+            ("RotatedSecret", datetime.datetime(2014, 10, 5, 0, 0, 3)),
+        ]:
+            self.assertEqual(
+                signer("DummyKey", secret, now, "Operation", hashlib.sha256(b'{"Payload": "Value"}').hexdigest()),
+                Signer("us-west-2", "localhost")("DummyKey", secret, now, "Operation", hashlib.sha256(b'{"Payload": "Value"}').hexdigest())
+            )
+        # Derived once per (secret, date), and again when either changes
+        self.assertEqual(
+            derivations,
+            [("DummySecret", "20141004"), ("DummySecret", "20141005"), ("RotatedSecret", "20141005")]
+        )
+
 
 class Responder(object):
+    def __init__(self, codec):
+        self.__codec = codec
+
     def __call__(self, response_class, r):
         status_code = r.status_code
         if status_code == 200:
             try:
-                data = r.json()
+                data = self.__codec.decode(r.content)
             except ValueError:
                 raise _exn.ServerError(200, r.text)
             return response_class(**data)
@@ -313,7 +1112,7 @@ class Responder(object):
 
     def __raise(self, status_code, r):
         try:
-            data = r.json()
+            data = self.__codec.decode(r.content)
         except ValueError:
             data = r.text
         if isinstance(data, dict):
@@ -339,18 +1138,18 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
         self.response_instance = object()
         self.requests_response = self.mocks.create("requests_response")
         self.json = {"a": 0}
-        self.responder = Responder()
+        self.responder = Responder(json_codecs.DEFAULT)
 
     def test_good_response(self):
         self.requests_response.expect.status_code.andReturn(200)
-        self.requests_response.expect.json().andReturn(self.json)
+        self.requests_response.expect.content.andReturn(json.dumps(self.json))
         self.response_class.expect(a=0).andReturn(self.response_instance)
 
         self.assertIs(self.responder(self.response_class.object, self.requests_response.object), self.response_instance)
 
     def test_non_json_response_with_good_status(self):
         self.requests_response.expect.status_code.andReturn(200)
-        self.requests_response.expect.json().andRaise(ValueError)
+        self.requests_response.expect.content.andReturn(b"foobar")
         self.requests_response.expect.text.andReturn("foobar")
 
         with self.assertRaises(_exn.ServerError) as catcher:
@@ -359,7 +1158,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_client_error_with_correct_json(self):
         self.requests_response.expect.status_code.andReturn(400)
-        self.requests_response.expect.json().andReturn({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"}))
 
         with self.assertRaises(_exn.UnknownClientError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -367,7 +1166,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_client_error_with_json_without_type(self):
         self.requests_response.expect.status_code.andReturn(400)
-        self.requests_response.expect.json().andReturn({"Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"Message": "tralala"}))
 
         with self.assertRaises(_exn.UnknownClientError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -375,7 +1174,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_client_error_with_non_dict_json(self):
         self.requests_response.expect.status_code.andReturn(400)
-        self.requests_response.expect.json().andReturn(["Message", "tralala"])
+        self.requests_response.expect.content.andReturn(json.dumps(["Message", "tralala"]))
 
         with self.assertRaises(_exn.UnknownClientError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -383,7 +1182,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_client_error_without_json(self):
         self.requests_response.expect.status_code.andReturn(400)
-        self.requests_response.expect.json().andRaise(ValueError)
+        self.requests_response.expect.content.andReturn(b"foobar")
         self.requests_response.expect.text.andReturn("Message: tralala")
 
         with self.assertRaises(_exn.UnknownClientError) as catcher:
@@ -392,7 +1191,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_server_error_with_correct_json(self):
         self.requests_response.expect.status_code.andReturn(500)
-        self.requests_response.expect.json().andReturn({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"}))
 
         with self.assertRaises(_exn.ServerError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -400,7 +1199,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_server_error_with_json_without_type(self):
         self.requests_response.expect.status_code.andReturn(500)
-        self.requests_response.expect.json().andReturn({"Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"Message": "tralala"}))
 
         with self.assertRaises(_exn.ServerError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -408,7 +1207,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_server_error_with_non_dict_json(self):
         self.requests_response.expect.status_code.andReturn(500)
-        self.requests_response.expect.json().andReturn(["Message", "tralala"])
+        self.requests_response.expect.content.andReturn(json.dumps(["Message", "tralala"]))
 
         with self.assertRaises(_exn.ServerError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -416,7 +1215,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_server_error_without_json(self):
         self.requests_response.expect.status_code.andReturn(500)
-        self.requests_response.expect.json().andRaise(ValueError)
+        self.requests_response.expect.content.andReturn(b"foobar")
         self.requests_response.expect.text.andReturn("Message: tralala")
 
         with self.assertRaises(_exn.ServerError) as catcher:
@@ -425,7 +1224,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_error_with_correct_json(self):
         self.requests_response.expect.status_code.andReturn(750)
-        self.requests_response.expect.json().andReturn({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"__type": "NobodyKnewThisCouldHappen", "Message": "tralala"}))
 
         with self.assertRaises(_exn.UnknownError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -433,7 +1232,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_error_with_json_without_type(self):
         self.requests_response.expect.status_code.andReturn(750)
-        self.requests_response.expect.json().andReturn({"Message": "tralala"})
+        self.requests_response.expect.content.andReturn(json.dumps({"Message": "tralala"}))
 
         with self.assertRaises(_exn.UnknownError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -441,7 +1240,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_error_with_non_dict_json(self):
         self.requests_response.expect.status_code.andReturn(750)
-        self.requests_response.expect.json().andReturn(["Message", "tralala"])
+        self.requests_response.expect.content.andReturn(json.dumps(["Message", "tralala"]))
 
         with self.assertRaises(_exn.UnknownError) as catcher:
             self.responder(self.response_class.object, self.requests_response.object)
@@ -449,7 +1248,7 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
 
     def test_unknown_error_without_json(self):
         self.requests_response.expect.status_code.andReturn(750)
-        self.requests_response.expect.json().andRaise(ValueError)
+        self.requests_response.expect.content.andReturn(b"foobar")
         self.requests_response.expect.text.andReturn("Message: tralala")
 
         with self.assertRaises(_exn.UnknownError) as catcher:
@@ -483,47 +1282,47 @@ class ResponderUnitTests(_tst.UnitTestsWithMocks):
             ("xxx.ValidationException", _exn.ValidationException),
         ]:
             self.requests_response.expect.status_code.andReturn(400)
-            self.requests_response.expect.json().andReturn({"__type": type_name, "Message": "tralala"})
+            self.requests_response.expect.content.andReturn(json.dumps({"__type": type_name, "Message": "tralala"}))
 
             with self.assertRaises(cls) as catcher:
                 self.responder(self.response_class.object, self.requests_response.object)
 
     def test_different_statuses(self):
         self.requests_response.expect.status_code.andReturn(400)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ClientError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(453)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ClientError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(499)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ClientError):
             self.responder(self.response_class.object, self.requests_response.object)
 
         self.requests_response.expect.status_code.andReturn(500)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ServerError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(547)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ServerError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(599)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.ServerError):
             self.responder(self.response_class.object, self.requests_response.object)
 
         self.requests_response.expect.status_code.andReturn(600)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.UnknownError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(612)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.UnknownError):
             self.responder(self.response_class.object, self.requests_response.object)
         self.requests_response.expect.status_code.andReturn(9999)
-        self.requests_response.expect.json().andReturn({})
+        self.requests_response.expect.content.andReturn(json.dumps({}))
         with self.assertRaises(_exn.UnknownError):
             self.responder(self.response_class.object, self.requests_response.object)
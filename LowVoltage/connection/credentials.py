@@ -20,6 +20,8 @@ This allows credentials rotation in the same long-lived connection: the credenti
 
 import datetime
 import os
+import threading
+import time
 
 import requests
 
@@ -68,17 +70,87 @@ class EnvironmentCredentials(object):
         return (os.environ["AWS_ACCESS_KEY_ID"], os.environ["AWS_SECRET_ACCESS_KEY"], os.environ.get("AWS_SECURITY_TOKEN"))
 
 
-class Ec2RoleCredentials(object):
+class _RefreshingCredentials(object):
+    # Base class for providers of temporary credentials. Subclasses implement _fetch(now), returning
+    # (credentials, refresh_time, expiration_time), and _current_time().
+    # Between refresh_time and expiration_time, the current credentials are still returned by get while a single
+    # background thread fetches new ones. After expiration_time (or if background refresh is disabled), get waits for them.
+
+    def __init__(self, background_refresh, retry_delay=datetime.timedelta(seconds=30)):
+        self.__background_refresh = background_refresh
+        self.__retry_delay = retry_delay
+        # Credentials and deadlines are replaced together so that concurrent calls to get never mix old and new credentials
+        self.__state = None
+        self.__fetch_lock = threading.Lock()
+        self.__refreshing = False
+        self.__refreshing_lock = threading.Lock()
+
+    def get(self):
+        now = self._current_time()
+        state = self.__state
+        if self.__must_fetch(now, state):
+            with self.__fetch_lock:
+                state = self.__state
+                if self.__must_fetch(now, state):
+                    state = self.__state = self._fetch(now)
+        elif now >= state[1]:
+            self.__start_background_refresh()
+        return state[0]
+
+    def __must_fetch(self, now, state):
+        if state is None:
+            return True
+        elif now >= state[2]:
+            return True
+        elif now >= state[1] and not self.__background_refresh:
+            return True
+        else:
+            return False
+
+    def __start_background_refresh(self):
+        with self.__refreshing_lock:
+            if self.__refreshing:
+                return
+            self.__refreshing = True
+        thread = threading.Thread(target=self.__refresh_in_background)
+        thread.daemon = True
+        thread.start()
+
+    def __refresh_in_background(self):
+        try:
+            with self.__fetch_lock:
+                now = self._current_time()
+                state = self.__state
+                if now >= state[1]:
+                    try:
+                        self.__state = self._fetch(now)
+                    except Exception:
+                        # Whatever the failure, current credentials are still valid: try again a bit later
+                        self.__state = (state[0], min(now + self.__retry_delay, state[2]), state[2])
+        finally:
+            with self.__refreshing_lock:
+                self.__refreshing = False
+
+
+class Ec2RoleCredentials(_RefreshingCredentials):
     """
     Credentials provider using EC2 instance metadata to retrieve temporary, automatically rotated, credentials
     from the `IAM role of the instance <http://docs.aws.amazon.com/IAM/latest/UserGuide/roles-usingrole-ec2instance.html>`__.
     Usable *only* on an EC2 instance with an IAM role assigned.
 
+    Credentials are refreshed every hour, and 15 minutes before they expire.
+    By default, this is done in a background thread while the current credentials are still used,
+    so that requests don't wait for the metadata endpoint. Requests wait only if credentials are about to expire (less than 5 minutes).
+
+    It can be shared by several threads: a single refresh is in flight at any time.
+
     :param requests_session: a ``Session`` object from the `python-requests <http://python-requests.org>`__ library.
         Typically not used. Leave it to ``None`` and one will be created for you.
+    :param background_refresh: if ``False``, credentials are refreshed synchronously by the first call to :meth:`get` after the refresh time.
     """
 
-    def __init__(self, requests_session=None):
+    def __init__(self, requests_session=None, background_refresh=True):
+        super(Ec2RoleCredentials, self).__init__(background_refresh)
         if requests_session is None:
             requests_session = requests.Session()
 
@@ -91,31 +163,13 @@ class Ec2RoleCredentials(object):
             raise _exn.UnknownError(e)
         self.__creds_uri = "http://169.254.169.254/latest/meta-data/iam/security-credentials/{}".format(role)
 
-        self.__key = None
-        self.__secret = None
-        self.__token = None
-
         # Dependency injection through monkey-patching
         self.__now = datetime.datetime.utcnow
 
-    def get(self):
-        now = self.__now()
-        if self.__needs_refresh(now):
-            self.__refresh(now)
+    def _current_time(self):
+        return self.__now()
 
-        return self.__key, self.__secret, self.__token
-
-    def __needs_refresh(self, now):
-        if self.__key is None:
-            return True
-        elif now >= self.__expiration:
-            return True
-        elif now >= self.__next_refresh:
-            return True
-        else:
-            return False
-
-    def __refresh(self, now):
+    def _fetch(self, now):
         try:
             creds = self.__session.get(self.__creds_uri).json()
         except requests.exceptions.RequestException as e:
@@ -131,12 +185,13 @@ class Ec2RoleCredentials(object):
         #     u'Expiration': u'2015-04-24T19:36:54Z',
         #     u'Type': u'AWS-HMAC'
         # }
-        self.__key = creds["AccessKeyId"]
-        self.__secret = creds["SecretAccessKey"]
-        self.__token = creds["Token"]
         # Refresh every hour and 15 minutes before expiration: http://docs.aws.amazon.com/IAM/latest/UserGuide/roles-usingrole-ec2instance.html
-        self.__expiration = datetime.datetime.strptime(creds["Expiration"], "%Y-%m-%dT%H:%M:%SZ") - datetime.timedelta(minutes=15)
-        self.__next_refresh = now + datetime.timedelta(hours=1)
+        expiration = datetime.datetime.strptime(creds["Expiration"], "%Y-%m-%dT%H:%M:%SZ")
+        return (
+            (creds["AccessKeyId"], creds["SecretAccessKey"], creds["Token"]),
+            min(now + datetime.timedelta(hours=1), expiration - datetime.timedelta(minutes=15)),
+            expiration - datetime.timedelta(minutes=5),
+        )
 
 
 class Ec2RoleCredentialsUnitTests(_tst.UnitTestsWithMocks):
@@ -149,7 +204,7 @@ class Ec2RoleCredentialsUnitTests(_tst.UnitTestsWithMocks):
         self.session.expect.get("http://169.254.169.254/latest/meta-data/iam/security-credentials/").andReturn(self.response.object)
         self.response.expect.text.andReturn("RoleName")
 
-        credentials = Ec2RoleCredentials(self.session.object)
+        credentials = Ec2RoleCredentials(self.session.object, background_refresh=False)
 
         self.now = self.mocks.replace("credentials._Ec2RoleCredentials__now")
 
@@ -217,3 +272,114 @@ class Ec2RoleCredentialsUnitTests(_tst.UnitTestsWithMocks):
 
         with self.assertRaises(_exn.UnknownError):
             credentials.get()
+
+    class FakeSession(object):
+        class Response(object):
+            def __init__(self, text=None, json=None):
+                self.text = text
+                self.__json = json
+
+            def json(self):
+                return self.__json
+
+        def __init__(self):
+            self.gets = 0
+            self.barrier = threading.Event()
+            self.credentials = [
+                {"AccessKeyId": "key1", "SecretAccessKey": "secret1", "Token": "token1", "Expiration": "2015-04-24T15:00:30Z"},
+                {"AccessKeyId": "key2", "SecretAccessKey": "secret2", "Token": "token2", "Expiration": "2015-04-24T18:00:30Z"},
+            ]
+
+        def get(self, url):
+            if url.endswith("/"):
+                return self.Response(text="RoleName")
+            self.gets += 1
+            self.barrier.wait()
+            credentials = self.credentials.pop(0)
+            if isinstance(credentials, Exception):
+                raise credentials
+            return self.Response(json=credentials)
+
+    def wait_for(self, predicate):
+        for i in range(500):
+            if predicate():
+                return
+            time.sleep(0.01)
+        self.fail()
+
+    def test_concurrent_refresh(self):
+        session = self.FakeSession()
+        credentials = Ec2RoleCredentials(session)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 12, 30, 0)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(credentials.get())) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        session.barrier.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(session.gets, 1)
+        self.assertEqual(results, [("key1", "secret1", "token1")] * 8)
+
+    def test_background_refresh(self):
+        session = self.FakeSession()
+        credentials = Ec2RoleCredentials(session)
+        session.barrier.set()
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 12, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+
+        # Current credentials are returned without waiting while a single refresh is in flight
+        session.barrier.clear()
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 13, 30, 0)
+        for i in range(5):
+            self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        self.wait_for(lambda: session.gets == 2)
+        session.barrier.set()
+        self.wait_for(lambda: credentials.get() == ("key2", "secret2", "token2"))
+        self.assertEqual(session.gets, 2)
+
+    def test_background_refresh_failure(self):
+        session = self.FakeSession()
+        session.credentials.insert(1, requests.exceptions.RequestException())
+        session.barrier.set()
+        credentials = Ec2RoleCredentials(session)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 12, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+
+        # The failure is not visible, and the refresh is retried 30 seconds later
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 13, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        self.wait_for(lambda: not credentials._RefreshingCredentials__refreshing)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        self.assertEqual(session.gets, 2)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 13, 30, 30)
+        credentials.get()
+        self.wait_for(lambda: credentials.get() == ("key2", "secret2", "token2"))
+        self.assertEqual(session.gets, 3)
+
+    def test_background_refresh_unexpected_failure(self):
+        session = self.FakeSession()
+        session.credentials.insert(1, {"Code": "Failure"})
+        session.barrier.set()
+        credentials = Ec2RoleCredentials(session)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 12, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 13, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        self.wait_for(lambda: not credentials._RefreshingCredentials__refreshing)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        self.assertEqual(session.gets, 2)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 13, 30, 30)
+        credentials.get()
+        self.wait_for(lambda: credentials.get() == ("key2", "secret2", "token2"))
+        self.assertEqual(session.gets, 3)
+
+    def test_refresh_after_expiration_is_synchronous(self):
+        session = self.FakeSession()
+        session.barrier.set()
+        credentials = Ec2RoleCredentials(session)
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 12, 30, 0)
+        self.assertEqual(credentials.get(), ("key1", "secret1", "token1"))
+        credentials._Ec2RoleCredentials__now = lambda: datetime.datetime(2015, 04, 24, 14, 55, 30)
+        self.assertEqual(credentials.get(), ("key2", "secret2", "token2"))
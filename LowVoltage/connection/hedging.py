@@ -0,0 +1,200 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Hedging policies reduce the tail latency of read actions: when DynamoDB takes longer than usual to answer a request,
+the :class:`.Connection` sends a second copy of it and returns the first successful response.
+Only idempotent actions should be hedged. The losing copy is not cancelled: it still consumes capacity.
+
+>>> hedging = PercentileHedgingPolicy(percentile=95., budget=0.05)
+>>> fast_connection = Connection("us-west-2", EnvironmentCredentials(), hedging_policy=hedging)
+>>> fast_connection(GetItem(table, {"h": 0})).item
+{u'h': 0, u'gr': 10, u'gh': 0}
+
+.. py:class:: HedgingPolicy
+
+    The interface to be implemented by all hedging policies. Note that you must not inherit from this class, just implement the same interface.
+
+    .. py:method:: delay(action, table_names)
+
+        Called before each attempt to send an action.
+
+        :param action: the action about to be sent.
+        :param table_names: the sorted list of names of the tables in the action.
+        :return: ``None`` to send it without hedging, or the delay after which to consider sending a second copy.
+
+        :type: ``None`` or number (in seconds)
+
+    .. py:method:: hedge(action)
+
+        Called when the delay returned by :meth:`delay` has passed and no response was received.
+
+        :param action: the action being sent.
+        :return: ``True`` to send a second copy.
+
+        :type: bool
+
+    .. py:method:: record(action, latency, table_names)
+
+        Called after each successful attempt, hedged or not.
+
+        :param action: the action that was sent.
+        :param latency: the time until the first successful response, in seconds.
+        :param table_names: the sorted list of names of the tables in the action.
+"""
+
+import collections
+import threading
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+from LowVoltage.actions.action import _read_actions
+from .metrics import _table_names
+
+
+class PercentileHedgingPolicy(object):
+    """
+    Hedge read actions (:class:`.GetItem`, :class:`.BatchGetItem`, :class:`.Query` and :class:`.Scan`)
+    that take longer than a percentile of the recent latencies of the same action on the same tables.
+
+    :param percentile: the percentile of latencies after which a second copy is sent.
+    :param budget: the maximum proportion of requests that are hedged. Unused budget accumulates up to ``burst`` hedges.
+    :param burst: the maximum number of hedges that can be sent in a row.
+    :param window: the number of recent latencies kept for each action and tables.
+    :param min_samples: the number of latencies needed before hedging an action on some tables.
+    :param min_delay: the minimum delay before hedging, in seconds.
+
+    It can be shared by several connections used from several threads.
+    """
+
+    def __init__(self, percentile=95., budget=0.05, burst=10., window=1000, min_samples=20, min_delay=0.):
+        self.__percentile = percentile
+        self.__budget = budget
+        self.__burst = burst
+        self.__window = window
+        self.__min_samples = min_samples
+        self.__min_delay = min_delay
+        self.__lock = threading.Lock()
+        self.__latencies = {}
+        self.__tokens = burst
+
+    def delay(self, action, table_names=None):
+        if action.name in _read_actions:
+            key = self.__key(action, table_names)
+            with self.__lock:
+                latencies = self.__latencies.get(key)
+                if latencies is not None:
+                    self.__tokens = min(self.__burst, self.__tokens + self.__budget)
+                    delay = latencies.delay()
+                    if delay is not None:
+                        return max(delay, self.__min_delay)
+
+    def hedge(self, action):
+        with self.__lock:
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return True
+            else:
+                return False
+
+    def record(self, action, latency, table_names=None):
+        if action.name in _read_actions:
+            key = self.__key(action, table_names)
+            with self.__lock:
+                latencies = self.__latencies.get(key)
+                if latencies is None:
+                    latencies = self.__latencies[key] = _Latencies(self.__percentile, self.__window, self.__min_samples)
+                latencies.add(latency)
+
+    def __key(self, action, table_names):
+        if table_names is None:
+            table_names = _table_names(action.payload)
+        return (action.name, tuple(table_names))
+
+
+class _Latencies(object):
+    # Sorting the window for each request would be too costly: the percentile is computed again after window / 10 new latencies
+    def __init__(self, percentile, window, min_samples):
+        self.__percentile = percentile
+        self.__min_samples = min_samples
+        self.__latencies = collections.deque(maxlen=window)
+        self.__refresh_every = max(1, window // 10)
+        self.__added = 0
+        self.__delay = None
+
+    def add(self, latency):
+        self.__latencies.append(latency)
+        self.__added += 1
+        if self.__delay is None and len(self.__latencies) >= self.__min_samples or self.__added >= self.__refresh_every:
+            self.__added = 0
+            latencies = sorted(self.__latencies)
+            if len(latencies) >= self.__min_samples:
+                self.__delay = latencies[min(len(latencies) - 1, int(len(latencies) * self.__percentile / 100.))]
+
+    def delay(self):
+        return self.__delay
+
+
+class PercentileHedgingPolicyUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(PercentileHedgingPolicyUnitTests, self).setUp()
+        self.policy = PercentileHedgingPolicy(percentile=90., budget=0.5, burst=2., window=20, min_samples=10)
+
+    def record(self, action, latencies):
+        for latency in latencies:
+            self.policy.record(action, latency)
+
+    def test_write_actions_are_not_hedged(self):
+        self.record(_lv.PutItem("A", {"h": 0}), range(100))
+        self.assertIsNone(self.policy.delay(_lv.PutItem("A", {"h": 0})))
+
+    def test_not_enough_samples(self):
+        self.assertIsNone(self.policy.delay(_lv.GetItem("A", {"h": 0})))
+        self.record(_lv.GetItem("A", {"h": 0}), range(9))
+        self.assertIsNone(self.policy.delay(_lv.GetItem("A", {"h": 0})))
+        self.record(_lv.GetItem("A", {"h": 0}), [9])
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 9)
+
+    def test_percentile_per_action(self):
+        self.record(_lv.GetItem("A", {"h": 0}), range(10))
+        self.record(_lv.Query("A"), range(100, 110))
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 9)
+        self.assertEqual(self.policy.delay(_lv.Query("A")), 109)
+
+    def test_percentile_per_table(self):
+        self.record(_lv.GetItem("A", {"h": 0}), range(10))
+        self.record(_lv.GetItem("B", {"h": 0}), range(100, 110))
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 9)
+        self.assertEqual(self.policy.delay(_lv.GetItem("B", {"h": 0})), 109)
+        self.assertIsNone(self.policy.delay(_lv.GetItem("C", {"h": 0})))
+
+    def test_given_table_names(self):
+        for latency in range(10):
+            self.policy.record(_lv.GetItem("A", {"h": 0}), latency, ["A"])
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0}), ["A"]), 9)
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 9)
+
+    def test_percentile_is_refreshed_on_sliding_window(self):
+        self.record(_lv.GetItem("A", {"h": 0}), range(10))
+        self.record(_lv.GetItem("A", {"h": 0}), [1])
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 9)
+        self.record(_lv.GetItem("A", {"h": 0}), [1] * 19)
+        self.assertEqual(self.policy.delay(_lv.GetItem("A", {"h": 0})), 1)
+
+    def test_min_delay(self):
+        policy = PercentileHedgingPolicy(min_samples=1, min_delay=0.01)
+        policy.record(_lv.GetItem("A", {"h": 0}), 0.001)
+        self.assertEqual(policy.delay(_lv.GetItem("A", {"h": 0})), 0.01)
+
+    def test_budget(self):
+        action = _lv.GetItem("A", {"h": 0})
+        self.record(action, range(10))
+        self.assertTrue(self.policy.hedge(action))
+        self.assertTrue(self.policy.hedge(action))
+        self.assertFalse(self.policy.hedge(action))
+        self.policy.delay(action)
+        self.assertFalse(self.policy.hedge(action))
+        self.policy.delay(action)
+        self.assertTrue(self.policy.hedge(action))
+        self.assertFalse(self.policy.hedge(action))
@@ -0,0 +1,93 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+JSON codecs encode the payload of requests and decode the body of responses.
+The :class:`.Connection` uses the :obj:`DEFAULT` codec, based on the standard ``json`` module, but you can give it any codec.
+For example, if you have `ujson <https://pypi.python.org/pypi/ujson>`__ installed:
+
+>>> import ujson  # doctest: +SKIP
+>>> fast_connection = Connection("us-west-2", credentials, codec=JsonCodec(dumps=ujson.dumps, loads=ujson.loads))  # doctest: +SKIP
+
+Run ``python -m LowVoltage.benchmarks.json_codecs`` to compare the available codecs on a 1MB :class:`.Query` response.
+
+.. py:class:: Codec
+
+    The interface to be implemented by all JSON codecs. Note that you must not inherit from this class, just implement the same interface.
+
+    .. py:method:: encode(payload)
+
+        Encode an action's payload.
+
+        :param payload: a dict as returned by :attr:`.Action.payload`.
+        :return: a text string (``unicode`` or ``str`` containing only ASCII characters in Python 2, ``str`` in Python 3).
+
+    .. py:method:: decode(body)
+
+        Decode the body of a response.
+
+        :param body: the bytes received from DynamoDB, encoded in UTF-8.
+        :return: the decoded object.
+        :raise: :exc:`ValueError` if ``body`` is not valid JSON.
+"""
+
+import json
+
+import LowVoltage.testing as _tst
+
+
+class JsonCodec(object):
+    """
+    Codec calling a ``dumps`` and a ``loads`` function, like the ones of the standard ``json`` module.
+
+    :param dumps: a function converting a dict to a text string. If left ``None``, ``json.dumps`` will be used.
+    :param loads: a function converting bytes to an object and raising :exc:`ValueError` on invalid input. If left ``None``, ``json.loads`` will be used.
+    """
+
+    def __init__(self, dumps=None, loads=None):
+        if dumps is None:
+            dumps = json.dumps
+        if loads is None:
+            loads = _loads
+        self.__dumps = dumps
+        self.__loads = loads
+
+    def encode(self, payload):
+        return self.__dumps(payload)
+
+    def decode(self, body):
+        return self.__loads(body)
+
+
+def _loads(body):
+    # json.loads only accepts bytes since Python 3.6
+    if isinstance(body, bytes):
+        body = body.decode("utf-8")
+    return json.loads(body)
+
+
+DEFAULT = JsonCodec()
+"""
+Codec using the standard ``json`` module.
+"""
+
+
+class JsonCodecUnitTests(_tst.UnitTests):
+    def test_default_encode(self):
+        self.assertEqual(DEFAULT.encode({"a": [1, u"b"]}), '{"a": [1, "b"]}')
+
+    def test_default_decode(self):
+        self.assertEqual(DEFAULT.decode(b'{"a": [1, "b"]}'), {"a": [1, u"b"]})
+
+    def test_default_decode_utf8(self):
+        self.assertEqual(DEFAULT.decode(u'{"a": "éoà"}'.encode("utf-8")), {"a": u"éoà"})
+
+    def test_default_decode_invalid(self):
+        with self.assertRaises(ValueError):
+            DEFAULT.decode(b"foobar")
+
+    def test_custom_functions(self):
+        codec = JsonCodec(dumps=lambda payload: "dumped {}".format(payload["a"]), loads=lambda body: {"loaded": body})
+        self.assertEqual(codec.encode({"a": 42}), "dumped 42")
+        self.assertEqual(codec.decode(b"foo"), {"loaded": b"foo"})
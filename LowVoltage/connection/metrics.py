@@ -0,0 +1,263 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+A :class:`.Connection` can report what happens to each request it sends to a metrics collector.
+Each attempt (the first request and each retry) is reported with a :class:`RequestMetrics`.
+
+:class:`MetricsRegistry` aggregates them per action and table, but you can give any metrics collector to the connection:
+
+>>> metrics = MetricsRegistry()
+>>> measured_connection = Connection("us-west-2", EnvironmentCredentials(), metrics=metrics)
+>>> r = measured_connection(GetItem(table, {"h": 0}).return_consumed_capacity_total())
+>>> stats = metrics.snapshot()[("GetItem", table)]
+>>> stats.requests
+1
+>>> stats.capacity_units
+0.5
+
+.. py:class:: MetricsCollector
+
+    The interface to be implemented by all metrics collectors. Note that you must not inherit from this class, just implement the same interface.
+
+    .. py:method:: record(request_metrics)
+
+        Called after each attempt, successful or not, from the thread that called the connection.
+
+        :param request_metrics: a :class:`RequestMetrics`.
+"""
+
+import threading
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from LowVoltage.actions.return_types import ConsumedCapacity
+
+
+class RequestMetrics(object):
+    """
+    What happened during one attempt to send an action.
+    Durations are in seconds. They are ``None`` for the steps that were not reached because of an exception.
+    """
+
+    def __init__(self, action_name, table_names, attempt):
+        self.action_name = action_name
+        """The name of the action, like ``"GetItem"``."""
+        self.table_names = table_names
+        """The names of the tables in the action. Empty for :class:`.ListTables`, several for batch actions."""
+        self.attempt = attempt
+        """0 for the first request, 1 for the first retry, etc."""
+        self.payload = None
+        """The payload of the action, as sent to DynamoDB. Don't modify it."""
+        self.exception = None
+        """The exception raised by this attempt, or ``None``. Usually an :exc:`.Error`."""
+        self.signing = None
+        """The time spent getting credentials and signing the request."""
+        self.serialization = None
+        """The time spent encoding and hashing the payload. It's done once for all attempts, so it's 0 for retries."""
+        self.network = None
+        """The time spent sending the request and receiving the response."""
+        self.parsing = None
+        """The time spent decoding the response."""
+        self.request_bytes = None
+        """The size of the encoded payload."""
+        self.response_bytes = None
+        """The size of the body of the response."""
+        self.consumed_capacity = None
+        """``None`` or list of :class:`.ConsumedCapacity`, if they were requested and returned."""
+
+
+class ActionMetrics(object):
+    """
+    Metrics of an action on a table, aggregated by :class:`MetricsRegistry`. Durations are in seconds.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        """The number of attempts, including retries."""
+        self.retries = 0
+        """The number of retries."""
+        self.errors = {}
+        """The number of failed attempts, by exception class name."""
+        self.throttles = 0
+        """The number of :exc:`.ProvisionedThroughputExceededException`."""
+        self.signing = 0.
+        """The total time spent signing."""
+        self.serialization = 0.
+        """The total time spent encoding and hashing payloads."""
+        self.network = 0.
+        """The total time spent in the network."""
+        self.parsing = 0.
+        """The total time spent decoding responses."""
+        self.max_latency = 0.
+        """The duration of the slowest attempt."""
+        self.request_bytes = 0
+        """The total size of encoded payloads."""
+        self.response_bytes = 0
+        """The total size of responses."""
+        self.capacity_units = 0.
+        """The total capacity units consumed, as returned in :class:`.ConsumedCapacity`."""
+
+    def _copy(self):
+        copy = ActionMetrics()
+        copy.__dict__.update(self.__dict__)
+        copy.errors = dict(self.errors)
+        return copy
+
+
+class MetricsRegistry(object):
+    """
+    Metrics collector aggregating :class:`RequestMetrics` by action name and table name, in :class:`ActionMetrics`.
+    Actions on several tables are counted for each table. Actions on no table are counted with table name ``None``.
+
+    It can be shared by several connections used from several threads.
+    """
+
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__metrics = {}
+
+    def record(self, request_metrics):
+        with self.__lock:
+            for table_name in request_metrics.table_names or [None]:
+                key = (request_metrics.action_name, table_name)
+                metrics = self.__metrics.get(key)
+                if metrics is None:
+                    metrics = self.__metrics[key] = ActionMetrics()
+                self.__add(metrics, request_metrics, table_name)
+
+    def __add(self, metrics, request_metrics, table_name):
+        metrics.requests += 1
+        if request_metrics.attempt > 0:
+            metrics.retries += 1
+        if request_metrics.exception is not None:
+            name = request_metrics.exception.__class__.__name__
+            metrics.errors[name] = metrics.errors.get(name, 0) + 1
+            if isinstance(request_metrics.exception, _exn.ProvisionedThroughputExceededException):
+                metrics.throttles += 1
+        latency = 0.
+        for step in ["signing", "serialization", "network", "parsing"]:
+            duration = getattr(request_metrics, step)
+            if duration is not None:
+                setattr(metrics, step, getattr(metrics, step) + duration)
+                latency += duration
+        metrics.max_latency = max(metrics.max_latency, latency)
+        metrics.request_bytes += request_metrics.request_bytes or 0
+        metrics.response_bytes += request_metrics.response_bytes or 0
+        for consumed_capacity in request_metrics.consumed_capacity or []:
+            if consumed_capacity.table_name in (None, table_name) and consumed_capacity.capacity_units is not None:
+                metrics.capacity_units += consumed_capacity.capacity_units
+
+    def snapshot(self):
+        """
+        Return a copy of the metrics collected so far.
+
+        :type: dict of (action name, table name) to :class:`ActionMetrics`
+        """
+        with self.__lock:
+            return {key: metrics._copy() for key, metrics in self.__metrics.iteritems()}
+
+    def reset(self):
+        """
+        Forget the metrics collected so far.
+        """
+        with self.__lock:
+            self.__metrics = {}
+
+
+def _table_names(payload):
+    if "TableName" in payload:
+        return [payload["TableName"]]
+    elif "RequestItems" in payload:
+        return sorted(payload["RequestItems"].keys())
+    else:
+        return []
+
+
+def _consumed_capacity(response):
+    consumed_capacity = getattr(response, "consumed_capacity", None)
+    if consumed_capacity is None:
+        return None
+    elif isinstance(consumed_capacity, list):
+        return consumed_capacity
+    else:
+        return [consumed_capacity]
+
+
+class MetricsRegistryUnitTests(_tst.UnitTests):
+    def metrics(self, action_name, table_names, attempt=0, exception=None, durations=(0.1, 0.2, 0.3, 0.4), request_bytes=10, response_bytes=20, consumed_capacity=None):
+        m = RequestMetrics(action_name, table_names, attempt)
+        m.exception = exception
+        m.signing, m.serialization, m.network, m.parsing = durations
+        m.request_bytes = request_bytes
+        m.response_bytes = response_bytes
+        m.consumed_capacity = consumed_capacity
+        return m
+
+    def test_empty(self):
+        self.assertEqual(MetricsRegistry().snapshot(), {})
+
+    def test_aggregate(self):
+        registry = MetricsRegistry()
+        registry.record(self.metrics("GetItem", ["A"], consumed_capacity=[ConsumedCapacity(CapacityUnits=0.5, TableName="A")]))
+        registry.record(self.metrics("GetItem", ["A"], durations=(0.1, 0.2, 1.3, 0.4), consumed_capacity=[ConsumedCapacity(CapacityUnits=1., TableName="A")]))
+        registry.record(self.metrics("PutItem", ["A"]))
+        registry.record(self.metrics("ListTables", []))
+
+        snapshot = registry.snapshot()
+        self.assertEqual(sorted(snapshot.keys()), [("GetItem", "A"), ("ListTables", None), ("PutItem", "A")])
+        metrics = snapshot[("GetItem", "A")]
+        self.assertEqual(metrics.requests, 2)
+        self.assertEqual(metrics.retries, 0)
+        self.assertEqual(metrics.errors, {})
+        self.assertAlmostEqual(metrics.network, 1.6)
+        self.assertAlmostEqual(metrics.max_latency, 2.)
+        self.assertEqual(metrics.request_bytes, 20)
+        self.assertEqual(metrics.response_bytes, 40)
+        self.assertEqual(metrics.capacity_units, 1.5)
+
+    def test_errors_and_retries(self):
+        registry = MetricsRegistry()
+        registry.record(self.metrics("PutItem", ["A"], exception=_lv.ProvisionedThroughputExceededException(), durations=(0.1, 0.2, 0.3, 0.4), response_bytes=None))
+        registry.record(self.metrics("PutItem", ["A"], attempt=1, exception=_lv.NetworkError(), durations=(0.1, 0.2, 0.3, None), response_bytes=None))
+        registry.record(self.metrics("PutItem", ["A"], attempt=2))
+
+        metrics = registry.snapshot()[("PutItem", "A")]
+        self.assertEqual(metrics.requests, 3)
+        self.assertEqual(metrics.retries, 2)
+        self.assertEqual(metrics.errors, {"ProvisionedThroughputExceededException": 1, "NetworkError": 1})
+        self.assertEqual(metrics.throttles, 1)
+        self.assertAlmostEqual(metrics.parsing, 0.8)
+        self.assertEqual(metrics.response_bytes, 20)
+
+    def test_batch_on_several_tables(self):
+        registry = MetricsRegistry()
+        registry.record(self.metrics("BatchGetItem", ["A", "B"], consumed_capacity=[ConsumedCapacity(CapacityUnits=1., TableName="A"), ConsumedCapacity(CapacityUnits=2., TableName="B")]))
+
+        snapshot = registry.snapshot()
+        self.assertEqual(snapshot[("BatchGetItem", "A")].capacity_units, 1.)
+        self.assertEqual(snapshot[("BatchGetItem", "B")].capacity_units, 2.)
+        self.assertEqual(snapshot[("BatchGetItem", "B")].requests, 1)
+
+    def test_snapshot_is_a_copy(self):
+        registry = MetricsRegistry()
+        registry.record(self.metrics("PutItem", ["A"], exception=_lv.NetworkError()))
+        snapshot = registry.snapshot()
+        registry.record(self.metrics("PutItem", ["A"], exception=_lv.NetworkError()))
+        self.assertEqual(snapshot[("PutItem", "A")].requests, 1)
+        self.assertEqual(snapshot[("PutItem", "A")].errors, {"NetworkError": 1})
+        registry.reset()
+        self.assertEqual(registry.snapshot(), {})
+
+    def test_table_names(self):
+        self.assertEqual(_table_names({"TableName": "A"}), ["A"])
+        self.assertEqual(_table_names({"RequestItems": {"B": {}, "A": {}}}), ["A", "B"])
+        self.assertEqual(_table_names({}), [])
+
+    def test_consumed_capacity(self):
+        self.assertIsNone(_consumed_capacity(object()))
+        self.assertIsNone(_consumed_capacity(_lv.GetItemResponse()))
+        self.assertEqual(len(_consumed_capacity(_lv.GetItemResponse(ConsumedCapacity={}))), 1)
+        self.assertEqual(len(_consumed_capacity(_lv.BatchGetItemResponse(ConsumedCapacity=[{}, {}]))), 2)
@@ -0,0 +1,215 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Rate limiters pace the requests sent by a :class:`.Connection` to stay under a target throughput,
+instead of waiting for :exc:`.ProvisionedThroughputExceededException` to happen.
+They are typically used for background jobs, to leave capacity for the online traffic on the same tables:
+
+>>> limiter = TokenBucketRateLimiter({table: (10, 5)})
+>>> background_connection = Connection("us-west-2", EnvironmentCredentials(), rate_limiter=limiter)
+>>> for item in iterate_scan(background_connection, Scan(table).return_consumed_capacity_total()):
+...   pass
+
+.. py:class:: RateLimiter
+
+    The interface to be implemented by all rate limiters. Note that you must not inherit from this class, just implement the same interface.
+
+    .. py:method:: delay(action, table_names)
+
+        Return the delay to wait before sending the action (including retries).
+
+        :param action: the action about to be sent.
+        :param table_names: the sorted list of names of the tables in the action.
+
+        :type: ``None`` or number (in seconds)
+
+    .. py:method:: consumed(action, response, table_names)
+
+        Called after each successful request.
+
+        :param action: the action that was sent.
+        :param response: the response returned by DynamoDB.
+        :param table_names: the sorted list of names of the tables in the action.
+"""
+
+import threading
+import time
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+from LowVoltage.actions.action import _read_actions, _write_actions
+from .metrics import _table_names, _consumed_capacity
+
+
+class TokenBucketRateLimiter(object):
+    """
+    Limit the capacity units consumed per second on some tables, using a token bucket per table for reads and another for writes.
+
+    Tokens are refilled continuously at the target rate. Requests are delayed while the bucket of one of their tables is empty.
+    ``default_cost`` tokens per table are reserved before each request, so that concurrent requests don't all see the same tokens.
+    Once the request is done, the reservation is corrected with the capacity consumed according to its
+    :class:`.ConsumedCapacity`, so actions should use ``return_consumed_capacity_total()``.
+    When the response doesn't contain it, the reservation is kept as is.
+    Reservations of failed requests are kept as well.
+
+    :param capacities: a dict of table name to a pair (read capacity units per second, write capacity units per second).
+        Either can be ``None`` meaning "unlimited". Tables not in this dict are not limited.
+    :param burst: the number of seconds of unused capacity that can be accumulated.
+    :param default_cost: the capacity units reserved per table before each request.
+
+    It can be shared by several connections used from several threads.
+    """
+
+    def __init__(self, capacities, burst=1., default_cost=1.):
+        self.__default_cost = default_cost
+        self.__lock = threading.Lock()
+        self.__buckets = {}
+        for table_name, (read, write) in capacities.iteritems():
+            if read is not None:
+                self.__buckets[("read", table_name)] = _Bucket(read, burst)
+            if write is not None:
+                self.__buckets[("write", table_name)] = _Bucket(write, burst)
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+
+    def delay(self, action, table_names=None):
+        buckets = self.__get_buckets(action, table_names)
+        if buckets:
+            now = self.__clock()
+            with self.__lock:
+                return max([bucket.reserve(now, self.__default_cost) for bucket in buckets.itervalues()])
+
+    def consumed(self, action, response, table_names=None):
+        buckets = self.__get_buckets(action, table_names)
+        if buckets:
+            costs = {}
+            for consumed_capacity in _consumed_capacity(response) or []:
+                if consumed_capacity.table_name in buckets and consumed_capacity.capacity_units is not None:
+                    costs[consumed_capacity.table_name] = costs.get(consumed_capacity.table_name, 0) + consumed_capacity.capacity_units
+            if costs:
+                now = self.__clock()
+                with self.__lock:
+                    for table_name, cost in costs.iteritems():
+                        buckets[table_name].take(now, cost - self.__default_cost)
+
+    def __get_buckets(self, action, table_names):
+        if action.name in _read_actions:
+            kind = "read"
+        elif action.name in _write_actions:
+            kind = "write"
+        else:
+            return None
+        if table_names is None:
+            table_names = _table_names(action.payload)
+        buckets = {}
+        for table_name in table_names:
+            bucket = self.__buckets.get((kind, table_name))
+            if bucket is not None:
+                buckets[table_name] = bucket
+        return buckets
+
+
+class _Bucket(object):
+    # The number of tokens can become negative: the cost of a request is only known once it's done.
+    def __init__(self, rate, burst):
+        self.__rate = float(rate)
+        self.__capacity = rate * burst
+        self.__tokens = self.__capacity
+        self.__last = None
+
+    def __refill(self, now):
+        if self.__last is not None:
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last) * self.__rate)
+        self.__last = now
+
+    def reserve(self, now, cost):
+        # The delay doesn't include the reserved cost: a request is sent as soon as the bucket is not empty
+        self.__refill(now)
+        if self.__tokens > 0:
+            delay = 0
+        else:
+            delay = -self.__tokens / self.__rate
+        self.__tokens -= cost
+        return delay
+
+    def take(self, now, cost):
+        # The cost is negative when a request consumed less than its reservation
+        self.__refill(now)
+        self.__tokens = min(self.__capacity, self.__tokens - cost)
+
+
+class TokenBucketRateLimiterUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(TokenBucketRateLimiterUnitTests, self).setUp()
+        self.limiter = TokenBucketRateLimiter({"A": (10, 5), "B": (None, 2)})
+        self.now = 1000.
+        self.limiter._TokenBucketRateLimiter__clock = lambda: self.now
+
+    def test_unlimited_actions_and_tables(self):
+        self.assertIsNone(self.limiter.delay(_lv.DescribeTable("A")))
+        self.assertIsNone(self.limiter.delay(_lv.ListTables()))
+        self.assertIsNone(self.limiter.delay(_lv.GetItem("B", {"h": 0})))
+        self.limiter.consumed(_lv.GetItem("B", {"h": 0}), _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 100., "TableName": "B"}))
+        self.assertIsNone(self.limiter.delay(_lv.GetItem("B", {"h": 0})))
+
+    def test_reads_are_delayed_when_bucket_is_empty(self):
+        action = _lv.GetItem("A", {"h": 0})
+        self.assertEqual(self.limiter.delay(action), 0)
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 8., "TableName": "A"}))
+        self.assertEqual(self.limiter.delay(action), 0)
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 7., "TableName": "A"}))
+        self.assertEqual(self.limiter.delay(action), 0.5)
+        self.now += 0.5
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 1., "TableName": "A"}))
+        self.assertAlmostEqual(self.limiter.delay(action), 0.1)
+        self.now += 0.2
+        self.limiter.consumed(action, _lv.GetItemResponse())
+        self.assertAlmostEqual(self.limiter.delay(action), 0)
+
+    def test_reads_and_writes_are_limited_separately(self):
+        self.assertEqual(self.limiter.delay(_lv.PutItem("A", {"h": 0})), 0)
+        self.limiter.consumed(_lv.PutItem("A", {"h": 0}), _lv.PutItemResponse(ConsumedCapacity={"CapacityUnits": 15., "TableName": "A"}))
+        self.assertEqual(self.limiter.delay(_lv.PutItem("A", {"h": 0})), 2)
+        self.assertEqual(self.limiter.delay(_lv.GetItem("A", {"h": 0})), 0)
+
+    def test_burst_is_capped(self):
+        action = _lv.GetItem("A", {"h": 0})
+        self.limiter.delay(action)
+        self.now += 3600
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 21., "TableName": "A"}))
+        self.assertEqual(self.limiter.delay(action), 1)
+
+    def test_default_cost(self):
+        action = _lv.PutItem("B", {"h": 0})
+        for i in range(3):
+            self.assertEqual(self.limiter.delay(action), 0)
+            self.limiter.consumed(action, _lv.PutItemResponse())
+        self.assertEqual(self.limiter.delay(action), 0.5)
+
+    def test_concurrent_requests_are_spread(self):
+        limiter = TokenBucketRateLimiter({"A": (10, None)}, default_cost=4.)
+        limiter._TokenBucketRateLimiter__clock = lambda: self.now
+        action = _lv.GetItem("A", {"h": 0})
+        self.assertEqual([limiter.delay(action, ["A"]) for i in range(5)], [0, 0, 0, 0.2, 0.6])
+        for i in range(5):
+            limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 1., "TableName": "A"}), ["A"])
+        self.assertEqual(limiter.delay(action, ["A"]), 0)
+
+    def test_reconciliation_is_capped(self):
+        action = _lv.GetItem("A", {"h": 0})
+        self.limiter.delay(action)
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 0., "TableName": "A"}))
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 0., "TableName": "A"}))
+        self.limiter.consumed(action, _lv.GetItemResponse(ConsumedCapacity={"CapacityUnits": 12., "TableName": "A"}))
+        self.assertEqual(self.limiter.delay(action), 0.1)
+
+    def test_batch_on_several_tables(self):
+        action = _lv.BatchWriteItem().table("A").put({"h": 0}).table("B").put({"h": 0})
+        self.assertEqual(self.limiter.delay(action), 0)
+        self.limiter.consumed(action, _lv.BatchWriteItemResponse(ConsumedCapacity=[{"CapacityUnits": 6., "TableName": "A"}, {"CapacityUnits": 6., "TableName": "B"}]))
+        self.assertEqual(self.limiter.delay(action), 2)
+        # The previous delay reserved a write on A
+        self.assertAlmostEqual(self.limiter.delay(_lv.PutItem("A", {"h": 0})), 0.4)
@@ -0,0 +1,611 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+:class:`TrafficRecorder` is a metrics collector (see :mod:`.metrics`) writing the actions sent by a :class:`.Connection`
+to a local log, and :func:`replay` sends them again, to the same endpoint or to another one.
+This is how to load-test a table, or to size its capacity, with the real mix of actions, page sizes and hot keys of an application:
+
+>>> recorder = TrafficRecorder("traffic.jsonl.gz")
+>>> recorded_connection = Connection("us-west-2", EnvironmentCredentials(), metrics=recorder)
+>>> recorded_connection(GetItem(table, {"h": 0})).item
+{u'h': 0, u'gr': 10, u'gh': 0}
+>>> recorder.close()
+>>> report = replay(connection, "traffic.jsonl.gz", speed=None)
+>>> report.actions["GetItem"].requests
+1
+>>> report.actions["GetItem"].error_rate
+0.0
+
+The log has one JSON object per line (gzipped if the file name ends with ``.gz``) with the following keys:
+
+- ``time``: when the action was sent, in seconds since the creation of the recorder;
+- ``action`` and ``payload``: the name and payload of the action;
+- ``latency``: the time it took, in seconds;
+- ``request_bytes`` and ``response_bytes``: the sizes of the request and response bodies;
+- ``error``: ``None``, or the class name of the exception raised.
+"""
+
+import base64
+import bisect
+import gzip
+import hashlib
+import hmac
+import io
+import json
+import os
+import Queue
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import timeit
+
+import LowVoltage as _lv
+import LowVoltage.testing as _tst
+import LowVoltage.exceptions as _exn
+from LowVoltage.actions.action import Action
+
+
+class TrafficRecorder(object):
+    """
+    Metrics collector writing the first attempt to send each action to a log. Retries are not recorded:
+    the connection used by :func:`replay` retries by itself. With a hedging policy (see :mod:`.hedging`),
+    hedged copies are recorded, like any request sent.
+
+    :param destination: the name of the log file, or a file object open for writing bytes.
+    :param sample_rate: the proportion of actions recorded, drawn randomly for each action.
+    :param redact: if ``True``, attribute values in payloads (items, keys and expression attribute values) are replaced by pseudonyms
+        of the same type and size. Equal values get equal pseudonyms, so hot keys stay hot when replayed,
+        and different values get different pseudonyms. When all pseudonyms of a size are taken (for example, there are only 9 one-digit numbers),
+        the pseudonyms of new values are longer.
+        The order of values is lost, so conditions on ranges of values select different items.
+        Attribute names and expressions are kept.
+    :param metrics: ``None`` or another metrics collector, like a :class:`.MetricsRegistry`, to which all attempts are forwarded.
+
+    It can be shared by several connections used from several threads.
+    """
+
+    def __init__(self, destination, sample_rate=1., redact=True, metrics=None):
+        if isinstance(destination, basestring):
+            self.__file = gzip.open(destination, "wb") if destination.endswith(".gz") else open(destination, "wb")
+            self.__owns_file = True
+        else:
+            self.__file = destination
+            self.__owns_file = False
+        self.__sample_rate = sample_rate
+        self.__redactor = _Redactor(os.urandom(16)) if redact else None
+        self.__metrics = metrics
+        self.__lock = threading.Lock()
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+        self.__random = random.random
+
+        self.__start = self.__clock()
+
+    def record(self, request_metrics):
+        if self.__metrics is not None:
+            self.__metrics.record(request_metrics)
+        if request_metrics.attempt > 0 or request_metrics.payload is None:
+            return
+        if self.__sample_rate < 1. and self.__random() >= self.__sample_rate:
+            return
+        latency = sum(
+            duration
+            for duration in (request_metrics.serialization, request_metrics.signing, request_metrics.network, request_metrics.parsing)
+            if duration is not None
+        )
+        payload = request_metrics.payload
+        if self.__redactor is not None:
+            payload = self.__redactor.payload(payload)
+        line = json.dumps(
+            {
+                "time": round(self.__clock() - latency - self.__start, 6),
+                "action": request_metrics.action_name,
+                "payload": payload,
+                "latency": round(latency, 6),
+                "request_bytes": request_metrics.request_bytes,
+                "response_bytes": request_metrics.response_bytes,
+                "error": None if request_metrics.exception is None else request_metrics.exception.__class__.__name__,
+            },
+            sort_keys=True,
+            separators=(",", ":"),
+        ) + "\n"
+        if not isinstance(line, bytes):
+            line = line.encode("utf-8")
+        with self.__lock:
+            self.__file.write(line)
+
+    def flush(self):
+        """
+        Write the recorded actions to the file.
+        """
+        with self.__lock:
+            self.__file.flush()
+
+    def close(self):
+        """
+        Write the recorded actions and close the file, if it was opened by the recorder.
+        """
+        with self.__lock:
+            if self.__owns_file:
+                self.__file.close()
+            else:
+                self.__file.flush()
+
+
+_attributes_keys = frozenset(["Item", "Key", "ExclusiveStartKey", "ExpressionAttributeValues"])
+_conditions_keys = frozenset(["KeyConditions", "QueryFilter", "ScanFilter", "Expected", "AttributeUpdates"])
+
+
+class _Redactor(object):
+    # Pseudonyms are keyed hashes of the values, so they can't be reversed without the key, which is never stored.
+    # Short values have so few possible pseudonyms that hashes would collide: their pseudonyms are remembered,
+    # and a value whose hash gives a taken pseudonym is hashed again with a counter.
+    def __init__(self, key):
+        self.__key = key
+        self.__lock = threading.Lock()
+        # (type, value) -> pseudonym
+        self.__pseudonyms = {}
+        # (type, sign, pseudonym)
+        self.__taken = set()
+        # (type, sign, size) -> number of pseudonyms taken
+        self.__counts = {}
+
+    def payload(self, payload):
+        redacted = {}
+        for name, value in payload.iteritems():
+            if name in _attributes_keys:
+                value = self.__attributes(value)
+            elif name == "Keys":
+                value = [self.__attributes(key) for key in value]
+            elif name in _conditions_keys:
+                value = {attribute: self.__condition(condition) for attribute, condition in value.iteritems()}
+            elif name == "RequestItems":
+                value = {
+                    table: [self.payload(write) for write in request] if isinstance(request, list) else self.payload(request)
+                    for table, request in value.iteritems()
+                }
+            elif name in ("PutRequest", "DeleteRequest"):
+                value = self.payload(value)
+            redacted[name] = value
+        return redacted
+
+    def __condition(self, condition):
+        condition = dict(condition)
+        if "AttributeValueList" in condition:
+            condition["AttributeValueList"] = [self.__value(value) for value in condition["AttributeValueList"]]
+        if "Value" in condition:
+            condition["Value"] = self.__value(condition["Value"])
+        return condition
+
+    def __attributes(self, attributes):
+        return {name: self.__value(value) for name, value in attributes.iteritems()}
+
+    def __value(self, value):
+        redacted = {}
+        for type_, v in value.iteritems():
+            if type_ == "S":
+                v = self.__string(v)
+            elif type_ == "N":
+                v = self.__number(v)
+            elif type_ == "B":
+                v = self.__binary(v)
+            elif type_ == "SS":
+                v = [self.__string(e) for e in v]
+            elif type_ == "NS":
+                v = [self.__number(e) for e in v]
+            elif type_ == "BS":
+                v = [self.__binary(e) for e in v]
+            elif type_ == "M":
+                v = self.__attributes(v)
+            elif type_ == "L":
+                v = [self.__value(e) for e in v]
+            redacted[type_] = v
+        return redacted
+
+    def __digest(self, type_, value, attempt):
+        prefix = type_ + ":" if attempt == 0 else "{}:{}:".format(type_, attempt)
+        return hmac.new(self.__key, _utf8(prefix) + _utf8(value), hashlib.sha256)
+
+    def __string(self, value):
+        return unicode(self.__pseudonym("S", "", value, len(_utf8(value)), lambda size: 16 ** size, _hex_pseudonym))
+
+    def __number(self, value):
+        # Same number of significant digits, and same sign
+        sign = "-" if value.startswith("-") else ""
+        digits = max(1, len(_not_digits.sub("", re.split("[eE]", value)[0])))
+        return sign + self.__pseudonym("N", sign, value, digits, lambda size: 9 * 10 ** (size - 1), _number_pseudonym)
+
+    def __binary(self, value):
+        size = len(base64.b64decode(value))
+        return base64.b64encode(self.__pseudonym("B", "", value, size, lambda size: 256 ** size, _binary_pseudonym)).decode("ascii")
+
+    def __pseudonym(self, type_, sign, value, size, space, make):
+        if space(size) >= 2 ** 64:
+            # As unlikely to collide as the hashes themselves
+            return make(self.__digest(type_, value, 0), size)
+        with self.__lock:
+            pseudonym = self.__pseudonyms.get((type_, value))
+            if pseudonym is None:
+                while self.__counts.get((type_, sign, size), 0) >= space(size):
+                    size += 1
+                attempt = 0
+                pseudonym = make(self.__digest(type_, value, attempt), size)
+                while (type_, sign, pseudonym) in self.__taken:
+                    attempt += 1
+                    pseudonym = make(self.__digest(type_, value, attempt), size)
+                self.__pseudonyms[(type_, value)] = pseudonym
+                self.__taken.add((type_, sign, pseudonym))
+                self.__counts[(type_, sign, size)] = self.__counts.get((type_, sign, size), 0) + 1
+            return pseudonym
+
+
+def _hex_pseudonym(digest, size):
+    return _repeat(digest.hexdigest(), size)
+
+
+def _number_pseudonym(digest, size):
+    # Any number of this many digits, without leading zero
+    return str(int(digest.hexdigest(), 16) % (9 * 10 ** (size - 1)) + 10 ** (size - 1))
+
+
+def _binary_pseudonym(digest, size):
+    return _repeat(digest.digest(), size)
+
+
+_not_digits = re.compile(r"[^0-9]")
+
+
+def _utf8(value):
+    return value if isinstance(value, bytes) else value.encode("utf-8")
+
+
+def _repeat(s, size):
+    return (s * (size // len(s) + 1))[:size]
+
+
+def load_traffic(source):
+    """
+    Return the actions recorded by a :class:`TrafficRecorder`, as a list of dicts (see above), sorted by time.
+
+    :param source: the name of the log file, or a file object open for reading bytes.
+    """
+    if isinstance(source, basestring):
+        f = gzip.open(source, "rb") if source.endswith(".gz") else open(source, "rb")
+        try:
+            lines = f.readlines()
+        finally:
+            f.close()
+    else:
+        lines = source.readlines()
+    entries = [json.loads(line.decode("utf-8")) for line in lines if line.strip()]
+    entries.sort(key=lambda entry: entry["time"])
+    return entries
+
+
+def replay(connection, traffic, speed=1., workers=8):
+    """
+    Send recorded actions again, and return a :class:`ReplayReport`.
+
+    Actions are sent at the same pace as when they were recorded, relative to the first one, if ``speed`` is 1,
+    ``speed`` times faster otherwise, or as fast as possible if ``speed`` is ``None``.
+    When all workers are busy, actions wait for a free worker: see :attr:`ReplayReport.max_lag`.
+
+    :param connection: the connection to send the actions to. Typically with a no-retry policy, to see throttling in the report.
+    :param traffic: the name of a log file, or a list of actions as returned by :func:`load_traffic`.
+    :param workers: the number of threads sending actions.
+    """
+    if isinstance(traffic, basestring):
+        traffic = load_traffic(traffic)
+    report = ReplayReport()
+    lock = threading.Lock()
+    tasks = Queue.Queue()
+    timer = timeit.default_timer
+
+    def work():
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            due, entry = task
+            before = timer()
+            error = None
+            try:
+                connection(_ReplayedAction(entry["action"], entry["payload"]))
+            except Exception as e:
+                error = e.__class__.__name__
+            after = timer()
+            with lock:
+                report._add(entry["action"], after - before, error, 0. if due is None else max(0., before - due))
+
+    threads = [threading.Thread(target=work) for i in range(workers)]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+
+    start = timer()
+    first = traffic[0]["time"] if traffic else 0.
+    for entry in traffic:
+        if speed is None:
+            due = None
+        else:
+            due = start + (entry["time"] - first) / speed
+            delay = due - timer()
+            if delay > 0:
+                time.sleep(delay)
+        tasks.put((due, entry))
+    for thread in threads:
+        tasks.put(None)
+    for thread in threads:
+        thread.join()
+    report.duration = timer() - start
+    return report
+
+
+class _ReplayedAction(Action):
+    # An action rebuilt from a recorded payload
+    def __init__(self, name, payload):
+        super(_ReplayedAction, self).__init__(name, getattr(_lv, name + "Response", _RawResponse))
+        self.payload = payload
+
+
+class _RawResponse(object):
+    def __init__(self, **kwds):
+        self.kwds = kwds
+
+
+# Upper bounds of the buckets of latency histograms, in seconds: from 1ms to about 46s, each 1.19 times the previous one
+_buckets = [0.001 * 2 ** (i / 4.) for i in range(63)]
+
+
+class ReplayReport(object):
+    """
+    What happened during a :func:`replay`.
+    """
+
+    def __init__(self):
+        self.duration = None
+        """The time taken by the replay, in seconds."""
+        self.max_lag = 0.
+        """The longest time an action waited for a free worker after its due time, in seconds."""
+        self.actions = {}
+        """The statistics of each action, by name.
+
+        :type: dict of action name to :class:`ReplayActionStats`"""
+
+    def _add(self, name, latency, error, lag):
+        stats = self.actions.get(name)
+        if stats is None:
+            stats = self.actions[name] = ReplayActionStats()
+        stats._add(latency, error)
+        self.max_lag = max(self.max_lag, lag)
+
+
+class ReplayActionStats(object):
+    """
+    Statistics of an action during a :func:`replay`.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        """The number of actions sent."""
+        self.errors = {}
+        """The number of failed actions, by exception class name."""
+        self.max_latency = 0.
+        """The latency of the slowest action, in seconds."""
+        self.__counts = [0] * (len(_buckets) + 1)
+
+    def _add(self, latency, error):
+        self.requests += 1
+        if error is not None:
+            self.errors[error] = self.errors.get(error, 0) + 1
+        self.max_latency = max(self.max_latency, latency)
+        self.__counts[bisect.bisect_left(_buckets, latency)] += 1
+
+    @property
+    def error_rate(self):
+        """
+        The proportion of failed actions.
+
+        :type: float
+        """
+        return float(sum(self.errors.itervalues())) / self.requests if self.requests else 0.
+
+    @property
+    def histogram(self):
+        """
+        The distribution of latencies: a list of (upper bound in seconds, number of actions) for each non-empty bucket,
+        in increasing order. The upper bound of the last bucket is :attr:`max_latency`.
+        """
+        return [
+            (_buckets[i] if i < len(_buckets) else self.max_latency, count)
+            for i, count in enumerate(self.__counts)
+            if count
+        ]
+
+    def percentile(self, percentile):
+        """
+        Return the latency below which ``percentile`` percent of the actions completed, in seconds.
+        It's the upper bound of a bucket of :attr:`histogram`, so it can be up to 19% too high.
+        """
+        threshold = self.requests * percentile / 100.
+        total = 0
+        for bound, count in self.histogram:
+            total += count
+            if total >= threshold:
+                return min(bound, self.max_latency)
+
+
+class TrafficRecorderUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(TrafficRecorderUnitTests, self).setUp()
+        self.engine = _tst.InMemoryDynamoDb()
+        self.engine.connection()(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).provisioned_throughput(1, 1))
+        self.log = io.BytesIO()
+
+    def record(self, actions, **kwds):
+        recorder = TrafficRecorder(self.log, **kwds)
+        connection = self.engine.connection(metrics=recorder, retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0))
+        for action in actions:
+            try:
+                connection(action)
+            except _exn.Error:
+                pass
+        recorder.close()
+        return load_traffic(io.BytesIO(self.log.getvalue()))
+
+    def test_record(self):
+        traffic = self.record([_lv.PutItem("Aaa", {"h": u"a", "v": 42}), _lv.GetItem("Bbb", {"h": u"a"})], redact=False)
+        self.assertEqual([entry["action"] for entry in traffic], ["PutItem", "GetItem"])
+        self.assertEqual(traffic[0]["payload"], {"TableName": "Aaa", "Item": {"h": {"S": "a"}, "v": {"N": "42"}}})
+        self.assertIsNone(traffic[0]["error"])
+        self.assertEqual(traffic[1]["error"], "ResourceNotFoundException")
+        self.assertGreater(traffic[0]["response_bytes"], 0)
+        self.assertGreater(traffic[0]["request_bytes"], 0)
+        self.assertLessEqual(traffic[0]["time"], traffic[1]["time"])
+
+    def test_sample(self):
+        draws = iter([0.5, 0.05, 0.2])
+        recorder = TrafficRecorder(self.log, sample_rate=0.1, redact=False)
+        recorder._TrafficRecorder__random = lambda: next(draws)
+        connection = self.engine.connection(metrics=recorder)
+        for i in range(3):
+            connection(_lv.GetItem("Aaa", {"h": unicode(i)}))
+        recorder.close()
+        traffic = load_traffic(io.BytesIO(self.log.getvalue()))
+        self.assertEqual([entry["payload"]["Key"] for entry in traffic], [{"h": {"S": "1"}}])
+
+    def test_forward_metrics(self):
+        metrics = _lv.MetricsRegistry()
+        self.record([_lv.GetItem("Aaa", {"h": u"a"})], metrics=metrics)
+        self.assertEqual(metrics.snapshot()[("GetItem", "Aaa")].requests, 1)
+
+    def test_redact(self):
+        redactor = _Redactor(b"key")
+        payload = {
+            "TableName": "Aaa",
+            "Item": {
+                "s": {"S": u"délivré"}, "n": {"N": "-12.5e3"}, "b": {"B": base64.b64encode(b"abcde").decode("ascii")},
+                "ss": {"SS": [u"a", u"bb"]}, "m": {"M": {"l": {"L": [{"N": "0"}, {"BOOL": True}, {"NULL": True}]}}},
+            },
+            "ConditionExpression": "attribute_not_exists(#s)",
+            "ExpressionAttributeNames": {"#s": "s"},
+        }
+        redacted = redactor.payload(payload)
+        self.assertEqual(redacted, redactor.payload(payload))
+        self.assertEqual(sorted(redacted.keys()), sorted(payload.keys()))
+        self.assertEqual(redacted["ExpressionAttributeNames"], {"#s": "s"})
+        item = redacted["Item"]
+        self.assertNotEqual(item["s"]["S"], u"délivré")
+        self.assertEqual(len(item["s"]["S"]), len(u"délivré".encode("utf-8")))
+        self.assertTrue(re.match(r"^-[1-9][0-9]{2}$", item["n"]["N"]))
+        self.assertEqual(len(base64.b64decode(item["b"]["B"])), 5)
+        self.assertEqual([len(s) for s in item["ss"]["SS"]], [1, 2])
+        self.assertEqual(item["m"]["M"]["l"]["L"][1:], [{"BOOL": True}, {"NULL": True}])
+        self.assertEqual(len(item["m"]["M"]["l"]["L"][0]["N"]), 1)
+
+    def test_redacted_short_values_dont_collide(self):
+        redactor = _Redactor(b"key")
+        strings = [redactor.payload({"Key": {"h": {"S": unicode(c)}}})["Key"]["h"]["S"] for c in u"abcdefghijklmnopqrstuvwxyz"]
+        self.assertEqual([len(s) for s in strings], [1] * 16 + [2] * 10)
+        self.assertEqual(len(set(strings)), 26)
+        numbers = [redactor.payload({"Key": {"h": {"N": str(i)}}})["Key"]["h"]["N"] for i in range(20)]
+        self.assertEqual([len(n) for n in numbers], [1] * 9 + [2] * 11)
+        self.assertEqual(len(set(numbers)), 20)
+        negative_numbers = [redactor.payload({"Key": {"h": {"N": str(-i)}}})["Key"]["h"]["N"] for i in range(1, 10)]
+        self.assertTrue(all(re.match(r"^-[1-9]$", n) for n in negative_numbers))
+        self.assertEqual(len(set(negative_numbers)), 9)
+        self.assertEqual(redactor.payload({"Key": {"h": {"N": "5"}}})["Key"]["h"]["N"], numbers[5])
+
+    def test_redacted_set_elements_stay_distinct(self):
+        redactor = _Redactor(b"key")
+        elements = redactor.payload({"Item": {"ss": {"SS": [unicode(i) for i in range(10)]}}})["Item"]["ss"]["SS"]
+        self.assertEqual(len(set(elements)), 10)
+        elements = redactor.payload({"Item": {"bs": {"BS": [base64.b64encode(bytes(bytearray([i]))).decode("ascii") for i in range(256)]}}})["Item"]["bs"]["BS"]
+        self.assertEqual(len(set(elements)), 256)
+
+    def test_redact_batches_and_conditions(self):
+        redactor = _Redactor(b"key")
+        key = {"h": {"S": u"hot"}}
+        redacted = redactor.payload({
+            "RequestItems": {
+                "Aaa": {"Keys": [key, key]},
+                "Bbb": [{"PutRequest": {"Item": key}}, {"DeleteRequest": {"Key": key}}],
+            },
+        })
+        pseudonym = redacted["RequestItems"]["Aaa"]["Keys"][0]
+        self.assertNotEqual(pseudonym, key)
+        self.assertEqual(redacted["RequestItems"]["Aaa"]["Keys"], [pseudonym, pseudonym])
+        self.assertEqual(redacted["RequestItems"]["Bbb"], [{"PutRequest": {"Item": pseudonym}}, {"DeleteRequest": {"Key": pseudonym}}])
+
+        redacted = redactor.payload({"KeyConditions": {"h": {"ComparisonOperator": "EQ", "AttributeValueList": [{"S": u"hot"}]}}})
+        self.assertEqual(redacted["KeyConditions"]["h"], {"ComparisonOperator": "EQ", "AttributeValueList": [pseudonym["h"]]})
+
+    def test_redacted_hot_keys_are_replayed(self):
+        traffic = self.record([_lv.PutItem("Aaa", {"h": u"hot", "v": 1}), _lv.GetItem("Aaa", {"h": u"hot"})])
+        replay_engine = _tst.InMemoryDynamoDb()
+        replay_connection = replay_engine.connection()
+        replay_connection(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).provisioned_throughput(1, 1))
+        replay(replay_connection, traffic[:1], speed=None)
+        key = traffic[1]["payload"]["Key"]
+        self.assertNotEqual(key, {"h": {"S": "hot"}})
+        self.assertEqual(key, {"h": traffic[0]["payload"]["Item"]["h"]})
+        self.assertIsNotNone(replay_connection(_lv.GetItem("Aaa", {"h": key["h"]["S"]})).item)
+
+
+class ReplayUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(ReplayUnitTests, self).setUp()
+        self.connection = _tst.InMemoryDynamoDb().connection(retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0))
+        self.connection(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).provisioned_throughput(1, 1))
+
+    def entry(self, time, action, payload):
+        return {"time": time, "action": action, "payload": payload, "latency": 0., "request_bytes": 0, "response_bytes": 0, "error": None}
+
+    def test_as_fast_as_possible(self):
+        traffic = [self.entry(float(i), "PutItem", {"TableName": "Aaa", "Item": {"h": {"S": unicode(i)}}}) for i in range(20)]
+        traffic.append(self.entry(20., "GetItem", {"TableName": "Bbb", "Key": {"h": {"S": "0"}}}))
+        report = replay(self.connection, traffic, speed=None, workers=4)
+        self.assertLess(report.duration, 10.)
+        self.assertEqual(sorted(report.actions.keys()), ["GetItem", "PutItem"])
+        self.assertEqual(report.actions["PutItem"].requests, 20)
+        self.assertEqual(report.actions["PutItem"].error_rate, 0.)
+        self.assertEqual(sum(count for bound, count in report.actions["PutItem"].histogram), 20)
+        self.assertEqual(report.actions["GetItem"].errors, {"ResourceNotFoundException": 1})
+        self.assertEqual(report.actions["GetItem"].error_rate, 1.)
+        self.assertEqual(self.connection(_lv.Scan("Aaa")).count, 20)
+
+    def test_speed(self):
+        traffic = [self.entry(100. + i, "GetItem", {"TableName": "Aaa", "Key": {"h": {"S": "a"}}}) for i in range(3)]
+        report = replay(self.connection, traffic, speed=40., workers=1)
+        self.assertGreaterEqual(report.duration, 0.05)
+        self.assertLess(report.duration, 1.)
+        self.assertEqual(report.actions["GetItem"].requests, 3)
+
+    def test_load_gzipped_file(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        filename = os.path.join(directory, "traffic.jsonl.gz")
+        recorder = TrafficRecorder(filename, redact=False)
+        connection = _tst.InMemoryDynamoDb().connection(metrics=recorder)
+        connection(_lv.ListTables())
+        recorder.close()
+        traffic = load_traffic(filename)
+        self.assertEqual([(entry["action"], entry["payload"]) for entry in traffic], [("ListTables", {})])
+        self.assertEqual(replay(self.connection, filename, speed=None).actions["ListTables"].requests, 1)
+
+    def test_histogram(self):
+        stats = ReplayActionStats()
+        for latency in [0.0005, 0.0015, 0.0016, 0.004, 100.]:
+            stats._add(latency, None)
+        self.assertEqual([count for bound, count in stats.histogram], [1, 2, 1, 1])
+        self.assertEqual(stats.histogram[-1][0], 100.)
+        self.assertEqual(stats.percentile(20), 0.001)
+        self.assertAlmostEqual(stats.percentile(50), 0.001 * 2 ** 0.75)
+        self.assertEqual(stats.percentile(100), 100.)
+        self.assertIsNone(ReplayActionStats().percentile(50))
@@ -21,6 +21,10 @@ Retry policies decide if it's worth retrying and how long to wait.
         :type: ``None`` or number (in seconds)
 """
 
+import random
+import threading
+import time
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
 
@@ -49,6 +53,146 @@ class ExponentialBackoffRetryPolicy(object):
         return "ExponentialBackoffRetryPolicy({}, {}, {})".format(self.__first_wait, self.__multiplier, self.__max_retries)
 
 
+class FullJitterRetryPolicy(object):
+    """
+    Retry failed requests after a random delay between 0 and an exponentially growing maximum.
+    Clients throttled at the same time don't retry at the same time.
+
+    :param first_wait: the maximum duration to wait before the first retry.
+    :param multiplier: the factor by which to augment the maximum waiting duration between successive retries. Greater than 1.
+    :param max_wait: the maximum duration to wait before any retry.
+    :param max_retries: the maximum number of times to retry a failed action.
+    """
+    def __init__(self, first_wait, multiplier, max_wait, max_retries):
+        self.__first_wait = first_wait
+        self.__multiplier = multiplier
+        self.__max_wait = max_wait
+        self.__max_retries = max_retries
+
+        # Dependency injection through monkey-patching
+        self.__uniform = random.uniform
+
+    def retry(self, action, exceptions):
+        if len(exceptions) > self.__max_retries:
+            return None
+        else:
+            return self.__uniform(0, min(self.__max_wait, self.__first_wait * (self.__multiplier ** (len(exceptions) - 1))))
+
+    def __repr__(self):
+        return "FullJitterRetryPolicy({}, {}, {}, {})".format(self.__first_wait, self.__multiplier, self.__max_wait, self.__max_retries)
+
+
+class DecorrelatedJitterRetryPolicy(object):
+    """
+    Retry failed requests after a random delay between ``first_wait`` and a bound that is multiplied by three after each failure.
+    Delays grow like with an exponential backoff, but successive delays of different clients are not correlated.
+
+    :param first_wait: the minimum duration to wait before any retry.
+    :param max_wait: the maximum duration to wait before any retry.
+    :param max_retries: the maximum number of times to retry a failed action.
+    """
+    def __init__(self, first_wait, max_wait, max_retries):
+        self.__first_wait = first_wait
+        self.__max_wait = max_wait
+        self.__max_retries = max_retries
+
+        # Dependency injection through monkey-patching
+        self.__uniform = random.uniform
+
+    def retry(self, action, exceptions):
+        if len(exceptions) > self.__max_retries:
+            return None
+        else:
+            # The bound only depends on the number of failures, so concurrent actions (in threads or in an event loop) don't share any state.
+            bound = self.__first_wait
+            for i in range(len(exceptions)):
+                bound = min(self.__max_wait, bound * 3)
+            return self.__uniform(self.__first_wait, bound)
+
+    def __repr__(self):
+        return "DecorrelatedJitterRetryPolicy({}, {}, {})".format(self.__first_wait, self.__max_wait, self.__max_retries)
+
+
+class ExceptionDependentRetryPolicy(object):
+    """
+    Delegate the decision to a different policy depending on the class of the last exception.
+    Base classes are considered, so a policy for :exc:`.ClientError` applies to :exc:`.ProvisionedThroughputExceededException`
+    if no policy is given for the latter.
+
+    >>> policy = ExceptionDependentRetryPolicy(
+    ...   {
+    ...     NetworkError: ExponentialBackoffRetryPolicy(0.1, 2, 5),
+    ...     ProvisionedThroughputExceededException: FullJitterRetryPolicy(1, 2, 20, 8),
+    ...   },
+    ...   default=ExponentialBackoffRetryPolicy(1, 1, 0),
+    ... )
+
+    :param policies: a dict of exception class to retry policy.
+    :param default: the retry policy used for other exceptions. If left ``None``, the :obj:`DEFAULT` retry policy will be used.
+    """
+    def __init__(self, policies, default=None):
+        if default is None:
+            default = DEFAULT
+        self.__policies = dict(policies)
+        self.__default = default
+
+    def retry(self, action, exceptions):
+        for cls in type(exceptions[-1]).__mro__:
+            policy = self.__policies.get(cls)
+            if policy is not None:
+                return policy.retry(action, exceptions)
+        return self.__default.retry(action, exceptions)
+
+    def __repr__(self):
+        return "ExceptionDependentRetryPolicy({{{}}}, default={})".format(
+            ", ".join("{}: {}".format(cls.__name__, policy) for cls, policy in sorted(self.__policies.iteritems(), key=lambda p: p[0].__name__)),
+            self.__default,
+        )
+
+
+class BudgetedRetryPolicy(object):
+    """
+    Limit the number of retries per second decided by another policy, using a token bucket.
+    When the budget is exhausted, failed actions are not retried.
+    This stops retry storms during an outage, when retrying would only add load.
+
+    The budget is shared by all actions sent with this policy, so give the same instance to the connections that should share it.
+
+    :param policy: the retry policy deciding if and when to retry while the budget is not exhausted.
+    :param retries_per_second: the rate at which the budget is refilled.
+    :param max_retries: the size of the budget, i.e. the number of retries that can happen in a burst.
+    """
+    def __init__(self, policy, retries_per_second, max_retries):
+        self.__policy = policy
+        self.__retries_per_second = retries_per_second
+        self.__rate = float(retries_per_second)
+        self.__capacity = max_retries
+        self.__tokens = float(max_retries)
+        self.__last = None
+        self.__lock = threading.Lock()
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+
+    def retry(self, action, exceptions):
+        delay = self.__policy.retry(action, exceptions)
+        if delay is None:
+            return None
+        now = self.__clock()
+        with self.__lock:
+            if self.__last is not None:
+                self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last) * self.__rate)
+            self.__last = now
+            if self.__tokens >= 1:
+                self.__tokens -= 1
+                return delay
+            else:
+                return None
+
+    def __repr__(self):
+        return "BudgetedRetryPolicy({}, {}, {})".format(self.__policy, self.__retries_per_second, self.__capacity)
+
+
 DEFAULT = ExponentialBackoffRetryPolicy(1, 1.5, 4)
 """
 The default retry policy: a reasonable exponential backoff.
@@ -89,3 +233,148 @@ class ExponentialBackoffRetryPolicyUnitTests(_tst.UnitTests):
 
     def test_repr(self):
         self.assertEqual(repr(self.policy), "ExponentialBackoffRetryPolicy(1, 3, 3)")
+
+
+class FullJitterRetryPolicyUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(FullJitterRetryPolicyUnitTests, self).setUp()
+        self.policy = FullJitterRetryPolicy(1, 3, 5, 3)
+        self.policy._FullJitterRetryPolicy__uniform = lambda a, b: (a, b)
+
+    def test_wait_after_failures(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), (0, 1))
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError(), _lv.ServerError()]), (0, 3))
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError(), _lv.ServerError(), _lv.ServerError()]), (0, 5))
+
+    def test_give_up_after_fourth_failure(self):
+        self.assertIsNone(self.policy.retry(object(), [_lv.ServerError(), _lv.ServerError(), _lv.ServerError(), _lv.ServerError()]))
+
+    def test_actual_randomness(self):
+        policy = FullJitterRetryPolicy(1, 3, 5, 3)
+        delays = set(policy.retry(object(), [_lv.ServerError()]) for i in range(10))
+        self.assertEqual(len(delays), 10)
+        self.assertTrue(all(0 <= d <= 1 for d in delays))
+
+    def test_repr(self):
+        self.assertEqual(repr(self.policy), "FullJitterRetryPolicy(1, 3, 5, 3)")
+
+
+class DecorrelatedJitterRetryPolicyUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(DecorrelatedJitterRetryPolicyUnitTests, self).setUp()
+        self.policy = DecorrelatedJitterRetryPolicy(1, 20, 3)
+        self.policy._DecorrelatedJitterRetryPolicy__uniform = lambda a, b: b
+
+    def test_wait_after_failures(self):
+        exceptions = [_lv.ServerError()]
+        self.assertEqual(self.policy.retry(object(), exceptions), 3)
+        exceptions.append(_lv.ServerError())
+        self.assertEqual(self.policy.retry(object(), exceptions), 9)
+        exceptions.append(_lv.ServerError())
+        self.assertEqual(self.policy.retry(object(), exceptions), 20)
+        exceptions.append(_lv.ServerError())
+        self.assertIsNone(self.policy.retry(object(), exceptions))
+
+    def test_exceptions_are_not_modified(self):
+        exceptions = [_lv.ServerError()]
+        self.policy.retry(object(), exceptions)
+        self.assertEqual(vars(exceptions[0]), vars(_lv.ServerError()))
+
+    def test_interleaved_actions(self):
+        first = [_lv.ServerError()]
+        second = [_lv.ServerError()]
+        self.assertEqual(self.policy.retry(object(), first), 3)
+        self.assertEqual(self.policy.retry(object(), second), 3)
+        first.append(_lv.ServerError())
+        self.assertEqual(self.policy.retry(object(), first), 9)
+        second.append(_lv.ServerError())
+        self.assertEqual(self.policy.retry(object(), second), 9)
+
+    def test_threads(self):
+        exceptions = [_lv.ServerError()]
+        self.assertEqual(self.policy.retry(object(), exceptions), 3)
+        delays = []
+        thread = threading.Thread(target=lambda: delays.append(self.policy.retry(object(), [_lv.ServerError()])))
+        thread.start()
+        thread.join()
+        self.assertEqual(delays, [3])
+        exceptions.append(_lv.ServerError())
+        self.assertEqual(self.policy.retry(object(), exceptions), 9)
+
+    def test_actual_randomness(self):
+        policy = DecorrelatedJitterRetryPolicy(1, 20, 3)
+        delays = set(policy.retry(object(), [_lv.ServerError()]) for i in range(10))
+        self.assertEqual(len(delays), 10)
+        self.assertTrue(all(1 <= d <= 3 for d in delays))
+
+    def test_repr(self):
+        self.assertEqual(repr(self.policy), "DecorrelatedJitterRetryPolicy(1, 20, 3)")
+
+
+class ExceptionDependentRetryPolicyUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(ExceptionDependentRetryPolicyUnitTests, self).setUp()
+        self.policy = ExceptionDependentRetryPolicy(
+            {
+                _lv.NetworkError: ExponentialBackoffRetryPolicy(1, 2, 5),
+                _lv.ClientError: ExponentialBackoffRetryPolicy(3, 2, 5),
+                _lv.ProvisionedThroughputExceededException: ExponentialBackoffRetryPolicy(5, 2, 5),
+            },
+            default=ExponentialBackoffRetryPolicy(7, 2, 5),
+        )
+
+    def test_exact_class(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.NetworkError()]), 1)
+        self.assertEqual(self.policy.retry(object(), [_lv.ProvisionedThroughputExceededException()]), 5)
+
+    def test_base_class(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.Throttling()]), 3)
+
+    def test_last_exception_is_used(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.ProvisionedThroughputExceededException(), _lv.NetworkError()]), 2)
+
+    def test_default(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 7)
+        self.assertEqual(ExceptionDependentRetryPolicy({}).retry(object(), [_lv.ServerError()]), 1)
+
+    def test_repr(self):
+        self.assertEqual(
+            repr(self.policy),
+            "ExceptionDependentRetryPolicy({"
+            "ClientError: ExponentialBackoffRetryPolicy(3, 2, 5), "
+            "NetworkError: ExponentialBackoffRetryPolicy(1, 2, 5), "
+            "ProvisionedThroughputExceededException: ExponentialBackoffRetryPolicy(5, 2, 5)"
+            "}, default=ExponentialBackoffRetryPolicy(7, 2, 5))"
+        )
+
+
+class BudgetedRetryPolicyUnitTests(_tst.UnitTests):
+    def setUp(self):
+        super(BudgetedRetryPolicyUnitTests, self).setUp()
+        self.policy = BudgetedRetryPolicy(ExponentialBackoffRetryPolicy(1, 2, 1), 0.5, 2)
+        self.now = 1000.
+        self.policy._BudgetedRetryPolicy__clock = lambda: self.now
+
+    def test_budget(self):
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+        self.assertIsNone(self.policy.retry(object(), [_lv.ServerError()]))
+        self.now += 1
+        self.assertIsNone(self.policy.retry(object(), [_lv.ServerError()]))
+        self.now += 1
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+        self.assertIsNone(self.policy.retry(object(), [_lv.ServerError()]))
+
+    def test_budget_is_capped(self):
+        self.now += 3600
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+        self.assertIsNone(self.policy.retry(object(), [_lv.ServerError()]))
+
+    def test_policy_giving_up_doesnt_consume_budget(self):
+        for i in range(5):
+            self.assertIsNone(self.policy.retry(object(), [_lv.ServerError(), _lv.ServerError()]))
+        self.assertEqual(self.policy.retry(object(), [_lv.ServerError()]), 1)
+
+    def test_repr(self):
+        self.assertEqual(repr(self.policy), "BudgetedRetryPolicy(ExponentialBackoffRetryPolicy(1, 2, 1), 0.5, 2)")
@@ -2,4 +2,4 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
-from .test_connection import ConnectionLocalIntegTests
+from .test_connection import ConnectionLocalIntegTests, AsyncConnectionLocalIntegTests
@@ -2,8 +2,11 @@
 
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
+import threading
+
 import LowVoltage as _lv
 import LowVoltage.testing as _tst
+from LowVoltage.connection.async_connection import asyncio
 
 
 class ConnectionLocalIntegTests(_tst.LocalIntegTests):
@@ -33,3 +36,55 @@ class ConnectionLocalIntegTests(_tst.LocalIntegTests):
     def test_unexisting_table(self):
         with self.assertRaises(_lv.ResourceNotFoundException):
             self.connection(self.TestAction("GetItem", {"TableName": "Bbb"}))
+
+    @_tst.skip_if_in_memory
+    def test_threads_share_pooled_connection(self):
+        connection = _lv.Connection("us-west-2", _lv.StaticCredentials("DummyKey", "DummySecret"), "http://localhost:65432/", max_connections=4)
+        threads = [threading.Thread(target=lambda: [connection(self.TestAction("ListTables", {})) for i in range(10)]) for j in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        stats = connection.pool_stats()
+        self.assertEqual(stats.in_use, 0)
+        self.assertLessEqual(stats.opened, 4)
+        self.assertEqual(stats.idle, stats.opened)
+
+
+@_tst.skip_if_in_memory
+class AsyncConnectionLocalIntegTests(_tst.LocalIntegTests):
+    TestAction = ConnectionLocalIntegTests.TestAction
+
+    def setUp(self):
+        super(AsyncConnectionLocalIntegTests, self).setUp()
+        self.loop = asyncio.new_event_loop()
+        self.async_connection = _lv.AsyncConnection("us-west-2", _lv.StaticCredentials("DummyKey", "DummySecret"), "http://localhost:65432/", loop=self.loop)
+
+    def tearDown(self):
+        self.async_connection.close()
+        self.loop.close()
+        super(AsyncConnectionLocalIntegTests, self).tearDown()
+
+    def test_network_error(self):
+        connection = _lv.AsyncConnection("us-west-2", _lv.StaticCredentials("DummyKey", "DummySecret"), "http://localhost:65555/", _lv.ExponentialBackoffRetryPolicy(0, 1, 3), loop=self.loop)
+        with self.assertRaises(_lv.NetworkError):
+            self.loop.run_until_complete(connection(self.TestAction("ListTables", {})))
+
+    def test_request(self):
+        r = self.loop.run_until_complete(self.async_connection(self.TestAction("ListTables", {})))
+        self.assertIsInstance(r, self.TestAction.response_class)
+        self.assertEqual(r.kwds, {"TableNames": []})
+
+    def test_concurrent_requests(self):
+        futures = [self.async_connection(self.TestAction("ListTables", {})) for i in range(10)]
+        responses = self.loop.run_until_complete(asyncio.gather(*futures))
+        self.assertEqual([r.kwds for r in responses], [{"TableNames": []}] * 10)
+
+    def test_client_error(self):
+        with self.assertRaises(_lv.UnknownOperationException):
+            self.loop.run_until_complete(self.async_connection(self.TestAction("UnexistingAction", {})))
+
+
+if asyncio is None:  # pragma no cover (Python 2 without Trollius)
+    class AsyncConnectionLocalIntegTests(object):
+        pass
@@ -3,5 +3,12 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 from ..connection import ConnectionUnitTests, SignerUnitTests, ResponderUnitTests
+from ..async_connection import AsyncConnectionUnitTests, AsyncHttpSessionUnitTests
 from ..credentials import StaticCredentialsUnitTests, Ec2RoleCredentialsUnitTests
-from ..retry_policies import ExponentialBackoffRetryPolicyUnitTests
+from ..retry_policies import ExponentialBackoffRetryPolicyUnitTests, FullJitterRetryPolicyUnitTests, DecorrelatedJitterRetryPolicyUnitTests, ExceptionDependentRetryPolicyUnitTests, BudgetedRetryPolicyUnitTests
+from ..json_codecs import JsonCodecUnitTests
+from ..metrics import MetricsRegistryUnitTests
+from ..rate_limiters import TokenBucketRateLimiterUnitTests
+from ..hedging import PercentileHedgingPolicyUnitTests
+from ..caching import CachingConnectionUnitTests
+from ..recording import TrafficRecorderUnitTests, ReplayUnitTests
@@ -13,6 +13,8 @@ except ImportError:  # pragma no cover (Test code)
 from .unit_tests import *
 from .local_integ_tests import *
 from .connected_integ_tests import *
+from .in_memory import InMemoryDynamoDb
+from .fault_injection import FaultInjector, FaultInjectingServer
 
 
 def main():  # pragma no cover (Test code)
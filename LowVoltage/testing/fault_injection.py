@@ -0,0 +1,518 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+Inject the failures of a production DynamoDB (throttling, server errors, latency, partial batch results)
+in front of :class:`.InMemoryDynamoDb` or DynamoDB Local, to tune retry policies and rate limiters and see how compounds behave.
+
+>>> from LowVoltage.testing import InMemoryDynamoDb, FaultInjector, FaultInjectingServer
+>>> injector = FaultInjector(InMemoryDynamoDb(), capacities={"Aaa": (10, 5)}, partitions=4, server_error_rate=0.01)
+>>> server = FaultInjectingServer(injector)
+>>> faulty_connection = Connection("us-west-2", StaticCredentials("DummyKey", "DummySecret"), endpoint=server.endpoint)
+>>> faulty_connection(CreateTable("Aaa").hash_key("h", STRING).provisioned_throughput(10, 5)).table_description.table_status
+u'ACTIVE'
+>>> server.close()
+
+A :class:`FaultInjector` can also be passed directly as the ``requests_session`` of a :class:`.Connection`, without going through HTTP.
+"""
+
+import BaseHTTPServer
+import hashlib
+import json
+import random
+import socket
+import SocketServer
+import sys
+import threading
+import time
+
+import LowVoltage as _lv
+from LowVoltage.actions.action import _read_actions, _write_actions
+from .unit_tests import UnitTests
+from .in_memory import InMemoryDynamoDb, _Response
+
+
+class FaultInjector(object):
+    """
+    Forward requests to a backend, injecting faults on the way.
+
+    Provisioned throughput is simulated like DynamoDB does it: the capacity of each table is split evenly between its partitions,
+    each partition has a token bucket for reads and another for writes, and keeps up to ``burst`` seconds of unused capacity.
+    Requests on a partition whose bucket is empty fail with :exc:`.ProvisionedThroughputExceededException`.
+    In :class:`.BatchGetItem` and :class:`.BatchWriteItem`, keys and items on such partitions are returned as unprocessed,
+    and the exception is raised only if none of them can be processed.
+    The partition of a request is chosen by hashing its hash key, so hot keys are throttled before the table's capacity is exhausted.
+    Queries on indexes consume the table's capacity, and scans consume the capacity of the partition they start from.
+    The actual cost of requests is taken from their :class:`.ConsumedCapacity`, requested from the backend when the client didn't.
+
+    :param backend: the object actually executing the requests, with the interface of a ``requests.Session``:
+        an :class:`.InMemoryDynamoDb`, or a ``requests.Session()`` to forward requests to DynamoDB Local.
+    :param endpoint: the URL requests are forwarded to. Defaults to the URL they were sent to.
+    :param capacities: a dict of table name to a pair (read capacity units per second, write capacity units per second).
+        Either can be ``None`` meaning "unlimited". Tables not in this dict are never throttled.
+    :param partitions: the number of partitions of each table.
+    :param burst: the number of seconds of unused capacity accumulated by each partition. It is also the initial capacity.
+    :param latency: ``None`` or a function returning the delay (in seconds) to add to each request, for example ``lambda: random.expovariate(50)``.
+    :param server_error_rate: the probability of failing each request with a :exc:`.ServerError`.
+    :param throttling_error_rate: the probability of failing each read or write request with a :exc:`.ProvisionedThroughputExceededException`,
+        regardless of capacities.
+    :param unprocessed_rate: the probability of returning each key of a :class:`.BatchGetItem` or item of a :class:`.BatchWriteItem` as unprocessed,
+        regardless of capacities.
+
+    It can be used by several threads.
+    """
+
+    def __init__(self, backend, endpoint=None, capacities={}, partitions=1, burst=300., latency=None, server_error_rate=0., throttling_error_rate=0., unprocessed_rate=0.):
+        self.__backend = backend
+        self.__endpoint = endpoint
+        self.__rates = {}
+        for table_name, (read, write) in capacities.iteritems():
+            self.__rates[("read", table_name)] = read
+            self.__rates[("write", table_name)] = write
+        self.__partitions = partitions
+        self.__burst = burst
+        self.__latency = latency
+        self.__server_error_rate = server_error_rate
+        self.__throttling_error_rate = throttling_error_rate
+        self.__unprocessed_rate = unprocessed_rate
+        self.__lock = threading.Lock()
+        self.__buckets = {}
+        self.__hash_keys = {}
+        self.__stats = FaultInjectionStats()
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+        self.__sleep = time.sleep
+        self.__random = random.random
+
+    @property
+    def adapters(self):
+        # Read by Connection.pool_stats
+        return getattr(self.__backend, "adapters", {})
+
+    def stats(self):
+        """
+        Return a snapshot of the :class:`FaultInjectionStats` of this injector.
+        """
+        with self.__lock:
+            stats = FaultInjectionStats()
+            stats.__dict__.update(self.__stats.__dict__)
+            return stats
+
+    def post(self, url, data, headers):
+        """
+        Execute a request. This is the part of the interface of ``requests.Session`` used by :class:`.Connection`.
+        """
+        url = self.__endpoint or url
+        operation = headers.get("X-Amz-Target", "").split(".")[-1]
+        with self.__lock:
+            self.__stats.requests += 1
+            server_error = self.__draw(self.__server_error_rate)
+            throttling_error = operation in _read_actions | _write_actions and self.__draw(self.__throttling_error_rate)
+            if server_error:
+                self.__stats.server_errors += 1
+            elif throttling_error:
+                self.__stats.throttled += 1
+
+        if self.__latency is not None:
+            self.__sleep(self.__latency())
+
+        if server_error:
+            return _Response(500, {"__type": "com.amazonaws.dynamodb.v20120810#InternalServerError", "message": "The server encountered an internal error trying to fulfill the request"})
+        elif throttling_error:
+            return _throttled()
+        elif operation in _read_actions:
+            kind = "read"
+        elif operation in _write_actions:
+            kind = "write"
+        else:
+            return self.__backend.post(url, data=data, headers=headers)
+
+        payload = json.loads(data)
+        if operation in ("BatchGetItem", "BatchWriteItem"):
+            return self.__batch(url, headers, operation, kind, payload)
+        else:
+            return self.__single(url, headers, operation, kind, payload)
+
+    def __draw(self, probability):
+        return probability > 0 and self.__random() < probability
+
+    def __single(self, url, headers, operation, kind, payload):
+        table_name = payload.get("TableName")
+        bucket = None
+        if self.__rates.get((kind, table_name)) is not None:
+            bucket = self.__bucket(kind, table_name, self.__partition(url, headers, operation, table_name, payload))
+        if bucket is not None:
+            with self.__lock:
+                if bucket.empty(self.__clock()):
+                    self.__stats.throttled += 1
+                    return _throttled()
+        response, costs = self.__forward(url, headers, payload, bucket is not None)
+        if bucket is not None:
+            with self.__lock:
+                bucket.take(self.__clock(), costs.get(table_name, 0))
+        return response
+
+    def __batch(self, url, headers, operation, kind, payload):
+        # Split the request in kept and held (unprocessed) keys or items, by table
+        kept = {}
+        held = {}
+        buckets = {}
+        throttled = 0
+        now = self.__clock()
+        for table_name, request in payload["RequestItems"].iteritems():
+            if operation == "BatchGetItem":
+                entries = request["Keys"]
+            else:
+                entries = request
+            for entry in entries:
+                if operation == "BatchGetItem":
+                    key = entry
+                else:
+                    key = entry.get("PutRequest", {}).get("Item") or entry["DeleteRequest"]["Key"]
+                bucket = None
+                if self.__rates.get((kind, table_name)) is not None:
+                    bucket = self.__bucket(kind, table_name, self.__partition_of_key(url, headers, table_name, key))
+                with self.__lock:
+                    if bucket is not None and bucket.empty(now):
+                        throttled += 1
+                        hold = True
+                    else:
+                        hold = self.__draw(self.__unprocessed_rate)
+                if hold:
+                    held.setdefault(table_name, []).append(entry)
+                else:
+                    kept.setdefault(table_name, []).append(entry)
+                    if bucket is not None:
+                        buckets.setdefault(table_name, []).append(bucket)
+
+        with self.__lock:
+            self.__stats.unprocessed += sum(len(entries) for entries in held.itervalues())
+            if not kept and throttled:
+                self.__stats.throttled += 1
+                return _throttled()
+
+        if operation == "BatchGetItem":
+            unprocessed_name = "UnprocessedKeys"
+            unprocessed = dict((table_name, dict(payload["RequestItems"][table_name], Keys=keys)) for (table_name, keys) in held.iteritems())
+            payload["RequestItems"] = dict((table_name, dict(payload["RequestItems"][table_name], Keys=keys)) for (table_name, keys) in kept.iteritems())
+        else:
+            unprocessed_name = "UnprocessedItems"
+            unprocessed = held
+            payload["RequestItems"] = kept
+
+        if kept:
+            response, costs = self.__forward(url, headers, payload, bool(buckets), unprocessed_name=unprocessed_name, unprocessed=unprocessed)
+            with self.__lock:
+                now = self.__clock()
+                for table_name, table_buckets in buckets.iteritems():
+                    for bucket in table_buckets:
+                        bucket.take(now, costs.get(table_name, 0) / len(table_buckets))
+            return response
+        else:
+            body = {unprocessed_name: unprocessed}
+            if operation == "BatchGetItem":
+                body["Responses"] = {}
+            return _Response(200, body)
+
+    def __forward(self, url, headers, payload, needs_costs, unprocessed_name=None, unprocessed={}):
+        # Return the response and the capacity units consumed per table
+        return_consumed_capacity = payload.get("ReturnConsumedCapacity", "NONE")
+        if needs_costs and return_consumed_capacity == "NONE":
+            payload["ReturnConsumedCapacity"] = "TOTAL"
+        response = self.__backend.post(url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+        if response.status_code != 200 or payload.get("ReturnConsumedCapacity", "NONE") == return_consumed_capacity and not unprocessed:
+            costs = {}
+            if response.status_code == 200 and needs_costs:
+                costs = _costs(json.loads(response.content.decode("utf-8")))
+            return response, costs
+
+        body = json.loads(response.content.decode("utf-8"))
+        costs = _costs(body)
+        if return_consumed_capacity == "NONE":
+            body.pop("ConsumedCapacity", None)
+        if unprocessed:
+            for table_name, entries in unprocessed.iteritems():
+                if unprocessed_name == "UnprocessedKeys":
+                    body.setdefault(unprocessed_name, {}).setdefault(table_name, dict(entries, Keys=[]))["Keys"].extend(entries["Keys"])
+                else:
+                    body.setdefault(unprocessed_name, {}).setdefault(table_name, []).extend(entries)
+        return _Response(200, body), costs
+
+    def __bucket(self, kind, table_name, partition):
+        with self.__lock:
+            bucket = self.__buckets.get((kind, table_name, partition))
+            if bucket is None:
+                bucket = _PartitionBucket(float(self.__rates[(kind, table_name)]) / self.__partitions, self.__burst)
+                self.__buckets[(kind, table_name, partition)] = bucket
+            return bucket
+
+    def __partition(self, url, headers, operation, table_name, payload):
+        if operation == "PutItem":
+            return self.__partition_of_key(url, headers, table_name, payload.get("Item", {}))
+        elif operation in ("GetItem", "UpdateItem", "DeleteItem"):
+            return self.__partition_of_key(url, headers, table_name, payload.get("Key", {}))
+        elif operation == "Query":
+            conditions = payload.get("KeyConditions", {})
+            return self.__partition_of_key(url, headers, table_name, dict((name, condition["AttributeValueList"][0]) for (name, condition) in conditions.iteritems() if condition.get("ComparisonOperator") == "EQ"))
+        elif "ExclusiveStartKey" in payload:
+            return self.__partition_of_key(url, headers, table_name, payload["ExclusiveStartKey"])
+        else:
+            return payload.get("Segment", 0) * self.__partitions // payload.get("TotalSegments", 1)
+
+    def __partition_of_key(self, url, headers, table_name, key):
+        if self.__partitions == 1:
+            return 0
+        hash_key = self.__hash_key(url, headers, table_name)
+        if hash_key in key:
+            value = key[hash_key]
+        else:
+            # Queries on indexes
+            value = key
+        return int(hashlib.md5(json.dumps(value, sort_keys=True).encode("utf-8")).hexdigest(), 16) % self.__partitions
+
+    def __hash_key(self, url, headers, table_name):
+        with self.__lock:
+            if table_name in self.__hash_keys:
+                return self.__hash_keys[table_name]
+        headers = dict(headers)
+        headers["X-Amz-Target"] = "DynamoDB_20120810.DescribeTable"
+        response = self.__backend.post(url, data=json.dumps({"TableName": table_name}).encode("utf-8"), headers=headers)
+        if response.status_code != 200:
+            return None
+        for element in json.loads(response.content.decode("utf-8"))["Table"]["KeySchema"]:
+            if element["KeyType"] == "HASH":
+                with self.__lock:
+                    self.__hash_keys[table_name] = element["AttributeName"]
+                return element["AttributeName"]
+
+
+class FaultInjectionStats(object):
+    """
+    Statistics about a :class:`FaultInjector`, as returned by :meth:`FaultInjector.stats`.
+    """
+
+    def __init__(self):
+        self.requests = 0
+        """The number of requests received."""
+        self.server_errors = 0
+        """The number of server errors injected."""
+        self.throttled = 0
+        """The number of requests failed with :exc:`.ProvisionedThroughputExceededException`."""
+        self.unprocessed = 0
+        """The number of keys and items returned as unprocessed by the injector (not counting those returned by the backend)."""
+
+
+class _PartitionBucket(object):
+    # The number of tokens can become negative: the cost of a request is only known once it's done.
+    def __init__(self, rate, burst):
+        self.__rate = rate
+        self.__capacity = rate * burst
+        self.__tokens = self.__capacity
+        self.__last = None
+
+    def __refill(self, now):
+        if self.__last is not None:
+            self.__tokens = min(self.__capacity, self.__tokens + (now - self.__last) * self.__rate)
+        self.__last = now
+
+    def empty(self, now):
+        self.__refill(now)
+        return self.__tokens <= 0
+
+    def take(self, now, cost):
+        self.__refill(now)
+        self.__tokens -= cost
+
+
+def _throttled():
+    return _Response(400, {
+        "__type": "com.amazonaws.dynamodb.v20120810#ProvisionedThroughputExceededException",
+        "message": "The level of configured provisioned throughput for the table was exceeded. Consider increasing your provisioning level with the UpdateTable API",
+    })
+
+
+def _costs(body):
+    consumed_capacity = body.get("ConsumedCapacity")
+    if isinstance(consumed_capacity, dict):
+        consumed_capacity = [consumed_capacity]
+    costs = {}
+    for capacity in consumed_capacity or []:
+        costs[capacity["TableName"]] = costs.get(capacity["TableName"], 0) + capacity["CapacityUnits"]
+    return costs
+
+
+class FaultInjectingServer(object):
+    """
+    Serve a :class:`FaultInjector` over HTTP on ``localhost``, from a background thread,
+    so that it can be used through the ``endpoint`` of any client (:class:`.Connection`, :class:`.AsyncConnection`...).
+
+    :param injector: the :class:`FaultInjector`.
+    :param port: the port to listen on. By default, a free port is chosen.
+    """
+
+    def __init__(self, injector, port=0):
+        self.__server = _HttpServer(("localhost", port), _RequestHandler)
+        self.__server.injector = injector
+        self.__thread = threading.Thread(target=self.__server.serve_forever)
+        self.__thread.daemon = True
+        self.__thread.start()
+
+    @property
+    def endpoint(self):
+        """
+        The endpoint to give to clients.
+        """
+        return "http://localhost:{}/".format(self.__server.server_address[1])
+
+    def close(self):
+        """
+        Stop serving.
+        """
+        self.__server.shutdown()
+        self.__server.server_close()
+        self.__thread.join()
+
+
+class _HttpServer(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+    def handle_error(self, request, client_address):
+        # Clients closing their keep-alive connections are not errors
+        if not isinstance(sys.exc_info()[1], socket.error):
+            BaseHTTPServer.HTTPServer.handle_error(self, request, client_address)
+
+
+class _RequestHandler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        headers = dict(
+            (name, self.headers.get(name))
+            for name in ["Authorization", "Content-Type", "X-Amz-Date", "X-Amz-Target"]
+            if self.headers.get(name) is not None
+        )
+        response = self.server.injector.post("http://{}:{}/".format(*self.server.server_address), data=data, headers=headers)
+        self.send_response(response.status_code)
+        self.send_header("Content-Type", "application/x-amz-json-1.0")
+        self.send_header("Content-Length", str(len(response.content)))
+        self.end_headers()
+        self.wfile.write(response.content)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FaultInjectorUnitTests(UnitTests):
+    def setUp(self):
+        super(FaultInjectorUnitTests, self).setUp()
+        self.backend = InMemoryDynamoDb()
+        self.backend.connection()(_lv.CreateTable("Aaa").hash_key("h", _lv.NUMBER).provisioned_throughput(1, 1))
+        self.now = 1000.
+        self.sleeps = []
+        self.draws = []
+
+    def make_connection(self, **kwds):
+        self.injector = FaultInjector(self.backend, **kwds)
+        self.injector._FaultInjector__clock = lambda: self.now
+        self.injector._FaultInjector__sleep = self.sleeps.append
+        self.injector._FaultInjector__random = lambda: self.draws.pop(0) if self.draws else 0.5
+        return _lv.Connection(
+            "us-west-2",
+            _lv.StaticCredentials("DummyKey", "DummySecret"),
+            endpoint="http://in-memory/",
+            requests_session=self.injector,
+            retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0),
+        )
+
+    def test_no_faults(self):
+        connection = self.make_connection()
+        connection(_lv.PutItem("Aaa", {"h": 0, "a": 1}))
+        self.assertEqual(connection(_lv.GetItem("Aaa", {"h": 0})).item, {"h": 0, "a": 1})
+        self.assertEqual(self.injector.stats().__dict__, {"requests": 2, "server_errors": 0, "throttled": 0, "unprocessed": 0})
+
+    def test_latency(self):
+        connection = self.make_connection(latency=lambda: 0.25)
+        connection(_lv.ListTables())
+        connection(_lv.ListTables())
+        self.assertEqual(self.sleeps, [0.25, 0.25])
+
+    def test_server_errors(self):
+        connection = self.make_connection(server_error_rate=0.1)
+        self.draws = [0.05]
+        with self.assertRaises(_lv.ServerError):
+            connection(_lv.ListTables())
+        self.draws = [0.15]
+        connection(_lv.ListTables())
+        self.assertEqual(self.injector.stats().server_errors, 1)
+
+    def test_throttling_errors(self):
+        connection = self.make_connection(throttling_error_rate=0.1)
+        self.draws = [0.05]
+        with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+            connection(_lv.GetItem("Aaa", {"h": 0}))
+        # Admin actions are never throttled
+        connection(_lv.ListTables())
+        self.assertEqual(self.injector.stats().throttled, 1)
+
+    def test_table_capacity(self):
+        connection = self.make_connection(capacities={"Aaa": (None, 2)}, burst=1.)
+        connection(_lv.PutItem("Aaa", {"h": 0}))
+        connection(_lv.PutItem("Aaa", {"h": 0}))
+        with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+            connection(_lv.PutItem("Aaa", {"h": 0}))
+        # Reads are not limited
+        self.assertEqual(connection(_lv.GetItem("Aaa", {"h": 0})).item, {"h": 0})
+        self.now += 1
+        r = connection(_lv.PutItem("Aaa", {"h": 0}))
+        self.assertIsNone(r.consumed_capacity)
+        r = connection(_lv.PutItem("Aaa", {"h": 0}).return_consumed_capacity_total())
+        self.assertEqual(r.consumed_capacity.capacity_units, 1)
+        self.assertEqual(self.injector.stats().throttled, 1)
+
+    def test_partitions(self):
+        connection = self.make_connection(capacities={"Aaa": (None, 2)}, partitions=2, burst=1.)
+        connection(_lv.PutItem("Aaa", {"h": 0}))
+        with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+            connection(_lv.PutItem("Aaa", {"h": 0}))
+        # Another partition
+        connection(_lv.PutItem("Aaa", {"h": 1}))
+        with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+            connection(_lv.PutItem("Aaa", {"h": 5}))
+
+    def test_batch_write_item_on_throttled_partition(self):
+        connection = self.make_connection(capacities={"Aaa": (1, 2)}, partitions=2, burst=1.)
+        connection(_lv.PutItem("Aaa", {"h": 0}))
+        r = connection(_lv.BatchWriteItem().table("Aaa").put({"h": 1}, {"h": 2}, {"h": 3}))
+        self.assertEqual(r.unprocessed_items, {"Aaa": [{"PutRequest": {"Item": {"h": {"N": "2"}}}}, {"PutRequest": {"Item": {"h": {"N": "3"}}}}]})
+        with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+            connection(_lv.BatchWriteItem().table("Aaa").put({"h": 2}, {"h": 3}))
+        self.assertEqual(self.injector.stats().unprocessed, 4)
+        self.assertEqual(len(list(_lv.iterate_scan(connection, _lv.Scan("Aaa")))), 2)
+
+    def test_batch_get_item_unprocessed_rate(self):
+        connection = self.make_connection(unprocessed_rate=0.5)
+        _lv.batch_put_item(connection, "Aaa", [{"h": h} for h in range(3)])
+        self.draws = [0.2, 0.7, 0.2]
+        r = connection(_lv.BatchGetItem().table("Aaa").keys({"h": 0}, {"h": 1}, {"h": 2}).project("h"))
+        self.assertEqual(r.responses, {"Aaa": [{"h": 1}]})
+        self.assertEqual(r.unprocessed_keys, {"Aaa": {"Keys": [{"h": {"N": "0"}}, {"h": {"N": "2"}}], "ProjectionExpression": "h"}})
+        self.draws = [0.2]
+        r = connection(_lv.BatchGetItem().table("Aaa").keys({"h": 0}))
+        self.assertEqual(r.responses, {})
+        self.assertEqual(r.unprocessed_keys, {"Aaa": {"Keys": [{"h": {"N": "0"}}]}})
+        self.assertEqual(sorted(item["h"] for item in _lv.iterate_batch_get_item(connection, "Aaa", [{"h": h} for h in range(3)])), [0, 1, 2])
+
+    def test_http_server(self):
+        server = FaultInjectingServer(FaultInjector(self.backend, capacities={"Aaa": (1, None)}, burst=1.))
+        try:
+            connection = _lv.Connection("us-west-2", _lv.StaticCredentials("DummyKey", "DummySecret"), endpoint=server.endpoint, retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0))
+            # Reading this item consumes 3 capacity units
+            connection(_lv.PutItem("Aaa", {"h": 0, "a": u"é" * 5000}))
+            self.assertEqual(connection(_lv.GetItem("Aaa", {"h": 0}).consistent_read_true()).item, {"h": 0, "a": u"é" * 5000})
+            with self.assertRaises(_lv.ProvisionedThroughputExceededException):
+                connection(_lv.GetItem("Aaa", {"h": 0}))
+        finally:
+            server.close()
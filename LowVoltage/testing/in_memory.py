@@ -0,0 +1,1604 @@
+# coding: utf8
+
+# Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
+
+"""
+An in-process, pure-Python stand-in for DynamoDB, to run tests and benchmarks without DynamoDB Local (and its JVM) nor network.
+
+It plugs into a :class:`.Connection` as its ``requests_session``: the connection encodes and signs requests as usual,
+and :class:`InMemoryDynamoDb` decodes them, executes them on its in-memory tables, and returns encoded responses.
+
+>>> from LowVoltage.testing import InMemoryDynamoDb
+>>> in_memory_connection = InMemoryDynamoDb().connection()
+>>> in_memory_connection(CreateTable("Aaa").hash_key("h", STRING).provisioned_throughput(1, 1)).table_description.table_status
+u'ACTIVE'
+
+To run LowVoltage's own local integration tests on it instead of DynamoDB Local, set the ``LOWVOLTAGE_IN_MEMORY`` environment variable.
+"""
+
+import base64
+import binascii
+import bisect
+import decimal
+import hashlib
+import json
+import math
+import re
+import threading
+import time
+
+import LowVoltage as _lv
+from .unit_tests import UnitTests
+
+
+class InMemoryDynamoDb(object):
+    """
+    The in-memory engine. Each instance holds its own independent set of tables.
+
+    It implements the actions of :mod:`LowVoltage.actions`: :class:`.CreateTable`, :class:`.DescribeTable`, :class:`.UpdateTable`,
+    :class:`.DeleteTable`, :class:`.ListTables`, :class:`.PutItem`, :class:`.GetItem`, :class:`.UpdateItem`, :class:`.DeleteItem`,
+    :class:`.BatchGetItem`, :class:`.BatchWriteItem`, :class:`.Query` (with ``KeyConditions``, on tables and indexes) and :class:`.Scan`
+    (with segments). Condition, filter, projection and update expressions are supported.
+    Tables are active as soon as they are created, throughput is not limited and credentials are not checked.
+
+    Items are stored in a sorted structure per partition (hash key), so queries are proportional to the size of the partition.
+    Like in DynamoDB, scans go through partitions in the order of a hash of their key, and segments are ranges of this hash.
+    Queries on global secondary indexes and scans of indexes go through all items of the table.
+    Sizes of items (for capacity units and limits) are computed like DynamoDB does.
+
+    :param max_batch_items: the maximum number of keys (resp. items) processed by each :class:`.BatchGetItem` (resp. :class:`.BatchWriteItem`).
+        The others are returned as unprocessed. If left ``None``, all keys and items are processed.
+    :param max_page_bytes: the approximate size of the items evaluated by each :class:`.Query` or :class:`.Scan`
+        before it stops and returns a ``LastEvaluatedKey``, like the 1MB limit of DynamoDB.
+
+    It can be used by several threads: each request is executed atomically.
+    """
+
+    def __init__(self, max_batch_items=None, max_page_bytes=1024 * 1024):
+        self.__max_batch_items = max_batch_items
+        self.__max_page_bytes = max_page_bytes
+        self.__lock = threading.Lock()
+        self.__tables = {}
+        self.__handlers = {
+            "CreateTable": self.__create_table,
+            "DescribeTable": self.__describe_table,
+            "UpdateTable": self.__update_table,
+            "DeleteTable": self.__delete_table,
+            "ListTables": self.__list_tables,
+            "PutItem": self.__put_item,
+            "GetItem": self.__get_item,
+            "UpdateItem": self.__update_item,
+            "DeleteItem": self.__delete_item,
+            "BatchGetItem": self.__batch_get_item,
+            "BatchWriteItem": self.__batch_write_item,
+            "Query": self.__query,
+            "Scan": self.__scan,
+        }
+        # Read by Connection.pool_stats
+        self.adapters = {}
+
+        # Dependency injection through monkey-patching
+        self.__clock = time.time
+
+    def connection(self, **kwds):
+        """
+        Create a :class:`.Connection` sending its requests to this engine. Keyword arguments are passed to the connection.
+        """
+        return _lv.Connection(
+            "us-west-2",
+            _lv.StaticCredentials("DummyKey", "DummySecret"),
+            endpoint="http://in-memory/",
+            requests_session=self,
+            **kwds
+        )
+
+    def post(self, url, data, headers):
+        """
+        Execute a request. This is the part of the interface of ``requests.Session`` used by :class:`.Connection`.
+        """
+        operation = headers.get("X-Amz-Target", "").split(".")[-1]
+        try:
+            handler = self.__handlers.get(operation)
+            if handler is None:
+                raise _Error("com.amazon.coral.service#UnknownOperationException", None)
+            try:
+                payload = json.loads(data)
+            except ValueError:
+                raise _Error("com.amazon.coral.service#SerializationException", None)
+            with self.__lock:
+                return _Response(200, handler(payload))
+        except _Error as e:
+            body = {"__type": e.type}
+            if e.message is not None:
+                body["message"] = e.message
+            return _Response(400, body)
+
+    def __table(self, payload):
+        table = self.__tables.get(payload.get("TableName"))
+        if table is None:
+            raise _Error(_not_found, "Requested resource not found")
+        return table
+
+    def __create_table(self, payload):
+        name = payload["TableName"]
+        definitions = payload.get("AttributeDefinitions")
+        if not definitions:
+            raise _validation("No Attribute Schema Defined")
+        types = dict((d["AttributeName"], d["AttributeType"]) for d in definitions)
+        key_names = set()
+        for schema in [payload["KeySchema"]] + [index["KeySchema"] for index in payload.get("LocalSecondaryIndexes", []) + payload.get("GlobalSecondaryIndexes", [])]:
+            for element in schema:
+                if element["AttributeName"] not in types:
+                    raise _validation("{} Key not specified in Attribute Definitions.  Type unknown.".format(element["KeyType"].capitalize()))
+                key_names.add(element["AttributeName"])
+        if len(key_names) != len(types):
+            raise _validation("The number of attributes in key schema must match the number of attributesdefined in attribute definitions.")
+        if name in self.__tables:
+            raise _Error(_in_use, "Cannot create preexisting table")
+        table = _Table(payload, self.__clock())
+        self.__tables[name] = table
+        return {"TableDescription": table.description()}
+
+    def __describe_table(self, payload):
+        return {"Table": self.__table(payload).description()}
+
+    def __update_table(self, payload):
+        table = self.__table(payload)
+        for definition in payload.get("AttributeDefinitions", []):
+            table.types[definition["AttributeName"]] = definition["AttributeType"]
+            table.attribute_definitions = [d for d in table.attribute_definitions if d["AttributeName"] != definition["AttributeName"]] + [definition]
+        if "ProvisionedThroughput" in payload:
+            table.throughput = payload["ProvisionedThroughput"]
+        deleted = []
+        for update in payload.get("GlobalSecondaryIndexUpdates", []):
+            if "Create" in update:
+                if any(index.name == update["Create"]["IndexName"] for index in table.indexes):
+                    raise _validation("Attempting to create an index which already exists")
+                for element in update["Create"]["KeySchema"]:
+                    if element["AttributeName"] not in table.types:
+                        raise _validation("Global Secondary Index hash key not specified in Attribute Definitions.")
+                table.indexes.append(_Index(update["Create"], True))
+            else:
+                action = update.get("Update") or update.get("Delete")
+                index = table.index(action["IndexName"])
+                if "Update" in update:
+                    index.throughput = action["ProvisionedThroughput"]
+                else:
+                    deleted.append(index)
+        description = table.description()
+        for index_description in description.get("GlobalSecondaryIndexes", []):
+            if any(index.name == index_description["IndexName"] for index in deleted):
+                index_description["IndexStatus"] = "DELETING"
+        # Deletions are immediate, but visible in the next DescribeTable only
+        for index in deleted:
+            table.indexes.remove(index)
+        key_names = set(table.key_names())
+        for index in table.indexes:
+            key_names.update(index.key_names())
+        table.attribute_definitions = [d for d in table.attribute_definitions if d["AttributeName"] in key_names]
+        table.types = dict((d["AttributeName"], d["AttributeType"]) for d in table.attribute_definitions)
+        return {"TableDescription": description}
+
+    def __delete_table(self, payload):
+        table = self.__table(payload)
+        del self.__tables[table.name]
+        # Like DynamoDB Local, the table is deleted immediately and its last description is returned
+        return {"TableDescription": table.description()}
+
+    def __list_tables(self, payload):
+        names = sorted(self.__tables.keys())
+        if "ExclusiveStartTableName" in payload:
+            names = names[bisect.bisect_right(names, payload["ExclusiveStartTableName"]):]
+        limit = payload.get("Limit", 100)
+        response = {"TableNames": names[:limit]}
+        if len(names) > limit:
+            response["LastEvaluatedTableName"] = names[limit - 1]
+        return response
+
+    def __put_item(self, payload):
+        table = self.__table(payload)
+        item = payload["Item"]
+        key = table.key_of(item)
+        old = table.get(key)
+        expression = _Expression(payload)
+        if "ConditionExpression" in payload:
+            _check(expression.condition(payload["ConditionExpression"]), old)
+        response = _capacity_response(payload, table, _write_units(table.put(item)))
+        if payload.get("ReturnValues", "NONE") == "ALL_OLD" and old is not None:
+            response["Attributes"] = old
+        elif payload.get("ReturnValues", "NONE") not in ("NONE", "ALL_OLD"):
+            raise _validation("Return values set to invalid value")
+        return response
+
+    def __get_item(self, payload):
+        table = self.__table(payload)
+        table.check_key(payload["Key"])
+        item = table.get(payload["Key"])
+        response = _capacity_response(payload, table, _read_units(table.size_of(payload["Key"]), payload.get("ConsistentRead")))
+        if item is not None:
+            response["Item"] = _Expression(payload).project(item)
+        return response
+
+    def __delete_item(self, payload):
+        table = self.__table(payload)
+        table.check_key(payload["Key"])
+        old = table.get(payload["Key"])
+        if "ConditionExpression" in payload:
+            _check(_Expression(payload).condition(payload["ConditionExpression"]), old)
+        response = _capacity_response(payload, table, _write_units(table.delete(payload["Key"])))
+        if payload.get("ReturnValues", "NONE") == "ALL_OLD" and old is not None:
+            response["Attributes"] = old
+        return response
+
+    def __update_item(self, payload):
+        table = self.__table(payload)
+        table.check_key(payload["Key"])
+        old = table.get(payload["Key"])
+        expression = _Expression(payload)
+        if "ConditionExpression" in payload:
+            _check(expression.condition(payload["ConditionExpression"]), old)
+        if "UpdateExpression" in payload:
+            update = expression.update(payload["UpdateExpression"])
+        else:
+            update = _Update([])
+        for path in update.paths:
+            if path[0] in payload["Key"]:
+                raise _validation("One or more parameter values were invalid: Cannot update attribute {}. This attribute is part of the key".format(path[0]))
+        new = update.apply(old or dict(payload["Key"]))
+        response = _capacity_response(payload, table, _write_units(table.put(new)))
+        return_values = payload.get("ReturnValues", "NONE")
+        updated = set(path[0] for path in update.paths)
+        if return_values == "ALL_OLD":
+            attributes = old
+        elif return_values == "ALL_NEW":
+            attributes = new
+        elif return_values == "UPDATED_OLD":
+            attributes = dict((name, value) for name, value in (old or {}).iteritems() if name in updated)
+        elif return_values == "UPDATED_NEW":
+            attributes = dict((name, value) for name, value in new.iteritems() if name in updated)
+        else:
+            attributes = None
+        if attributes:
+            response["Attributes"] = attributes
+        return response
+
+    def __batch_get_item(self, payload):
+        requests = payload.get("RequestItems", {})
+        if sum(len(request["Keys"]) for request in requests.itervalues()) > 100:
+            raise _validation("Too many items requested for the BatchGetItem call")
+        tables = {}
+        for name, request in requests.iteritems():
+            tables[name] = self.__table({"TableName": name})
+            keys = set()
+            for key in request["Keys"]:
+                tables[name].check_key(key)
+                key = tables[name].canonical_key(key)
+                if key in keys:
+                    raise _validation("Provided list of item keys contains duplicates")
+                keys.add(key)
+
+        budget = self.__max_batch_items
+        size = 0
+        responses = {}
+        unprocessed = {}
+        units = {}
+        for name, request in sorted(requests.iteritems()):
+            table = tables[name]
+            expression = _Expression(request)
+            responses[name] = []
+            units[name] = 0.
+            for key in request["Keys"]:
+                item = table.get(key)
+                item_size = table.size_of(key)
+                if budget == 0 or size + item_size > _max_batch_get_bytes:
+                    unprocessed.setdefault(name, dict(request, Keys=[]))["Keys"].append(key)
+                    continue
+                if budget is not None:
+                    budget -= 1
+                size += item_size
+                units[name] += _read_units(item_size, request.get("ConsistentRead"))
+                if item is not None:
+                    responses[name].append(expression.project(item))
+        response = {"Responses": responses, "UnprocessedKeys": unprocessed}
+        _add_batch_capacity(payload, response, tables, units)
+        return response
+
+    def __batch_write_item(self, payload):
+        requests = payload.get("RequestItems", {})
+        if sum(len(writes) for writes in requests.itervalues()) > 25:
+            raise _validation("Too many items requested for the BatchWriteItem call")
+        tables = {}
+        for name, writes in requests.iteritems():
+            tables[name] = self.__table({"TableName": name})
+            keys = set()
+            for write in writes:
+                if "PutRequest" in write:
+                    key = tables[name].key_of(write["PutRequest"]["Item"])
+                else:
+                    key = write["DeleteRequest"]["Key"]
+                    tables[name].check_key(key)
+                key = tables[name].canonical_key(key)
+                if key in keys:
+                    raise _validation("Provided list of item keys contains duplicates")
+                keys.add(key)
+
+        budget = self.__max_batch_items
+        unprocessed = {}
+        units = {}
+        for name, writes in sorted(requests.iteritems()):
+            table = tables[name]
+            units[name] = 0.
+            for write in writes:
+                if budget is not None:
+                    if budget == 0:
+                        unprocessed.setdefault(name, []).append(write)
+                        continue
+                    budget -= 1
+                if "PutRequest" in write:
+                    units[name] += _write_units(table.put(write["PutRequest"]["Item"]))
+                else:
+                    units[name] += _write_units(table.delete(write["DeleteRequest"]["Key"]))
+        response = {"UnprocessedItems": unprocessed}
+        _add_batch_capacity(payload, response, tables, units)
+        return response
+
+    def __query(self, payload):
+        table = self.__table(payload)
+        index = table.index(payload["IndexName"]) if "IndexName" in payload else None
+        if index is not None and index.is_global and payload.get("ConsistentRead"):
+            raise _validation("Consistent reads are not supported on global secondary indexes")
+        hash_key, range_key = (table.hash_key, table.range_key) if index is None else (index.hash_key, index.range_key)
+        conditions = payload.get("KeyConditions", {})
+        if hash_key not in conditions or conditions[hash_key]["ComparisonOperator"] != "EQ":
+            raise _validation("Query condition missed key schema element: {}".format(hash_key))
+        for name in conditions:
+            if name not in (hash_key, range_key):
+                raise _validation("Query condition missed key schema element")
+        hash_value = conditions[hash_key]["AttributeValueList"][0]
+        range_condition = conditions.get(range_key)
+
+        if index is None:
+            rows = table.partition_rows(hash_value)
+        else:
+            rows = index.rows(table, hash_value)
+        if range_condition is not None:
+            operator, values = range_condition["ComparisonOperator"], range_condition["AttributeValueList"]
+            rows = [(sort_key, item) for (sort_key, item) in rows if _key_condition(operator, item.get(range_key), values)]
+        if not payload.get("ScanIndexForward", True):
+            rows.reverse()
+        start = payload.get("ExclusiveStartKey")
+        if start is not None:
+            start = table.row_key(start, index)
+            if payload.get("ScanIndexForward", True):
+                rows = [row for row in rows if row[0] > start]
+            else:
+                rows = [row for row in rows if row[0] < start]
+        return self.__page(payload, table, index, iter(rows))
+
+    def __scan(self, payload):
+        table = self.__table(payload)
+        index = table.index(payload["IndexName"]) if "IndexName" in payload else None
+        start = payload.get("ExclusiveStartKey")
+        if start is not None:
+            start = table.row_key(start, index)
+        if index is None:
+            rows = table.rows(start)
+        else:
+            rows = index.rows(table)
+            if start is not None:
+                rows = rows[bisect.bisect_right([row[0] for row in rows], start):]
+            rows = iter(rows)
+        if "TotalSegments" in payload:
+            segments = payload["TotalSegments"]
+            segment = payload.get("Segment")
+            if segment is None or not 0 <= segment < segments:
+                raise _validation("The Segment parameter is required but was not present in the request when parameter TotalSegments is present")
+            rows = (row for row in rows if _segment(row[0][0], segments) == segment)
+        return self.__page(payload, table, index, rows)
+
+    def __page(self, payload, table, index, rows):
+        expression = _Expression(payload)
+        condition = expression.condition(payload["FilterExpression"]) if "FilterExpression" in payload else None
+        select = payload.get("Select")
+        if select is None:
+            if "ProjectionExpression" in payload:
+                select = "SPECIFIC_ATTRIBUTES"
+            elif index is None:
+                select = "ALL_ATTRIBUTES"
+            else:
+                select = "ALL_PROJECTED_ATTRIBUTES"
+        if select == "ALL_ATTRIBUTES" and index is not None and index.is_global and index.projection_type != "ALL":
+            raise _validation("One or more parameter values were invalid: Select type ALL_ATTRIBUTES is not supported for global secondary index {} because its projection type is not ALL".format(index.name))
+
+        limit = payload.get("Limit")
+        items = []
+        evaluated = 0
+        size = 0
+        last = None
+        truncated = False
+        for sort_key, item in rows:
+            if limit is not None and evaluated >= limit or size >= self.__max_page_bytes:
+                truncated = True
+                break
+            evaluated += 1
+            size += _size(item)
+            last = item
+            if index is not None and (index.is_global or select == "ALL_PROJECTED_ATTRIBUTES"):
+                item = index.project(item, table)
+            if condition is not None and not condition(item):
+                continue
+            if select == "SPECIFIC_ATTRIBUTES":
+                item = expression.project(item)
+            items.append(item)
+
+        response = _capacity_response(payload, table, _read_units(size, payload.get("ConsistentRead")))
+        response["Count"] = len(items)
+        response["ScannedCount"] = evaluated
+        if select != "COUNT":
+            response["Items"] = items
+        if truncated or limit is not None and evaluated >= limit:
+            response["LastEvaluatedKey"] = table.last_evaluated_key(last, index)
+        return response
+
+
+class _Response(object):
+    def __init__(self, status_code, body):
+        self.status_code = status_code
+        self.content = json.dumps(body).encode("utf-8")
+        self.text = self.content.decode("utf-8")
+
+
+class _Error(Exception):
+    def __init__(self, type, message):
+        super(_Error, self).__init__(type, message)
+        self.type = type
+        self.message = message
+
+
+# DynamoDB returns at most 16MB of items in a BatchGetItem response
+_max_batch_get_bytes = 16 * 1024 * 1024
+
+_not_found = "com.amazonaws.dynamodb.v20120810#ResourceNotFoundException"
+_in_use = "com.amazonaws.dynamodb.v20120810#ResourceInUseException"
+
+
+def _validation(message):
+    return _Error("com.amazon.coral.validate#ValidationException", message)
+
+
+def _check(condition, item):
+    if not condition(item or {}):
+        raise _Error("com.amazonaws.dynamodb.v20120810#ConditionalCheckFailedException", "The conditional request failed")
+
+
+class _Table(object):
+    def __init__(self, payload, now):
+        self.name = payload["TableName"]
+        self.attribute_definitions = payload["AttributeDefinitions"]
+        self.types = dict((d["AttributeName"], d["AttributeType"]) for d in self.attribute_definitions)
+        self.key_schema = payload["KeySchema"]
+        self.hash_key, self.range_key = _key_names(self.key_schema)
+        self.throughput = payload["ProvisionedThroughput"]
+        self.creation_date_time = now
+        self.indexes = [_Index(index, False) for index in payload.get("LocalSecondaryIndexes", [])]
+        self.indexes += [_Index(index, True) for index in payload.get("GlobalSecondaryIndexes", [])]
+        # Partitions are sorted by hash key, and items in partitions by range key.
+        # Keys are represented by (sort value, canonical value) to sort them like DynamoDB, and use them in dicts.
+        self.__hashes = []
+        self.__partitions = {}
+        self.__size = 0
+        self.__count = 0
+
+    def description(self):
+        description = {
+            "AttributeDefinitions": self.attribute_definitions,
+            "CreationDateTime": self.creation_date_time,
+            "ItemCount": self.__count,
+            "KeySchema": self.key_schema,
+            "ProvisionedThroughput": {
+                "LastDecreaseDateTime": 0.,
+                "LastIncreaseDateTime": 0.,
+                "NumberOfDecreasesToday": 0,
+                "ReadCapacityUnits": self.throughput["ReadCapacityUnits"],
+                "WriteCapacityUnits": self.throughput["WriteCapacityUnits"],
+            },
+            "TableName": self.name,
+            "TableSizeBytes": self.__size,
+            "TableStatus": "ACTIVE",
+        }
+        for index in self.indexes:
+            items = [item for item in self.items() if index.contains(item)]
+            index_description = {
+                "IndexName": index.name,
+                "IndexSizeBytes": sum(_size(index.project(item, self)) for item in items),
+                "ItemCount": len(items),
+                "KeySchema": index.key_schema,
+                "Projection": index.projection,
+            }
+            if index.is_global:
+                index_description["IndexStatus"] = "ACTIVE"
+                index_description["ProvisionedThroughput"] = index.throughput
+                description.setdefault("GlobalSecondaryIndexes", []).append(index_description)
+            else:
+                description.setdefault("LocalSecondaryIndexes", []).append(index_description)
+        return description
+
+    def index(self, name):
+        for index in self.indexes:
+            if index.name == name:
+                return index
+        raise _validation("The table does not have the specified index: {}".format(name))
+
+    def key_names(self):
+        return [name for name in (self.hash_key, self.range_key) if name is not None]
+
+    def key_of(self, item):
+        for name in self.key_names():
+            if name not in item:
+                raise _validation("One or more parameter values were invalid: Missing the key {} in the item".format(name))
+            if _type(item[name]) != self.types[name]:
+                raise _validation("One or more parameter values were invalid: Type mismatch for key {} expected: {} actual: {}".format(name, self.types[name], _type(item[name])))
+        for index in self.indexes:
+            for name in index.key_names():
+                if name in item and _type(item[name]) != self.types[name]:
+                    raise _validation("One or more parameter values were invalid: Type mismatch for Index Key {} Expected: {} Actual: {} IndexName: {}".format(name, self.types[name], _type(item[name]), index.name))
+        return dict((name, item[name]) for name in self.key_names())
+
+    def check_key(self, key):
+        if sorted(key.keys()) != sorted(self.key_names()) or any(_type(key[name]) != self.types[name] for name in key):
+            raise _validation("The provided key element does not match the schema")
+
+    def canonical_key(self, key):
+        return tuple(_canonical(key[name]) for name in self.key_names())
+
+    def __split(self, key):
+        hash_key = _hash_key(key[self.hash_key])
+        range_key = _sort_key(key[self.range_key]) if self.range_key is not None else ("", "")
+        return hash_key, range_key
+
+    def get(self, key):
+        hash_key, range_key = self.__split(key)
+        partition = self.__partitions.get(hash_key[1])
+        if partition is not None:
+            return partition.items.get(range_key[1])
+
+    def size_of(self, key):
+        hash_key, range_key = self.__split(key)
+        partition = self.__partitions.get(hash_key[1])
+        if partition is not None:
+            return partition.sizes.get(range_key[1], 0)
+        return 0
+
+    def put(self, item):
+        # Return the sizes of the previous and new items, for capacity units
+        hash_key, range_key = self.__split(item)
+        partition = self.__partitions.get(hash_key[1])
+        if partition is None:
+            partition = _Partition()
+            self.__partitions[hash_key[1]] = partition
+            bisect.insort(self.__hashes, hash_key)
+        size = _size(item)
+        old_size = partition.put(range_key, item, size)
+        if old_size is None:
+            self.__count += 1
+            old_size = 0
+        self.__size += size - old_size
+        return (old_size, size)
+
+    def delete(self, key):
+        # Return the sizes of the previous and new (absent) items, for capacity units
+        hash_key, range_key = self.__split(key)
+        partition = self.__partitions.get(hash_key[1])
+        old_size = None
+        if partition is not None:
+            old_size = partition.delete(range_key)
+            if old_size is not None:
+                self.__count -= 1
+                self.__size -= old_size
+            if not partition.keys:
+                del self.__partitions[hash_key[1]]
+                del self.__hashes[bisect.bisect_left(self.__hashes, hash_key)]
+        return (old_size or 0, 0)
+
+    def items(self):
+        for sort_key, item in self.rows():
+            yield item
+
+    def rows(self, start=None):
+        # (sort key, item) in the order of a Scan, strictly after start
+        i = 0 if start is None else bisect.bisect_left(self.__hashes, start[:2])
+        while i < len(self.__hashes):
+            hash_key = self.__hashes[i]
+            partition = self.__partitions[hash_key[1]]
+            j = 0
+            if start is not None and hash_key == start[:2]:
+                j = bisect.bisect_right(partition.keys, start[2:4])
+            while j < len(partition.keys):
+                range_key = partition.keys[j]
+                yield hash_key + range_key, partition.items[range_key[1]]
+                j += 1
+            i += 1
+
+    def partition_rows(self, hash_value):
+        partition = self.__partitions.get(_canonical(hash_value))
+        if partition is None:
+            return []
+        hash_key = _hash_key(hash_value)
+        return [(hash_key + range_key, partition.items[range_key[1]]) for range_key in partition.keys]
+
+    def row_key(self, key, index):
+        # Scans go through partitions in the order of their hashed keys, like DynamoDB. Hash-only tables and indexes
+        # sort as if they had an empty range key.
+        try:
+            row_key = _hash_key(key[self.hash_key]) + (_sort_key(key[self.range_key]) if self.range_key is not None else ("", ""))
+            if index is not None:
+                row_key = _hash_key(key[index.hash_key]) + (_sort_key(key[index.range_key]) if index.range_key is not None else ("", "")) + row_key
+            return row_key
+        except KeyError:
+            raise _validation("The provided starting key is invalid")
+
+    def last_evaluated_key(self, item, index):
+        names = self.key_names()
+        if index is not None:
+            names = index.key_names() + names
+        return dict((name, item[name]) for name in names)
+
+
+class _Partition(object):
+    def __init__(self):
+        self.keys = []
+        self.items = {}
+        self.sizes = {}
+
+    def put(self, range_key, item, size):
+        old_size = self.sizes.get(range_key[1])
+        if old_size is None:
+            bisect.insort(self.keys, range_key)
+        self.items[range_key[1]] = item
+        self.sizes[range_key[1]] = size
+        return old_size
+
+    def delete(self, range_key):
+        self.items.pop(range_key[1], None)
+        old_size = self.sizes.pop(range_key[1], None)
+        if old_size is not None:
+            del self.keys[bisect.bisect_left(self.keys, range_key)]
+        return old_size
+
+
+class _Index(object):
+    def __init__(self, payload, is_global):
+        self.name = payload["IndexName"]
+        self.key_schema = payload["KeySchema"]
+        self.hash_key, self.range_key = _key_names(self.key_schema)
+        self.projection = payload["Projection"]
+        self.projection_type = self.projection["ProjectionType"]
+        self.throughput = payload.get("ProvisionedThroughput")
+        self.is_global = is_global
+
+    def key_names(self):
+        return [name for name in (self.hash_key, self.range_key) if name is not None]
+
+    def contains(self, item):
+        return all(name in item for name in self.key_names())
+
+    def project(self, item, table):
+        if self.projection_type == "ALL":
+            return item
+        names = set(self.key_names() + table.key_names() + self.projection.get("NonKeyAttributes", []))
+        return dict((name, value) for name, value in item.iteritems() if name in names)
+
+    def rows(self, table, hash_value=None):
+        if hash_value is not None and not self.is_global:
+            candidates = [item for sort_key, item in table.partition_rows(hash_value)]
+        else:
+            candidates = table.items()
+        rows = []
+        for item in candidates:
+            if self.contains(item) and (hash_value is None or _equal(item[self.hash_key], hash_value)):
+                rows.append((table.row_key(item, self), item))
+        rows.sort(key=lambda row: row[0])
+        return rows
+
+
+def _key_names(key_schema):
+    hash_key = range_key = None
+    for element in key_schema:
+        if element["KeyType"] == "HASH":
+            hash_key = element["AttributeName"]
+        else:
+            range_key = element["AttributeName"]
+    return hash_key, range_key
+
+
+def _segment(digest, segments):
+    # Segments are contiguous ranges of hashed keys, so each segment is scanned in order
+    return int(binascii.hexlify(digest[:4]), 16) * segments >> 32
+
+
+def _size(item):
+    # The size of an item, as computed by DynamoDB for capacity units and limits
+    if item is None:
+        return 0
+    return sum(len(name.encode("utf-8")) + _value_size(value) for name, value in item.iteritems())
+
+
+def _value_size(value):
+    typ, data = next(iter(value.iteritems()))
+    if typ == "S":
+        return len(data.encode("utf-8"))
+    elif typ == "N":
+        return _number_size(data)
+    elif typ == "B":
+        return len(base64.b64decode(data))
+    elif typ == "SS":
+        return sum(len(element.encode("utf-8")) for element in data)
+    elif typ == "NS":
+        return sum(_number_size(element) for element in data)
+    elif typ == "BS":
+        return sum(len(base64.b64decode(element)) for element in data)
+    elif typ == "L":
+        return 3 + sum(1 + _value_size(element) for element in data)
+    elif typ == "M":
+        return 3 + sum(len(name.encode("utf-8")) + 1 + _value_size(element) for name, element in data.iteritems())
+    else:
+        return 1
+
+
+def _number_size(number):
+    # Roughly one byte per two significant digits, plus one
+    digits = number.lstrip("-").lower().split("e")[0].replace(".", "").strip("0")
+    return (len(digits) + 1) // 2 + 1
+
+
+def _read_units(size, consistent_read):
+    units = max(1, int(math.ceil(size / 4096.)))
+    return float(units) if consistent_read else units / 2.
+
+
+def _write_units(sizes):
+    return float(max(1, int(math.ceil(max(sizes) / 1024.))))
+
+
+def _capacity_response(payload, table, units):
+    return_consumed_capacity = payload.get("ReturnConsumedCapacity", "NONE")
+    if return_consumed_capacity == "NONE":
+        return {}
+    capacity = {"TableName": table.name, "CapacityUnits": units}
+    if return_consumed_capacity == "INDEXES":
+        capacity["Table"] = {"CapacityUnits": units}
+    return {"ConsumedCapacity": capacity}
+
+
+def _add_batch_capacity(payload, response, tables, units):
+    capacities = [_capacity_response(payload, tables[name], units[name]).get("ConsumedCapacity") for name in sorted(units)]
+    if capacities and capacities[0] is not None:
+        response["ConsumedCapacity"] = capacities
+
+
+# Attribute values, in DynamoDB's notation (like {"N": "42"})
+
+_decimal_context = decimal.Context(prec=38)
+
+
+def _type(value):
+    return next(iter(value))
+
+
+def _format_number(number):
+    if number == 0:
+        return "0"
+    return "{:f}".format(number.normalize(_decimal_context))
+
+
+_integer = re.compile(r"^(0|-?[1-9][0-9]*)$")
+
+
+def _sort_key(value):
+    # For key attributes only: (value sorting like in DynamoDB, canonical string)
+    typ, data = next(iter(value.iteritems()))
+    if typ == "N":
+        if _integer.match(data):
+            # Fast path for the most common numbers
+            return (int(data), "N" + data)
+        number = decimal.Decimal(data)
+        return (number, "N" + _format_number(number))
+    elif typ == "S":
+        return (data.encode("utf-8"), "S" + data)
+    else:
+        return (base64.b64decode(data), "B" + data)
+
+
+def _hash_key(value):
+    # For hash key attributes: (hash of the value, canonical string)
+    typ, data = next(iter(value.iteritems()))
+    if typ == "S":
+        data = data.encode("utf-8")
+    elif typ == "B":
+        data = base64.b64decode(data)
+    canonical = _canonical(value)
+    if typ == "N":
+        data = canonical[1:].encode("utf-8")
+    return (hashlib.sha1(data).digest(), canonical)
+
+
+def _canonical(value):
+    return _sort_key(value)[1]
+
+
+def _comparable(value):
+    # The value of a scalar, comparable with < and >, or None
+    typ, data = next(iter(value.iteritems()))
+    if typ == "N":
+        return decimal.Decimal(data)
+    elif typ == "S":
+        return data
+    elif typ == "B":
+        return base64.b64decode(data)
+
+
+def _set_elements(value):
+    typ, data = next(iter(value.iteritems()))
+    if typ == "NS":
+        return set(decimal.Decimal(n) for n in data)
+    else:
+        return set(data)
+
+
+def _equal(a, b):
+    type_a, data_a = next(iter(a.iteritems()))
+    type_b, data_b = next(iter(b.iteritems()))
+    if type_a != type_b:
+        return False
+    elif type_a == "N":
+        return decimal.Decimal(data_a) == decimal.Decimal(data_b)
+    elif type_a in ("NS", "SS", "BS"):
+        return _set_elements(a) == _set_elements(b)
+    elif type_a == "L":
+        return len(data_a) == len(data_b) and all(_equal(x, y) for x, y in zip(data_a, data_b))
+    elif type_a == "M":
+        return sorted(data_a.keys()) == sorted(data_b.keys()) and all(_equal(data_a[k], data_b[k]) for k in data_a)
+    else:
+        return data_a == data_b
+
+
+def _key_condition(operator, value, values):
+    if value is None or _type(value) != _type(values[0]):
+        return False
+    value = _comparable(value)
+    values = [_comparable(v) for v in values]
+    if operator == "EQ":
+        return value == values[0]
+    elif operator == "LE":
+        return value <= values[0]
+    elif operator == "LT":
+        return value < values[0]
+    elif operator == "GE":
+        return value >= values[0]
+    elif operator == "GT":
+        return value > values[0]
+    elif operator == "BEGINS_WITH":
+        return value.startswith(values[0])
+    elif operator == "BETWEEN":
+        return values[0] <= value <= values[1]
+    else:
+        raise _validation("Unsupported operator on KeyCondition: {}".format(operator))
+
+
+# Expressions
+
+_token = re.compile(r"\s*(?:(#[A-Za-z0-9_]+)|(:[A-Za-z0-9_]+)|([A-Za-z_][A-Za-z0-9_\-]*)|(\d+)|(<>|<=|>=|[=<>()\[\],.+\-]))")
+
+
+class _Expression(object):
+    # Parses the expressions of a request, with its ExpressionAttributeNames and ExpressionAttributeValues
+    def __init__(self, payload):
+        self.__names = payload.get("ExpressionAttributeNames", {})
+        self.__values = payload.get("ExpressionAttributeValues", {})
+        self.__projection = None
+        if "ProjectionExpression" in payload:
+            self.__projection = self.__parse(payload["ProjectionExpression"], self.__projection_expression)
+
+    def condition(self, expression):
+        return self.__parse(expression, self.__condition)
+
+    def update(self, expression):
+        return self.__parse(expression, self.__update_expression)
+
+    def project(self, item):
+        if self.__projection is None:
+            return item
+        result = {}
+        for path in self.__projection:
+            value = _get(item, path)
+            if value is not None:
+                _merge(result, path, value)
+        return _finalize(result)
+
+    def __parse(self, expression, rule):
+        self.__expression = expression
+        self.__tokens = []
+        position = 0
+        while expression[position:].strip():
+            match = _token.match(expression, position)
+            if match is None:
+                raise self.__syntax_error(expression[position:].strip())
+            position = match.end()
+            kind = match.lastindex
+            self.__tokens.append((kind, match.group(kind)))
+        self.__position = 0
+        result = rule()
+        if self.__position != len(self.__tokens):
+            raise self.__syntax_error(self.__tokens[self.__position][1])
+        return result
+
+    def __syntax_error(self, token):
+        return _validation("Invalid expression: Syntax error; token: \"{}\", near: \"{}\"".format(token, self.__expression))
+
+    def __peek(self, offset=0):
+        if self.__position + offset < len(self.__tokens):
+            return self.__tokens[self.__position + offset]
+        else:
+            return (None, None)
+
+    def __next(self):
+        token = self.__peek()
+        if token[0] is None:
+            raise _validation("Invalid expression: Syntax error; token: <EOF>, near: \"{}\"".format(self.__expression))
+        self.__position += 1
+        return token
+
+    def __accept(self, text):
+        kind, token = self.__peek()
+        if token is not None and (kind == 5 and token == text or kind == 3 and token.upper() == text):
+            self.__position += 1
+            return True
+        return False
+
+    def __expect(self, text):
+        if not self.__accept(text):
+            raise self.__syntax_error(self.__next()[1])
+
+    def __is_function(self, name):
+        return self.__peek()[0] == 3 and self.__peek()[1] == name and self.__peek(1) == (5, "(")
+
+    def __name(self):
+        kind, token = self.__next()
+        if kind == 1:
+            if token not in self.__names:
+                raise _validation("Value provided in ExpressionAttributeNames unused in expressions: keys: {{{}}}".format(token))
+            return self.__names[token]
+        elif kind == 3:
+            return token
+        else:
+            raise self.__syntax_error(token)
+
+    def __value(self):
+        kind, token = self.__next()
+        if kind != 2:
+            raise self.__syntax_error(token)
+        if token not in self.__values:
+            raise _validation("An expression attribute value used in expression is not defined; attribute value: {}".format(token))
+        return self.__values[token]
+
+    def __path(self):
+        path = [self.__name()]
+        while True:
+            if self.__accept("."):
+                path.append(self.__name())
+            elif self.__accept("["):
+                kind, token = self.__next()
+                if kind != 4:
+                    raise self.__syntax_error(token)
+                path.append(int(token))
+                self.__expect("]")
+            else:
+                return tuple(path)
+
+    def __projection_expression(self):
+        paths = [self.__path()]
+        while self.__accept(","):
+            paths.append(self.__path())
+        _check_overlaps(paths)
+        return paths
+
+    # Conditions are compiled to functions of the item
+
+    def __condition(self):
+        left = self.__conjunction()
+        while self.__accept("OR"):
+            left = (lambda l, r: lambda item: l(item) or r(item))(left, self.__conjunction())
+        return left
+
+    def __conjunction(self):
+        left = self.__negation()
+        while self.__accept("AND"):
+            left = (lambda l, r: lambda item: l(item) and r(item))(left, self.__negation())
+        return left
+
+    def __negation(self):
+        if self.__accept("NOT"):
+            operand = self.__negation()
+            return lambda item: not operand(item)
+        else:
+            return self.__primary()
+
+    def __primary(self):
+        if self.__accept("("):
+            condition = self.__condition()
+            self.__expect(")")
+            return condition
+        for name, function in _condition_functions:
+            if self.__is_function(name):
+                self.__next()
+                self.__expect("(")
+                path = self.__path()
+                arguments = []
+                while self.__accept(","):
+                    arguments.append(self.__operand())
+                self.__expect(")")
+                return (lambda path, arguments, function: lambda item: function(_get(item, path), *[a(item) for a in arguments]))(path, arguments, function)
+        left = self.__operand()
+        if self.__accept("BETWEEN"):
+            low = self.__operand()
+            self.__expect("AND")
+            high = self.__operand()
+            return lambda item: _compare(">=", left(item), low(item)) and _compare("<=", left(item), high(item))
+        if self.__accept("IN"):
+            self.__expect("(")
+            candidates = [self.__operand()]
+            while self.__accept(","):
+                candidates.append(self.__operand())
+            self.__expect(")")
+            return lambda item: any(_compare("=", left(item), candidate(item)) for candidate in candidates)
+        kind, operator = self.__next()
+        if operator not in ("=", "<>", "<", "<=", ">", ">="):
+            raise self.__syntax_error(operator)
+        right = self.__operand()
+        return lambda item: _compare(operator, left(item), right(item))
+
+    def __operand(self):
+        if self.__peek()[0] == 2:
+            value = self.__value()
+            return lambda item: value
+        if self.__is_function("size"):
+            self.__next()
+            self.__expect("(")
+            path = self.__path()
+            self.__expect(")")
+            return lambda item: _size_of(_get(item, path))
+        path = self.__path()
+        return lambda item: _get(item, path)
+
+    # Updates are compiled to an _Update
+
+    def __update_expression(self):
+        actions = []
+        clauses = set()
+        while self.__peek()[0] is not None:
+            kind, clause = self.__next()
+            clause = clause.upper()
+            if clause not in ("SET", "REMOVE", "ADD", "DELETE") or clause in clauses:
+                raise self.__syntax_error(clause)
+            clauses.add(clause)
+            while True:
+                path = self.__path()
+                if clause == "SET":
+                    self.__expect("=")
+                    actions.append((clause, path, self.__set_value()))
+                elif clause == "REMOVE":
+                    actions.append((clause, path, None))
+                else:
+                    value = self.__value()
+                    actions.append((clause, path, lambda item, value=value: value))
+                if not self.__accept(","):
+                    break
+        _check_overlaps([path for clause, path, value in actions], update=True)
+        return _Update(actions)
+
+    def __set_value(self):
+        left = self.__set_operand()
+        if self.__accept("+"):
+            right = self.__set_operand()
+            return lambda item: _arithmetic(left(item), right(item), lambda a, b: _decimal_context.add(a, b))
+        elif self.__accept("-"):
+            right = self.__set_operand()
+            return lambda item: _arithmetic(left(item), right(item), lambda a, b: _decimal_context.subtract(a, b))
+        else:
+            return left
+
+    def __set_operand(self):
+        if self.__peek()[0] == 2:
+            value = self.__value()
+            return lambda item: value
+        if self.__is_function("if_not_exists"):
+            self.__next()
+            self.__expect("(")
+            path = self.__path()
+            self.__expect(",")
+            default = self.__set_operand()
+            self.__expect(")")
+            return lambda item: _get(item, path) or default(item)
+        if self.__is_function("list_append"):
+            self.__next()
+            self.__expect("(")
+            left = self.__set_operand()
+            self.__expect(",")
+            right = self.__set_operand()
+            self.__expect(")")
+            return lambda item: _list_append(left(item), right(item))
+        path = self.__path()
+        return lambda item: _get(item, path)
+
+
+def _check_overlaps(paths, update=False):
+    for i, a in enumerate(paths):
+        for b in paths[i + 1:]:
+            if a[:len(b)] == b or b[:len(a)] == a:
+                raise _validation("Invalid {}Expression: Two document paths overlap with each other; must remove or rewrite one of these paths; path one: [{}], path two: [{}]".format(
+                    "Update" if update else "Projection",
+                    ", ".join(str(e) for e in a),
+                    ", ".join(str(e) for e in b),
+                ))
+
+
+class _Update(object):
+    def __init__(self, actions):
+        self.__actions = actions
+        self.paths = [path for clause, path, value in actions]
+
+    def apply(self, old):
+        # All operands are evaluated on the item before the update
+        values = [(clause, path, None if value is None else value(old)) for clause, path, value in self.__actions]
+        new = json.loads(json.dumps(old))
+        for clause, path, value in values:
+            if clause == "SET":
+                if value is None:
+                    raise _validation("The provided expression refers to an attribute that does not exist in the item")
+                _set(new, path, value)
+            elif clause == "REMOVE":
+                _remove(new, path)
+            elif clause == "ADD":
+                _set(new, path, _add(_get(new, path), value))
+            else:
+                remaining = _delete(_get(new, path), value)
+                if remaining is None:
+                    _remove(new, path)
+                else:
+                    _set(new, path, remaining)
+        return new
+
+
+def _container(item, path):
+    # The map (dict) or list containing the last element of path
+    container = item
+    for element in path[:-1]:
+        if isinstance(element, int):
+            if not isinstance(container, list) or element >= len(container):
+                return None
+        elif not isinstance(container, dict) or element not in container:
+            return None
+        value = container[element]
+        if "M" in value:
+            container = value["M"]
+        elif "L" in value:
+            container = value["L"]
+        else:
+            return None
+    return container
+
+
+def _get(item, path):
+    container = _container(item, path)
+    element = path[-1]
+    if isinstance(element, int):
+        if isinstance(container, list) and element < len(container):
+            return container[element]
+    elif isinstance(container, dict):
+        return container.get(element)
+
+
+def _set(item, path, value):
+    container = _container(item, path)
+    element = path[-1]
+    if isinstance(element, int) and isinstance(container, list):
+        if element < len(container):
+            container[element] = value
+        else:
+            container.append(value)
+    elif not isinstance(element, int) and isinstance(container, dict):
+        container[element] = value
+    else:
+        raise _validation("The document path provided in the update expression is invalid for update")
+
+
+def _remove(item, path):
+    container = _container(item, path)
+    element = path[-1]
+    if isinstance(element, int):
+        if isinstance(container, list) and element < len(container):
+            del container[element]
+    elif isinstance(container, dict):
+        container.pop(element, None)
+
+
+class _PartialList(dict):
+    # Elements of a list selected by a projection expression, by index
+    pass
+
+
+def _merge(result, path, value):
+    container = result
+    for element, next_element in zip(path[:-1], path[1:]):
+        if element not in container:
+            container[element] = {"L": _PartialList()} if isinstance(next_element, int) else {"M": {}}
+        container = next(iter(container[element].values()))
+    container[path[-1]] = value
+
+
+def _finalize(value):
+    if isinstance(value, _PartialList):
+        return [_finalize(value[index]) for index in sorted(value)]
+    elif isinstance(value, dict):
+        return dict((key, _finalize(element)) for key, element in value.iteritems())
+    else:
+        return value
+
+
+def _compare(operator, left, right):
+    if left is None or right is None:
+        return operator == "<>"
+    if operator == "=":
+        return _equal(left, right)
+    elif operator == "<>":
+        return not _equal(left, right)
+    if _type(left) != _type(right) or _type(left) not in ("N", "S", "B"):
+        return False
+    left, right = _comparable(left), _comparable(right)
+    if operator == "<":
+        return left < right
+    elif operator == "<=":
+        return left <= right
+    elif operator == ">":
+        return left > right
+    else:
+        return left >= right
+
+
+def _size_of(value):
+    if value is None:
+        return None
+    typ, data = next(iter(value.iteritems()))
+    if typ == "S":
+        size = len(data)
+    elif typ == "B":
+        size = len(base64.b64decode(data))
+    elif typ in ("SS", "NS", "BS", "L", "M"):
+        size = len(data)
+    else:
+        return None
+    return {"N": str(size)}
+
+
+def _begins_with(value, prefix):
+    if value is None or prefix is None or _type(value) != _type(prefix) or _type(value) not in ("S", "B"):
+        return False
+    return _comparable(value).startswith(_comparable(prefix))
+
+
+def _contains(value, operand):
+    if value is None or operand is None:
+        return False
+    typ = _type(value)
+    if typ in ("S", "B"):
+        return _type(operand) == typ and _comparable(operand) in _comparable(value)
+    elif typ in ("SS", "NS", "BS"):
+        return _type(operand) == typ[0] and _comparable(operand) in _set_elements(value)
+    elif typ == "L":
+        return any(_equal(element, operand) for element in value["L"])
+    else:
+        return False
+
+
+_condition_functions = [
+    ("attribute_exists", lambda value: value is not None),
+    ("attribute_not_exists", lambda value: value is None),
+    ("attribute_type", lambda value, typ: value is not None and typ is not None and _type(value) == typ.get("S")),
+    ("begins_with", _begins_with),
+    ("contains", _contains),
+]
+
+
+def _arithmetic(left, right, operation):
+    if left is None or right is None or _type(left) != "N" or _type(right) != "N":
+        raise _validation("An operand in the update expression has an incorrect data type")
+    return {"N": _format_number(operation(decimal.Decimal(left["N"]), decimal.Decimal(right["N"])))}
+
+
+def _list_append(left, right):
+    if left is None or right is None or _type(left) != "L" or _type(right) != "L":
+        raise _validation("An operand in the update expression has an incorrect data type")
+    return {"L": left["L"] + right["L"]}
+
+
+def _add(existing, value):
+    typ = _type(value)
+    if existing is None:
+        if typ not in ("N", "SS", "NS", "BS"):
+            raise _validation("An operand in the update expression has an incorrect data type")
+        return value
+    if _type(existing) != typ:
+        raise _validation("An operand in the update expression has an incorrect data type")
+    if typ == "N":
+        return _arithmetic(existing, value, lambda a, b: _decimal_context.add(a, b))
+    elif typ in ("SS", "NS", "BS"):
+        return {typ: _set_union(existing[typ], value[typ], typ)}
+    else:
+        raise _validation("An operand in the update expression has an incorrect data type")
+
+
+def _set_union(a, b, typ):
+    result = list(a)
+    elements = _set_elements({typ: a})
+    for element in b:
+        comparable = decimal.Decimal(element) if typ == "NS" else element
+        if comparable not in elements:
+            elements.add(comparable)
+            result.append(element)
+    return result
+
+
+def _delete(existing, value):
+    if existing is None:
+        return None
+    typ = _type(value)
+    if _type(existing) != typ or typ not in ("SS", "NS", "BS"):
+        raise _validation("An operand in the update expression has an incorrect data type")
+    removed = _set_elements(value)
+    remaining = [element for element in existing[typ] if (decimal.Decimal(element) if typ == "NS" else element) not in removed]
+    if remaining:
+        return {typ: remaining}
+
+
+class InMemoryDynamoDbUnitTests(UnitTests):
+    def setUp(self):
+        super(InMemoryDynamoDbUnitTests, self).setUp()
+        self.engine = InMemoryDynamoDb()
+        self.connection = self.engine.connection(retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0))
+        self.connection(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).range_key("r", _lv.NUMBER).provisioned_throughput(1, 2))
+
+    def put(self, *items):
+        for item in items:
+            self.connection(_lv.PutItem("Aaa", item))
+
+    def test_create_describe_list_delete_tables(self):
+        r = self.connection(
+            _lv.CreateTable("Bbb").hash_key("h", _lv.NUMBER).provisioned_throughput(3, 4)
+                .global_secondary_index("gsi").hash_key("g", _lv.STRING).project("a").provisioned_throughput(5, 6)
+        )
+        self.assertEqual(r.table_description.table_status, "ACTIVE")
+        self.assertEqual(r.table_description.global_secondary_indexes[0].projection.non_key_attributes, ["a"])
+        self.assertEqual(self.connection(_lv.ListTables()).table_names, ["Aaa", "Bbb"])
+        self.assertEqual(self.connection(_lv.ListTables().limit(1)).last_evaluated_table_name, "Aaa")
+        self.assertEqual(self.connection(_lv.ListTables().exclusive_start_table_name("Aaa")).table_names, ["Bbb"])
+        self.connection(_lv.PutItem("Bbb", {"h": 1, "g": u"x", "a": 1, "b": 2}))
+        description = self.connection(_lv.DescribeTable("Bbb")).table
+        self.assertEqual((description.item_count, description.global_secondary_indexes[0].item_count), (1, 1))
+        self.assertEqual(self.connection(_lv.DeleteTable("Bbb")).table_description.table_name, "Bbb")
+        with self.assertRaises(_lv.ResourceNotFoundException):
+            self.connection(_lv.DescribeTable("Bbb"))
+
+    def test_create_table_errors(self):
+        with self.assertRaises(_lv.ResourceInUseException):
+            self.connection(_lv.CreateTable("Aaa").hash_key("h", _lv.STRING).provisioned_throughput(1, 2))
+        with self.assertRaises(_lv.ValidationException) as catcher:
+            self.connection(_lv.CreateTable("Bbb").hash_key("h").provisioned_throughput(1, 2))
+        self.assertEqual(catcher.exception.args, ({"__type": "com.amazon.coral.validate#ValidationException", "message": "No Attribute Schema Defined"},))
+
+    def test_update_table(self):
+        self.connection(
+            _lv.UpdateTable("Aaa").provisioned_throughput(3, 4)
+                .create_global_secondary_index("gsi").hash_key("g", _lv.NUMBER).project_all().provisioned_throughput(1, 1)
+        )
+        description = self.connection(_lv.DescribeTable("Aaa")).table
+        self.assertEqual(description.provisioned_throughput.read_capacity_units, 3)
+        self.assertEqual(description.global_secondary_indexes[0].index_name, "gsi")
+        self.connection(_lv.UpdateTable("Aaa").delete_global_secondary_index("gsi"))
+        self.assertIsNone(self.connection(_lv.DescribeTable("Aaa")).table.global_secondary_indexes)
+
+    def test_put_get_delete_item(self):
+        self.assertIsNone(self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": 1})).item)
+        self.put({"h": u"a", "r": 1, "x": 1, "m": {"a": [1, 2, 3], "b": u"b"}})
+        self.assertEqual(self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": 1})).item, {"h": "a", "r": 1, "x": 1, "m": {"a": [1, 2, 3], "b": "b"}})
+        self.assertEqual(self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": 1}).project("x", "m.a[2]", "m.a[0]")).item, {"x": 1, "m": {"a": [1, 3]}})
+        r = self.connection(_lv.PutItem("Aaa", {"h": u"a", "r": 1, "x": 2}).return_values_all_old().return_consumed_capacity_total())
+        self.assertEqual(r.attributes["x"], 1)
+        self.assertEqual(r.consumed_capacity.capacity_units, 1.)
+        r = self.connection(_lv.DeleteItem("Aaa", {"h": u"a", "r": 1}).return_values_all_old())
+        self.assertEqual(r.attributes, {"h": "a", "r": 1, "x": 2})
+        self.assertIsNone(self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": 1})).item)
+
+    def test_key_errors(self):
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.GetItem("Aaa", {"h": u"a"}))
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": u"1"}))
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.PutItem("Aaa", {"h": u"a"}))
+        with self.assertRaises(_lv.ResourceNotFoundException):
+            self.connection(_lv.GetItem("Bbb", {"h": u"a"}))
+
+    def test_condition_expressions(self):
+        self.put({"h": u"a", "r": 1, "x": 1, "s": u"hello", "l": [1, 2], "ss": set([u"a", u"b"])})
+
+        def check(expression, **values):
+            action = _lv.DeleteItem("Aaa", {"h": u"z", "r": 0}).condition_expression(expression)
+            for name, value in values.iteritems():
+                action.expression_attribute_value(name, value)
+            # Condition is evaluated on the item (h, r) = ("a", 1) by putting the same item
+            action = _lv.PutItem("Aaa", {"h": u"a", "r": 1, "x": 1, "s": u"hello", "l": [1, 2], "ss": set([u"a", u"b"])}).condition_expression(expression)
+            for name, value in values.iteritems():
+                action.expression_attribute_value(name, value)
+            try:
+                self.connection(action)
+                return True
+            except _lv.ConditionalCheckFailedException:
+                return False
+
+        self.assertTrue(check("x = :v", v=1))
+        self.assertFalse(check("x <> :v", v=1))
+        self.assertTrue(check("nope <> :v", v=1))
+        self.assertTrue(check("x BETWEEN :a AND :b", a=0, b=2))
+        self.assertTrue(check("x IN (:a, :b)", a=3, b=1))
+        self.assertTrue(check("attribute_exists(s) AND attribute_not_exists(nope)"))
+        self.assertTrue(check("begins_with(s, :p) AND contains(s, :q)", p=u"he", q=u"ll"))
+        self.assertTrue(check("contains(ss, :e) AND contains(l, :f)", e=u"a", f=2))
+        self.assertTrue(check("size(l) = :two AND size(s) > :two", two=2))
+        self.assertTrue(check("attribute_type(l, :t)", t=u"L"))
+        self.assertTrue(check("NOT (x > :v OR x < :v)", v=1))
+        self.assertFalse(check("x = :v AND s = :v", v=1))
+        with self.assertRaises(_lv.ValidationException):
+            check("x = :undefined")
+        with self.assertRaises(_lv.ValidationException):
+            check("x = = :v", v=1)
+
+    def test_update_item(self):
+        self.put({"h": u"a", "r": 1, "n": 1, "s": set([1, 2]), "l": [1], "m": {"a": 1}, "gone": 0})
+        r = self.connection(
+            _lv.UpdateItem("Aaa", {"h": u"a", "r": 1})
+                .set("n", "n + :one")
+                .set("l", "list_append(l, :l)")
+                .set("m.b", ":one")
+                .set("c", "if_not_exists(c, :one)")
+                .remove("gone")
+                .add("s", "s")
+                .expression_attribute_value("one", 1)
+                .expression_attribute_value("l", [2, 3])
+                .expression_attribute_value("s", set([3]))
+                .return_values_all_new()
+        )
+        self.assertEqual(r.attributes, {"h": "a", "r": 1, "n": 2, "s": set([1, 2, 3]), "l": [1, 2, 3], "m": {"a": 1, "b": 1}, "c": 1})
+        r = self.connection(_lv.UpdateItem("Aaa", {"h": u"a", "r": 1}).delete("s", "s").expression_attribute_value("s", set([1, 2, 3])).return_values_updated_old())
+        self.assertEqual(r.attributes, {"s": set([1, 2, 3])})
+        self.assertNotIn("s", self.connection(_lv.GetItem("Aaa", {"h": u"a", "r": 1})).item)
+        r = self.connection(_lv.UpdateItem("Aaa", {"h": u"b", "r": 1}).set("x", ":x").expression_attribute_value("x", u"x").return_values_all_new())
+        self.assertEqual(r.attributes, {"h": "b", "r": 1, "x": "x"})
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.UpdateItem("Aaa", {"h": u"a", "r": 1}).set("h", ":x").expression_attribute_value("x", u"x"))
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.UpdateItem("Aaa", {"h": u"a", "r": 1}).set("x", ":x").remove("x.y").expression_attribute_value("x", u"x"))
+        with self.assertRaises(_lv.ConditionalCheckFailedException):
+            self.connection(_lv.UpdateItem("Aaa", {"h": u"a", "r": 1}).set("x", ":x").expression_attribute_value("x", u"x").condition_expression("n = :x"))
+
+    def test_query(self):
+        self.put(*[{"h": u"a", "r": r, "x": r % 2} for r in range(10)])
+        self.put({"h": u"b", "r": 0})
+        r = self.connection(_lv.Query("Aaa").key_eq("h", u"a").key_between("r", 2, 5))
+        self.assertEqual([item["r"] for item in r.items], [2, 3, 4, 5])
+        r = self.connection(_lv.Query("Aaa").key_eq("h", u"a").key_ge("r", 5).scan_index_forward_false().limit(2))
+        self.assertEqual([item["r"] for item in r.items], [9, 8])
+        self.assertEqual(r.last_evaluated_key, {"h": "a", "r": 8})
+        r = self.connection(_lv.Query("Aaa").key_eq("h", u"a").key_ge("r", 5).scan_index_forward_false().exclusive_start_key({"h": u"a", "r": 8}))
+        self.assertEqual([item["r"] for item in r.items], [7, 6, 5])
+        self.assertIsNone(r.last_evaluated_key)
+        r = self.connection(_lv.Query("Aaa").key_eq("h", u"a").filter_expression("x = :one").expression_attribute_value("one", 1).project("r"))
+        self.assertEqual(r.items, [{"r": 1}, {"r": 3}, {"r": 5}, {"r": 7}, {"r": 9}])
+        self.assertEqual((r.count, r.scanned_count), (5, 10))
+        r = self.connection(_lv.Query("Aaa").key_eq("h", u"a").select_count())
+        self.assertEqual((r.count, r.items), (10, None))
+        self.assertEqual(list(_lv.iterate_query(self.connection, _lv.Query("Aaa").key_eq("h", u"a").limit(3))), [{"h": "a", "r": r, "x": r % 2} for r in range(10)])
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.Query("Aaa").key_ge("r", 5))
+
+    def test_query_indexes(self):
+        self.connection(
+            _lv.CreateTable("Bbb").hash_key("h", _lv.STRING).range_key("r", _lv.NUMBER).provisioned_throughput(1, 1)
+                .local_secondary_index("lsi").hash_key("h").range_key("l", _lv.NUMBER).project_keys_only()
+                .global_secondary_index("gsi").hash_key("g", _lv.NUMBER).range_key("r").project("a").provisioned_throughput(1, 1)
+        )
+        for r in range(6):
+            self.connection(_lv.PutItem("Bbb", {"h": u"a", "r": r, "l": 10 - r, "g": r % 2, "a": r, "b": r}))
+        self.connection(_lv.PutItem("Bbb", {"h": u"a", "r": 6}))
+        r = self.connection(_lv.Query("Bbb").index_name("lsi").key_eq("h", u"a").key_le("l", 7))
+        self.assertEqual(r.items, [{"h": "a", "r": 5, "l": 5}, {"h": "a", "r": 4, "l": 6}, {"h": "a", "r": 3, "l": 7}])
+        r = self.connection(_lv.Query("Bbb").index_name("lsi").key_eq("h", u"a").select_all_attributes().limit(1))
+        self.assertEqual(r.items, [{"h": "a", "r": 5, "l": 5, "g": 1, "a": 5, "b": 5}])
+        self.assertEqual(r.last_evaluated_key, {"h": "a", "r": 5, "l": 5})
+        r = self.connection(_lv.Query("Bbb").index_name("gsi").key_eq("g", 1))
+        self.assertEqual(r.items, [{"h": "a", "r": 1, "g": 1, "a": 1}, {"h": "a", "r": 3, "g": 1, "a": 3}, {"h": "a", "r": 5, "g": 1, "a": 5}])
+        self.assertEqual(list(_lv.iterate_query(self.connection, _lv.Query("Bbb").index_name("gsi").key_eq("g", 0).limit(1))), [
+            {"h": "a", "r": 0, "g": 0, "a": 0}, {"h": "a", "r": 2, "g": 0, "a": 2}, {"h": "a", "r": 4, "g": 0, "a": 4},
+        ])
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.Query("Bbb").index_name("gsi").key_eq("g", 1).consistent_read_true())
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.Query("Bbb").index_name("gsi").key_eq("g", 1).select_all_attributes())
+
+    def test_scan(self):
+        items = [{"h": u"{}".format(h), "r": r} for h in range(10) for r in range(3)]
+        self.put(*items)
+        self.assertEqual(self.connection(_lv.Scan("Aaa")).count, 30)
+        self.assertEqual(sorted(_lv.iterate_scan(self.connection, _lv.Scan("Aaa").limit(7)), key=lambda i: (i["h"], i["r"])), items)
+        segments = [list(_lv.iterate_scan(self.connection, _lv.Scan("Aaa").segment(s, 3).limit(2))) for s in range(3)]
+        self.assertEqual(sum(len(segment) for segment in segments), 30)
+        self.assertTrue(all(segments))
+        r = self.connection(_lv.Scan("Aaa").filter_expression("r = :r").expression_attribute_value("r", 1))
+        self.assertEqual((r.count, r.scanned_count), (10, 30))
+
+    def test_page_size(self):
+        engine = InMemoryDynamoDb(max_page_bytes=100)
+        connection = engine.connection()
+        connection(_lv.CreateTable("Aaa").hash_key("h", _lv.NUMBER).provisioned_throughput(1, 1))
+        for h in range(10):
+            connection(_lv.PutItem("Aaa", {"h": h, "x": u"x" * 30}))
+        r = connection(_lv.Scan("Aaa"))
+        self.assertEqual(r.count, 3)
+        self.assertIsNotNone(r.last_evaluated_key)
+        self.assertEqual(len(list(_lv.iterate_scan(connection, _lv.Scan("Aaa")))), 10)
+
+    def test_batch_get_item(self):
+        self.put(*[{"h": u"a", "r": r, "x": r} for r in range(5)])
+        r = self.connection(_lv.BatchGetItem().table("Aaa").keys({"h": u"a", "r": 1}, {"h": u"a", "r": 7}).project("x"))
+        self.assertEqual(r.responses, {"Aaa": [{"x": 1}]})
+        self.assertEqual(r.unprocessed_keys, {})
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.BatchGetItem().table("Aaa").keys({"h": u"a", "r": 1}, {"h": u"a", "r": 1}))
+
+        engine = InMemoryDynamoDb(max_batch_items=2)
+        connection = engine.connection()
+        connection(_lv.CreateTable("Aaa").hash_key("h", _lv.NUMBER).provisioned_throughput(1, 1))
+        r = connection(_lv.BatchWriteItem().table("Aaa").put(*[{"h": h} for h in range(5)]))
+        self.assertEqual(len(r.unprocessed_items["Aaa"]), 3)
+        _lv.batch_put_item(connection, "Aaa", [{"h": h} for h in range(5)])
+        r = connection(_lv.BatchGetItem().table("Aaa").keys(*[{"h": h} for h in range(5)]))
+        self.assertEqual(len(r.responses["Aaa"]), 2)
+        self.assertEqual(len(r.unprocessed_keys["Aaa"]["Keys"]), 3)
+        self.assertEqual(sorted(item["h"] for item in _lv.iterate_batch_get_item(connection, "Aaa", [{"h": h} for h in range(5)])), range(5))
+
+    def test_batch_write_item(self):
+        self.put({"h": u"a", "r": 0})
+        r = self.connection(_lv.BatchWriteItem().table("Aaa").put({"h": u"a", "r": 1}).delete({"h": u"a", "r": 0}).return_consumed_capacity_total())
+        self.assertEqual(r.consumed_capacity[0].capacity_units, 2.)
+        self.assertEqual([item["r"] for item in self.connection(_lv.Query("Aaa").key_eq("h", u"a")).items], [1])
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.BatchWriteItem().table("Aaa").put({"h": u"a", "r": 1}).delete({"h": u"a", "r": 1}))
+        with self.assertRaises(_lv.ValidationException):
+            self.connection(_lv.BatchWriteItem().table("Aaa").put(*[{"h": u"a", "r": r} for r in range(26)]))
+
+    def test_numbers_and_binaries(self):
+        self.connection(_lv.CreateTable("Bbb").hash_key("h", _lv.BINARY).range_key("r", _lv.NUMBER).provisioned_throughput(1, 1))
+        for r in [100, -10, 3, 10, 2]:
+            self.connection(_lv.PutItem("Bbb", {"h": b"\x00\xff", "r": r}))
+        r = self.connection(_lv.Query("Bbb").key_eq("h", b"\x00\xff"))
+        self.assertEqual([item["r"] for item in r.items], [-10, 2, 3, 10, 100])
+
+        def post(operation, payload):
+            return json.loads(self.engine.post("http://in-memory/", json.dumps(payload), {"X-Amz-Target": "DynamoDB_20120810." + operation}).content)
+
+        post("PutItem", {"TableName": "Bbb", "Item": {"h": {"B": "AP8="}, "r": {"N": "1e1"}, "n": {"N": "0.1"}}})
+        r = post("UpdateItem", {"TableName": "Bbb", "Key": {"h": {"B": "AP8="}, "r": {"N": "10.00"}}, "UpdateExpression": "ADD n :n", "ExpressionAttributeValues": {":n": {"N": "0.20"}}, "ReturnValues": "ALL_NEW"})
+        self.assertEqual(r["Attributes"]["n"], {"N": "0.3"})
+
+    def test_unknown_operation(self):
+        r = self.engine.post("http://in-memory/", b"{}", {"X-Amz-Target": "DynamoDB_20120810.Foo"})
+        self.assertEqual((r.status_code, json.loads(r.content)), (400, {"__type": "com.amazon.coral.service#UnknownOperationException"}))
@@ -9,6 +9,7 @@ import os
 import stat
 import subprocess
 import tarfile
+import unittest
 
 import requests
 try:
@@ -21,6 +22,7 @@ except ImportError:  # pragma no cover (Test code)
         pass
 
 import LowVoltage as _lv
+from .in_memory import InMemoryDynamoDb
 
 
 class DynamoDbLocalResourceManager(TestResourceManager):
@@ -53,8 +55,28 @@ class DynamoDbLocalResourceManager(TestResourceManager):
         self.__process.kill()
 
 
+class InMemoryDynamoDbResourceManager(TestResourceManager):
+    def make(self, dependencies):
+        return InMemoryDynamoDb().connection(
+            retry_policy=_lv.ExponentialBackoffRetryPolicy(1, 1, 0),
+        )
+
+    def clean(self, resource):
+        pass
+
+
+# Set LOWVOLTAGE_IN_MEMORY to run the local integration tests without DynamoDB Local
+in_memory_local_integ_tests = bool(os.environ.get("LOWVOLTAGE_IN_MEMORY"))
+
+# For tests connecting to DynamoDB Local through the network
+skip_if_in_memory = unittest.skipIf(in_memory_local_integ_tests, "needs DynamoDB Local")
+
+
 class LocalIntegTests(ResourcedTestCase):
-    resources = [("connection", DynamoDbLocalResourceManager())]
+    if in_memory_local_integ_tests:
+        resources = [("connection", InMemoryDynamoDbResourceManager())]
+    else:
+        resources = [("connection", DynamoDbLocalResourceManager())]
 
     before_start = datetime.datetime.utcnow()
     after_end = before_start + datetime.timedelta(minutes=10)
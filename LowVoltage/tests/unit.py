@@ -6,6 +6,9 @@ import LowVoltage.testing as _tst
 from LowVoltage.actions.tests.unit import *
 from LowVoltage.compounds.tests.unit import *
 from LowVoltage.connection.tests.unit import *
+from LowVoltage.testing.in_memory import InMemoryDynamoDbUnitTests
+from LowVoltage.testing.fault_injection import FaultInjectorUnitTests
+from LowVoltage.benchmarks.suite import SuiteUnitTests
 
 
 if __name__ == "__main__":  # pragma no branch (Test code)
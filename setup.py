@@ -4,6 +4,7 @@
 # Copyright 2014-2015 Vincent Jacques <vincent@vincent-jacques.net>
 
 import os
+import sys
 import setuptools
 
 version = "0.7.4"
@@ -33,7 +34,7 @@ setuptools.setup(
         "Topic :: Database",
     ],
     install_requires=["requests>=2.1"],
-    tests_require=["testresources", "MockMockMock<0.6.0"],
+    tests_require=["testresources", "MockMockMock<0.6.0"] + (["trollius"] if sys.version_info < (3, 4) else []),
     test_suite="LowVoltage.tests" if "AWS_ACCESS_KEY_ID" in os.environ else "LowVoltage.tests.local",
     test_loader="testresources:TestLoader",
     use_2to3=True,